@@ -77,9 +77,9 @@ if %errorlevel% neq 0 (
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.4: Silver to Gold
+echo STEP %PARENT_STEP%.4: Build Prontuario Matching Index
 echo ========================================
-python 03_silver_to_gold.py
+python 02_03_build_matching_index.py
 if %errorlevel% neq 0 (
     echo ERROR: Step %PARENT_STEP%.4 failed
     @REM pause (removed for automated execution)
@@ -87,6 +87,18 @@ if %errorlevel% neq 0 (
     goto cleanup
 )
 
+echo.
+echo ========================================
+echo STEP %PARENT_STEP%.5: Silver to Gold
+echo ========================================
+python 03_silver_to_gold.py
+if %errorlevel% neq 0 (
+    echo ERROR: Step %PARENT_STEP%.5 failed
+    @REM pause (removed for automated execution)
+    set "EXIT_CODE=1"
+    goto cleanup
+)
+
 echo.
 echo ========================================
 echo DATAFLOW COMPLETED SUCCESSFULLY!
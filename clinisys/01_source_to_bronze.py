@@ -12,6 +12,10 @@ from sqlalchemy import create_engine, text
 from datetime import datetime
 import hashlib
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commons import duckdb_manager
 
 # Load config and logging level
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'params.yml')
@@ -49,7 +53,7 @@ def get_mysql_connection(config):
 
 def get_duckdb_connection(duckdb_path):
     """Create DuckDB connection"""
-    return duckdb.connect(duckdb_path)
+    return duckdb_manager.connect(duckdb_path)
 
 def get_table_schema(engine, table_name):
     """Get the schema (column names and types) of a MySQL table"""
@@ -0,0 +1,59 @@
+"""
+Builds the persistent prontuario matching index (silver.prontuario_matching_index)
+inside clinisys_all.duckdb, right after the bronze -> silver refresh.
+
+Every downstream find_prontuarios call (embryoscope, planilha, redlara, protheus)
+reuses this index instead of re-unpivoting and re-normalising view_pacientes.
+The build is skipped when the index version already matches view_pacientes.
+"""
+import os
+import sys
+import logging
+from datetime import datetime
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+
+from commons.prontuario_matching_v1 import build_matching_index
+
+# Load config and logging level
+CONFIG_PATH = os.path.join(BASE_DIR, 'params.yml')
+with open(CONFIG_PATH, 'r') as f:
+    config = yaml.safe_load(f)
+logging_level_str = config.get('logging_level', 'INFO').upper()
+logging_level = getattr(logging, logging_level_str, logging.INFO)
+
+# Setup logging
+LOGS_DIR = os.path.join(BASE_DIR, 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+logging.basicConfig(
+    level=logging_level,
+    format='%(asctime)s %(levelname)s %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+logger.info(f'Loaded logging level: {logging_level_str}')
+
+db_path = os.path.abspath(os.path.join(BASE_DIR, '..', 'database', 'clinisys_all.duckdb'))
+
+
+def main():
+    logger.info('Starting prontuario matching index build')
+    logger.info(f'Database path: {db_path}')
+    if not os.path.exists(db_path):
+        logger.error(f'Database not found: {db_path}')
+        sys.exit(1)
+
+    version = build_matching_index(db_path)
+    logger.info(f'Prontuario matching index ready (version {version})')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
 import duckdb
 import os
+import sys
 import logging
 from datetime import datetime
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons.build_cache import cached_build, input_fingerprints
+
 # Load config and logging level
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'params.yml')
 with open(CONFIG_PATH, 'r') as f:
@@ -38,6 +42,17 @@ BASE_DIR = os.path.dirname(__file__)
 source_db_path = os.path.abspath(os.path.join(BASE_DIR, '..', 'database', 'clinisys_all.duckdb'))
 target_db_path = os.path.abspath(os.path.join(BASE_DIR, '..', 'database', 'huntington_data_lake.duckdb'))
 
+# Source tables read by the gold query (fingerprinted by the build cache)
+GOLD_INPUT_TABLES = [
+    'silver.view_tratamentos',
+    'silver.view_embrioes_congelados',
+    'silver.view_micromanipulacao_oocitos',
+    'silver.view_micromanipulacao',
+    'silver.view_congelamentos_embrioes',
+    'silver.view_descongelamentos_embrioes',
+    'silver.view_medicos',
+]
+
 
 def build_select_columns():
     """
@@ -165,34 +180,29 @@ def main():
     '''
     
     try:
-        # Read data from source database
-        logger.info('Connecting to source database to read data')
         with duckdb.connect(source_db_path, read_only=True) as source_con:
-            logger.info('Connected to source DuckDB')
-            
-            # Indexes should be created in silver layer, not here
-            logger.info('Using pre-created indexes from silver layer for better JOIN performance')
-            
-            # Execute query to get data
-            df = source_con.execute(query).df()
-            logger.info(f'Read {len(df)} rows from source database')
+            source_fingerprints = input_fingerprints(source_con, GOLD_INPUT_TABLES)
+
+        def build_gold_table():
+            # Read data from source database
+            logger.info('Connecting to source database to read data')
+            with duckdb.connect(source_db_path, read_only=True) as source_con:
+                logger.info('Connected to source DuckDB')
+                
+                # Indexes should be created in silver layer, not here
+                logger.info('Using pre-created indexes from silver layer for better JOIN performance')
+                
+                # Execute query to get data
+                df = source_con.execute(query).df()
+                logger.info(f'Read {len(df)} rows from source database')
             
             # Validate data
             if df.empty:
                 logger.warning('No data found in source database')
-                return
+                return False
             
             logger.info(f'Final column count: {len(df.columns)}')
             
-        # Write data to target database
-        logger.info('Connecting to target database to write data')
-        with duckdb.connect(target_db_path) as target_con:
-            logger.info('Connected to target DuckDB')
-            
-            # Create schema if not exists
-            target_con.execute('CREATE SCHEMA IF NOT EXISTS gold;')
-            logger.info('Ensured gold schema exists')
-            
             # Drop existing table if it exists
             target_con.execute('DROP TABLE IF EXISTS gold.clinisys_embrioes;')
             logger.info('Dropped existing gold.clinisys_embrioes table if it existed')
@@ -218,6 +228,20 @@ def main():
             
             logger.info('Indexes created successfully')
             
+        # Write data to target database
+        logger.info('Connecting to target database to write data')
+        with duckdb.connect(target_db_path) as target_con:
+            logger.info('Connected to target DuckDB')
+            
+            # Create schema if not exists
+            target_con.execute('CREATE SCHEMA IF NOT EXISTS gold;')
+            logger.info('Ensured gold schema exists')
+            
+            # Skip the rebuild (and the report below) when neither the silver tables nor the query changed
+            if not cached_build(target_con, 'gold.clinisys_embrioes', source_fingerprints, build_gold_table, key=query):
+                logger.info('Gold loader finished without rebuilding gold.clinisys_embrioes')
+                return
+            
             # Validate row count
             row_count = target_con.execute("SELECT COUNT(*) FROM gold.clinisys_embrioes").fetchone()[0]
             logger.info(f'gold.clinisys_embrioes row count: {row_count}')
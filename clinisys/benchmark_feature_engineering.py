@@ -0,0 +1,164 @@
+"""
+Benchmark + parity check for the view_tratamentos feature engineering.
+
+Compares the window-function projection compiled from TRATAMENTOS_FEATURES
+against the legacy correlated-subquery SQL (kept here as the reference
+implementation) and reports wall time for both plus any mismatching rows.
+
+Usage:
+    python benchmark_feature_engineering.py                 # uses silver.view_tratamentos
+    python benchmark_feature_engineering.py --synthetic 200000
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import duckdb
+
+from feature_engineering import (
+    TRATAMENTOS_FEATURES,
+    TRATAMENTOS_RECASTS,
+    compile_feature_projection,
+)
+
+# Setup logging
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+db_path = os.path.join('..', 'database', 'clinisys_all.duckdb') if not os.path.exists('database/clinisys_all.duckdb') else 'database/clinisys_all.duckdb'
+
+FEATURE_COLUMNS = [f['name'] for f in TRATAMENTOS_FEATURES]
+
+# Legacy implementation (two rebuilds, O(n^2) correlated subqueries per patient)
+LEGACY_SQL = """
+    CREATE OR REPLACE TABLE legacy AS
+    SELECT *,
+           CASE
+               WHEN peso_paciente IS NOT NULL
+                    AND altura_paciente IS NOT NULL
+                    AND altura_paciente > 0
+               THEN ROUND(CAST(peso_paciente AS DOUBLE) / POWER(CAST(altura_paciente AS DOUBLE), 2), 2)
+               ELSE NULL
+           END AS bmi,
+           COALESCE((
+               SELECT COUNT(*)
+               FROM base AS prev
+               WHERE prev.prontuario = base.prontuario
+                 AND COALESCE(prev.data_transferencia, prev.data_procedimento, prev.data_dum)
+                     < COALESCE(base.data_transferencia, base.data_procedimento, base.data_dum)
+                 AND (prev.resultado_tratamento IS NULL
+                      OR prev.resultado_tratamento NOT IN ('No transfer', 'Cancelado', 'Congelamento de Óvulos'))
+           ), 0) AS previous_et,
+           COALESCE((
+               SELECT COUNT(*)
+               FROM base AS prev
+               WHERE prev.prontuario = base.prontuario
+                 AND COALESCE(prev.data_transferencia, prev.data_procedimento, prev.data_dum)
+                     < COALESCE(base.data_transferencia, base.data_procedimento, base.data_dum)
+                 AND prev.doacao_ovulos = 'Sim'
+                 AND (prev.resultado_tratamento IS NULL
+                      OR prev.resultado_tratamento NOT IN ('No transfer', 'Cancelado', 'Congelamento de Óvulos'))
+           ), 0) AS previous_et_od
+    FROM base;
+
+    CREATE OR REPLACE TABLE legacy AS
+    SELECT * EXCLUDE (unidade),
+           TRY_CAST(unidade AS INTEGER) AS unidade
+    FROM legacy;
+"""
+
+
+def load_silver_base(con):
+    """Copy silver.view_tratamentos (without derived columns) into an in-memory base table."""
+    con.execute(f"ATTACH '{db_path}' AS src (READ_ONLY)")
+    existing = {r[0] for r in con.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_catalog = 'src' AND table_schema = 'silver' AND table_name = 'view_tratamentos'"
+    ).fetchall()}
+    derived = [c for c in FEATURE_COLUMNS if c in existing]
+    exclude = f" EXCLUDE ({', '.join(derived)})" if derived else ""
+    con.execute(f"CREATE TABLE base AS SELECT *{exclude} FROM src.silver.view_tratamentos")
+    con.execute("DETACH src")
+
+
+def load_synthetic_base(con, n_rows):
+    """Generate a synthetic treatment table with duplicate dates, NULL dates and NULL prontuarios."""
+    con.execute(f"""
+        CREATE TABLE base AS
+        SELECT
+            i AS id,
+            CASE WHEN i % 97 = 0 THEN NULL ELSE (i % {max(n_rows // 6, 1)}) END AS prontuario,
+            CASE WHEN i % 5 = 0 THEN NULL ELSE DATE '2015-01-01' + CAST(hash(i) % 3000 AS INTEGER) END AS data_transferencia,
+            CASE WHEN i % 7 = 0 THEN NULL ELSE DATE '2015-01-01' + CAST(hash(i + 1) % 3000 AS INTEGER) END AS data_procedimento,
+            CASE WHEN i % 11 = 0 THEN NULL ELSE DATE '2015-01-01' + CAST(hash(i + 2) % 3000 AS INTEGER) END AS data_dum,
+            CASE i % 6
+                WHEN 0 THEN 'No transfer' WHEN 1 THEN 'Cancelado' WHEN 2 THEN 'Congelamento de Óvulos'
+                WHEN 3 THEN NULL ELSE 'Positivo' END AS resultado_tratamento,
+            CASE WHEN i % 4 = 0 THEN 'Sim' ELSE 'Não' END AS doacao_ovulos,
+            CASE WHEN i % 13 = 0 THEN NULL ELSE 50 + (i % 40) END AS peso_paciente,
+            CASE WHEN i % 17 = 0 THEN 0 ELSE 1.5 + (i % 30) / 100.0 END AS altura_paciente,
+            CAST(i % 9 AS VARCHAR) AS unidade
+        FROM range({n_rows}) t(i)
+    """)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark view_tratamentos feature engineering')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Use N synthetic rows instead of silver.view_tratamentos')
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    if args.synthetic:
+        logger.info(f'Generating {args.synthetic:,} synthetic treatment rows')
+        load_synthetic_base(con, args.synthetic)
+    else:
+        logger.info(f'Loading silver.view_tratamentos from {db_path}')
+        load_silver_base(con)
+    n_rows = con.execute("SELECT COUNT(*) FROM base").fetchone()[0]
+    logger.info(f'Base rows: {n_rows:,}')
+
+    start = time.time()
+    con.execute(f"CREATE OR REPLACE TABLE compiled AS {compile_feature_projection('base', TRATAMENTOS_FEATURES, TRATAMENTOS_RECASTS)}")
+    compiled_secs = time.time() - start
+    logger.info(f'Compiled window projection: {compiled_secs:.2f}s')
+
+    start = time.time()
+    con.execute(LEGACY_SQL)
+    legacy_secs = time.time() - start
+    logger.info(f'Legacy correlated subqueries: {legacy_secs:.2f}s')
+
+    # Parity: same column order and identical rows (EXCEPT ALL in both directions)
+    legacy_cols = [r[0] for r in con.execute("DESCRIBE legacy").fetchall()]
+    compiled_cols = [r[0] for r in con.execute("DESCRIBE compiled").fetchall()]
+    if legacy_cols != compiled_cols:
+        logger.error(f'Column order differs:\n  legacy:   {legacy_cols}\n  compiled: {compiled_cols}')
+
+    only_legacy = con.execute("SELECT COUNT(*) FROM (SELECT * FROM legacy EXCEPT ALL SELECT * FROM compiled)").fetchone()[0]
+    only_compiled = con.execute("SELECT COUNT(*) FROM (SELECT * FROM compiled EXCEPT ALL SELECT * FROM legacy)").fetchone()[0]
+
+    speedup = legacy_secs / compiled_secs if compiled_secs > 0 else float('inf')
+    logger.info(f'Speedup: {speedup:.1f}x')
+    if only_legacy or only_compiled or legacy_cols != compiled_cols:
+        logger.error(f'PARITY FAILED: {only_legacy} rows only in legacy, {only_compiled} rows only in compiled')
+        raise SystemExit(1)
+    logger.info(f'PARITY OK: {n_rows:,} rows identical for {", ".join(FEATURE_COLUMNS)}')
+
+
+if __name__ == '__main__':
+    main()
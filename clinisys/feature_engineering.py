@@ -8,6 +8,113 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# ---------------------------------------------------------------------------
+# Declarative feature definitions
+# ---------------------------------------------------------------------------
+# Each feature is a dict with:
+#   name  - output column name
+#   kind  - 'expression': plain row-level SQL expression ('sql')
+#           'prior_count': number of earlier rows in the same partition that
+#                          satisfy 'where', ordered by 'order_by'. Rows with an
+#                          equal order value are NOT counted (strictly earlier),
+#                          and rows with a NULL partition/order value get 0.
+# compile_feature_projection() turns the list into one SELECT, so the whole
+# table is rebuilt once regardless of how many features are defined.
+
+# Event date of a treatment: transfer date, else procedure date, else DUM
+_TRATAMENTO_EVENT_DATE = "COALESCE(data_transferencia, data_procedimento, data_dum)"
+
+# Treatments that count as an embryo transfer.
+# Excludes: 'No transfer', 'Cancelado', 'Congelamento de Óvulos'
+_TRATAMENTO_IS_TRANSFER = (
+    "(resultado_tratamento IS NULL "
+    "OR resultado_tratamento NOT IN ('No transfer', 'Cancelado', 'Congelamento de Óvulos'))"
+)
+
+TRATAMENTOS_FEATURES = [
+    {
+        # BMI: weight(kg) / height(m)^2
+        'name': 'bmi',
+        'kind': 'expression',
+        'sql': """CASE
+                       WHEN peso_paciente IS NOT NULL
+                            AND altura_paciente IS NOT NULL
+                            AND altura_paciente > 0
+                       THEN ROUND(CAST(peso_paciente AS DOUBLE) / POWER(CAST(altura_paciente AS DOUBLE), 2), 2)
+                       ELSE NULL
+                   END""",
+    },
+    {
+        # Previous ET: count of previous embryo transfers for this patient
+        'name': 'previous_et',
+        'kind': 'prior_count',
+        'partition_by': 'prontuario',
+        'order_by': _TRATAMENTO_EVENT_DATE,
+        'where': _TRATAMENTO_IS_TRANSFER,
+    },
+    {
+        # Previous OD ET: count of previous egg donation embryo transfers
+        'name': 'previous_et_od',
+        'kind': 'prior_count',
+        'partition_by': 'prontuario',
+        'order_by': _TRATAMENTO_EVENT_DATE,
+        'where': f"doacao_ovulos = 'Sim' AND {_TRATAMENTO_IS_TRANSFER}",
+    },
+]
+
+# unidade is a FK integer (references view_unidades.id) in view_tratamentos,
+# but was removed from global int_columns because in view_medicamentos_prescricoes
+# it holds free-text unit strings. Re-cast it to INTEGER here.
+TRATAMENTOS_RECASTS = {'unidade': 'INTEGER'}
+
+
+def _compile_feature(feature):
+    """Return the SQL expression for a single feature definition."""
+    kind = feature['kind']
+    if kind == 'expression':
+        return feature['sql']
+    if kind == 'prior_count':
+        partition_by = feature['partition_by']
+        order_by = feature['order_by']
+        where = feature['where']
+        # Cumulative count up to and including the current peer group, minus the
+        # peer group itself -> count of strictly earlier rows. NULL order values
+        # sort last, so they never fall inside the frame of a dated row.
+        return f"""CASE
+                       WHEN {partition_by} IS NULL OR {order_by} IS NULL THEN 0
+                       ELSE COUNT(*) FILTER (WHERE {where}) OVER (
+                                PARTITION BY {partition_by}
+                                ORDER BY {order_by} ASC NULLS LAST
+                                RANGE BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+                            - COUNT(*) FILTER (WHERE {where}) OVER (
+                                PARTITION BY {partition_by}, {order_by})
+                   END"""
+    raise ValueError(f"Unknown feature kind: {kind}")
+
+
+def compile_feature_projection(source, features, recasts=None):
+    """
+    Compile feature definitions into a single SELECT over `source`.
+
+    Args:
+        source: Fully qualified relation to read from (e.g. 'silver.view_tratamentos')
+        features: List of feature definition dicts (see TRATAMENTOS_FEATURES)
+        recasts: Optional {column: type} to TRY_CAST; recast columns are moved
+                 after the features, matching the previous two-step rebuild
+
+    Returns:
+        SQL SELECT statement (string)
+    """
+    recasts = recasts or {}
+    star = f"* EXCLUDE ({', '.join(recasts)})" if recasts else "*"
+    projections = [star]
+    projections += [f"{_compile_feature(f)} AS {f['name']}" for f in features]
+    projections += [f"TRY_CAST({col} AS {typ}) AS {col}" for col, typ in recasts.items()]
+    select_list = ",\n                   ".join(projections)
+    return f"""SELECT {select_list}
+            FROM {source}"""
+
+
 def feature_creation(con, table):
     """
     Apply table-specific feature engineering to the silver table.
@@ -33,60 +140,17 @@ def feature_creation(con, table):
 
 
     elif table == 'view_tratamentos':
-        # Add calculated columns: BMI, previous_et, previous_et_od
+        # Add calculated columns (bmi, previous_et, previous_et_od) and re-cast
+        # unidade in a single projection / single table rebuild.
         logger.info(f"Adding calculated columns to silver.{table}")
 
         con.execute(f"""
             CREATE OR REPLACE TABLE silver.{table} AS
-            SELECT *,
-                   -- BMI: weight(kg) / height(m)^2
-                   CASE
-                       WHEN peso_paciente IS NOT NULL
-                            AND altura_paciente IS NOT NULL
-                            AND altura_paciente > 0
-                       THEN ROUND(CAST(peso_paciente AS DOUBLE) / POWER(CAST(altura_paciente AS DOUBLE), 2), 2)
-                       ELSE NULL
-                   END AS bmi,
-
-                   -- Previous ET: count of previous embryo transfers for this patient
-                   -- Excludes: 'No transfer', 'Cancelado', 'Congelamento de Óvulos'
-                   COALESCE((
-                       SELECT COUNT(*)
-                       FROM silver.{table} AS prev
-                       WHERE prev.prontuario = {table}.prontuario
-                         AND COALESCE(prev.data_transferencia, prev.data_procedimento, prev.data_dum)
-                             < COALESCE({table}.data_transferencia, {table}.data_procedimento, {table}.data_dum)
-                         AND (prev.resultado_tratamento IS NULL
-                              OR prev.resultado_tratamento NOT IN ('No transfer', 'Cancelado', 'Congelamento de Óvulos'))
-                   ), 0) AS previous_et,
-
-                   -- Previous OD ET: count of previous egg donation embryo transfers
-                   COALESCE((
-                       SELECT COUNT(*)
-                       FROM silver.{table} AS prev
-                       WHERE prev.prontuario = {table}.prontuario
-                         AND COALESCE(prev.data_transferencia, prev.data_procedimento, prev.data_dum)
-                             < COALESCE({table}.data_transferencia, {table}.data_procedimento, {table}.data_dum)
-                         AND prev.doacao_ovulos = 'Sim'
-                         AND (prev.resultado_tratamento IS NULL
-                              OR prev.resultado_tratamento NOT IN ('No transfer', 'Cancelado', 'Congelamento de Óvulos'))
-                   ), 0) AS previous_et_od
-
-            FROM silver.{table}
-        """)
-
-        # unidade is a FK integer (references view_unidades.id) in view_tratamentos,
-        # but was removed from global int_columns because in view_medicamentos_prescricoes
-        # it holds free-text unit strings. Re-cast it to INTEGER here.
-        logger.info(f"Re-casting unidade to INTEGER in silver.{table}")
-        con.execute(f"""
-            CREATE OR REPLACE TABLE silver.{table} AS
-            SELECT * EXCLUDE (unidade),
-                   TRY_CAST(unidade AS INTEGER) AS unidade
-            FROM silver.{table}
+            {compile_feature_projection(f'silver.{table}', TRATAMENTOS_FEATURES, TRATAMENTOS_RECASTS)}
         """)
 
-        logger.info(f"Added bmi, previous_et, previous_et_od, re-cast unidade to silver.{table}")
+        logger.info(f"Added {', '.join(f['name'] for f in TRATAMENTOS_FEATURES)}, "
+                    f"re-cast {', '.join(TRATAMENTOS_RECASTS)} in silver.{table}")
 
 
     elif table == 'view_medicamentos_prescricoes':
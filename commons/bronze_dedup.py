@@ -0,0 +1,155 @@
+"""
+bronze_dedup.py — Hash-deduplicated appends to the API bronze tables
+====================================================================
+The Protheus and RD Station loaders loaded every hash ever written to
+bronze.<table> into a Python set at startup and hashed each fetched row in
+Python, so startup time and memory grew with the whole bronze history.
+append_new_rows() stages a batch of fetched rows in DuckDB instead, computes
+the row hash there and inserts only the rows whose hash bronze does not hold:
+
+  - the hash is md5 over the non-NULL columns in name order ('col:value'
+    joined by '|'), leaving out hash, extraction_timestamp and is_deleted.
+    NULL and missing columns hash the same, so adding a column to bronze
+    does not change the hash of existing rows;
+  - bronze.<table>(hash) has an ART index. The batch is joined to bronze on
+    hash and its hashes are pushed into the bronze scan as an IN filter
+    (dynamic_or_filter_threshold), which DuckDB answers from the index
+    instead of reading the whole hash column;
+  - rows repeated within a batch are inserted once.
+
+Python holds one batch. DuckDB holds the index (roughly 100 bytes per bronze
+row once loaded), so keep a connection to the database open for the whole
+run: reopening the file reloads the index.
+
+Tables written with the old Python hash are migrated on first use: the hash
+column is recomputed in SQL, then indexed. The index marks a migrated table.
+
+Public API
+----------
+  HASH_EXCLUDE, BATCH_ROWS
+  row_hash_sql(columns) -> SQL expression
+  ensure_hash_index(con, table) -> True when the table was migrated by this call
+  append_new_rows(con, table, df, batch_rows=BATCH_ROWS) -> rows inserted
+"""
+
+import logging
+from typing import Iterable
+
+import duckdb
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns that describe the extraction, not the record
+HASH_EXCLUDE = ("hash", "extraction_timestamp", "is_deleted")
+BATCH_ROWS = 2048
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _split(table: str):
+    schema, _, name = table.rpartition(".")
+    return schema or "main", name
+
+
+def row_hash_sql(columns: Iterable[str]) -> str:
+    """md5 of 'col:value' for the non-NULL columns (in name order) outside HASH_EXCLUDE, joined by '|'."""
+    parts = [f"CASE WHEN {_ident(c)} IS NOT NULL THEN {_literal(c + ':')} || CAST({_ident(c)} AS VARCHAR) END"
+             for c in sorted(set(columns)) if c not in HASH_EXCLUDE]
+    if not parts:
+        return "md5('')"
+    return f"md5(concat_ws('|', {', '.join(parts)}))"
+
+
+def _index_name(table: str) -> str:
+    return f"{_split(table)[1]}_hash_idx"
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    schema, name = _split(table)
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+        [schema, name],
+    ).fetchone()[0] > 0
+
+
+def ensure_hash_index(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    """Recompute the hash column in SQL and index it, unless the table already has the index."""
+    schema, name = _split(table)
+    has_index = con.execute(
+        "SELECT COUNT(*) FROM duckdb_indexes() WHERE schema_name = ? AND table_name = ? AND index_name = ?",
+        [schema, name, _index_name(table)],
+    ).fetchone()[0]
+    if has_index:
+        return False
+
+    columns = [row[0] for row in con.execute(f"DESCRIBE {table}").fetchall()]
+    logger.info(f"Migrating {table} to SQL row hashes and indexing its hash column...")
+    # Rewrite rather than UPDATE: DuckDB refuses to index a table with outstanding updates
+    # while other connections to the database are open. If the run stops before the index
+    # exists, the next one recomputes the (same) hashes again
+    data_cols = ", ".join(_ident(c) for c in columns if c != "hash")
+    con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT {data_cols}, {row_hash_sql(columns)} AS hash FROM {table}")
+    con.execute(f"CREATE INDEX {_index_name(table)} ON {table} (hash)")
+    logger.info(f"Migrated {table}")
+    return True
+
+
+def append_new_rows(
+    con: duckdb.DuckDBPyConnection,
+    table: str,
+    df: pd.DataFrame,
+    batch_rows: int = BATCH_ROWS,
+) -> int:
+    """
+    Insert the rows of df (string or NULL values) whose hash is not in table
+    yet. Creates the table (VARCHAR columns) and adds new columns as needed.
+    Returns the number of rows inserted.
+    """
+    columns = [c for c in df.columns if c != "hash"]
+    if df.empty or not columns:
+        return 0
+
+    if not _table_exists(con, table):
+        logger.info(f"Creating table {table} with VARCHAR columns")
+        cols_def = ", ".join(f"{_ident(c)} VARCHAR" for c in columns)
+        con.execute(f"CREATE TABLE {table} ({cols_def}, hash VARCHAR)")
+        con.execute(f"CREATE INDEX {_index_name(table)} ON {table} (hash)")
+    else:
+        ensure_hash_index(con, table)
+        existing_cols = {row[0] for row in con.execute(f"DESCRIBE {table}").fetchall()}
+        for col in columns:
+            if col not in existing_cols:
+                logger.info(f"Schema evolution: Adding column '{col}' to {table}")
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {_ident(col)} VARCHAR")
+
+    cols_str = ", ".join(_ident(c) for c in columns)
+    casts = ", ".join(f"CAST({_ident(c)} AS VARCHAR) AS {_ident(c)}" for c in columns)
+    # Push the batch's hashes into the bronze scan as an IN filter, which the index answers
+    con.execute(f"SET dynamic_or_filter_threshold = {max(batch_rows, 50)}")
+
+    inserted = 0
+    for start in range(0, len(df), batch_rows):
+        con.register("_bronze_batch", df.iloc[start:start + batch_rows][columns])
+        try:
+            inserted += con.execute(f"""
+                INSERT INTO {table} ({cols_str}, hash)
+                WITH staged AS (
+                    SELECT DISTINCT ON (hash) *
+                    FROM (SELECT *, {row_hash_sql(columns)} AS hash FROM (SELECT {casts} FROM _bronze_batch))
+                ),
+                present AS (
+                    SELECT DISTINCT b.hash FROM staged s JOIN {table} b ON b.hash = s.hash
+                )
+                SELECT {cols_str}, hash FROM staged
+                WHERE hash NOT IN (SELECT hash FROM present)
+            """).fetchone()[0]
+        finally:
+            con.unregister("_bronze_batch")
+    return inserted
@@ -0,0 +1,202 @@
+"""
+build_cache.py — Skip table rebuilds when the inputs have not changed
+=====================================================================
+Most stages rebuild their gold tables with DROP TABLE / CREATE TABLE AS on
+every run, even when nothing upstream changed. This module keeps one record
+per output table in a `main._build_cache` table of the output's database:
+
+  - the build fingerprint: sha1 of the input table fingerprints (row count +
+    order-independent row hash) and a caller-provided key, normally the
+    CREATE statement / SELECT query, so that code changes also trigger a
+    rebuild. A key that reads the clock (CURRENT_DATE, now(), ...) also
+    carries today's date: such a table is rebuilt once per day even when its
+    inputs did not change;
+  - the fingerprint of the output table right after the build, so that a
+    table modified in place by a later stage (or rebuilt by another script)
+    is not mistaken for a fresh one;
+  - how long the build took, reported as the time saved on a cache hit.
+
+A build is skipped (cache hit) when the output table exists, the build
+fingerprint matches and the output is unchanged since it was built.
+Set BUILD_CACHE_FORCE=1 to rebuild regardless (00_run_pipeline_dag.py sets it
+for --force).
+
+Public API
+----------
+  table_fingerprint(con, table) -> str
+  input_fingerprints(con, tables) -> {table: fingerprint}
+  build_fingerprint(inputs, key='') -> str
+  is_fresh(con, output_table, fingerprint) -> Optional[dict]
+  record_build(con, output_table, fingerprint, build_seconds)
+  cached_build(con, output_table, inputs, build_fn, key='', ...) -> bool
+  build_table(con, output_table, create_sql, inputs, post_sql=(), ...) -> bool
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import date
+from typing import Callable, Dict, Mapping, Optional, Sequence, Union
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+BUILD_CACHE_TABLE = "_build_cache"
+FORCE_ENV_VAR = "BUILD_CACHE_FORCE"
+# SQL whose result depends on the day it runs
+CLOCK_SQL = re.compile(
+    r"\b(current_date|current_timestamp|current_time|localtimestamp|localtime|get_current_date|"
+    r"get_current_timestamp|get_current_time|transaction_timestamp)\b|(?<![.\w])(now|today)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def force_requested() -> bool:
+    return os.environ.get(FORCE_ENV_VAR, "").strip().lower() in ("1", "true", "yes")
+
+
+def table_fingerprint(con: duckdb.DuckDBPyConnection, table: str) -> str:
+    """Cheap content fingerprint: row count + order-independent row hash sum."""
+    n_rows, hash_sum = con.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(hash(t)), 0) FROM {table} t"
+    ).fetchone()
+    return f"{n_rows}-{hash_sum}"
+
+
+def input_fingerprints(con: duckdb.DuckDBPyConnection, tables: Sequence[str]) -> Dict[str, str]:
+    """Fingerprint each input table (qualified names as used in the build query)."""
+    return {table: table_fingerprint(con, table) for table in tables}
+
+
+def build_fingerprint(inputs: Mapping[str, str], key: str = "") -> str:
+    """sha1 of the input fingerprints and key, plus today's date when key reads the clock."""
+    payload = {"inputs": dict(inputs), "key": key}
+    if CLOCK_SQL.search(key):
+        payload["as_of"] = date.today().isoformat()
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _cache_table(output_table: str) -> str:
+    """The record lives in the output's database: 'db.gold.t' -> 'db.main._build_cache'."""
+    parts = output_table.split(".")
+    catalog = parts[0] + "." if len(parts) == 3 else ""
+    return f"{catalog}main.{BUILD_CACHE_TABLE}"
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    try:
+        con.execute(f"SELECT 1 FROM {table} LIMIT 0")
+        return True
+    except duckdb.CatalogException:
+        return False
+
+
+def _lookup(con: duckdb.DuckDBPyConnection, output_table: str, fingerprint: str):
+    """(previous build record, None) if output_table is up to date, else (None, miss reason)."""
+    cache_table = _cache_table(output_table)
+    if not _table_exists(con, output_table):
+        return None, "output table does not exist"
+    if not _table_exists(con, cache_table):
+        return None, "no build record"
+    row = con.execute(
+        f"SELECT fingerprint, output_fingerprint, build_seconds, built_at FROM {cache_table} WHERE output_table = ?",
+        [output_table],
+    ).fetchone()
+    if row is None:
+        return None, "no build record"
+    if row[0] != fingerprint:
+        return None, "inputs or build query changed"
+    if table_fingerprint(con, output_table) != row[1]:
+        return None, "output table modified since it was built"
+    return {"build_seconds": row[2], "built_at": row[3]}, None
+
+
+def is_fresh(con: duckdb.DuckDBPyConnection, output_table: str, fingerprint: str) -> Optional[dict]:
+    """Return the previous build record if output_table is up to date, else None."""
+    return _lookup(con, output_table, fingerprint)[0]
+
+
+def record_build(con: duckdb.DuckDBPyConnection, output_table: str, fingerprint: str, build_seconds: float):
+    cache_table = _cache_table(output_table)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {cache_table} (
+            output_table VARCHAR PRIMARY KEY,
+            fingerprint VARCHAR,
+            output_fingerprint VARCHAR,
+            build_seconds DOUBLE,
+            built_at TIMESTAMP
+        )
+    """)
+    con.execute(
+        f"INSERT OR REPLACE INTO {cache_table} VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        [output_table, fingerprint, table_fingerprint(con, output_table), build_seconds],
+    )
+
+
+def cached_build(
+    con: duckdb.DuckDBPyConnection,
+    output_table: str,
+    inputs: Union[Sequence[str], Mapping[str, str]],
+    build_fn: Callable[[], Optional[bool]],
+    key: str = "",
+    force: Optional[bool] = None,
+    log: Callable[[str], None] = logger.info,
+) -> bool:
+    """
+    Run build_fn (which must (re)create output_table on con) unless the output
+    is up to date. build_fn may return False to report that it wrote nothing
+    (e.g. empty source). Returns True if the table was rebuilt, else False.
+
+    inputs: table names fingerprinted on con, or fingerprints already taken on
+            another connection (input_fingerprints) when the inputs live in a
+            different database.
+    key:    anything else the output depends on, normally the build SQL.
+    log:    output function; scripts that report with print pass print.
+    """
+    force = force_requested() if force is None else force
+    t_check = time.perf_counter()
+    fps = dict(inputs) if isinstance(inputs, Mapping) else input_fingerprints(con, inputs)
+    fingerprint = build_fingerprint(fps, key)
+
+    previous, reason = (None, "forced") if force else _lookup(con, output_table, fingerprint)
+    check_seconds = time.perf_counter() - t_check
+    if previous is not None:
+        log(f"Build cache hit: {output_table} is up to date (built {previous['built_at']:%Y-%m-%d %H:%M:%S}); "
+            f"skipped rebuild, saved ~{previous['build_seconds']:.1f}s (check took {check_seconds:.1f}s)")
+        return False
+
+    log(f"Build cache miss: {output_table} ({reason}); rebuilding")
+    t_build = time.perf_counter()
+    if build_fn() is False:
+        log(f"Build of {output_table} produced nothing; build record not updated")
+        return False
+    build_seconds = time.perf_counter() - t_build
+    record_build(con, output_table, fingerprint, build_seconds)
+    log(f"Built {output_table} in {build_seconds:.1f}s")
+    return True
+
+
+def build_table(
+    con: duckdb.DuckDBPyConnection,
+    output_table: str,
+    create_sql: str,
+    inputs: Union[Sequence[str], Mapping[str, str]],
+    post_sql: Sequence[str] = (),
+    log: Callable[[str], None] = logger.info,
+) -> bool:
+    """
+    cached_build for the usual DROP TABLE + CREATE TABLE AS stage. post_sql
+    statements (ALTER/UPDATE/CREATE OR REPLACE on the output) run after the
+    CREATE; all statements form the cache key.
+    """
+    def build():
+        con.execute(f"DROP TABLE IF EXISTS {output_table}")
+        con.execute(create_sql)
+        for sql in post_sql:
+            con.execute(sql)
+
+    return cached_build(con, output_table, inputs, build, key="\n".join([create_sql, *post_sql]), log=log)
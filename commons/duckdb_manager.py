@@ -0,0 +1,316 @@
+"""
+duckdb_manager.py — Shared DuckDB connection and resource manager
+=================================================================
+One place to open DuckDB files, instead of a get_duckdb_connection() /
+get_database_connection() copy per script.
+
+  - Resources: memory_limit, threads and temp_directory are picked from the
+    machine (physical RAM, CPU cores) and a stage profile, unless params.yml
+    sets duckdb_memory_limit / duckdb_threads / duckdb_temp_directory.
+    Spill files go to the local temp dir by default, not next to the
+    database (which may live on a synced drive).
+  - Reuse: each process keeps one DuckDB instance per file; every connect()
+    returns a cursor on it, so ATTACHes and settings are shared and the file
+    is opened once. The instance is closed when its last cursor closes, so
+    an idle script does not keep the file locked.
+  - Lock wait: DuckDB allows one writing process per file. When the file is
+    locked by another process, connect() waits (exponential backoff, up to
+    lock_timeout seconds, params.yml duckdb_lock_timeout_s) instead of
+    failing, then raises DatabaseLockTimeout. Threads of the same process
+    opening the same file queue on a per-file lock. Across processes DuckDB's
+    file lock is the arbiter; waiters are not served in strict FIFO order.
+  - Read-only fan-out: fan_out() runs independent reporting queries in
+    parallel on cursors of one read-only instance.
+  - Query timing hooks: add_query_hook(fn) calls fn(db_path, query, seconds)
+    after every execute() on a managed connection; slow_query_hook() logs
+    queries above a threshold.
+  - Profiling: with DUCKDB_PROFILE=1 (or duckdb_profiling: true in params.yml)
+    every execute() is profiled and its plan saved next to the run log, see
+    query_profiler.py.
+
+A file cannot be open read-only and read-write in the same process. A
+read-only request while the file is open for writing gets a cursor on the
+writable instance; a write request while it is open read-only raises.
+
+Public API
+----------
+  PROFILES
+  resolve_resources(profile='default', config=None) -> {memory_limit, threads, temp_directory}
+  connect(db_path, read_only=False, profile='default', config=None, lock_timeout=None) -> ManagedConnection
+  fan_out(db_path, queries, max_workers=4, profile='light', config=None) -> {name: DataFrame}
+  add_query_hook(fn) / remove_query_hook(fn)
+  slow_query_hook(threshold_s, log=logger.warning) -> hook
+  is_lock_error(exc) -> bool
+  DatabaseLockTimeout
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Union
+
+import duckdb
+import pandas as pd
+import psutil
+
+from commons import query_profiler
+
+logger = logging.getLogger(__name__)
+
+# Share of physical RAM and cap on threads per stage profile.
+# default: ordinary bronze/silver/gold scripts (several may run at once under the DAG)
+# heavy:   large joins such as the clinisys-embryoscope merge
+# light:   reporting, exports and API extractions
+PROFILES = {
+    "default": {"memory_fraction": 0.5, "max_threads": None},
+    "heavy": {"memory_fraction": 0.75, "max_threads": None},
+    "light": {"memory_fraction": 0.25, "max_threads": 4},
+}
+
+DEFAULT_LOCK_TIMEOUT_S = 600
+LOCK_ERROR_MARKERS = ("Could not set lock on file", "being used by another process")
+
+
+class DatabaseLockTimeout(RuntimeError):
+    """The database file stayed locked by another process for longer than the timeout."""
+
+
+def resolve_resources(profile: str = "default", config: Optional[dict] = None) -> Dict[str, Union[str, int]]:
+    """Return memory_limit, threads and temp_directory for a profile; params.yml keys win."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DuckDB profile '{profile}' (expected one of {sorted(PROFILES)})")
+    config = config or {}
+    settings = PROFILES[profile]
+
+    memory_limit = config.get("duckdb_memory_limit")
+    if not memory_limit:
+        total_gb = psutil.virtual_memory().total / (1024 ** 3)
+        memory_limit = f"{max(int(total_gb * settings['memory_fraction']), 1)}GB"
+
+    threads = config.get("duckdb_threads")
+    if not threads:
+        threads = os.cpu_count() or 1
+        if settings["max_threads"]:
+            threads = min(threads, settings["max_threads"])
+
+    temp_directory = config.get("duckdb_temp_directory") or os.path.join(tempfile.gettempdir(), "duckdb_spill")
+    return {"memory_limit": memory_limit, "threads": int(threads), "temp_directory": temp_directory}
+
+
+# ── Query timing hooks ─────────────────────────────────────────────────────────
+
+_query_hooks: List[Callable[[str, str, float], None]] = []
+
+
+def add_query_hook(fn: Callable[[str, str, float], None]):
+    """Register fn(db_path, query, seconds), called after every managed execute()."""
+    _query_hooks.append(fn)
+
+
+def remove_query_hook(fn: Callable[[str, str, float], None]):
+    if fn in _query_hooks:
+        _query_hooks.remove(fn)
+
+
+def slow_query_hook(threshold_s: float, log: Callable[[str], None] = logger.warning):
+    """Hook that logs every query slower than threshold_s."""
+    def hook(db_path: str, query: str, seconds: float):
+        if seconds >= threshold_s:
+            log(f"Slow query ({seconds:.1f}s) on {os.path.basename(db_path)}: {' '.join(query.split())[:200]}")
+    return hook
+
+
+def _run_hooks(db_path: str, query: str, seconds: float):
+    for hook in list(_query_hooks):
+        try:
+            hook(db_path, query, seconds)
+        except Exception as e:
+            logger.warning("Query hook %r failed: %s", hook, e)
+
+
+# ── Connections ────────────────────────────────────────────────────────────────
+
+class _Instance:
+    def __init__(self, parent: duckdb.DuckDBPyConnection, read_only: bool, resources: dict):
+        self.parent = parent
+        self.read_only = read_only
+        self.resources = resources
+        self.refs = 0
+
+
+_instances: Dict[str, _Instance] = {}
+_path_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _registry_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    return any(marker in str(exc) for marker in LOCK_ERROR_MARKERS)
+
+
+def _open_with_wait(path: str, read_only: bool, duckdb_config: dict, lock_timeout: float) -> duckdb.DuckDBPyConnection:
+    deadline = time.monotonic() + lock_timeout
+    delay = 0.5
+    next_report = 0.0
+    while True:
+        try:
+            return duckdb.connect(path, read_only=read_only, config=duckdb_config)
+        except duckdb.IOException as e:
+            if not is_lock_error(e):
+                raise
+            now = time.monotonic()
+            if now >= deadline:
+                raise DatabaseLockTimeout(f"{path} still locked after {lock_timeout:.0f}s: {e}") from e
+            if now >= next_report:
+                logger.warning("%s is locked by another process; waiting up to %.0fs more (%s)",
+                               path, deadline - now, e)
+                next_report = now + 30
+            time.sleep(min(delay, deadline - now))
+            delay = min(delay * 2, 10)
+
+
+class ManagedConnection:
+    """A cursor on the shared per-file DuckDB instance, with query timing hooks.
+
+    Behaves like a DuckDBPyConnection (other attributes are delegated);
+    execute() returns the connection itself so .df() / .fetchone() chain as usual.
+    """
+
+    def __init__(self, cursor: duckdb.DuckDBPyConnection, db_path: str, read_only: bool, profile: bool = False):
+        self._con = cursor
+        self.db_path = db_path
+        self.read_only = read_only
+        self._closed = False
+        self._profiler = None
+        if profile:
+            self._profiler = query_profiler.QueryProfiler(db_path)
+            self._profiler.enable(cursor)
+
+    def execute(self, query: str, parameters=None):
+        if self._profiler is not None:
+            self._profiler.before_execute(self._con, query)
+        start = time.perf_counter()
+        try:
+            if parameters is None:
+                self._con.execute(query)
+            else:
+                self._con.execute(query, parameters)
+        finally:
+            _run_hooks(self.db_path, query, time.perf_counter() - start)
+        return self
+
+    def executemany(self, query: str, parameters=None):
+        if self._profiler is not None:
+            # Row-by-row inserts are not profiled; save the previous statement before it is overwritten
+            self._profiler.capture(self._con)
+        start = time.perf_counter()
+        try:
+            self._con.executemany(query, parameters or [])
+        finally:
+            _run_hooks(self.db_path, query, time.perf_counter() - start)
+        return self
+
+    def cursor(self) -> "ManagedConnection":
+        return connect(self.db_path, read_only=self.read_only)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._profiler is not None:
+            self._profiler.capture(self._con)
+        self._con.close()
+        _release(self.db_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+
+def _release(path: str):
+    with _path_lock(path):
+        instance = _instances.get(path)
+        if instance is None:
+            return
+        instance.refs -= 1
+        if instance.refs <= 0:
+            instance.parent.close()
+            del _instances[path]
+            logger.debug("Closed DuckDB instance %s", path)
+
+
+def connect(
+    db_path: str,
+    read_only: bool = False,
+    profile: str = "default",
+    config: Optional[dict] = None,
+    lock_timeout: Optional[float] = None,
+) -> ManagedConnection:
+    """
+    Open db_path (or reuse this process's instance of it) and return a
+    connection. profile/config only apply when the instance is created.
+    """
+    path = os.path.abspath(db_path)
+    config = config or {}
+    if lock_timeout is None:
+        lock_timeout = float(config.get("duckdb_lock_timeout_s", DEFAULT_LOCK_TIMEOUT_S))
+
+    with _path_lock(path):
+        instance = _instances.get(path)
+        if instance is not None and instance.read_only and not read_only:
+            raise RuntimeError(f"{path} is open read-only in this process; close those connections "
+                               f"before opening it for writing")
+        if instance is None:
+            resources = resolve_resources(profile, config)
+            os.makedirs(resources["temp_directory"], exist_ok=True)
+            # execute() runs one Python frame below the caller; scanning all frames keeps
+            # "SELECT * FROM df" (pandas replacement scans) working through the wrapper
+            duckdb_config = dict(resources, python_scan_all_frames=True)
+            parent = _open_with_wait(path, read_only, duckdb_config, lock_timeout)
+            instance = _Instance(parent, read_only, resources)
+            _instances[path] = instance
+            logger.info("Opened DuckDB %s (read_only=%s, profile=%s, memory_limit=%s, threads=%d, temp_directory=%s)",
+                        path, read_only, profile, resources["memory_limit"], resources["threads"],
+                        resources["temp_directory"])
+        instance.refs += 1
+        try:
+            cursor = instance.parent.cursor()
+        except Exception:
+            instance.refs -= 1
+            raise
+    return ManagedConnection(cursor, path, instance.read_only, profile=query_profiler.enabled(config))
+
+
+def fan_out(
+    db_path: str,
+    queries: Union[Mapping[str, str], Sequence[str]],
+    max_workers: int = 4,
+    profile: str = "light",
+    config: Optional[dict] = None,
+) -> Dict[Union[str, int], pd.DataFrame]:
+    """
+    Run independent read queries in parallel, one cursor each on a shared
+    read-only instance. Returns {name: DataFrame} (index for a plain list).
+    """
+    named = dict(queries) if isinstance(queries, Mapping) else dict(enumerate(queries))
+
+    def run(name, query):
+        with connect(db_path, read_only=True, profile=profile, config=config) as con:
+            return name, con.execute(query).df()
+
+    # Hold one connection for the whole fan-out so the instance is opened once
+    with connect(db_path, read_only=True, profile=profile, config=config):
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(named)))) as pool:
+            return dict(pool.map(lambda item: run(*item), named.items()))
@@ -0,0 +1,305 @@
+"""
+excel_export.py — Streaming xlsx export from DuckDB
+===================================================
+The Excel exports used to load the whole table into pandas and call
+to_excel, which builds every cell of the workbook in memory (openpyxl) or
+holds all rows until the file is closed (xlsxwriter). For the wide combined
+tables that took minutes and as much memory as the table.
+
+export_query_to_excel() streams a query instead:
+
+  - rows are fetched from DuckDB in batches (fetchmany) and written straight
+    into the worksheet XML inside the xlsx zip, so memory does not grow with
+    the number of rows;
+  - strings are written inline (no shared string table to keep in memory);
+  - a sheet that reaches Excel's row limit (1,048,576 rows including the
+    header) continues on a new sheet '<name>_2', '<name>_3', ...
+
+Column types are set once per column, in the query, and are the same in
+every export:
+
+  integers, floats, decimals  number (NaN and infinity left empty)
+  DATE                        date, formatted YYYY-MM-DD
+  TIMESTAMP                   date and time, formatted YYYY-MM-DD HH:MM:SS
+                              (date only with timestamps_as_dates=True;
+                              time zones are converted to local time)
+  BOOLEAN                     TRUE / FALSE
+  anything else               text (values starting with '=' stay text)
+
+The header row is bold. Text longer than Excel's cell limit (32,767
+characters) is truncated and counted in the log.
+
+pyarrow is not a dependency of the pipeline, so batches are fetched as
+tuples; openpyxl is not used for writing because its per-cell objects make
+it barely faster than to_excel.
+
+Public API
+----------
+  EXCEL_MAX_ROWS
+  ExcelExportResult(path, rows, sheets)
+  export_query_to_excel(con, query, path, sheet_name='Sheet1', params=None, column_width=None,
+                        timestamps_as_dates=False, max_rows_per_sheet=EXCEL_MAX_ROWS - 1,
+                        batch_rows=None, log=logger.info) -> ExcelExportResult
+  export_dataframe_to_excel(df, path, sheet_name='Sheet1', **options) -> ExcelExportResult
+"""
+
+import logging
+import os
+import re
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_CELL_CHARS = 32_767
+BATCH_CELLS = 100_000
+
+# cellXfs indexes in _STYLES
+_STYLE_DATE = 1
+_STYLE_DATETIME = 2
+_STYLE_HEADER = 3
+
+_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XML_DECL = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+_STYLES = (
+    _XML_DECL + f'<styleSheet {_NS}>'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy\\-mm\\-dd\\ hh:mm:ss"/>'
+    '</numFmts>'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '</fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# XML escaping; control characters other than tab and newlines are not allowed in XML 1.0
+_ESCAPE = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;'}
+_ESCAPE.update({c: None for c in range(32) if c not in (9, 10, 13)})
+_INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+_NUMBER_TYPES = ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT',
+                 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT', 'UHUGEINT')
+
+
+@dataclass
+class ExcelExportResult:
+    path: str
+    rows: int
+    sheets: List[str]
+
+
+def _column_letter(index: int) -> str:
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _typed_column(name: str, col_type: str, timestamps_as_dates: bool) -> Tuple[str, str]:
+    """(SQL expression, cell kind) for one column: kind is 'n' number, 'b' boolean, 's' text, 'd'/'t' date serial"""
+    col = '"' + name.replace('"', '""') + '"'
+    if col_type in _NUMBER_TYPES:
+        return col, 'n'
+    if col_type in ('DOUBLE', 'FLOAT') or col_type.startswith('DECIMAL'):
+        return f"CASE WHEN isfinite(CAST({col} AS DOUBLE)) THEN CAST({col} AS DOUBLE) END", 'n'
+    if col_type == 'BOOLEAN':
+        return col, 'b'
+    if col_type == 'DATE':
+        return f"date_diff('day', DATE '1899-12-30', {col})", 'd'
+    if col_type.startswith('TIMESTAMP'):
+        value = f"CAST({col} AS TIMESTAMP)" if 'TIME ZONE' in col_type else col
+        if timestamps_as_dates:
+            return f"date_diff('day', DATE '1899-12-30', CAST({value} AS DATE))", 'd'
+        return f"epoch({value}) / 86400 + 25569", 't'
+    return f"CAST({col} AS VARCHAR)", 's'
+
+
+def _sheet_names(base: str):
+    """'Data', 'Data_2', 'Data_3', ... valid as Excel sheet names (31 chars, no []:*?/\\)"""
+    base = _INVALID_SHEET_CHARS.sub('_', base)[:31] or 'Sheet1'
+    yield base
+    n = 2
+    while True:
+        suffix = f'_{n}'
+        yield base[:31 - len(suffix)] + suffix
+        n += 1
+
+
+class _WorkbookWriter:
+    """Minimal xlsx package: worksheets streamed into the zip, workbook parts written on close."""
+
+    def __init__(self, path: str):
+        self.zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets: List[str] = []
+        self.stream = None
+
+    def start_sheet(self, name: str, header: Sequence[str], column_width: Optional[float]):
+        self.end_sheet()
+        self.sheets.append(name)
+        self.stream = self.zip.open(f'xl/worksheets/sheet{len(self.sheets)}.xml', 'w', force_zip64=True)
+        parts = [_XML_DECL, f'<worksheet {_NS}>']
+        if column_width and header:
+            parts.append(f'<cols><col min="1" max="{len(header)}" width="{column_width}" customWidth="1"/></cols>')
+        parts.append('<sheetData><row r="1">')
+        for i, column in enumerate(header):
+            parts.append(f'<c r="{_column_letter(i)}1" s="{_STYLE_HEADER}" t="inlineStr">'
+                         f'<is><t xml:space="preserve">{str(column).translate(_ESCAPE)}</t></is></c>')
+        parts.append('</row>')
+        self.write(''.join(parts))
+
+    def write(self, text: str):
+        self.stream.write(text.encode('utf-8'))
+
+    def end_sheet(self):
+        if self.stream is not None:
+            self.write('</sheetData></worksheet>')
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        self.end_sheet()
+        n = len(self.sheets)
+        self.zip.writestr('[Content_Types].xml', (
+            _XML_DECL + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for i in range(1, n + 1))
+            + '</Types>'))
+        self.zip.writestr('_rels/.rels', (
+            _XML_DECL + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'))
+        self.zip.writestr('xl/workbook.xml', (
+            _XML_DECL + f'<workbook {_NS} xmlns:r="{_REL_NS}"><sheets>'
+            + ''.join(f'<sheet name="{name.translate(_ESCAPE).replace(chr(34), "&quot;")}" sheetId="{i}" r:id="rId{i}"/>'
+                      for i, name in enumerate(self.sheets, 1))
+            + '</sheets></workbook>'))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', (
+            _XML_DECL + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                      for i in range(1, n + 1))
+            + f'<Relationship Id="rId{n + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'))
+        self.zip.writestr('xl/styles.xml', _STYLES)
+        self.zip.close()
+
+
+def export_query_to_excel(
+    con: duckdb.DuckDBPyConnection,
+    query: str,
+    path: str,
+    sheet_name: str = 'Sheet1',
+    params: Optional[Sequence] = None,
+    column_width: Optional[float] = None,
+    timestamps_as_dates: bool = False,
+    max_rows_per_sheet: int = EXCEL_MAX_ROWS - 1,
+    batch_rows: Optional[int] = None,
+    log: Callable[[str], None] = logger.info,
+) -> ExcelExportResult:
+    """
+    Write the rows of query (a SELECT) to an xlsx file at path, streaming.
+    column_width sets the same width on every column. batch_rows (default:
+    about 100,000 cells per batch) is how many rows are fetched and written at a time.
+    Returns what was written.
+    """
+    start = time.perf_counter()
+    description = con.execute(f"SELECT * FROM ({query}) LIMIT 0", params).description
+    names = [d[0] for d in description]
+    typed = [_typed_column(name, str(d[1]), timestamps_as_dates) for name, d in zip(names, description)]
+    kinds = [kind for _, kind in typed]
+    styles = {'d': f' s="{_STYLE_DATE}"', 't': f' s="{_STYLE_DATETIME}"'}
+    letters = [_column_letter(i) for i in range(len(names))]
+    # Cell XML up to the value, per column; the row number goes in between
+    cell_open = [(f'<c r="{letter}', f'"{styles.get(kind, "")}'
+                  + {'b': ' t="b"><v>', 's': ' t="inlineStr"><is><t xml:space="preserve">'}.get(kind, '><v>'))
+                 for letter, kind in zip(letters, kinds)]
+    cell_close = ['</t></is></c>' if kind == 's' else '</v></c>' for kind in kinds]
+    batch_rows = batch_rows or max(100, BATCH_CELLS // max(1, len(names)))
+
+    result = con.execute(f"SELECT {', '.join(expr for expr, _ in typed)} FROM ({query})", params)
+    sheet_names = _sheet_names(sheet_name)
+    writer = _WorkbookWriter(path)
+    rows = 0
+    truncated = 0
+    try:
+        writer.start_sheet(next(sheet_names), names, column_width)
+        sheet_row = 1
+        while True:
+            batch = result.fetchmany(batch_rows)
+            if not batch:
+                break
+            parts = []
+            for values in batch:
+                if sheet_row > max_rows_per_sheet:
+                    writer.write(''.join(parts))
+                    parts = []
+                    writer.start_sheet(next(sheet_names), names, column_width)
+                    sheet_row = 1
+                sheet_row += 1
+                r = str(sheet_row)
+                parts.append(f'<row r="{r}">')
+                for i, value in enumerate(values):
+                    if value is None:
+                        continue
+                    kind = kinds[i]
+                    if kind == 's':
+                        if len(value) > EXCEL_MAX_CELL_CHARS:
+                            value = value[:EXCEL_MAX_CELL_CHARS]
+                            truncated += 1
+                        value = value.translate(_ESCAPE)
+                    elif kind == 'b':
+                        value = '1' if value else '0'
+                    else:
+                        value = repr(value)
+                    opening, attributes = cell_open[i]
+                    parts.append(opening + r + attributes + value + cell_close[i])
+                parts.append('</row>')
+            rows += len(batch)
+            writer.write(''.join(parts))
+    finally:
+        writer.close()
+
+    if truncated:
+        log(f"{truncated:,} text values longer than {EXCEL_MAX_CELL_CHARS:,} characters were truncated")
+    log(f"Wrote {rows:,} rows x {len(names)} columns to {path} "
+        f"({len(writer.sheets)} sheet(s), {os.path.getsize(path) / (1024 * 1024):.1f} MB) "
+        f"in {time.perf_counter() - start:.1f}s")
+    return ExcelExportResult(path, rows, list(writer.sheets))
+
+
+def export_dataframe_to_excel(df, path: str, sheet_name: str = 'Sheet1', **options) -> ExcelExportResult:
+    """export_query_to_excel for a DataFrame already in memory (same typing and sheet splitting)."""
+    con = duckdb.connect()
+    try:
+        con.register('_excel_export_df', df)
+        return export_query_to_excel(con, 'SELECT * FROM _excel_export_df', path, sheet_name, **options)
+    finally:
+        con.close()
@@ -0,0 +1,114 @@
+"""
+finops_shared_tables.py — Intermediate tables shared by the finops gold builders
+===============================================================================
+Several finops builders (finops/02_create_tables/03_*.py) computed the same
+CTEs over and over:
+
+  - the most recent doctor per prontuario (03_00 patient_info, 03_01 finops_summary);
+  - the unit of origin per prontuario (03_00 patient_info, 03_01 finops_summary);
+  - silver.mesclada_vendas filtered to valid prontuarios and past emission
+    dates and grouped by month (the billing CTEs of 03_02, 03_03, 03_04_b and
+    03_05, each with its own product filter).
+
+They are materialised once here, behind the build cache, and the builders
+read them:
+
+  gold.finops_patient_medico   (prontuario, medico_nome)
+  gold.finops_patient_unidade  (prontuario, unidade_nome)     NULL when unknown
+  gold.finops_billing_monthly  (prontuario, period_month, descricao_gerencial,
+                                descricao, n_rows, total, quantity)
+
+ensure_shared_tables() builds (or checks) each requested table at most once
+per process, so the builders run together by 00_run_finops_builders.py share
+one build, and a builder run on its own still gets up-to-date tables.
+
+Public API
+----------
+  SHARED_TABLES
+  ensure_shared_tables(con, names=None, log=print) -> names built or checked in this call
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import duckdb
+
+from commons.build_cache import build_table
+
+PATIENT_MEDICO = "gold.finops_patient_medico"
+PATIENT_UNIDADE = "gold.finops_patient_unidade"
+BILLING_MONTHLY = "gold.finops_billing_monthly"
+
+# name -> (create statement, input tables)
+SHARED_TABLES: Dict[str, tuple] = {
+    # Most recent doctor per patient (highest treatment id with a responsible doctor)
+    PATIENT_MEDICO: ("""
+    CREATE TABLE gold.finops_patient_medico AS
+    SELECT
+        prontuario,
+        COALESCE(m.nome, 'Não informado') as medico_nome
+    FROM (
+        SELECT
+            prontuario,
+            responsavel_informacoes,
+            ROW_NUMBER() OVER (PARTITION BY prontuario ORDER BY id DESC) as rn
+        FROM clinisys_all.silver.view_tratamentos
+        WHERE responsavel_informacoes IS NOT NULL
+    ) latest_treatment
+    LEFT JOIN clinisys_all.silver.view_medicos m ON latest_treatment.responsavel_informacoes = m.id
+    WHERE latest_treatment.rn = 1
+    """, ['clinisys_all.silver.view_tratamentos', 'clinisys_all.silver.view_medicos']),
+
+    # Unit of origin per patient, from view_pacientes and view_unidades
+    PATIENT_UNIDADE: ("""
+    CREATE TABLE gold.finops_patient_unidade AS
+    SELECT
+        p.codigo as prontuario,
+        u.nome as unidade_nome
+    FROM clinisys_all.silver.view_pacientes p
+    LEFT JOIN clinisys_all.silver.view_unidades u ON p.unidade_origem = u.id
+    """, ['clinisys_all.silver.view_pacientes', 'clinisys_all.silver.view_unidades']),
+
+    # Billing by prontuario, month and product; the builders sum the products they need
+    BILLING_MONTHLY: ("""
+    CREATE TABLE gold.finops_billing_monthly AS
+    SELECT
+        prontuario,
+        STRFTIME("DT Emissao", '%Y-%m') as period_month,
+        "Descrição Gerencial" as descricao_gerencial,
+        Descricao as descricao,
+        COUNT(*) as n_rows,
+        SUM(Total) as total,
+        SUM("Qntd.") as quantity
+    FROM silver.mesclada_vendas
+    WHERE prontuario IS NOT NULL
+        AND prontuario != -1
+        AND "DT Emissao" IS NOT NULL
+        AND "DT Emissao" <= CURRENT_DATE
+    GROUP BY ALL
+    """, ['silver.mesclada_vendas']),
+}
+
+_ensured = set()
+_lock = threading.Lock()
+
+
+def ensure_shared_tables(
+    con: duckdb.DuckDBPyConnection,
+    names: Optional[Sequence[str]] = None,
+    log: Callable[[str], None] = print,
+) -> List[str]:
+    """
+    Build the requested shared tables (default: all) unless already done in
+    this process. clinisys_all must be attached for the patient tables.
+    """
+    done = []
+    with _lock:
+        for name in names or SHARED_TABLES:
+            if name in _ensured:
+                continue
+            create_sql, inputs = SHARED_TABLES[name]
+            build_table(con, name, create_sql, inputs, log=log)
+            _ensured.add(name)
+            done.append(name)
+    return done
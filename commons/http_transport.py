@@ -0,0 +1,175 @@
+"""
+http_transport.py — Pooled HTTP sessions for the API integrations
+=================================================================
+The Protheus and RD Station scripts each built their own HTTP access: a bare
+requests.request per call in the RD Station check clients (a new connection,
+and TLS handshake, per request), and sessions with requests' default pool of
+10 connections and no timeout elsewhere. create_session() gives them one
+transport:
+
+  - keep-alive connection pool sized to the caller's worker count
+    (pool_block=True: extra threads wait for a free connection instead of
+    opening throwaway ones);
+  - gzip/deflate negotiated explicitly (requests decodes the body);
+  - a default (connect, read) timeout for calls that pass none;
+  - per-host request metrics shared by every session of the process:
+    requests, errors, status codes, latency to the response headers,
+    wire bytes. log_metrics() writes
+    them at the end of a run.
+
+Tests and dry runs can point every session at a local stub server with
+HTTP_TRANSPORT_STUB_URL=http://127.0.0.1:8765 (or create_session(stub_url=...)):
+scheme and host are replaced, path and query are kept, and the original host
+is sent as X-Original-Host so one stub can serve several APIs.
+
+Public API
+----------
+  STUB_ENV_VAR, DEFAULT_TIMEOUT
+  create_session(pool_size=10, timeout=DEFAULT_TIMEOUT, auth=None, headers=None, stub_url=None) -> requests.Session
+  metrics_snapshot() -> {host: {...}}
+  log_metrics(log=print)
+  reset_metrics()
+  RateLimiter(requests_per_second)  .wait()  .defer(seconds, slow_down=1.0)
+"""
+
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+STUB_ENV_VAR = "HTTP_TRANSPORT_STUB_URL"
+# (connect, read) seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (10.0, 60.0)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+# ── Per-host metrics ──────────────────────────────────────────────────────────
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, dict] = defaultdict(lambda: {
+    "requests": 0, "errors": 0, "status": Counter(), "seconds": 0.0, "max_seconds": 0.0, "bytes": 0,
+})
+
+
+def _record(host: str, seconds: float, status: Optional[int] = None, size: int = 0) -> None:
+    with _metrics_lock:
+        m = _metrics[host]
+        m["requests"] += 1
+        m["seconds"] += seconds
+        m["max_seconds"] = max(m["max_seconds"], seconds)
+        m["bytes"] += size
+        if status is None:
+            m["errors"] += 1
+        else:
+            m["status"][status] += 1
+
+
+def metrics_snapshot() -> Dict[str, dict]:
+    """Copy of the per-host metrics collected so far in this process."""
+    with _metrics_lock:
+        return {host: dict(m, status=dict(m["status"])) for host, m in _metrics.items()}
+
+
+def reset_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def log_metrics(log: Callable[[str], None] = print) -> None:
+    """One line per host: requests, connection errors, status codes, mean/max latency, wire MB."""
+    for host, m in sorted(metrics_snapshot().items()):
+        mean = m["seconds"] / m["requests"] if m["requests"] else 0.0
+        statuses = ", ".join(f"{code}: {n}" for code, n in sorted(m["status"].items()))
+        log(f"HTTP {host}: {m['requests']:,} requests, {m['errors']} connection errors, "
+            f"status {{{statuses}}}, latency mean {mean:.2f}s max {m['max_seconds']:.2f}s, "
+            f"{m['bytes'] / 1e6:.1f} MB received")
+
+
+# ── Adapter ───────────────────────────────────────────────────────────────────
+
+class _TransportAdapter(HTTPAdapter):
+    """HTTPAdapter with a default timeout, optional stub redirection and metrics."""
+
+    def __init__(self, pool_size: int, timeout: Timeout, stub_url: Optional[str]):
+        self.timeout = timeout
+        self.stub = urlsplit(stub_url) if stub_url else None
+        super().__init__(pool_maxsize=pool_size, pool_block=True)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        host = urlsplit(request.url).netloc
+        if self.stub:
+            parts = urlsplit(request.url)
+            request.url = urlunsplit((self.stub.scheme, self.stub.netloc, parts.path, parts.query, parts.fragment))
+            request.headers["X-Original-Host"] = host
+        start = time.perf_counter()
+        try:
+            response = super().send(request, timeout=timeout, **kwargs)
+        except Exception:
+            _record(host, time.perf_counter() - start)
+            raise
+        # Content-Length is the size on the wire (compressed when gzip was negotiated)
+        size = int(response.headers.get("Content-Length") or 0)
+        _record(host, time.perf_counter() - start, response.status_code, size)
+        return response
+
+
+def create_session(
+    pool_size: int = 10,
+    timeout: Timeout = DEFAULT_TIMEOUT,
+    auth=None,
+    headers: Optional[Dict[str, str]] = None,
+    stub_url: Optional[str] = None,
+) -> requests.Session:
+    """
+    requests.Session with a keep-alive pool of pool_size connections per host
+    (use the number of threads that share the session), gzip negotiation and
+    a default timeout. stub_url (default: $HTTP_TRANSPORT_STUB_URL) sends every
+    request to a local stub server instead.
+    """
+    session = requests.Session()
+    adapter = _TransportAdapter(max(1, pool_size), timeout, stub_url or os.environ.get(STUB_ENV_VAR) or None)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    if headers:
+        session.headers.update(headers)
+    if auth is not None:
+        session.auth = auth
+    return session
+
+
+# ── Request pacing ────────────────────────────────────────────────────────────
+
+class RateLimiter:
+    """Thread-safe spacing of API requests across all fetch threads."""
+
+    def __init__(self, requests_per_second: Optional[float]):
+        self.interval = 1.0 / requests_per_second if requests_per_second and requests_per_second > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Reserve the next request slot and sleep until it comes."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def defer(self, seconds: float, slow_down: float = 1.0) -> None:
+        """
+        Hold back every thread's next request for the given time (retry backoff,
+        429 Retry-After), then space requests slow_down times further apart.
+        """
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+            self.interval *= slow_down
@@ -0,0 +1,229 @@
+"""
+incremental_refresh.py — Replace only the changed keys of a derived table
+=========================================================================
+Gold tables keyed by prontuario used to be rebuilt whole (or kept as views
+recomputed on every read) although a pipeline run touches few patients.
+refresh_by_key() keeps a materialised table in step with a source query:
+
+  - the source query and the table are compared per key: row count plus an
+    order-independent hash of the rows;
+  - the rows of the keys that changed, appeared or disappeared are deleted
+    and re-inserted from the query, in one transaction;
+  - the table is recreated from the query when it does not exist, its
+    columns differ from the query's, a full refresh is forced
+    (BUILD_CACHE_FORCE=1 / force=True), or more than full_share of the keys
+    changed.
+
+With order_by the table is written sorted, so DuckDB's per-row-group min/max
+(zone maps) prune scans filtered on those columns. Rows inserted by an
+incremental refresh are sorted among themselves and appended at the end;
+when more than full_share of the table was appended that way since the last
+full refresh, the next refresh recreates it to restore the order.
+
+Each refresh is recorded in main._incremental_refresh of the table's
+database (when, how, how many keys) and in the table comment, so readers
+can check how fresh the table is:
+
+    SELECT refreshed_at, mode FROM main._incremental_refresh WHERE target_table = 'gold.x'
+
+The key column must not be NULL.
+
+Public API
+----------
+  RefreshResult(mode, reason, changed_keys, total_keys, deleted, inserted)
+  refresh_by_key(con, target, source_sql, key, order_by=None, force=None, full_share=0.5, log=logger.info)
+      -> RefreshResult
+  last_refresh(con, target) -> Optional[dict]
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import duckdb
+
+from commons import build_cache
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TABLE = "_incremental_refresh"
+_SOURCE_VIEW = "_incremental_refresh_source"
+_CHANGED_TABLE = "_incremental_refresh_changed"
+
+
+@dataclass
+class RefreshResult:
+    mode: str  # 'full', 'incremental' or 'unchanged'
+    reason: str
+    changed_keys: int
+    total_keys: int
+    deleted: int
+    inserted: int
+
+
+def _refresh_table(target: str) -> str:
+    """The record lives in the target's database: 'db.gold.t' -> 'db.main._incremental_refresh'."""
+    parts = target.split(".")
+    catalog = parts[0] + "." if len(parts) == 3 else ""
+    return f"{catalog}main.{REFRESH_TABLE}"
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    try:
+        con.execute(f"SELECT 1 FROM {table} LIMIT 0")
+        return True
+    except duckdb.CatalogException:
+        return False
+
+
+def _columns(con: duckdb.DuckDBPyConnection, relation: str) -> List[Tuple[str, str]]:
+    return [(row[0], row[1]) for row in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()]
+
+
+def last_refresh(con: duckdb.DuckDBPyConnection, target: str) -> Optional[dict]:
+    """The last refresh record of target, or None."""
+    refresh_table = _refresh_table(target)
+    if not _table_exists(con, refresh_table):
+        return None
+    row = con.execute(
+        f"SELECT refreshed_at, mode, changed_keys, total_keys, rows_since_full FROM {refresh_table} "
+        f"WHERE target_table = ?",
+        [target],
+    ).fetchone()
+    if row is None:
+        return None
+    return {"refreshed_at": row[0], "mode": row[1], "changed_keys": row[2], "total_keys": row[3],
+            "rows_since_full": row[4]}
+
+
+def _record(con: duckdb.DuckDBPyConnection, target: str, result: RefreshResult, rows_since_full: int):
+    refresh_table = _refresh_table(target)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {refresh_table} (
+            target_table VARCHAR PRIMARY KEY,
+            refreshed_at TIMESTAMP,
+            mode VARCHAR,
+            changed_keys BIGINT,
+            total_keys BIGINT,
+            rows_since_full BIGINT
+        )
+    """)
+    con.execute(
+        f"INSERT OR REPLACE INTO {refresh_table} VALUES (?, CURRENT_TIMESTAMP, ?, ?, ?, ?)",
+        [target, result.mode, result.changed_keys, result.total_keys, rows_since_full],
+    )
+    refreshed_at = con.execute(f"SELECT refreshed_at FROM {refresh_table} WHERE target_table = ?",
+                               [target]).fetchone()[0]
+    comment = f"refreshed {refreshed_at:%Y-%m-%d %H:%M:%S} ({result.mode}, {result.changed_keys} keys changed)"
+    con.execute(f"COMMENT ON TABLE {target} IS '{comment}'")
+
+
+def _row_hash(alias: str, columns: Sequence[str]) -> str:
+    return "hash(" + ", ".join(f'{alias}."{c}"' for c in columns) + ")"
+
+
+def _diff_keys(con: duckdb.DuckDBPyConnection, target: str, key: str, columns: Sequence[str]) -> Tuple[int, int]:
+    """Materialise the keys whose rows differ between the source view and target; returns (changed, total)."""
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {_CHANGED_TABLE} AS
+        WITH new_rows AS (
+            SELECT {key}, COUNT(*) AS n_rows, SUM({_row_hash('s', columns)}) AS rows_hash
+            FROM {_SOURCE_VIEW} s
+            GROUP BY {key}
+        ),
+        old_rows AS (
+            SELECT {key}, COUNT(*) AS n_rows, SUM({_row_hash('t', columns)}) AS rows_hash
+            FROM {target} t
+            GROUP BY {key}
+        )
+        SELECT {key}, n.{key} IS NULL AS removed, o.{key} IS NULL AS added
+        FROM new_rows n
+        FULL OUTER JOIN old_rows o USING ({key})
+        WHERE n.n_rows IS DISTINCT FROM o.n_rows
+           OR n.rows_hash IS DISTINCT FROM o.rows_hash
+    """)
+    changed, added, removed = con.execute(
+        f"SELECT COUNT(*), COUNT(*) FILTER (added), COUNT(*) FILTER (removed) FROM {_CHANGED_TABLE}"
+    ).fetchone()
+    total = con.execute(
+        f"SELECT COUNT(*) FROM (SELECT {key} FROM {_SOURCE_VIEW} UNION SELECT {key} FROM {target})"
+    ).fetchone()[0]
+    logger.info(f"{target}: {changed:,} of {total:,} {key} values changed "
+                f"({added:,} new, {removed:,} gone, {changed - added - removed:,} modified)")
+    return changed, total
+
+
+def refresh_by_key(
+    con: duckdb.DuckDBPyConnection,
+    target: str,
+    source_sql: str,
+    key: str,
+    order_by: Optional[str] = None,
+    force: Optional[bool] = None,
+    full_share: float = 0.5,
+    log: Callable[[str], None] = logger.info,
+) -> RefreshResult:
+    """
+    Bring target in line with source_sql (a SELECT), replacing only the rows
+    of the key values whose rows changed. order_by (e.g. 'prontuario,
+    event_date') sorts what is written. Returns what was done.
+    """
+    force = build_cache.force_requested() if force is None else force
+    con.execute(f"CREATE OR REPLACE TEMP VIEW {_SOURCE_VIEW} AS {source_sql}")
+    order = f" ORDER BY {order_by}" if order_by else ""
+    previous = last_refresh(con, target)
+    t0 = time.perf_counter()
+    try:
+        reason, changed, total = None, 0, 0
+        if force:
+            reason = "full refresh forced"
+        elif not _table_exists(con, target):
+            reason = "table does not exist"
+        elif _columns(con, target) != _columns(con, _SOURCE_VIEW):
+            reason = "columns changed"
+        else:
+            changed, total = _diff_keys(con, target, key, [c for c, _ in _columns(con, _SOURCE_VIEW)])
+            if total and changed > full_share * total:
+                reason = f"{changed / total:.0%} of the {key} values changed"
+            elif order_by and changed and previous is not None:
+                n_rows = con.execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0]
+                if n_rows and previous["rows_since_full"] > full_share * n_rows:
+                    reason = f"{previous['rows_since_full']:,} rows appended out of order since the last full refresh"
+
+        if reason is not None:
+            log(f"Recreating {target} ({reason})")
+            con.execute(f"CREATE OR REPLACE TABLE {target} AS SELECT * FROM {_SOURCE_VIEW}{order}")
+            inserted = con.execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0]
+            n_keys = con.execute(f"SELECT COUNT(DISTINCT {key}) FROM {target}").fetchone()[0]
+            result = RefreshResult("full", reason, changed or n_keys, total or n_keys, 0, inserted)
+            rows_since_full = 0
+        elif changed == 0:
+            log(f"{target}: no {key} changed; table left as is")
+            result = RefreshResult("unchanged", "no changes", 0, total, 0, 0)
+            rows_since_full = previous["rows_since_full"] if previous else 0
+        else:
+            con.execute("BEGIN TRANSACTION")
+            try:
+                deleted = con.execute(
+                    f"DELETE FROM {target} WHERE {key} IN (SELECT {key} FROM {_CHANGED_TABLE})"
+                ).fetchone()[0]
+                inserted = con.execute(f"""
+                    INSERT INTO {target}
+                    SELECT s.* FROM {_SOURCE_VIEW} s
+                    SEMI JOIN {_CHANGED_TABLE} c USING ({key}){order}
+                """).fetchone()[0]
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            log(f"{target}: replaced the rows of {changed:,} {key} values "
+                f"(deleted {deleted:,}, inserted {inserted:,})")
+            result = RefreshResult("incremental", "changed keys", changed, total, deleted, inserted)
+            rows_since_full = (previous["rows_since_full"] if previous else 0) + inserted
+        _record(con, target, result, rows_since_full)
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {_CHANGED_TABLE}")
+        con.execute(f"DROP VIEW IF EXISTS {_SOURCE_VIEW}")
+    log(f"{target} refreshed in {time.perf_counter() - t0:.1f}s ({result.mode})")
+    return result
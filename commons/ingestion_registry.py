@@ -0,0 +1,162 @@
+"""
+ingestion_registry.py — Skip unchanged source files in the bronze loaders
+=========================================================================
+The Excel/CSV loaders used to re-read every input file on every run, and
+some re-hashed every row to find out nothing had changed. The registry
+keeps one record per source file in main._ingestion_registry of the
+target database:
+
+    source_path, size, mtime, content_hash, target_tables, n_rows, ingested_at
+
+check() decides before the file is parsed:
+  - unchanged: size and mtime match the record (nothing is read), or they
+    differ but the content hash matches, e.g. a file copied again with a new
+    mtime. In that case the record's size and mtime are refreshed;
+  - otherwise the file is new, changed, or its target tables are gone, and
+    the loader re-reads it. Loaders that keep several files in one table use
+    replace_file_rows() to delete only that file's previous rows before
+    inserting the new ones.
+
+BUILD_CACHE_FORCE=1 (00_run_pipeline_dag.py --force) reloads every file.
+
+Public API
+----------
+  FileStatus(path, size, mtime, content_hash, record, unchanged, reason)
+  content_hash(path) -> str
+  check(con, path) -> FileStatus
+  record(con, status, tables, rows)
+  replace_file_rows(con, table, file_name, file_column='file_name') -> deleted rows
+  forget_missing(con, existing_paths, under) -> records dropped for files no longer on disk
+"""
+
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+import duckdb
+
+from commons import build_cache
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TABLE = "main._ingestion_registry"
+_HASH_CHUNK = 1024 * 1024
+
+
+@dataclass
+class FileStatus:
+    path: str
+    size: int
+    mtime: float
+    content_hash: Optional[str]
+    record: Optional[dict]
+    unchanged: bool
+    reason: str
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    try:
+        con.execute(f"SELECT 1 FROM {table} LIMIT 0")
+        return True
+    except duckdb.CatalogException:
+        return False
+
+
+def _ensure_registry(con: duckdb.DuckDBPyConnection):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+            source_path VARCHAR PRIMARY KEY,
+            size BIGINT,
+            mtime DOUBLE,
+            content_hash VARCHAR,
+            target_tables VARCHAR,
+            n_rows BIGINT,
+            ingested_at TIMESTAMP
+        )
+    """)
+
+
+def _previous(con: duckdb.DuckDBPyConnection, path: str) -> Optional[dict]:
+    if not _table_exists(con, REGISTRY_TABLE):
+        return None
+    row = con.execute(
+        f"SELECT size, mtime, content_hash, target_tables, n_rows, ingested_at FROM {REGISTRY_TABLE} "
+        f"WHERE source_path = ?",
+        [path],
+    ).fetchone()
+    if row is None:
+        return None
+    return {"size": row[0], "mtime": row[1], "content_hash": row[2], "tables": json.loads(row[3]),
+            "rows": row[4], "ingested_at": row[5]}
+
+
+def check(con: duckdb.DuckDBPyConnection, path: str) -> FileStatus:
+    """Compare path with its registry record without parsing it (hashing only when size/mtime moved)."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    previous = _previous(con, path)
+
+    def status(unchanged, reason, digest=None):
+        return FileStatus(path, stat.st_size, stat.st_mtime, digest, previous, unchanged, reason)
+
+    if build_cache.force_requested():
+        return status(False, "forced")
+    if previous is None:
+        return status(False, "new file")
+    missing = [t for t in previous["tables"] if not _table_exists(con, t)]
+    if missing:
+        return status(False, f"target table missing: {', '.join(missing)}")
+    if previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+        return status(True, "size and mtime unchanged")
+
+    digest = content_hash(path)
+    if digest != previous["content_hash"]:
+        return status(False, "content changed", digest)
+    # Same bytes with a new mtime (copied or re-saved unchanged): remember the new mtime
+    con.execute(f"UPDATE {REGISTRY_TABLE} SET size = ?, mtime = ? WHERE source_path = ?",
+                [stat.st_size, stat.st_mtime, path])
+    return status(True, "content unchanged (mtime moved)", digest)
+
+
+def record(con: duckdb.DuckDBPyConnection, status: FileStatus, tables: Sequence[str], rows: int):
+    """Register a successful load of status.path into tables."""
+    _ensure_registry(con)
+    digest = status.content_hash or content_hash(status.path)
+    con.execute(
+        f"INSERT OR REPLACE INTO {REGISTRY_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [status.path, status.size, status.mtime, digest, json.dumps(list(tables)), rows, dt.datetime.now()],
+    )
+
+
+def replace_file_rows(con: duckdb.DuckDBPyConnection, table: str, file_name: str,
+                      file_column: str = "file_name") -> int:
+    """Delete the rows a previous load of file_name left in table; returns the number deleted."""
+    if not _table_exists(con, table):
+        return 0
+    return con.execute(f'DELETE FROM {table} WHERE "{file_column}" = ?', [file_name]).fetchone()[0]
+
+
+def forget_missing(con: duckdb.DuckDBPyConnection, existing_paths: Iterable[str], under: str) -> int:
+    """Drop records of files below directory `under` that are no longer in existing_paths."""
+    if not _table_exists(con, REGISTRY_TABLE):
+        return 0
+    under = os.path.join(os.path.abspath(under), "")
+    keep = {os.path.abspath(p) for p in existing_paths}
+    stale = [p for (p,) in con.execute(
+        f"SELECT source_path FROM {REGISTRY_TABLE} WHERE starts_with(source_path, ?)", [under]).fetchall()
+        if p not in keep]
+    for path in stale:
+        con.execute(f"DELETE FROM {REGISTRY_TABLE} WHERE source_path = ?", [path])
+    return len(stale)
@@ -0,0 +1,397 @@
+"""
+pipeline_dag.py — Table-level DAG orchestrator for the pipeline scripts
+========================================================================
+Replaces the sequential .bat chains with a dependency graph built from the
+tables each script reads and writes.
+
+Each Stage declares its script plus input/output table references of the form
+"<db>:<schema>.<table>" (or "<db>:<schema>.*" for a whole schema), where <db>
+is an alias from the `databases` mapping. Dependencies are inferred in
+declaration order: a stage depends on every earlier stage whose outputs it
+reads (read-after-write), or that reads or writes one of its own outputs
+(write-after-read / write-after-write). Extra ordering can be forced with
+`after`.
+
+Scheduling rules:
+  - A stage starts once all its dependencies succeeded.
+  - DuckDB allows a single writing process per file, so two stages that touch
+    the same database (or share an explicit `locks` entry) never run at the
+    same time. Independent branches on different databases/sources run
+    concurrently (up to max_workers).
+  - A stage is skipped when its input fingerprints (row count + order-
+    independent row hash), script content and arguments match its last
+    successful run and its outputs still exist. Stages without declared table
+    inputs (source extractions) or marked always_run (they also read files,
+    APIs or per-clinic databases that are not fingerprinted) always run.
+    Stages that update one of their inputs in place record the fingerprint
+    taken after their run, so they are not re-triggered by their own write.
+  - When a stage fails, its downstream stages are marked blocked; independent
+    branches keep running.
+
+State (fingerprints, last durations) is kept in a JSON file next to the
+databases. At the end of a run the per-stage durations and the critical path
+are logged.
+
+Public API
+----------
+  Stage(name, script, args, inputs, outputs, after, locks, cwd, always_run)
+  PipelineDAG(stages, databases, repo_root, state_path)
+      .select(patterns, downstream=False) -> list of stage names
+      .run(selected=None, max_workers=4, force=False, dry_run=False) -> {name: status}
+"""
+
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import duckdb
+
+from commons import build_cache
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# Stage statuses
+SUCCESS = "success"
+SKIPPED = "skipped"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+@dataclass
+class Stage:
+    """One pipeline script and the tables it reads and writes."""
+    name: str
+    script: str                        # path relative to the repo root
+    args: Union[Sequence[str], Callable[[], Optional[Sequence[str]]]] = ()  # callable: resolved at run time, None = nothing to do
+    inputs: Sequence[str] = ()         # "<db>:<schema>.<table>" or "<db>:<schema>.*"
+    outputs: Sequence[str] = ()
+    after: Sequence[str] = ()          # explicit extra dependencies (stage names)
+    locks: Sequence[str] = ()          # extra exclusive resources (e.g. an API or per-clinic DBs)
+    cwd: Optional[str] = None          # relative to the repo root; defaults to the script directory
+    always_run: bool = False
+    deps: List[str] = field(default_factory=list, init=False)
+
+
+def parse_ref(ref: str) -> Tuple[str, str, str]:
+    """'lake:gold.data_ploidia' -> ('lake', 'gold', 'data_ploidia')."""
+    db, _, qualified = ref.partition(":")
+    schema, _, table = qualified.partition(".")
+    if not db or not schema or not table:
+        raise ValueError(f"Invalid table reference '{ref}' (expected <db>:<schema>.<table>)")
+    return db, schema, table
+
+
+def _refs_overlap(a: str, b: str) -> bool:
+    db_a, schema_a, table_a = parse_ref(a)
+    db_b, schema_b, table_b = parse_ref(b)
+    return db_a == db_b and schema_a == schema_b and (table_a == table_b or "*" in (table_a, table_b))
+
+
+def _any_overlap(refs_a: Sequence[str], refs_b: Sequence[str]) -> bool:
+    return any(_refs_overlap(a, b) for a in refs_a for b in refs_b)
+
+
+def _file_sha1(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def table_fingerprint(con: duckdb.DuckDBPyConnection, schema: str, table: str) -> str:
+    """Cheap content fingerprint: row count + order-independent row hash sum."""
+    return build_cache.table_fingerprint(con, f'"{schema}"."{table}"')
+
+
+def _schema_tables(con: duckdb.DuckDBPyConnection, schema: str) -> List[str]:
+    rows = con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = ? ORDER BY table_name",
+        [schema],
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+class PipelineDAG:
+    def __init__(self, stages: Sequence[Stage], databases: Dict[str, str], repo_root: str, state_path: str):
+        self.repo_root = repo_root
+        self.databases = {alias: os.path.join(repo_root, path) for alias, path in databases.items()}
+        self.state_path = state_path
+        self.stages: Dict[str, Stage] = {}
+        self._state_lock = threading.Lock()
+
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name '{stage.name}'")
+            for ref in list(stage.inputs) + list(stage.outputs):
+                db, _, _ = parse_ref(ref)
+                if db not in self.databases:
+                    raise ValueError(f"Stage '{stage.name}' references unknown database '{db}'")
+            deps = []
+            for prev in self.stages.values():
+                if (_any_overlap(stage.inputs, prev.outputs)
+                        or _any_overlap(stage.outputs, prev.inputs)
+                        or _any_overlap(stage.outputs, prev.outputs)
+                        or prev.name in stage.after):
+                    deps.append(prev.name)
+            unknown = set(stage.after) - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' must be declared after {sorted(unknown)}")
+            stage.deps = deps
+            self.stages[stage.name] = stage
+
+    # ── Graph helpers ────────────────────────────────────────────────────────
+
+    def resources(self, stage: Stage) -> set:
+        # Keyed by file, so two aliases of the same database still exclude each other
+        dbs = {parse_ref(ref)[0] for ref in list(stage.inputs) + list(stage.outputs)}
+        files = {os.path.normcase(os.path.abspath(self.databases[db])) for db in dbs}
+        return {f"db:{path}" for path in files} | {f"lock:{name}" for name in stage.locks}
+
+    def downstream(self, names: Sequence[str]) -> List[str]:
+        selected = set(names)
+        for stage in self.stages.values():  # declaration order is topological
+            if any(dep in selected for dep in stage.deps):
+                selected.add(stage.name)
+        return [name for name in self.stages if name in selected]
+
+    def select(self, patterns: Sequence[str], downstream: bool = False) -> List[str]:
+        """Stage names matching any glob pattern (optionally with everything downstream)."""
+        names = [name for name in self.stages if any(fnmatch.fnmatch(name, p) for p in patterns)]
+        if not names:
+            raise ValueError(f"No stage matches {list(patterns)}")
+        return self.downstream(names) if downstream else names
+
+    def critical_path(self, durations: Dict[str, float], names: Sequence[str]) -> Tuple[float, List[str]]:
+        """Longest chain of dependent stages (by measured duration) among `names`."""
+        best: Dict[str, Tuple[float, List[str]]] = {}
+        for name in self.stages:
+            if name not in names:
+                continue
+            prev = max((best[d] for d in self.stages[name].deps if d in best), default=(0.0, []), key=lambda x: x[0])
+            best[name] = (prev[0] + durations.get(name, 0.0), prev[1] + [name])
+        return max(best.values(), default=(0.0, []), key=lambda x: x[0])
+
+    # ── State / fingerprints ─────────────────────────────────────────────────
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read DAG state %s (%s); all stages will run", self.state_path, e)
+            return {}
+        return state.get("stages", {}) if state.get("version") == STATE_VERSION else {}
+
+    def _save_state(self, stage_state: dict) -> None:
+        with self._state_lock:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": STATE_VERSION, "stages": stage_state}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.state_path)
+
+    def _expand_refs(self, refs: Sequence[str]) -> Dict[str, List[Tuple[str, str]]]:
+        by_db: Dict[str, List[Tuple[str, str]]] = {}
+        for ref in refs:
+            db, schema, table = parse_ref(ref)
+            by_db.setdefault(db, []).append((schema, table))
+        return by_db
+
+    def input_fingerprint(self, stage: Stage, args: Sequence[str]) -> Optional[str]:
+        """Fingerprint of script, args and input tables; None when any input is unavailable."""
+        parts = {
+            "script": _file_sha1(os.path.join(self.repo_root, stage.script)),
+            "args": list(args),
+            "inputs": {},
+        }
+        for db, refs in self._expand_refs(stage.inputs).items():
+            path = self.databases[db]
+            if not os.path.exists(path):
+                return None
+            with duckdb.connect(path, read_only=True) as con:
+                for schema, table in refs:
+                    tables = _schema_tables(con, schema) if table == "*" else [table]
+                    if not tables:
+                        return None
+                    for t in tables:
+                        try:
+                            parts["inputs"][f"{db}:{schema}.{t}"] = table_fingerprint(con, schema, t)
+                        except duckdb.CatalogException:
+                            return None
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def outputs_exist(self, stage: Stage) -> bool:
+        for db, refs in self._expand_refs(stage.outputs).items():
+            path = self.databases[db]
+            if not os.path.exists(path):
+                return False
+            with duckdb.connect(path, read_only=True) as con:
+                for schema, table in refs:
+                    existing = _schema_tables(con, schema)
+                    if (table == "*" and not existing) or (table != "*" and table not in existing):
+                        return False
+        return True
+
+    # ── Execution ────────────────────────────────────────────────────────────
+
+    def _run_script(self, stage: Stage, args: Sequence[str], force: bool = False) -> int:
+        script_path = os.path.join(self.repo_root, stage.script)
+        cwd = os.path.join(self.repo_root, stage.cwd) if stage.cwd is not None else os.path.dirname(script_path)
+        env = dict(os.environ)
+        if force:
+            # Also bypass the per-table build cache inside the scripts
+            env[build_cache.FORCE_ENV_VAR] = "1"
+        res = subprocess.run(
+            [sys.executable, script_path, *args],
+            cwd=cwd, env=env, capture_output=True, text=True, encoding="utf-8", errors="replace",
+        )
+        if res.returncode == 0:
+            for line in res.stdout.split("\n")[-10:]:
+                if line:
+                    logger.info("  [%s][STDOUT] %s", stage.name, line)
+        else:
+            logger.error("[%s] failed with exit code %d. Error output:\n%s",
+                         stage.name, res.returncode, res.stderr[-5000:])
+        return res.returncode
+
+    def _fingerprint(self, stage: Stage, args: Sequence[str]) -> Optional[str]:
+        try:
+            return self.input_fingerprint(stage, args)
+        except Exception as e:
+            logger.warning("[%s] Could not fingerprint inputs (%s)", stage.name, e)
+            return None
+
+    def _execute(self, stage: Stage, prev: dict, force: bool) -> Tuple[str, float, dict]:
+        t_start = time.perf_counter()
+        args = stage.args() if callable(stage.args) else list(stage.args)
+        if args is None:
+            logger.info("[%s] Nothing to do; skipped", stage.name)
+            return SKIPPED, time.perf_counter() - t_start, prev
+
+        cacheable = bool(stage.inputs) and not stage.always_run
+        fingerprint = self._fingerprint(stage, args) if cacheable else None
+        if (not force and fingerprint is not None and prev.get("fingerprint") == fingerprint
+                and self.outputs_exist(stage)):
+            logger.info("[%s] Inputs unchanged since %s; skipped (last run took %.1fs)",
+                        stage.name, prev.get("finished_at"), prev.get("duration_s", 0.0))
+            return SKIPPED, time.perf_counter() - t_start, prev
+
+        logger.info("[%s] Starting %s %s", stage.name, stage.script, " ".join(args))
+        try:
+            returncode = self._run_script(stage, args, force)
+        except Exception as e:
+            logger.error("[%s] Could not start: %s", stage.name, e)
+            returncode = -1
+        duration = time.perf_counter() - t_start
+        if returncode != 0:
+            return FAILED, duration, prev
+
+        if cacheable and _any_overlap(stage.inputs, stage.outputs):
+            # Updated its own input: remember the post-run state instead
+            fingerprint = self._fingerprint(stage, args)
+        record = {
+            "fingerprint": fingerprint,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "duration_s": round(duration, 2),
+        }
+        logger.info("[%s] Completed in %.1fs", stage.name, duration)
+        return SUCCESS, duration, record
+
+    def run(self, selected: Optional[Sequence[str]] = None, max_workers: int = 4,
+            force: bool = False, dry_run: bool = False) -> Dict[str, str]:
+        names = [n for n in self.stages if selected is None or n in selected]
+        state = self._load_state()
+
+        if dry_run:
+            for name in names:
+                stage = self.stages[name]
+                deps = [d for d in stage.deps if d in names]
+                logger.info("%-40s after %-50s resources %s", name, ",".join(deps) or "-",
+                            ",".join(sorted(self.resources(stage))))
+            return {}
+
+        status: Dict[str, str] = {}
+        durations: Dict[str, float] = {}
+        pending = list(names)
+        held: set = set()
+        running = {}
+        t_run = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                # Block stages whose dependencies failed (dependencies outside the selection count as done)
+                for name in list(pending):
+                    bad = [d for d in self.stages[name].deps if status.get(d) in (FAILED, BLOCKED)]
+                    if bad:
+                        logger.warning("[%s] Blocked by failed dependency %s", name, ", ".join(bad))
+                        status[name] = BLOCKED
+                        pending.remove(name)
+
+                for name in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    stage = self.stages[name]
+                    if any(d in pending or d in running.values() for d in stage.deps):
+                        continue
+                    needed = self.resources(stage)
+                    if needed & held:
+                        continue
+                    held |= needed
+                    pending.remove(name)
+                    future = pool.submit(self._execute, stage, state.get(name, {}), force)
+                    running[future] = name
+
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Deadlock: cannot schedule {pending}")
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    held -= self.resources(self.stages[name])
+                    try:
+                        result, duration, record = future.result()
+                    except Exception as e:
+                        logger.exception("[%s] Orchestrator error: %s", name, e)
+                        result, duration, record = FAILED, 0.0, state.get(name, {})
+                    status[name] = result
+                    durations[name] = duration
+                    if result == SUCCESS:
+                        state[name] = record
+                        self._save_state(state)
+
+        wall = time.perf_counter() - t_run
+        self._log_summary(names, status, durations, wall)
+        return status
+
+    def _log_summary(self, names, status, durations, wall) -> None:
+        logger.info("=" * 70)
+        logger.info("%-40s %-8s %10s", "stage", "status", "seconds")
+        for name in names:
+            logger.info("%-40s %-8s %10.1f", name, status.get(name, "-"), durations.get(name, 0.0))
+        path_secs, path = self.critical_path(durations, names)
+        logger.info("-" * 70)
+        logger.info("Wall time: %.1fs | sum of stages: %.1fs | critical path: %.1fs",
+                    wall, sum(durations.values()), path_secs)
+        logger.info("Critical path: %s", " -> ".join(path) or "-")
+        counts = {s: sum(1 for v in status.values() if v == s) for s in (SUCCESS, SKIPPED, FAILED, BLOCKED)}
+        logger.info("Stages: %d succeeded, %d skipped, %d failed, %d blocked",
+                    counts[SUCCESS], counts[SKIPPED], counts[FAILED], counts[BLOCKED])
+        logger.info("=" * 70)
@@ -0,0 +1,194 @@
+"""
+prontuario_link_matching.py — Match source ids against every view_pacientes link column in one pass
+=======================================================================================================
+The finops silver scripts resolve a prontuario from a source id column
+(Cliente, Paciente, Cliente_totvs) by looking the id up in codigo and in the
+14 prontuario_* link columns of clinisys_all.silver.view_pacientes, then
+keeping the candidates whose first names agree.
+
+Mesclada used to do it with a 15-way UNION of joins per step, executed once per
+step and once more per step for inactive patients. Diario (one step, active
+patients only) still runs its single UNION query: there the per-row ranking
+below is slower (0.6-0.7x on synthetic data, same result). Here the link columns are
+unpivoted once into a long index
+
+    (link_value, codigo, role, link_score, esposa_first, marido_first, inativo)
+
+every step's source ids are stacked into one long table, the two meet in a single
+equi-join on link_value, and one window ranking per row picks the winner:
+
+    active before inactive, then step order, then name score + link score,
+    then the lowest prontuario.
+
+Scores and labels are those of the old SQL: link_score is 1 for codigo ('main'),
+3 for prontuario_esposa, ... 29 for prontuario_marido_ba; name_score is 0 when
+both first names agree with the couple and 2 when one does. A candidate needs
+at least one first-name agreement. match_type is '<step label>_<role>', e.g.
+'paciente_esposa_pel' or 'prontuario_main'.
+
+A candidate is an (id, Nome, Nom Paciente) name pair of the source whose first
+names agree with a patient linked to the id. A step without name_field
+(as in diario) assigns per id: every row with the id gets the best candidate of any
+of its name pairs. A step with name_field (mesclada) assigns per row: the
+first name in the row's name_field must be one of the two first names of a
+candidate pair of its id. That is the old rule, except that the old SQL only
+looked at one arbitrarily chosen pair per (id, patient) and so left some rows
+unmatched.
+
+Only rows whose prontuario is still -1 are considered.
+
+Public API
+----------
+  LINK_ROLES
+  MatchStep(label, column, name_field=None)
+  build_link_index(con, patients='clinisys_all.silver.view_pacientes', include_inactive=True) -> rows
+  match_prontuarios(con, table, steps, include_inactive=True, build_index=True) -> {match_type: rows}
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+# (view_pacientes column, role label), in priority order; link_score = 2 * position + 1
+LINK_ROLES = [
+    ("codigo", "main"),
+    ("prontuario_esposa", "esposa"),
+    ("prontuario_marido", "marido"),
+    ("prontuario_responsavel1", "responsavel1"),
+    ("prontuario_responsavel2", "responsavel2"),
+    ("prontuario_esposa_pel", "esposa_pel"),
+    ("prontuario_marido_pel", "marido_pel"),
+    ("prontuario_esposa_pc", "esposa_pc"),
+    ("prontuario_marido_pc", "marido_pc"),
+    ("prontuario_responsavel1_pc", "responsavel1_pc"),
+    ("prontuario_responsavel2_pc", "responsavel2_pc"),
+    ("prontuario_esposa_fc", "esposa_fc"),
+    ("prontuario_marido_fc", "marido_fc"),
+    ("prontuario_esposa_ba", "esposa_ba"),
+    ("prontuario_marido_ba", "marido_ba"),
+]
+
+INDEX_TABLE = "_prontuario_link_index"
+_SOURCE_TABLE = "_prontuario_link_source"
+_BEST_TABLE = "_prontuario_link_best"
+
+
+@dataclass
+class MatchStep:
+    """
+    label:      match_type prefix ('paciente' -> 'paciente_main', 'paciente_esposa', ...)
+    column:     source id column, matched numerically against the link columns
+    name_field: per-row check (the first name in this field must appear in a matching
+                name pair of the id); None assigns the best match of the id to all its rows
+    """
+    label: str
+    column: str
+    name_field: Optional[str] = None
+
+
+def _first_name(expr: str) -> str:
+    return f"strip_accents(LOWER(SPLIT_PART(TRIM({expr}), ' ', 1)))"
+
+
+def build_link_index(
+    con: duckdb.DuckDBPyConnection,
+    patients: str = "clinisys_all.silver.view_pacientes",
+    include_inactive: bool = True,
+) -> int:
+    """Unpivot codigo and the prontuario_* link columns of patients into the temp link index."""
+    links = ",\n                ".join(f"TRY_CAST({column} AS BIGINT) AS {role}" for column, role in LINK_ROLES)
+    roles = ", ".join(role for _, role in LINK_ROLES)
+    scores = ", ".join(f"('{role}', {2 * i + 1})" for i, (_, role) in enumerate(LINK_ROLES))
+    inactive_filter = "IN (0, 1)" if include_inactive else "= 0"
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {INDEX_TABLE} AS
+        WITH patients AS (
+            SELECT
+                codigo AS prontuario,
+                TRY_CAST(inativo AS INTEGER) AS inativo,
+                {_first_name('esposa_nome')} AS esposa_first,
+                {_first_name('marido_nome')} AS marido_first,
+                {links}
+            FROM {patients}
+            WHERE codigo IS NOT NULL
+              AND TRY_CAST(inativo AS INTEGER) {inactive_filter}
+        )
+        SELECT u.link_value, u.prontuario, u.role, s.link_score, u.esposa_first, u.marido_first, u.inativo
+        FROM (UNPIVOT patients ON {roles} INTO NAME role VALUE link_value) u
+        JOIN (VALUES {scores}) s(role, link_score) USING (role)
+    """)
+    n_rows = con.execute(f"SELECT COUNT(*) FROM {INDEX_TABLE}").fetchone()[0]
+    logger.info(f"Link index: {n_rows:,} (link value, patient) rows")
+    return n_rows
+
+
+def match_prontuarios(
+    con: duckdb.DuckDBPyConnection,
+    table: str,
+    steps: Sequence[MatchStep],
+    include_inactive: bool = True,
+    build_index: bool = True,
+) -> Dict[str, int]:
+    """
+    Fill prontuario = -1 rows of table from the link index in one ranked pass.
+    Returns the number of rows updated per match_type.
+    """
+    if build_index:
+        build_link_index(con, include_inactive=include_inactive)
+
+    source = "\n            UNION ALL\n            ".join(
+        f"""SELECT rowid AS row_id, {i} AS step_no, '{step.label}' AS label,
+                   TRY_CAST("{step.column}" AS BIGINT) AS link_value,
+                   {_first_name('"Nome"')} AS nome_first,
+                   {_first_name('"Nom Paciente"')} AS nom_paciente_first,
+                   {'TRUE' if step.name_field else 'FALSE'} AS row_level,
+                   {_first_name(f'"{step.name_field}"') if step.name_field else 'NULL'} AS row_name
+            FROM {table}
+            WHERE prontuario = -1 AND TRY_CAST("{step.column}" AS BIGINT) IS NOT NULL"""
+        for i, step in enumerate(steps, 1)
+    )
+
+    try:
+        con.execute(f"CREATE OR REPLACE TEMP TABLE {_SOURCE_TABLE} AS\n            {source}")
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {_BEST_TABLE} AS
+            WITH name_pairs AS (
+                SELECT DISTINCT step_no, label, link_value, nome_first, nom_paciente_first
+                FROM {_SOURCE_TABLE}
+            ),
+            pair_matches AS (
+                SELECT n.*, i.prontuario, i.inativo, i.role, i.link_score,
+                       CASE WHEN (n.nome_first = i.esposa_first AND n.nom_paciente_first = i.marido_first)
+                              OR (n.nom_paciente_first = i.esposa_first AND n.nome_first = i.marido_first)
+                            THEN 0 ELSE 2 END AS name_score
+                FROM name_pairs n
+                JOIN {INDEX_TABLE} i USING (link_value)
+                WHERE n.nome_first IN (i.esposa_first, i.marido_first)
+                   OR n.nom_paciente_first IN (i.esposa_first, i.marido_first)
+            )
+            SELECT s.row_id, m.prontuario, m.label || '_' || m.role AS match_type
+            FROM {_SOURCE_TABLE} s
+            JOIN pair_matches m
+              ON s.step_no = m.step_no AND s.link_value = m.link_value
+             AND (NOT s.row_level OR s.row_name IN (m.nome_first, m.nom_paciente_first))
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY s.row_id
+                ORDER BY m.inativo, s.step_no, m.name_score + m.link_score, m.prontuario
+            ) = 1
+        """)
+        con.execute(f"""
+            UPDATE {table} SET prontuario = b.prontuario
+            FROM {_BEST_TABLE} b
+            WHERE {table}.rowid = b.row_id
+        """)
+        counts = dict(con.execute(
+            f"SELECT match_type, COUNT(*) FROM {_BEST_TABLE} GROUP BY match_type ORDER BY 2 DESC"
+        ).fetchall())
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {_SOURCE_TABLE}")
+        con.execute(f"DROP TABLE IF EXISTS {_BEST_TABLE}")
+    return counts
@@ -26,6 +26,26 @@ Public API
   suffix=""   → production mode: only updates the bare `prontuario` column.
   suffix="_L" → benchmark mode: also adds `clinisys_name_L` and
                 `clinisys_matched_name_L` columns.
+
+  find_prontuarios_batch(source_con, clinisys_db_path, sources, suffix)
+
+  Matches many source tables (possibly in different attached databases) in
+  one pass: unique identity tuples are scored once, results are scattered
+  back with one UPDATE per source. Each source must target a different
+  table. Returns {label: DataFrame}.
+
+  Scored candidates are cached per source identity tuple and Clinisys index
+  version in prontuario_match_cache.duckdb (next to clinisys_all.duckdb), so
+  reruns only score tuples that were not seen before (use_cache=False to
+  disable).
+
+  build_matching_index(clinisys_db_path)
+
+  Materialises the unpivoted, tokenised and norm_name-normalised Clinisys
+  candidates into clinisys_all.silver.prontuario_matching_index (run once
+  after the Clinisys silver refresh). find_prontuarios reuses it whenever its
+  version matches the current silver.view_pacientes; otherwise it falls back
+  to building the candidates on the fly.
 """
 
 import os
@@ -40,145 +60,36 @@ logger = logging.getLogger(__name__)
 def _t(label: str, start: float) -> None:
     logger.info("  [T] %-40s %6.0f ms", label, (time.perf_counter() - start) * 1000)
 
-def find_prontuarios(
-    source_con: duckdb.DuckDBPyConnection,
-    clinisys_db_path: str,
-    source_schema: str,
-    source_table: str,
-    id_col: str,
-    name_col: str = None,
-    birthdate_col: str = None,
-    cpf_col: str = None,
-    label: str = "",
-    suffix: str = "",
-) -> pd.DataFrame:
-    """
-    Runs Strategy L patient matching on the source table.
-    Updates the table in-place by adding/updating target columns.
 
-    Parameters
-    ----------
-    suffix : str
-        Column suffix.  "" (empty) for production — only `prontuario` is written.
-        Use e.g. "_L" for benchmarking to also write clinisys_name and
-        clinisys_matched_name columns.
-
-    Returns
-    -------
-    pd.DataFrame with columns: source_id, patient_name, prontuario,
-        clinisys_name, clinisys_matched_name, match_tier, name_score.
-    """
-    tag = label or f"{source_schema}.{source_table}"
-    t_start = time.perf_counter()
-    logger.info("[%s] Starting Strategy L matching", tag)
+# Bump whenever the candidate parsing / normalisation below changes, so that
+# existing persisted indexes are treated as stale.
+MATCHING_INDEX_VERSION = 1
+MATCHING_INDEX_TABLE = "silver.prontuario_matching_index"
+MATCHING_INDEX_META_TABLE = "silver.prontuario_matching_index_meta"
 
-    target_pront_col = f"prontuario{suffix}"
-    if suffix:
-        target_name_col = f"clinisys_name{suffix}"
-        target_matched_name_col = f"clinisys_matched_name{suffix}"
-    else:
-        target_name_col = None
-        target_matched_name_col = None
+INVALID_CPFS = (
+    "'00000000000', '11111111111', '22222222222', '33333333333', '44444444444', "
+    "'55555555555', '66666666666', '77777777777', '88888888888', '99999999999'"
+)
 
-    # ── 1. Attach Clinisys DB ──────────────────────────────────────────────────
-    try:
-        source_con.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
-        logger.info("[%s] Attached clinisys_all", tag)
-    except Exception as e:
-        if "already attached" in str(e).lower():
-            logger.info("[%s] clinisys_all already attached", tag)
-        else:
-            raise
 
-    # 1b. Detect original prontuario column for tie-breaker
-    cols_df = source_con.execute(f"PRAGMA table_info('{source_schema}.\"{source_table}\"')").df()
-    col_names = {c.lower() for c in cols_df["name"]}
+# Incremental match cache: accepted candidates per source identity tuple,
+# valid for one Clinisys index version. Lives in its own database so every
+# pipeline (including in-memory batch connections) shares it.
+MATCH_CACHE_DB_NAME = "prontuario_match_cache.duckdb"
+MATCH_CACHE_KEYS_TABLE = "match_cache.main.match_cache_keys"
+MATCH_CACHE_CANDIDATES_TABLE = "match_cache.main.match_cache_candidates"
 
-    if "prontuario_old" in col_names:
-        orig_pront_col = "prontuario_old"
-    elif "prontuario" in col_names:
-        orig_pront_col = "prontuario"
-    else:
-        orig_pront_col = "NULL"
+# Hash of the normalised source identity tuple (id, name, birthdate, cpf);
+# JSON keeps NULL distinct from the string 'NULL'.
+TUPLE_HASH_SQL = (
+    "md5(CAST(to_json([source_id, patient_name, CAST(src_birthdate AS VARCHAR), src_cpf]) AS VARCHAR))"
+)
 
-    orig_pront_select = (
-        f'TRY_CAST("{orig_pront_col}" AS BIGINT)'
-        if orig_pront_col != "NULL"
-        else "CAST(NULL AS BIGINT)"
-    )
 
-    # ── 2. Build input SELECT expressions ────────────────────────────────────
-    name_select = f'"{name_col}"' if name_col else "CAST(NULL AS VARCHAR)"
-    birthdate_select = (
-        f'TRY_CAST("{birthdate_col}" AS DATE)' if birthdate_col else "CAST(NULL AS DATE)"
-    )
-    if cpf_col:
-        cpf_select = f"""
-            CASE
-                WHEN length(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g')) < 9 THEN NULL
-                WHEN lpad(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g'), 11, '0') IN (
-                    '00000000000', '11111111111', '22222222222', '33333333333', '44444444444',
-                    '55555555555', '66666666666', '77777777777', '88888888888', '99999999999'
-                ) THEN NULL
-                ELSE lpad(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g'), 11, '0')
-            END
-        """
-    else:
-        cpf_select = "CAST(NULL AS VARCHAR)"
-
-    if name_col:
-        p_words_select = f"""
-            list_filter(
-                regexp_split_to_array(
-                    regexp_replace(
-                        strip_accents(
-                            lower(
-                                trim(
-                                    CASE
-                                        WHEN "{name_col}" IS NOT NULL THEN
-                                            CASE
-                                                WHEN POSITION(',' IN "{name_col}") > 0 THEN
-                                                    SPLIT_PART("{name_col}", ',', 2) || ' ' || SPLIT_PART("{name_col}", ',', 1)
-                                                ELSE "{name_col}"
-                                            END
-                                        ELSE NULL
-                                    END
-                                )
-                            )
-                        ),
-                        '[^a-z]', ' ', 'g'
-                    ),
-                    '\\s+'
-                ),
-                w -> length(w) > 0
-            )
-        """
-        p_full_select = f"""
-            regexp_replace(
-                strip_accents(
-                    lower(
-                        trim(
-                            CASE
-                                WHEN "{name_col}" IS NOT NULL THEN
-                                    CASE
-                                        WHEN POSITION(',' IN "{name_col}") > 0 THEN
-                                            SPLIT_PART("{name_col}", ',', 2) || ' ' || SPLIT_PART("{name_col}", ',', 1)
-                                        ELSE "{name_col}"
-                                    END
-                                ELSE NULL
-                            END
-                        )
-                    )
-                ),
-                '[^a-z]', ' ', 'g'
-            )
-        """
-    else:
-        p_words_select = "CAST([] AS VARCHAR[])"
-        p_full_select = "CAST(NULL AS VARCHAR)"
-
-    # ── 3. Phonetic normalisation macro ──────────────────────────────────────
-    source_con.execute("""
+def _create_norm_name_macro(con: duckdb.DuckDBPyConnection) -> None:
+    """Phonetic normalisation macro used on first names (source and Clinisys)."""
+    con.execute("""
         CREATE OR REPLACE TEMPORARY MACRO norm_name(w) AS (
             replace(
                 replace(
@@ -226,91 +137,16 @@ def find_prontuarios(
         );
     """)
 
-    # ── 4. Extract & pre-normalise source records ─────────────────────────────
-    t0 = time.perf_counter()
-    source_con.execute(f"""
-        CREATE OR REPLACE TEMP TABLE __source_extract AS
-        WITH raw_extract AS (
-            SELECT DISTINCT
-                CAST("{id_col}" AS VARCHAR) AS source_id,
-                TRY_CAST("{id_col}" AS BIGINT) AS source_id_numeric,
-                {name_select} AS patient_name,
-                {birthdate_select} AS src_birthdate,
-                {cpf_select} AS src_cpf,
-                {orig_pront_select} AS original_prontuario,
-                {p_words_select} AS p_words,
-                {p_full_select} AS p_full
-            FROM {source_schema}."{source_table}"
-            WHERE "{id_col}" IS NOT NULL AND TRIM(CAST("{id_col}" AS VARCHAR)) != ''
-        )
-        SELECT *,
-               CASE WHEN len(p_words) > 0 THEN norm_name(p_words[1]) ELSE NULL END AS norm_p_w1
-        FROM raw_extract;
-    """)
-    _t("Extract and clean source records", t0)
-
-    # ── 5. Name scoring macro (Strategy L rules) ──────────────────────────────
-    source_con.execute("""
-        CREATE OR REPLACE TEMPORARY MACRO score_name(p_w, c_w, norm_p_w1, norm_c_w1, p_full, c_full, is_direct_id) AS (
-            CASE
-                WHEN p_w IS NULL OR len(p_w) = 0 THEN 1
-                WHEN c_w IS NULL OR len(c_w) = 0 THEN 5
-                WHEN p_w = c_w THEN 1
-                WHEN NOT (
-                    -- Rule 1: Exact first name match
-                    list_contains(c_w, p_w[1]) OR
-
-                    -- Rule 2: First name spelling tolerance (Levenshtein <= 1) with gender safeguards
-                    (
-                        norm_p_w1 IS NOT NULL AND norm_c_w1 IS NOT NULL AND
-                        levenshtein(norm_p_w1, norm_c_w1) <= 1 AND
-                        NOT (
-                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'a') OR
-                            (right(norm_p_w1, 1) = 'a' AND right(norm_c_w1, 1) = 'o') OR
-                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'e') OR
-                            (right(norm_p_w1, 1) = 'e' AND right(norm_c_w1, 1) = 'o') OR
-                            (right(norm_p_w1, 2) = 'an' AND right(norm_c_w1, 2) = 'ne') OR
-                            (right(norm_p_w1, 2) = 'ne' AND right(norm_c_w1, 2) = 'an') OR
-                            (right(norm_p_w1, 3) = 'dre' AND right(norm_c_w1, 3) = 'dra') OR
-                            (right(norm_p_w1, 3) = 'dra' AND right(norm_c_w1, 3) = 'dre') OR
-                            norm_c_w1 = norm_p_w1 || 'a' OR
-                            norm_p_w1 = norm_c_w1 || 'a'
-                        )
-                    ) OR
-
-                    -- Rule 3: First-name spelling tolerance (Levenshtein = 2) if last name matches exactly
-                    (
-                        norm_p_w1 IS NOT NULL AND norm_c_w1 IS NOT NULL AND
-                        levenshtein(norm_p_w1, norm_c_w1) = 2 AND
-                        list_contains(c_w, p_w[-1]) AND
-                        NOT (
-                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'a') OR
-                            (right(norm_p_w1, 1) = 'a' AND right(norm_c_w1, 1) = 'o') OR
-                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'e') OR
-                            (right(norm_p_w1, 1) = 'e' AND right(norm_c_w1, 1) = 'o')
-                        )
-                    ) OR
 
-                    -- Rule 4: Couple/spousal folder fallback (direct ID only)
-                    (
-                        is_direct_id AND
-                        p_full IS NOT NULL AND c_full IS NOT NULL AND
-                        jaro_winkler_similarity(p_full, c_full) >= 0.72 AND
-                        len(list_filter(p_w, w -> w NOT IN ('de', 'da', 'do', 'dos', 'das', 'e', 'a', 'o') AND list_contains(c_w, w))) >= 2
-                    )
-                ) THEN 5
-                WHEN list_contains(c_w, p_w[-1]) THEN 2
-                WHEN len(list_filter(p_w, w -> list_contains(c_w, w))) > 1 THEN 3
-                ELSE 4
-            END
-        );
-    """)
+def _discover_clinisys_schema(con: duckdb.DuckDBPyConnection, view_pacientes: str, tag: str) -> dict:
+    """
+    Discover patient roles and prontuario link columns of view_pacientes.
 
-    # ── 6. Discover Clinisys schema ───────────────────────────────────────────
-    t0 = time.perf_counter()
-    cols_df = source_con.execute("PRAGMA table_info('clinisys_all.silver.view_pacientes')").df()
+    Returns a dict with clinisys_cols, roles_config, prefixes_list, pront_cols.
+    """
+    cols_df = con.execute(f"PRAGMA table_info('{view_pacientes}')").df()
     clinisys_cols = {c.lower() for c in cols_df["name"]}
-    logger.info("[%s] Discovered %d columns in clinisys_all.silver.view_pacientes", tag, len(clinisys_cols))
+    logger.info("[%s] Discovered %d columns in %s", tag, len(clinisys_cols), view_pacientes)
 
     discovered_prefixes = set()
     for col in clinisys_cols:
@@ -334,26 +170,24 @@ def find_prontuarios(
     pront_cols = sorted([col for col in clinisys_cols if col.startswith("prontuario")])
     logger.info("[%s] Found prontuario link columns: %s", tag, pront_cols)
 
-    # ── 7. Build candidate filter & unpivot ───────────────────────────────────
-    cand_conditions = [
-        "codigo IN (SELECT source_id_numeric FROM __source_extract WHERE source_id_numeric IS NOT NULL)"
-    ]
-    for col in pront_cols:
-        if col == "prontuario":
-            continue
-        cand_conditions.append(
-            f"TRY_CAST(\"{col}\" AS BIGINT) IN (SELECT source_id_numeric FROM __source_extract WHERE source_id_numeric IS NOT NULL)"
-        )
-    for role_key, config in ROLES_CONFIG.items():
-        prefix = config["prefix"]
-        cpf_col_name = f"{prefix}_cpf"
-        if cpf_col_name in clinisys_cols:
-            cand_conditions.append(
-                f"lpad(regexp_replace(\"{cpf_col_name}\", '[^0-9]', '', 'g'), 11, '0') IN (SELECT src_cpf FROM __source_extract WHERE src_cpf IS NOT NULL AND length(src_cpf) = 11)"
-            )
+    return {
+        "clinisys_cols": clinisys_cols,
+        "roles_config": ROLES_CONFIG,
+        "prefixes_list": sorted(list(discovered_prefixes)),
+        "pront_cols": pront_cols,
+    }
 
-    cand_where = "\n           OR ".join(cand_conditions)
-    prefixes_list = sorted(list(discovered_prefixes))
+
+def _parsed_candidates_sql(schema: dict, candidates_relation: str, tag: str) -> str:
+    """
+    SELECT that unpivots patients of `candidates_relation` into one row per
+    (patient, link_id, role) and pre-parses every name (words, normalised
+    first word, full string) for scoring.
+    """
+    clinisys_cols = schema["clinisys_cols"]
+    ROLES_CONFIG = schema["roles_config"]
+    prefixes_list = schema["prefixes_list"]
+    pront_cols = schema["pront_cols"]
 
     def get_role_select_exprs(prefix, link_id_col, priority_group, matched_role):
         cpf_col_name = f"{prefix}_cpf"
@@ -401,7 +235,7 @@ def find_prontuarios(
         if f"{prefix}_nome" in clinisys_cols:
             union_parts.append(
                 get_role_select_exprs(prefix, "codigo", 1, config["role_name"])
-                + "FROM __clinisys_candidates"
+                + f"FROM {candidates_relation}"
             )
     for col in pront_cols:
         if col == "prontuario":
@@ -417,7 +251,7 @@ def find_prontuarios(
             role = matched_config["role_name"]
             union_parts.append(
                 get_role_select_exprs(prefix, f"TRY_CAST(\"{col}\" AS BIGINT)", pg, role)
-                + f"FROM __clinisys_candidates WHERE \"{col}\" IS NOT NULL"
+                + f"FROM {candidates_relation} WHERE \"{col}\" IS NOT NULL"
             )
         else:
             logger.warning("[%s] Prontuario link column %s did not match any known role. Skipping.", tag, col)
@@ -437,20 +271,11 @@ def find_prontuarios(
 
     parsed_cols_sql = ", ".join(parsed_cols)
 
-    source_con.execute(f"""
-        CREATE OR REPLACE TEMP TABLE __clinisys_candidate_codigos AS
-        SELECT codigo FROM clinisys_all.silver.view_pacientes
-        WHERE {cand_where};
-
-        CREATE OR REPLACE TEMP TABLE __clinisys_candidates AS
-        SELECT * FROM clinisys_all.silver.view_pacientes
-        WHERE codigo IN (SELECT codigo FROM __clinisys_candidate_codigos);
-
-        CREATE OR REPLACE TEMP TABLE __clinisys_unpivoted AS
-        {unpivoted_union_sql};
-
-        CREATE OR REPLACE TEMP TABLE __clinisys_parsed AS
-        WITH raw_parsed AS (
+    return f"""
+        WITH unpivoted AS (
+            {unpivoted_union_sql}
+        ),
+        raw_parsed AS (
             SELECT
                 prontuario,
                 link_id,
@@ -458,10 +283,7 @@ def find_prontuarios(
                 matched_role,
                 CASE
                     WHEN length(regexp_replace(matched_cpf, '[^0-9]', '', 'g')) < 9 THEN NULL
-                    WHEN matched_cpf IN (
-                        '00000000000', '11111111111', '22222222222', '33333333333', '44444444444',
-                        '55555555555', '66666666666', '77777777777', '88888888888', '99999999999'
-                    ) THEN NULL
+                    WHEN matched_cpf IN ({INVALID_CPFS}) THEN NULL
                     ELSE matched_cpf
                 END AS matched_cpf,
                 matched_birthdate,
@@ -469,34 +291,522 @@ def find_prontuarios(
                 inativo,
                 list_filter(regexp_split_to_array(regexp_replace(strip_accents(lower(trim(matched_name))), '[^a-z]', ' ', 'g'), '\\s+'), w -> length(w) > 0) AS c_words,
                 {parsed_cols_sql}
-            FROM __clinisys_unpivoted
+            FROM unpivoted
         )
         SELECT *,
                CASE WHEN len(c_words) > 0 THEN norm_name(c_words[1]) ELSE NULL END AS norm_c_w1,
                regexp_replace(strip_accents(lower(trim(matched_name))), '[^a-z]', ' ', 'g') AS c_full
-        FROM raw_parsed;
+        FROM raw_parsed
+    """
+
+
+def clinisys_fingerprint(con: duckdb.DuckDBPyConnection, view_pacientes: str) -> str:
+    """Cheap content fingerprint of view_pacientes: row count + order-independent row hash sum."""
+    n_rows, hash_sum = con.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(hash(p)), 0) FROM {view_pacientes} p"
+    ).fetchone()
+    return f"{n_rows}-{hash_sum}"
+
+
+def _index_version(fingerprint: str) -> str:
+    return f"v{MATCHING_INDEX_VERSION}-{fingerprint}"
+
+
+def build_matching_index(clinisys_db_path: str) -> str:
+    """
+    Build (or rebuild) the persistent Clinisys matching index inside
+    clinisys_all.duckdb. Skips the rebuild when the stored version already
+    matches the current silver.view_pacientes.
+
+    Returns
+    -------
+    The index version string.
+    """
+    tag = "matching_index"
+    t_start = time.perf_counter()
+    with duckdb.connect(clinisys_db_path) as con:
+        fingerprint = clinisys_fingerprint(con, "silver.view_pacientes")
+        version = _index_version(fingerprint)
+
+        existing = con.execute(f"""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = 'silver' AND table_name = '{MATCHING_INDEX_META_TABLE.split('.')[1]}'
+        """).fetchone()[0]
+        if existing:
+            row = con.execute(f"SELECT version FROM {MATCHING_INDEX_META_TABLE}").fetchone()
+            if row and row[0] == version:
+                logger.info("[%s] Index is up to date (%s), skipping rebuild", tag, version)
+                return version
+
+        logger.info("[%s] Building %s (%s)", tag, MATCHING_INDEX_TABLE, version)
+        _create_norm_name_macro(con)
+        schema = _discover_clinisys_schema(con, "silver.view_pacientes", tag)
+
+        t0 = time.perf_counter()
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {MATCHING_INDEX_TABLE} AS
+            {_parsed_candidates_sql(schema, "silver.view_pacientes", tag)}
+        """)
+        _t("Unpivot and parse all Clinisys patients", t0)
+
+        t0 = time.perf_counter()
+        con.execute(f"CREATE INDEX idx_prontuario_matching_index_link_id ON {MATCHING_INDEX_TABLE}(link_id)")
+        con.execute(f"CREATE INDEX idx_prontuario_matching_index_matched_cpf ON {MATCHING_INDEX_TABLE}(matched_cpf)")
+        _t("Create link_id / matched_cpf indexes", t0)
+
+        n_rows = con.execute(f"SELECT COUNT(*) FROM {MATCHING_INDEX_TABLE}").fetchone()[0]
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {MATCHING_INDEX_META_TABLE} AS
+            SELECT
+                '{version}' AS version,
+                '{','.join(schema['prefixes_list'])}' AS role_prefixes,
+                {n_rows} AS n_rows,
+                CURRENT_TIMESTAMP AS built_at
+        """)
+
+    logger.info("[%s] Built %s with %d rows in %.1f seconds",
+                tag, MATCHING_INDEX_TABLE, n_rows, time.perf_counter() - t_start)
+    return version
+
+
+def _attach_match_cache(con: duckdb.DuckDBPyConnection, cache_db_path: str, tag: str) -> bool:
+    """Attach (and create if needed) the match cache database. Returns False if it is unavailable."""
+    try:
+        con.execute(f"ATTACH '{cache_db_path}' AS match_cache")
+    except Exception as e:
+        if "already attached" not in str(e).lower() and "already exists" not in str(e).lower():
+            logger.warning("[%s] Match cache unavailable (%s); scoring all tuples", tag, e)
+            return False
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MATCH_CACHE_KEYS_TABLE} (
+            tuple_hash VARCHAR,
+            index_version VARCHAR,
+            cached_at TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS {MATCH_CACHE_CANDIDATES_TABLE} (
+            tuple_hash VARCHAR,
+            prontuario BIGINT,
+            esposa_nome VARCHAR,
+            matched_name VARCHAR,
+            match_tier INTEGER,
+            inativo VARCHAR,
+            link_id BIGINT,
+            priority_group INTEGER,
+            best_name_score INTEGER,
+            index_version VARCHAR
+        );
+    """)
+    logger.info("[%s] Attached match cache %s", tag, cache_db_path)
+    return True
+
+
+def _load_current_index(con: duckdb.DuckDBPyConnection, tag: str):
+    """
+    Return (version, prefixes_list) of clinisys_all's persisted matching index
+    if it exists and matches the current view_pacientes, else (version, None).
+    """
+    fingerprint = clinisys_fingerprint(con, "clinisys_all.silver.view_pacientes")
+    version = _index_version(fingerprint)
+    meta_name = MATCHING_INDEX_META_TABLE.split(".")[1]
+    existing = con.execute(f"""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_catalog = 'clinisys_all' AND table_schema = 'silver' AND table_name = '{meta_name}'
+    """).fetchone()[0]
+    if not existing:
+        logger.warning("[%s] No persisted matching index found; building candidates on the fly "
+                       "(run build_matching_index after the Clinisys silver refresh)", tag)
+        return version, None
+    row = con.execute(f"SELECT version, role_prefixes FROM clinisys_all.{MATCHING_INDEX_META_TABLE}").fetchone()
+    if not row or row[0] != version:
+        logger.warning("[%s] Persisted matching index is stale (%s != %s); building candidates on the fly",
+                       tag, row[0] if row else None, version)
+        return version, None
+    prefixes_list = [p for p in (row[1] or "").split(",") if p]
+    logger.info("[%s] Using persisted matching index %s", tag, version)
+    return version, prefixes_list
+
+def _source_select_exprs(con: duckdb.DuckDBPyConnection, source: dict) -> str:
+    """
+    SELECT list extracting (source_id, patient_name, src_birthdate, src_cpf,
+    original_prontuario) from one source table.
+    """
+    source_schema = source["source_schema"]
+    source_table = source["source_table"]
+    id_col = source["id_col"]
+    name_col = source.get("name_col")
+    birthdate_col = source.get("birthdate_col")
+    cpf_col = source.get("cpf_col")
+
+    # Detect original prontuario column for tie-breaker
+    cols_df = con.execute(f"PRAGMA table_info('{source_schema}.\"{source_table}\"')").df()
+    col_names = {c.lower() for c in cols_df["name"]}
+
+    if "prontuario_old" in col_names:
+        orig_pront_col = "prontuario_old"
+    elif "prontuario" in col_names:
+        orig_pront_col = "prontuario"
+    else:
+        orig_pront_col = "NULL"
+
+    orig_pront_select = (
+        f'TRY_CAST("{orig_pront_col}" AS BIGINT)'
+        if orig_pront_col != "NULL"
+        else "CAST(NULL AS BIGINT)"
+    )
+
+    name_select = f'"{name_col}"' if name_col else "CAST(NULL AS VARCHAR)"
+    birthdate_select = (
+        f'TRY_CAST("{birthdate_col}" AS DATE)' if birthdate_col else "CAST(NULL AS DATE)"
+    )
+    if cpf_col:
+        cpf_select = f"""
+            CASE
+                WHEN length(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g')) < 9 THEN NULL
+                WHEN lpad(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g'), 11, '0') IN ({INVALID_CPFS}) THEN NULL
+                ELSE lpad(regexp_replace(CAST("{cpf_col}" AS VARCHAR), '[^0-9]', '', 'g'), 11, '0')
+            END
+        """
+    else:
+        cpf_select = "CAST(NULL AS VARCHAR)"
+
+    return f"""
+            SELECT DISTINCT
+                {source["source_idx"]} AS source_idx,
+                CAST("{id_col}" AS VARCHAR) AS source_id,
+                TRY_CAST("{id_col}" AS BIGINT) AS source_id_numeric,
+                {name_select} AS patient_name,
+                {birthdate_select} AS src_birthdate,
+                {cpf_select} AS src_cpf,
+                {orig_pront_select} AS original_prontuario
+            FROM {source_schema}."{source_table}"
+            WHERE "{id_col}" IS NOT NULL AND TRIM(CAST("{id_col}" AS VARCHAR)) != ''
+    """
+
+
+def _normalised_name_sql(col: str) -> str:
+    """Lower-cased, accent-free, letters-only name; 'LAST, FIRST' is flipped to 'FIRST LAST'."""
+    return f"""
+            regexp_replace(
+                strip_accents(
+                    lower(
+                        trim(
+                            CASE
+                                WHEN {col} IS NOT NULL THEN
+                                    CASE
+                                        WHEN POSITION(',' IN {col}) > 0 THEN
+                                            SPLIT_PART({col}, ',', 2) || ' ' || SPLIT_PART({col}, ',', 1)
+                                        ELSE {col}
+                                    END
+                                ELSE NULL
+                            END
+                        )
+                    )
+                ),
+                '[^a-z]', ' ', 'g'
+            )
+    """
+
+
+def find_prontuarios_batch(
+    source_con: duckdb.DuckDBPyConnection,
+    clinisys_db_path: str,
+    sources: list,
+    suffix: str = "",
+    use_cache: bool = True,
+    cache_db_path: str = None,
+    block_pruning: bool = True,
+) -> dict:
+    """
+    Runs Strategy L patient matching once for many source tables.
+
+    The distinct (id, name, birthdate, cpf) tuples of every source are
+    unioned, parsed, joined against Clinisys and scored once; the ranking is
+    then done per source (same rules as a single find_prontuarios call) and
+    each source table receives one bulk UPDATE.
+
+    Sources may live in different attached databases (source_schema such as
+    'embryoscope_ibirapuera.silver') and must target different tables: every
+    source reads its original-prontuario tie-breaker before any update is
+    applied. Passes that fill one table in turn (e.g. Paciente, then Cliente
+    for the rows still unmatched) must be separate calls, so each pass ranks
+    against the prontuarios written by the one before. A ValueError is raised
+    when two sources target the same table.
+
+    Parameters
+    ----------
+    sources : list of dict
+        Each dict takes the find_prontuarios arguments: source_schema,
+        source_table, id_col and optionally name_col, birthdate_col, cpf_col,
+        label.
+    suffix : str
+        Column suffix, see find_prontuarios.
+    use_cache : bool
+        Reuse scored candidates of identity tuples already matched against
+        the same Clinisys index version (see MATCH_CACHE_* tables); only
+        unseen tuples are joined and scored.
+    cache_db_path : str
+        Match cache database; defaults to prontuario_match_cache.duckdb next
+        to clinisys_db_path.
+    block_pruning : bool
+        Only run score_name on candidate pairs that share a blocking key
+        (see name_block); pairs outside every block are rejected (score 5)
+        without evaluating Levenshtein / Jaro-Winkler. Decisions are
+        identical either way; False is kept for parity checks.
+
+    Returns
+    -------
+    dict label → pd.DataFrame (same columns as find_prontuarios returns).
+    """
+    sources = [
+        dict(src, source_idx=i, label=src.get("label") or f"{src['source_schema']}.{src['source_table']}")
+        for i, src in enumerate(sources)
+    ]
+    targets = [f'{src["source_schema"]}.{src["source_table"]}'.lower() for src in sources]
+    repeated = sorted({t for t in targets if targets.count(t) > 1})
+    if repeated:
+        raise ValueError(
+            f"find_prontuarios_batch sources must target different tables; {', '.join(repeated)} "
+            "is targeted more than once (match it with sequential find_prontuarios calls)"
+        )
+    labels = [src["label"] for src in sources]
+    tag = labels[0] if len(sources) == 1 else f"batch[{len(sources)}]"
+    t_start = time.perf_counter()
+    logger.info("[%s] Starting Strategy L matching for %s", tag, ", ".join(labels))
+
+    target_pront_col = f"prontuario{suffix}"
+    if suffix:
+        target_name_col = f"clinisys_name{suffix}"
+        target_matched_name_col = f"clinisys_matched_name{suffix}"
+    else:
+        target_name_col = None
+        target_matched_name_col = None
+
+    # ── 1. Attach Clinisys DB ──────────────────────────────────────────────────
+    try:
+        source_con.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
+        logger.info("[%s] Attached clinisys_all", tag)
+    except Exception as e:
+        if "already attached" in str(e).lower() or "already exists" in str(e).lower():
+            logger.info("[%s] clinisys_all already attached", tag)
+        else:
+            raise
+
+    # ── 2. Phonetic normalisation macro ──────────────────────────────────────
+    _create_norm_name_macro(source_con)
+
+    # ── 3. Extract source rows, then pre-normalise the distinct tuples ───────
+    t0 = time.perf_counter()
+    union_sql = "\n            UNION ALL\n".join(_source_select_exprs(source_con, src) for src in sources)
+    source_con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE __source_rows AS
+        SELECT *, {TUPLE_HASH_SQL} AS tuple_hash
+        FROM (
+            {union_sql}
+        );
+
+        CREATE OR REPLACE TEMP TABLE __source_tuples AS
+        SELECT DISTINCT tuple_hash, source_id, source_id_numeric, patient_name, src_birthdate, src_cpf
+        FROM __source_rows;
+    """)
+    n_rows, n_tuples = source_con.execute(
+        "SELECT (SELECT COUNT(*) FROM __source_rows), (SELECT COUNT(*) FROM __source_tuples)"
+    ).fetchone()
+    logger.info("[%s] %d distinct source rows → %d unique identity tuples", tag, n_rows, n_tuples)
+
+    # ── 3b. Skip tuples already scored against this Clinisys index version ──
+    index_version, prefixes_list = _load_current_index(source_con, tag)
+    if use_cache:
+        use_cache = _attach_match_cache(
+            source_con, cache_db_path or os.path.join(os.path.dirname(clinisys_db_path), MATCH_CACHE_DB_NAME), tag
+        )
+    if use_cache:
+        n_purged = source_con.execute(
+            f"DELETE FROM {MATCH_CACHE_KEYS_TABLE} WHERE index_version != ?", [index_version]
+        ).fetchone()[0]
+        source_con.execute(f"DELETE FROM {MATCH_CACHE_CANDIDATES_TABLE} WHERE index_version != ?", [index_version])
+        if n_purged:
+            logger.info("[%s] Match cache: purged %d tuples scored against an older Clinisys index", tag, n_purged)
+        source_con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE __source_todo AS
+            SELECT t.* FROM __source_tuples t
+            ANTI JOIN {MATCH_CACHE_KEYS_TABLE} k
+                   ON k.tuple_hash = t.tuple_hash AND k.index_version = '{index_version}';
+        """)
+    else:
+        source_con.execute("CREATE OR REPLACE TEMP TABLE __source_todo AS SELECT * FROM __source_tuples")
+    n_todo = source_con.execute("SELECT COUNT(*) FROM __source_todo").fetchone()[0]
+    logger.info("[%s] Match cache: %d cached, %d to score", tag, n_tuples - n_todo, n_todo)
+
+    p_full_select = _normalised_name_sql("patient_name")
+    source_con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE __source_extract AS
+        WITH tuples AS (
+            SELECT * FROM __source_todo
+        ),
+        raw_extract AS (
+            SELECT *,
+                   list_filter(regexp_split_to_array({p_full_select}, '\\s+'), w -> length(w) > 0) AS p_words,
+                   {p_full_select} AS p_full
+            FROM tuples
+        )
+        SELECT *,
+               CASE WHEN len(p_words) > 0 THEN norm_name(p_words[1]) ELSE NULL END AS norm_p_w1
+        FROM raw_extract;
+    """)
+    _t("Extract and clean source records", t0)
+
+    # ── 4. Name scoring macro (Strategy L rules) ──────────────────────────────
+    source_con.execute("""
+        CREATE OR REPLACE TEMPORARY MACRO score_name(p_w, c_w, norm_p_w1, norm_c_w1, p_full, c_full, is_direct_id) AS (
+            CASE
+                WHEN p_w IS NULL OR len(p_w) = 0 THEN 1
+                WHEN c_w IS NULL OR len(c_w) = 0 THEN 5
+                WHEN p_w = c_w THEN 1
+                WHEN NOT (
+                    -- Rule 1: Exact first name match
+                    list_contains(c_w, p_w[1]) OR
+
+                    -- Rule 2: First name spelling tolerance (Levenshtein <= 1) with gender safeguards
+                    (
+                        norm_p_w1 IS NOT NULL AND norm_c_w1 IS NOT NULL AND
+                        levenshtein(norm_p_w1, norm_c_w1) <= 1 AND
+                        NOT (
+                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'a') OR
+                            (right(norm_p_w1, 1) = 'a' AND right(norm_c_w1, 1) = 'o') OR
+                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'e') OR
+                            (right(norm_p_w1, 1) = 'e' AND right(norm_c_w1, 1) = 'o') OR
+                            (right(norm_p_w1, 2) = 'an' AND right(norm_c_w1, 2) = 'ne') OR
+                            (right(norm_p_w1, 2) = 'ne' AND right(norm_c_w1, 2) = 'an') OR
+                            (right(norm_p_w1, 3) = 'dre' AND right(norm_c_w1, 3) = 'dra') OR
+                            (right(norm_p_w1, 3) = 'dra' AND right(norm_c_w1, 3) = 'dre') OR
+                            norm_c_w1 = norm_p_w1 || 'a' OR
+                            norm_p_w1 = norm_c_w1 || 'a'
+                        )
+                    ) OR
+
+                    -- Rule 3: First-name spelling tolerance (Levenshtein = 2) if last name matches exactly
+                    (
+                        norm_p_w1 IS NOT NULL AND norm_c_w1 IS NOT NULL AND
+                        levenshtein(norm_p_w1, norm_c_w1) = 2 AND
+                        list_contains(c_w, p_w[-1]) AND
+                        NOT (
+                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'a') OR
+                            (right(norm_p_w1, 1) = 'a' AND right(norm_c_w1, 1) = 'o') OR
+                            (right(norm_p_w1, 1) = 'o' AND right(norm_c_w1, 1) = 'e') OR
+                            (right(norm_p_w1, 1) = 'e' AND right(norm_c_w1, 1) = 'o')
+                        )
+                    ) OR
+
+                    -- Rule 4: Couple/spousal folder fallback (direct ID only)
+                    (
+                        is_direct_id AND
+                        p_full IS NOT NULL AND c_full IS NOT NULL AND
+                        jaro_winkler_similarity(p_full, c_full) >= 0.72 AND
+                        len(list_filter(p_w, w -> w NOT IN ('de', 'da', 'do', 'dos', 'das', 'e', 'a', 'o') AND list_contains(c_w, w))) >= 2
+                    )
+                ) THEN 5
+                WHEN list_contains(c_w, p_w[-1]) THEN 2
+                WHEN len(list_filter(p_w, w -> list_contains(c_w, w))) > 1 THEN 3
+                ELSE 4
+            END
+        );
+    """)
+
+    # ── 4b. Blocking keys: necessary conditions for score_name < 5 ──────────
+    # A pair can only be accepted if it shares a word (rules 1, 3, 4 and
+    # p_w = c_w) or if its normalised first names can be within Levenshtein 1
+    # (rule 2): length bucket differs by <= 1 and, since a single edit cannot
+    # change both ends of a 2+ letter word, the first or last letter agrees.
+    # Empty source names are always accepted.
+    source_con.execute("""
+        CREATE OR REPLACE TEMPORARY MACRO name_block(p_w, c_w, norm_p_w1, norm_c_w1) AS (
+            p_w IS NULL OR len(p_w) = 0 OR (
+                c_w IS NOT NULL AND len(c_w) > 0 AND (
+                    list_has_any(p_w, c_w) OR (
+                        abs(length(norm_p_w1) - length(norm_c_w1)) <= 1 AND (
+                            left(norm_p_w1, 1) = left(norm_c_w1, 1) OR
+                            right(norm_p_w1, 1) = right(norm_c_w1, 1) OR
+                            least(length(norm_p_w1), length(norm_c_w1)) <= 1
+                        )
+                    )
+                )
+            )
+        );
     """)
-    _t("Extract, unpivot, and parse candidates dynamically (with pre-normalization)", t0)
 
-    # ── 8. Hierarchical joins & scoring ──────────────────────────────────────
+    # ── 5. Reuse the persisted matching index when it is current ────────────
+    t0 = time.perf_counter()
+    if prefixes_list is not None:
+        source_con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE __clinisys_parsed AS
+            SELECT * FROM clinisys_all.{MATCHING_INDEX_TABLE}
+            WHERE link_id IN (SELECT source_id_numeric FROM __source_extract WHERE source_id_numeric IS NOT NULL)
+               OR matched_cpf IN (SELECT src_cpf FROM __source_extract WHERE src_cpf IS NOT NULL AND length(src_cpf) = 11);
+        """)
+        _t("Select candidates from persisted matching index", t0)
+    else:
+        # ── 6. Discover schema, filter candidates, unpivot & parse on the fly ──
+        schema = _discover_clinisys_schema(source_con, "clinisys_all.silver.view_pacientes", tag)
+        clinisys_cols = schema["clinisys_cols"]
+        prefixes_list = schema["prefixes_list"]
+
+        cand_conditions = [
+            "codigo IN (SELECT source_id_numeric FROM __source_extract WHERE source_id_numeric IS NOT NULL)"
+        ]
+        for col in schema["pront_cols"]:
+            if col == "prontuario":
+                continue
+            cand_conditions.append(
+                f"TRY_CAST(\"{col}\" AS BIGINT) IN (SELECT source_id_numeric FROM __source_extract WHERE source_id_numeric IS NOT NULL)"
+            )
+        for role_key, config in schema["roles_config"].items():
+            prefix = config["prefix"]
+            cpf_col_name = f"{prefix}_cpf"
+            if cpf_col_name in clinisys_cols:
+                cand_conditions.append(
+                    f"lpad(regexp_replace(\"{cpf_col_name}\", '[^0-9]', '', 'g'), 11, '0') IN (SELECT src_cpf FROM __source_extract WHERE src_cpf IS NOT NULL AND length(src_cpf) = 11)"
+                )
+
+        cand_where = "\n           OR ".join(cand_conditions)
+
+        source_con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE __clinisys_candidate_codigos AS
+            SELECT codigo FROM clinisys_all.silver.view_pacientes
+            WHERE {cand_where};
+
+            CREATE OR REPLACE TEMP TABLE __clinisys_candidates AS
+            SELECT * FROM clinisys_all.silver.view_pacientes
+            WHERE codigo IN (SELECT codigo FROM __clinisys_candidate_codigos);
+
+            CREATE OR REPLACE TEMP TABLE __clinisys_parsed AS
+            {_parsed_candidates_sql(schema, "__clinisys_candidates", tag)};
+        """)
+        _t("Extract, unpivot, and parse candidates dynamically (with pre-normalization)", t0)
+
+    # ── 7. Hierarchical joins & scoring ──────────────────────────────────────
     t0 = time.perf_counter()
     role_names_select = ", ".join([f"c.{pref}_nome" for pref in prefixes_list])
 
+    name_pairs = [("name", "c_words", "norm_c_w1", "c_full")] + [
+        (pref, f"{pref}_words", f"norm_{pref}_w1", f"{pref}_full") for pref in prefixes_list
+    ]
+
     def get_tier_select(tier_num, join_clause, where_clause, is_direct_id: bool):
         is_direct_str = "true" if is_direct_id else "false"
-        score_exprs = [
-            f"score_name(s.p_words, c.c_words, s.norm_p_w1, c.norm_c_w1, s.p_full, c.c_full, {is_direct_str}) AS name_score"
-        ]
-        for pref in prefixes_list:
-            score_exprs.append(
-                f"score_name(s.p_words, c.{pref}_words, s.norm_p_w1, c.norm_{pref}_w1, s.p_full, c.{pref}_full, {is_direct_str}) AS {pref}_score"
-            )
+        score_exprs = []
+        block_exprs = []
+        for pref, c_words, c_norm_w1, c_full in name_pairs:
+            score_sql = f"score_name(s.p_words, c.{c_words}, s.norm_p_w1, c.{c_norm_w1}, s.p_full, c.{c_full}, {is_direct_str})"
+            block_sql = f"name_block(s.p_words, c.{c_words}, s.norm_p_w1, c.{c_norm_w1})"
+            if block_pruning:
+                score_sql = f"CASE WHEN {block_sql} THEN {score_sql} ELSE 5 END"
+            score_exprs.append(f"{score_sql} AS {pref}_score")
+            block_exprs.append(f"CASE WHEN {block_sql} THEN 1 ELSE 0 END")
+        score_exprs.append(f"{' + '.join(block_exprs)} AS pairs_in_block")
         score_exprs_sql = ", ".join(score_exprs)
         return f"""
         SELECT
-            s.source_id,
-            s.patient_name,
-            s.original_prontuario,
+            s.tuple_hash,
             c.prontuario,
             {role_names_select},
             c.matched_name,
@@ -510,7 +820,6 @@ def find_prontuarios(
         {join_clause}
         {where_clause}
         """
-
     tier_1_sql = get_tier_select(
         1, "INNER JOIN __clinisys_parsed c ON s.src_cpf = c.matched_cpf",
         "WHERE s.src_cpf IS NOT NULL AND length(s.src_cpf) = 11", False
@@ -549,9 +858,19 @@ def find_prontuarios(
         UNION ALL
         {tier_3_sql};
     """)
+    pairs_total, pairs_in_block = source_con.execute(
+        f"SELECT COUNT(*) * {len(name_pairs)}, COALESCE(SUM(pairs_in_block), 0) FROM __matches_all"
+    ).fetchone()
+    pairs_scored = pairs_in_block if block_pruning else pairs_total
+    logger.info(
+        "[%s] Name scoring: %d of %d candidate pairs scored (%.1f%% pruned by blocking keys%s)",
+        tag, pairs_scored, pairs_total,
+        (1 - pairs_in_block / pairs_total) * 100 if pairs_total else 0.0,
+        "" if block_pruning else ", pruning disabled",
+    )
     _t("Apply hierarchical joins & score names", t0)
 
-    # ── 9. Rank & select best match per source row ────────────────────────────
+    # ── 8. Rank & select best match per source row ────────────────────────────
     t0 = time.perf_counter()
     least_args = ["COALESCE(name_score, 5)"]
     for pref in prefixes_list:
@@ -563,33 +882,68 @@ def find_prontuarios(
         name_cases.append(f"WHEN {pref}_score < 5 THEN {pref}_nome")
     matched_name_select = f"CASE {' '.join(name_cases)} ELSE matched_name END"
 
+    # Keep only accepted candidates, reduced to the columns the ranking needs
     source_con.execute(f"""
-        CREATE OR REPLACE TEMP TABLE __matches_ranked AS
+        CREATE OR REPLACE TEMP TABLE __match_candidates AS
         SELECT
-            source_id,
-            patient_name,
+            tuple_hash,
             prontuario,
             esposa_nome,
             {matched_name_select} AS matched_name,
             match_tier,
-            {least_expr} AS best_name_score,
-            ROW_NUMBER() OVER (
-                PARTITION BY source_id, patient_name
-                ORDER BY
-                    match_tier ASC,
-                    CASE WHEN COALESCE(inativo, '0') = '0' THEN 0 ELSE 1 END ASC,
-                    CASE WHEN link_id = TRY_CAST(source_id AS BIGINT) THEN 0 ELSE 1 END ASC,
-                    {least_expr} ASC,
-                    priority_group ASC,
-                    CASE WHEN prontuario = original_prontuario THEN 0 ELSE 1 END ASC,
-                    prontuario DESC
-            ) AS rn
+            inativo,
+            link_id,
+            priority_group,
+            {least_expr} AS best_name_score
         FROM __matches_all
         WHERE {least_expr} < 5;
     """)
 
-    df_matched = source_con.execute(f"""
+    if use_cache:
+        source_con.execute(f"""
+            INSERT INTO {MATCH_CACHE_CANDIDATES_TABLE}
+            SELECT *, '{index_version}' FROM __match_candidates;
+
+            INSERT INTO {MATCH_CACHE_KEYS_TABLE}
+            SELECT tuple_hash, '{index_version}', CURRENT_TIMESTAMP FROM __source_todo;
+
+            CREATE OR REPLACE TEMP TABLE __match_candidates AS
+            SELECT c.* EXCLUDE (index_version)
+            FROM {MATCH_CACHE_CANDIDATES_TABLE} c
+            SEMI JOIN __source_tuples t ON t.tuple_hash = c.tuple_hash
+            WHERE c.index_version = '{index_version}';
+        """)
+
+    # Scored tuples are fanned back out to the source rows they came from, so
+    # each source is ranked on its own (and keeps its own tie-breaker).
+    source_con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE __matches_ranked AS
+        SELECT
+            r.source_idx,
+            r.source_id,
+            r.patient_name,
+            m.prontuario,
+            m.esposa_nome,
+            m.matched_name,
+            m.match_tier,
+            m.best_name_score,
+            ROW_NUMBER() OVER (
+                PARTITION BY r.source_idx, r.source_id, r.patient_name
+                ORDER BY
+                    m.match_tier ASC,
+                    CASE WHEN COALESCE(m.inativo, '0') = '0' THEN 0 ELSE 1 END ASC,
+                    CASE WHEN m.link_id = TRY_CAST(r.source_id AS BIGINT) THEN 0 ELSE 1 END ASC,
+                    m.best_name_score ASC,
+                    m.priority_group ASC,
+                    CASE WHEN m.prontuario = r.original_prontuario THEN 0 ELSE 1 END ASC,
+                    m.prontuario DESC
+            ) AS rn
+        FROM __match_candidates m
+        INNER JOIN __source_rows r ON r.tuple_hash = m.tuple_hash;
+
+        CREATE OR REPLACE TEMP TABLE __matches_final AS
         SELECT
+            s.source_idx,
             s.source_id,
             s.patient_name,
             COALESCE(m.prontuario, -1) AS prontuario,
@@ -597,76 +951,150 @@ def find_prontuarios(
             m.matched_name AS clinisys_matched_name,
             m.match_tier,
             m.best_name_score AS name_score
-        FROM (SELECT DISTINCT source_id, patient_name FROM __source_extract) s
+        FROM (SELECT DISTINCT source_idx, source_id, patient_name FROM __source_rows) s
         LEFT JOIN __matches_ranked m
-               ON s.source_id = m.source_id
+               ON s.source_idx = m.source_idx
+              AND s.source_id = m.source_id
               AND s.patient_name IS NOT DISTINCT FROM m.patient_name
               AND m.rn = 1;
-    """).df()
+    """)
     _t("Rank matches and select winners", t0)
 
-    # ── 10. Ensure target columns exist & write results ───────────────────────
-    pront_col_exists = target_pront_col.lower() in col_names
+    # ── 9. Ensure target columns exist & write results (one UPDATE per source) ─
+    t0 = time.perf_counter()
+    results = {}
+    for src in sources:
+        source_schema = src["source_schema"]
+        source_table = src["source_table"]
+        id_col = src["id_col"]
+        name_col = src.get("name_col")
 
-    columns_to_add = [(target_pront_col, "BIGINT")]
-    if suffix:
-        columns_to_add.extend([
-            (target_name_col, "VARCHAR"),
-            (target_matched_name_col, "VARCHAR"),
-        ])
-    for col_name, col_type in columns_to_add:
-        if col_name.lower() not in col_names:
-            logger.info("[%s] Adding column %s (%s) to target table...", tag, col_name, col_type)
-            source_con.execute(
-                f"ALTER TABLE {source_schema}.\"{source_table}\" ADD COLUMN {col_name} {col_type}"
-            )
+        cols_df = source_con.execute(f"PRAGMA table_info('{source_schema}.\"{source_table}\"')").df()
+        col_names = {c.lower() for c in cols_df["name"]}
+        pront_col_exists = target_pront_col.lower() in col_names
 
-    source_con.register("__df_l_temp", df_matched)
+        columns_to_add = [(target_pront_col, "BIGINT")]
+        if suffix:
+            columns_to_add.extend([
+                (target_name_col, "VARCHAR"),
+                (target_matched_name_col, "VARCHAR"),
+            ])
+        for col_name, col_type in columns_to_add:
+            if col_name.lower() not in col_names:
+                logger.info("[%s] Adding column %s (%s) to target table...", src["label"], col_name, col_type)
+                source_con.execute(
+                    f"ALTER TABLE {source_schema}.\"{source_table}\" ADD COLUMN {col_name} {col_type}"
+                )
 
-    where_clause = f"""
-        WHERE target."{id_col}" = m.source_id
-          AND target."{name_col if name_col else 'id'}" IS NOT DISTINCT FROM m.patient_name
-    """
-    if pront_col_exists:
-        where_clause += f'          AND (target."{target_pront_col}" = -1 OR target."{target_pront_col}" IS NULL)'
+        where_clause = f"""
+            WHERE m.source_idx = {src["source_idx"]}
+              AND target."{id_col}" = m.source_id
+              AND target."{name_col if name_col else 'id'}" IS NOT DISTINCT FROM m.patient_name
+        """
+        if pront_col_exists:
+            where_clause += f'          AND (target."{target_pront_col}" = -1 OR target."{target_pront_col}" IS NULL)'
 
-    if suffix:
-        source_con.execute(f"""
-            UPDATE {source_schema}."{source_table}" AS target
-            SET {target_pront_col} = m.prontuario,
-                {target_name_col} = m.clinisys_name,
-                {target_matched_name_col} = m.clinisys_matched_name
-            FROM __df_l_temp m
-            {where_clause};
-        """)
-    else:
-        source_con.execute(f"""
-            UPDATE {source_schema}."{source_table}" AS target
-            SET {target_pront_col} = m.prontuario
-            FROM __df_l_temp m
-            {where_clause};
-        """)
-    logger.info("[%s] Strategy L in-place updates applied to %s.%s", tag, source_schema, source_table)
+        if suffix:
+            source_con.execute(f"""
+                UPDATE {source_schema}."{source_table}" AS target
+                SET {target_pront_col} = m.prontuario,
+                    {target_name_col} = m.clinisys_name,
+                    {target_matched_name_col} = m.clinisys_matched_name
+                FROM __matches_final m
+                {where_clause};
+            """)
+        else:
+            source_con.execute(f"""
+                UPDATE {source_schema}."{source_table}" AS target
+                SET {target_pront_col} = m.prontuario
+                FROM __matches_final m
+                {where_clause};
+            """)
+        logger.info("[%s] Strategy L in-place updates applied to %s.%s", src["label"], source_schema, source_table)
 
-    # ── 11. Cleanup temp objects ──────────────────────────────────────────────
+        df_matched = source_con.execute(f"""
+            SELECT source_id, patient_name, prontuario, clinisys_name,
+                   clinisys_matched_name, match_tier, name_score
+            FROM __matches_final
+            WHERE source_idx = {src["source_idx"]}
+        """).df()
+        n_matched = len(df_matched[df_matched["prontuario"] != -1])
+        total = len(df_matched)
+        logger.info(
+            "[%s] Strategy L: %d/%d matched (%.2f%%)",
+            src["label"], n_matched, total,
+            (n_matched / total * 100) if total else 0.0,
+        )
+        results[src["label"]] = df_matched
+    _t("Write results to source tables", t0)
+
+    # ── 10. Cleanup temp objects ──────────────────────────────────────────────
     try:
         for tbl in [
-            "__source_extract", "__clinisys_candidate_codigos", "__clinisys_candidates",
-            "__clinisys_unpivoted", "__clinisys_parsed", "__matches_all", "__matches_ranked",
-            "__df_l_temp",
+            "__source_rows", "__source_tuples", "__source_todo", "__source_extract",
+            "__clinisys_candidate_codigos", "__clinisys_candidates", "__clinisys_parsed",
+            "__matches_all", "__match_candidates", "__matches_ranked", "__matches_final",
         ]:
             source_con.execute(f"DROP TABLE IF EXISTS {tbl}")
+        if use_cache:
+            source_con.execute("DETACH match_cache")
         source_con.execute("DROP TEMPORARY MACRO IF EXISTS score_name")
+        source_con.execute("DROP TEMPORARY MACRO IF EXISTS name_block")
         source_con.execute("DROP TEMPORARY MACRO IF EXISTS norm_name")
     except Exception:
         pass
 
-    n_matched = len(df_matched[df_matched["prontuario"] != -1])
-    total = len(df_matched)
-    logger.info(
-        "[%s] Strategy L: %d/%d matched (%.2f%%) in %.1f seconds",
-        tag, n_matched, total,
-        (n_matched / total * 100) if total else 0.0,
-        time.perf_counter() - t_start,
+    logger.info("[%s] Strategy L batch finished in %.1f seconds", tag, time.perf_counter() - t_start)
+    return results
+
+
+def find_prontuarios(
+    source_con: duckdb.DuckDBPyConnection,
+    clinisys_db_path: str,
+    source_schema: str,
+    source_table: str,
+    id_col: str,
+    name_col: str = None,
+    birthdate_col: str = None,
+    cpf_col: str = None,
+    label: str = "",
+    suffix: str = "",
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    Runs Strategy L patient matching on the source table.
+    Updates the table in-place by adding/updating target columns.
+    Single-source shortcut for find_prontuarios_batch.
+
+    Parameters
+    ----------
+    suffix : str
+        Column suffix.  "" (empty) for production — only `prontuario` is written.
+        Use e.g. "_L" for benchmarking to also write clinisys_name and
+        clinisys_matched_name columns.
+    use_cache : bool
+        Reuse cached scores for identity tuples seen before (see
+        find_prontuarios_batch).
+
+    Returns
+    -------
+    pd.DataFrame with columns: source_id, patient_name, prontuario,
+        clinisys_name, clinisys_matched_name, match_tier, name_score.
+    """
+    tag = label or f"{source_schema}.{source_table}"
+    results = find_prontuarios_batch(
+        source_con,
+        clinisys_db_path,
+        [{
+            "source_schema": source_schema,
+            "source_table": source_table,
+            "id_col": id_col,
+            "name_col": name_col,
+            "birthdate_col": birthdate_col,
+            "cpf_col": cpf_col,
+            "label": tag,
+        }],
+        suffix=suffix,
+        use_cache=use_cache,
     )
-    return df_matched
+    return results[tag]
@@ -0,0 +1,355 @@
+"""
+query_profiler.py — Opt-in DuckDB query profiling for pipeline runs
+===================================================================
+Most SQL stages only log wall time, which says a stage got slower but not
+which join did. With profiling on, every statement executed through a
+duckdb_manager connection is run with DuckDB's profiler and its JSON plan
+(operators with timing and output cardinality) is saved next to the run log:
+
+    <script>_<timestamp>.log
+    <script>_<timestamp>_profiles/
+        0001_<database>.json     one DuckDB JSON profile per statement
+        statements.jsonl         seq, file, query, latency, rows per statement
+        summary.txt              written (and logged) when the script exits
+
+The summary lists the slowest statements, the top operators by time and by
+rows, and the joins whose output is much larger than their largest input
+(row explosions). `diff` compares two runs statement by statement, so a
+slowdown after a schema or data change can be attributed to an operator.
+
+Turn it on with DUCKDB_PROFILE=1 (00_run_pipeline_dag.py --profile sets it for
+every stage) or `duckdb_profiling: true` in a params.yml.
+DUCKDB_PROFILE_MIN_SECONDS skips statements faster than the threshold.
+
+The profile of a SELECT is only complete once its result has been fetched,
+so each statement is captured right before the next execute() on the same
+connection, or when the connection closes.
+
+Usage
+-----
+    python commons/query_profiler.py summary <profiles dir or .log file>
+    python commons/query_profiler.py diff <run A> <run B> [--top 15]
+
+Public API
+----------
+  ENV_VAR, MIN_SECONDS_ENV_VAR
+  enabled(config=None) -> bool
+  QueryProfiler(db_path)             per-connection capture used by duckdb_manager
+  profile_dir() -> str               directory of the current run
+  load_run(path) -> list of statement records (with operators)
+  summarize(statements, top=15) -> str
+  diff_runs(run_a, run_b, top=15) -> str
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "DUCKDB_PROFILE"
+MIN_SECONDS_ENV_VAR = "DUCKDB_PROFILE_MIN_SECONDS"
+STATEMENTS_FILE = "statements.jsonl"
+SUMMARY_FILE = "summary.txt"
+
+# extra_info keys that identify an operator across runs (which table, which join)
+_DETAIL_KEYS = ("Table", "Function", "Join Type", "Conditions", "Groups")
+EXPLOSION_RATIO = 2.0
+
+
+def _truthy(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+_forced_on = False
+
+
+def enabled(config: Optional[dict] = None) -> bool:
+    """True when DUCKDB_PROFILE is set; a params.yml with duckdb_profiling: true turns it on for the process."""
+    global _forced_on
+    if config and _truthy(config.get("duckdb_profiling", "")):
+        _forced_on = True
+    return _forced_on or _truthy(os.environ.get(ENV_VAR, ""))
+
+
+def _min_seconds() -> float:
+    try:
+        return float(os.environ.get(MIN_SECONDS_ENV_VAR, 0) or 0)
+    except ValueError:
+        return 0.0
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+def query_key(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode()).hexdigest()[:12]
+
+
+# ── Run directory and per-statement capture ───────────────────────────────────
+
+_run_lock = threading.Lock()
+_run_dir: Optional[str] = None
+_seq = 0
+_records: List[dict] = []
+
+
+def profile_dir() -> str:
+    """<log file without .log>_profiles for the first log file of the root logger, else logs/<script>_<ts>_profiles."""
+    global _run_dir
+    with _run_lock:
+        if _run_dir is None:
+            base = None
+            for handler in logging.getLogger().handlers:
+                if isinstance(handler, logging.FileHandler):
+                    base = os.path.splitext(handler.baseFilename)[0]
+                    break
+            if base is None:
+                script = os.path.abspath(sys.argv[0]) if sys.argv and sys.argv[0] else os.path.abspath("python")
+                name = os.path.splitext(os.path.basename(script))[0] or "python"
+                base = os.path.join(os.path.dirname(script), "logs",
+                                    f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+            _run_dir = f"{base}_profiles"
+            os.makedirs(_run_dir, exist_ok=True)
+            atexit.register(_write_summary)
+            _emit(f"DuckDB profiling on; plans are saved to {_run_dir}")
+        return _run_dir
+
+
+def _emit(message: str):
+    # finops scripts report with print and configure no logging handlers
+    if logging.getLogger().handlers:
+        logger.info(message)
+    else:
+        print(message)
+
+
+class QueryProfiler:
+    """Enables the profiler on one DuckDB connection and saves each statement's plan."""
+
+    def __init__(self, db_path: str):
+        self.db_name = os.path.splitext(os.path.basename(db_path))[0] or "memory"
+        self._pending: Optional[str] = None
+
+    def enable(self, con):
+        # no_output: keep the plan in the connection instead of printing it
+        con.execute("SET enable_profiling = 'no_output'")
+
+    def before_execute(self, con, query: str):
+        self.capture(con)
+        self._pending = query
+
+    def capture(self, con):
+        """Save the profile of the last statement run on con, if any."""
+        query, self._pending = self._pending, None
+        if query is None:
+            return
+        try:
+            profile = json.loads(con.get_profiling_information(format="json"))
+        except Exception as e:
+            logger.debug("No profile for %s: %s", normalize_query(query)[:80], e)
+            return
+        if not profile.get("children") or profile.get("latency", 0.0) < _min_seconds():
+            return
+        _save(self.db_name, query, profile)
+
+
+def _save(db_name: str, query: str, profile: dict):
+    global _seq
+    run_dir = profile_dir()
+    with _run_lock:
+        _seq += 1
+        seq = _seq
+    file_name = f"{seq:04d}_{db_name}.json"
+    with open(os.path.join(run_dir, file_name), "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=1)
+    record = {
+        "seq": seq,
+        "file": file_name,
+        "database": db_name,
+        "query_key": query_key(query),
+        "query": normalize_query(query)[:1000],
+        "latency": profile.get("latency", 0.0),
+        "cpu_time": profile.get("cpu_time", 0.0),
+        "rows_returned": profile.get("rows_returned", 0),
+        "cumulative_cardinality": profile.get("cumulative_cardinality", 0),
+    }
+    with _run_lock:
+        with open(os.path.join(run_dir, STATEMENTS_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        _records.append(dict(record, operators=list(operators(profile))))
+
+
+def _write_summary():
+    if _run_dir is None or not _records:
+        return
+    text = summarize(_records)
+    with open(os.path.join(_run_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    _emit(f"DuckDB profile summary ({len(_records)} statements, plans in {_run_dir}):\n{text}")
+
+
+# ── Reading plans ─────────────────────────────────────────────────────────────
+
+def operators(profile: dict) -> Iterator[dict]:
+    """Flatten a DuckDB JSON profile into operators (depth-first) with rows in/out."""
+    def walk(node, depth):
+        for child in node.get("children", []):
+            rows_in = [c.get("operator_cardinality", 0) for c in child.get("children", [])]
+            extra = child.get("extra_info") or {}
+            detail = "; ".join(f"{k}: {' '.join(str(extra[k]).split())}" for k in _DETAIL_KEYS if k in extra)
+            yield {
+                "name": child.get("operator_name") or child.get("operator_type", "?"),
+                "depth": depth,
+                "detail": detail,
+                "seconds": child.get("operator_timing", 0.0),
+                "rows": child.get("operator_cardinality", 0),
+                "max_rows_in": max(rows_in) if rows_in else 0,
+            }
+            yield from walk(child, depth + 1)
+    yield from walk(profile, 0)
+
+
+def load_run(path: str) -> List[dict]:
+    """Statement records of a run; path is its _profiles directory or its .log file."""
+    if path.endswith(".log"):
+        path = path[:-4] + "_profiles"
+    statements = []
+    with open(os.path.join(path, STATEMENTS_FILE), encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            with open(os.path.join(path, record["file"]), encoding="utf-8") as pf:
+                record["operators"] = list(operators(json.load(pf)))
+            statements.append(record)
+    return statements
+
+
+def _short(query: str, width: int = 90) -> str:
+    return query if len(query) <= width else query[:width - 3] + "..."
+
+
+def summarize(statements: List[dict], top: int = 15) -> str:
+    """Slowest statements, top operators by time and rows, and exploding joins."""
+    if not statements:
+        return "No profiled statements."
+    lines = [f"Statements: {len(statements)}, total latency {sum(s['latency'] for s in statements):.2f}s"]
+
+    lines.append("\nSlowest statements:")
+    for s in sorted(statements, key=lambda s: -s["latency"])[:top]:
+        lines.append(f"  #{s['seq']:<5} {s['latency']:8.3f}s  rows={s['rows_returned']:<10} "
+                     f"[{s['database']}] {_short(s['query'])}")
+
+    flat = [(s, op) for s in statements for op in s["operators"]]
+    lines.append("\nTop operators by time:")
+    for s, op in sorted(flat, key=lambda x: -x[1]["seconds"])[:top]:
+        lines.append(f"  #{s['seq']:<5} {op['seconds']:8.3f}s  rows={op['rows']:<12} {op['name']}"
+                     + (f" ({op['detail']})" if op["detail"] else ""))
+
+    lines.append("\nTop operators by rows:")
+    for s, op in sorted(flat, key=lambda x: -x[1]["rows"])[:top]:
+        lines.append(f"  #{s['seq']:<5} rows={op['rows']:<12} {op['seconds']:8.3f}s  {op['name']}"
+                     + (f" ({op['detail']})" if op["detail"] else ""))
+
+    explosions = [(s, op, op["rows"] / op["max_rows_in"]) for s, op in flat
+                  if "JOIN" in op["name"] and op["max_rows_in"]
+                  and op["rows"] >= EXPLOSION_RATIO * op["max_rows_in"]]
+    lines.append(f"\nJoins producing >= {EXPLOSION_RATIO:g}x their largest input:")
+    if not explosions:
+        lines.append("  none")
+    for s, op, ratio in sorted(explosions, key=lambda x: -x[1]["rows"])[:top]:
+        lines.append(f"  #{s['seq']:<5} x{ratio:<8.1f} {op['max_rows_in']} -> {op['rows']} rows, "
+                     f"{op['seconds']:.3f}s  {op['name']} ({op['detail']})")
+    return "\n".join(lines)
+
+
+# ── Diff between runs ─────────────────────────────────────────────────────────
+
+def _keyed(statements: List[dict]) -> Dict[tuple, dict]:
+    """Key statements by query hash plus occurrence number (the same query may run repeatedly)."""
+    seen = defaultdict(int)
+    keyed = {}
+    for s in statements:
+        seen[s["query_key"]] += 1
+        keyed[(s["query_key"], seen[s["query_key"]])] = s
+    return keyed
+
+
+def _operator_totals(statement: dict) -> Dict[tuple, List[float]]:
+    # Keyed by operator name + detail so that plan shape changes still line up
+    totals = defaultdict(lambda: [0.0, 0])
+    for op in statement["operators"]:
+        entry = totals[(op["name"], op["detail"])]
+        entry[0] += op["seconds"]
+        entry[1] += op["rows"]
+    return totals
+
+
+def diff_runs(run_a: str, run_b: str, top: int = 15) -> str:
+    """Compare two profiled runs: statement latency deltas and the operators behind them."""
+    a, b = _keyed(load_run(run_a)), _keyed(load_run(run_b))
+    total_a = sum(s["latency"] for s in a.values())
+    total_b = sum(s["latency"] for s in b.values())
+    lines = [f"A: {run_a} ({len(a)} statements, {total_a:.2f}s)",
+             f"B: {run_b} ({len(b)} statements, {total_b:.2f}s)",
+             f"Total latency change: {total_b - total_a:+.2f}s"]
+
+    common = sorted(set(a) & set(b), key=lambda k: -abs(b[k]["latency"] - a[k]["latency"]))
+    lines.append("\nLargest statement changes (B - A):")
+    for key in common[:top]:
+        sa, sb = a[key], b[key]
+        delta = sb["latency"] - sa["latency"]
+        lines.append(f"  {delta:+8.3f}s  {sa['latency']:.3f}s -> {sb['latency']:.3f}s  "
+                     f"rows {sa['rows_returned']} -> {sb['rows_returned']}  "
+                     f"(#{sa['seq']} / #{sb['seq']}) {_short(sb['query'])}")
+        ops_a, ops_b = _operator_totals(sa), _operator_totals(sb)
+        op_deltas = sorted(set(ops_a) | set(ops_b),
+                           key=lambda k: -abs(ops_b.get(k, [0.0, 0])[0] - ops_a.get(k, [0.0, 0])[0]))
+        for op_key in op_deltas[:3]:
+            (sec_a, rows_a), (sec_b, rows_b) = ops_a.get(op_key, [0.0, 0]), ops_b.get(op_key, [0.0, 0])
+            if sec_a == sec_b and rows_a == rows_b:
+                continue
+            name, detail = op_key
+            lines.append(f"        {sec_b - sec_a:+8.3f}s  rows {rows_a} -> {rows_b}  {name}"
+                         + (f" ({detail})" if detail else ""))
+
+    for label, only in (("only in A", set(a) - set(b)), ("only in B", set(b) - set(a))):
+        runs = a if label.endswith("A") else b
+        if only:
+            lines.append(f"\nStatements {label} ({len(only)}):")
+            for key in sorted(only, key=lambda k: -runs[k]["latency"])[:top]:
+                s = runs[key]
+                lines.append(f"  {s['latency']:8.3f}s  #{s['seq']} {_short(s['query'])}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise or compare DuckDB profiles saved by a pipeline run")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_summary = sub.add_parser("summary", help="Summarise one run")
+    p_summary.add_argument("run", help="_profiles directory or the run's .log file")
+    p_summary.add_argument("--top", type=int, default=15)
+    p_diff = sub.add_parser("diff", help="Compare two runs (B - A)")
+    p_diff.add_argument("run_a")
+    p_diff.add_argument("run_b")
+    p_diff.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        print(summarize(load_run(args.run), top=args.top))
+    else:
+        print(diff_runs(args.run_a, args.run_b, top=args.top))
+
+
+if __name__ == "__main__":
+    main()
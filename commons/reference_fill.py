@@ -0,0 +1,82 @@
+"""
+reference_fill.py — Fill missing column values from a reference query
+=====================================================================
+Declarative replacement for the "compute one value per key, then loop and
+UPDATE ... WHERE key = <value>" pattern. Each FillSpec names the target
+column, the key that links the target table to the reference, and a query
+returning one value per key. fill_missing_from_reference() applies it as a
+single set-based UPDATE ... FROM, touching only rows where the target column
+is NULL.
+
+The source query is materialised once in a temp table so its row count can
+be logged and its keys checked for uniqueness: with two values for the same
+key, UPDATE ... FROM would pick one arbitrarily.
+
+Public API
+----------
+  FillSpec(target_column, source_query, key, source_key=None, value_column=None, label=None)
+  fill_missing_from_reference(con, table, spec, log=logger.info) -> rows updated
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+_SOURCE_TABLE = "_reference_fill_source"
+
+
+@dataclass
+class FillSpec:
+    """
+    target_column: column of the target table to fill where it is NULL
+    source_query:  SELECT returning at most one row per key
+    key:           key column in the target table
+    source_key:    key column in the source query (default: key)
+    value_column:  value column in the source query (default: target_column)
+    """
+    target_column: str
+    source_query: str
+    key: str
+    source_key: Optional[str] = None
+    value_column: Optional[str] = None
+    label: Optional[str] = None
+
+    def __post_init__(self):
+        self.source_key = self.source_key or self.key
+        self.value_column = self.value_column or self.target_column
+        self.label = self.label or self.target_column
+
+
+def fill_missing_from_reference(
+    con: duckdb.DuckDBPyConnection,
+    table: str,
+    spec: FillSpec,
+    log: Callable[[str], None] = logger.info,
+) -> int:
+    """Fill NULL spec.target_column values of table from spec.source_query; returns the rows updated."""
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {_SOURCE_TABLE} AS {spec.source_query}")
+    try:
+        n_rows, n_keys = con.execute(
+            f'SELECT COUNT(*), COUNT(DISTINCT "{spec.source_key}") FROM {_SOURCE_TABLE}'
+        ).fetchone()
+        if n_rows != n_keys:
+            raise ValueError(f"{spec.label}: source query returns {n_rows:,} rows for {n_keys:,} distinct "
+                             f"\"{spec.source_key}\" values; it must return at most one row per key")
+        log(f"Found {spec.label} values for {n_keys:,} keys")
+
+        updated = con.execute(f"""
+            UPDATE {table} AS t
+            SET "{spec.target_column}" = s."{spec.value_column}"
+            FROM {_SOURCE_TABLE} AS s
+            WHERE t."{spec.key}" = s."{spec.source_key}"
+              AND t."{spec.target_column}" IS NULL
+              AND s."{spec.value_column}" IS NOT NULL
+        """).fetchone()[0]
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {_SOURCE_TABLE}")
+    log(f"Updated {updated:,} rows with {spec.label} values")
+    return updated
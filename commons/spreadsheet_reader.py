@@ -0,0 +1,253 @@
+"""
+spreadsheet_reader.py — Shared Excel reader for the bronze loaders
+==================================================================
+The bronze loaders used to open each workbook several times: pd.ExcelFile to
+list the sheets, pd.read_excel(nrows=...) to find the header and
+pd.read_excel again per sheet. This module opens a workbook once with
+openpyxl in read-only (streaming) mode and reads every requested sheet in a
+single pass. The header is detected from the rows it has already read.
+
+Values are returned as strings with the conventions of
+pd.read_excel(dtype=str), so existing bronze tables keep their content:
+  - integral numbers lose the '.0' (5.0 -> '5');
+  - dates are rendered as 'YYYY-MM-DD HH:MM:SS';
+  - empty cells, '' and Excel error values (#N/A, #REF!, ...) become NULL;
+  - blank rows at the end of a sheet are dropped, blank rows inside are kept;
+  - unnamed header cells become 'Unnamed: <i>', and duplicate names get
+    '.1', '.2' suffixes.
+
+Sheets are inserted into DuckDB in DataFrame batches. pyarrow is not a
+dependency of the pipeline, and DuckDB scans pandas batches directly.
+
+Loaders skip unchanged workbooks before calling this module, see
+ingestion_registry.py.
+
+read_workbooks() parses several workbooks in a process pool. openpyxl is
+pure Python and CPU bound. Only the parsing runs in the workers; the
+DuckDB writes stay in the calling process. Workers are always spawned (the
+Windows default, also on Linux), so they never fork a process holding an open
+DuckDB connection. Spawned workers re-import the calling script as
+__mp_main__: loaders set up logging and other side effects under
+if __name__ == "__main__", not at import.
+
+Public API
+----------
+  Sheet(name, header_row, header_detected, columns, rows)
+      .batches(batch_rows=50000) -> DataFrames indexed by data row number
+  read_workbook(path, sheets, header=0, detect_header=None, scan_rows=20) -> [Sheet]
+  read_workbooks(jobs, max_workers=None) -> iterator of (path, [Sheet] or Exception)
+  unique_column_names(columns) -> names made unique case-insensitively ('x', 'X_1')
+  insert_sheet(con, table, sheet, metadata=None, line_number_column='line_number', create=False) -> rows
+"""
+
+import logging
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import duckdb
+import openpyxl
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 50_000
+EXCEL_ERRORS = {"#N/A", "#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#GETTING_DATA"}
+
+Row = Tuple[Optional[str], ...]
+
+
+@dataclass
+class Sheet:
+    name: str
+    header_row: int
+    header_detected: bool
+    columns: List[str]
+    rows: List[Row] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def batches(self, batch_rows: int = DEFAULT_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+        """String DataFrames of at most batch_rows rows; the index is the data row number (0-based)."""
+        for start in range(0, len(self.rows), batch_rows):
+            chunk = self.rows[start:start + batch_rows]
+            yield pd.DataFrame.from_records(chunk, columns=self.columns,
+                                            index=pd.RangeIndex(start, start + len(chunk)))
+
+
+def _cell_str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value == "" or value in EXCEL_ERRORS else value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _header_names(values: Sequence[Any], width: int) -> List[str]:
+    """pandas-style column names: 'Unnamed: i' for blanks, '.1', '.2' for duplicates."""
+    names = []
+    for i in range(width):
+        value = values[i] if i < len(values) else None
+        text = _cell_str(value)
+        names.append(f"Unnamed: {i}" if text is None else text)
+
+    counts: Dict[str, int] = defaultdict(int)
+    for i, name in enumerate(names):
+        count = counts[name]
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts[name]
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def unique_column_names(columns: Sequence[Any]) -> List[str]:
+    """Make names unique for DuckDB (case-insensitive): a later 'Data' after 'DATA' becomes 'Data_1'."""
+    used = set()
+    unique = []
+    for col in columns:
+        original = str(col)
+        name, counter = original, 0
+        while name.lower() in used:
+            counter += 1
+            name = f"{original}_{counter}"
+        used.add(name.lower())
+        unique.append(name)
+    return unique
+
+
+def _select_sheets(available: List[str], sheets: Union[Sequence[str], Callable[[List[str]], List[str]]]) -> List[str]:
+    if callable(sheets):
+        return list(sheets(available))
+    # Case-insensitive match, in request order, each sheet once
+    lower = {name.lower(): name for name in reversed(available)}
+    selected = []
+    for wanted in sheets:
+        actual = lower.get(wanted.lower())
+        if actual is not None and actual not in selected:
+            selected.append(actual)
+    return selected
+
+
+def read_workbook(
+    path: str,
+    sheets: Union[Sequence[str], Callable[[List[str]], List[str]]],
+    header: int = 0,
+    detect_header: Optional[Callable[[List[Row]], Optional[int]]] = None,
+    scan_rows: int = 20,
+) -> List[Sheet]:
+    """
+    Read the requested sheets of one workbook in a single streaming pass.
+
+    sheets:        names (case-insensitive) or fn(available names) -> names to read
+    header:        0-based row index of the header (blank rows count)
+    detect_header: fn(first scan_rows rows, as strings) -> header index,
+                   or None to fall back to header
+    """
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        result = []
+        for name in _select_sheets(wb.sheetnames, sheets):
+            rows = [_trim(r) for r in wb[name].iter_rows(values_only=True)]
+            while rows and not rows[-1]:
+                rows.pop()
+
+            header_row, detected = header, False
+            if detect_header is not None:
+                found = detect_header([tuple(_cell_str(v) for v in r) for r in rows[:scan_rows]])
+                if found is not None:
+                    header_row, detected = found, True
+
+            # Like pandas, every row (also those above the header) widens the sheet
+            width = max((len(r) for r in rows), default=0)
+            header_values = rows[header_row] if header_row < len(rows) else ()
+            data = [tuple(_cell_str(v) for v in r) + (None,) * (width - len(r)) for r in rows[header_row + 1:]]
+            result.append(Sheet(name, header_row, detected, _header_names(header_values, width), data))
+        return result
+    finally:
+        wb.close()
+
+
+def _trim(row: tuple) -> tuple:
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ""):
+        end -= 1
+    return row[:end]
+
+
+def _read_job(path: str, kwargs: dict) -> List[Sheet]:
+    return read_workbook(path, **kwargs)
+
+
+def read_workbooks(
+    jobs: Sequence[Tuple[str, dict]],
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[str, Union[List[Sheet], Exception]]]:
+    """
+    Parse several workbooks in a process pool; jobs are (path, read_workbook kwargs).
+    Yields (path, sheets) as files finish, or (path, exception) for files that failed.
+    Callables in the kwargs must be module-level functions (they are pickled).
+    """
+    if not jobs:
+        return
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(jobs)))
+    if max_workers == 1:
+        for path, kwargs in jobs:
+            try:
+                yield path, read_workbook(path, **kwargs)
+            except Exception as e:
+                yield path, e
+        return
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(_read_job, path, kwargs): path for path, kwargs in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def insert_sheet(
+    con: duckdb.DuckDBPyConnection,
+    table: str,
+    sheet: Sheet,
+    columns: Optional[Sequence[str]] = None,
+    metadata: Optional[Mapping[str, Any]] = None,
+    line_number_column: Optional[str] = "line_number",
+    create: bool = False,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+) -> int:
+    """
+    Insert a sheet into table in batches: the data columns, then line_number
+    (data row number) and the constant metadata columns, in that order.
+    columns renames the data columns (e.g. unique_column_names(sheet.columns)).
+    create=True (re)creates table with all columns as VARCHAR (line_number INTEGER).
+    """
+    columns = list(columns or sheet.columns)
+    metadata = dict(metadata or {})
+    if create:
+        defs = [f'"{c}" VARCHAR' for c in columns]
+        if line_number_column:
+            defs.append(f'"{line_number_column}" INTEGER')
+        defs.extend(f'"{c}" VARCHAR' for c in metadata)
+        con.execute(f"CREATE OR REPLACE TABLE {table} ({', '.join(defs)})")
+
+    inserted = 0
+    for batch in sheet.batches(batch_rows):
+        batch.columns = columns
+        if line_number_column:
+            batch[line_number_column] = batch.index
+        for key, value in metadata.items():
+            batch[key] = value
+        con.execute(f"INSERT INTO {table} SELECT * FROM batch")
+        inserted += len(batch)
+    return inserted
+
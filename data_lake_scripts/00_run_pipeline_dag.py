@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+00_run_pipeline_dag.py
+Runs the nightly refresh as a dependency graph instead of the sequential .bat chain
+(00_run_complete_dataflow.bat). See commons/pipeline_dag.py for the scheduling rules.
+
+Stages mirror the steps that are active in the .bat files, declared with the
+tables they read and write (docs/pipeline_implementation_guide.md):
+  clinisys -> embryoscope gold -> combined -> ploidia / prescriptions
+  clinisys + protheus -> finops timelines -> CSV exports
+Source extractions (Clinisys MySQL, Embryoscope API, Protheus API, image checks)
+run concurrently; stages sharing a DuckDB file are serialised.
+
+The VPN connect/disconnect of 00_run_complete_dataflow.bat is not handled here.
+
+Usage:
+    python 00_run_pipeline_dag.py                        # full refresh, skipping unchanged stages
+    python 00_run_pipeline_dag.py --list                 # print stages, dependencies and locks
+    python 00_run_pipeline_dag.py --stages "lake_*" --downstream
+    python 00_run_pipeline_dag.py --stages ploidia_fill --force
+    python 00_run_pipeline_dag.py --stages "finops_*" --force --profile   # save DuckDB query plans per stage
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+from datetime import datetime
+
+import yaml
+
+# Setup logging
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+from commons import query_profiler
+from commons.pipeline_dag import FAILED, BLOCKED, PipelineDAG, Stage
+
+STATE_PATH = os.path.join(REPO_ROOT, 'database', 'pipeline_dag_state.json')
+
+
+def protheus_db_path():
+    """Protheus writes to duckdb_path from its params.yml (relative to its folder); default: the data lake."""
+    params_path = os.path.join(REPO_ROOT, 'protheus', '01_ingestion', 'params.yml')
+    if os.path.exists(params_path):
+        with open(params_path, 'r') as f:
+            duckdb_path = (yaml.safe_load(f) or {}).get('duckdb_path')
+        if duckdb_path:
+            return os.path.relpath(
+                os.path.normpath(os.path.join(REPO_ROOT, 'protheus', '01_ingestion', duckdb_path)), REPO_ROOT
+            )
+    return os.path.join('database', 'huntington_data_lake.duckdb')
+
+
+DATABASES = {
+    'clinisys': os.path.join('database', 'clinisys_all.duckdb'),
+    'lake': os.path.join('database', 'huntington_data_lake.duckdb'),
+    'protheus': protheus_db_path(),
+}
+
+
+def latest_image_results_dir(mode='new'):
+    """Most recent api_results/<mode>_* directory written by 01_check_image_availability.py (None if none)."""
+    pattern = os.path.join(REPO_ROOT, 'embryoscope', '02_images_availability_report', 'api_results', f'{mode}_*')
+    dirs = [d for d in glob.glob(pattern) if os.path.isdir(d)]
+    if not dirs:
+        return None
+    return ['--input-dir', max(dirs, key=os.path.getmtime)]
+
+
+FINOPS_EXPORTS = [
+    ('all_patients_timeline', '01_'),
+    ('patient_info', '03_00_'),
+    ('resumed_biopsy_pgta_timeline', '03_02_'),
+    ('embryoscope_timeline', '03_03_'),
+    ('resumed_embryoscope_timeline', '03_03_'),
+    ('finops_summary', '03_01_'),
+    ('resumed_cryopreservation_events_timeline', '03_04_b_'),
+    ('consultas_timeline', '03_05_'),
+    ('resumed_consultas_timeline', '03_05_'),
+]
+
+
+def build_stages():
+    stages = [
+        # ── Clinisys ──────────────────────────────────────────────────────────
+        Stage('clinisys_bronze', 'clinisys/01_source_to_bronze.py',
+              outputs=['clinisys:bronze.*'], locks=['clinisys_mysql']),
+        Stage('clinisys_silver', 'clinisys/02_01_bronze_to_silver.py',
+              inputs=['clinisys:bronze.*'], outputs=['clinisys:silver.*']),
+        Stage('clinisys_compare', 'clinisys/02_02_compare_bronze_and_silver.py',
+              inputs=['clinisys:bronze.*', 'clinisys:silver.*']),
+        Stage('clinisys_matching_index', 'clinisys/02_03_build_matching_index.py',
+              inputs=['clinisys:silver.view_pacientes'], outputs=['clinisys:silver.prontuario_matching_index']),
+        Stage('clinisys_gold', 'clinisys/03_silver_to_gold.py',
+              inputs=['clinisys:silver.*'], outputs=['lake:gold.clinisys_embrioes'],
+              after=['clinisys_compare']),
+
+        # ── Embryoscope (per-clinic DBs are not fingerprinted: always run) ──
+        Stage('embryoscope_bronze', 'embryoscope/01_get_embryo_data/01_source_to_bronze.py',
+              locks=['embryoscope_clinic_dbs', 'embryoscope_api']),
+        Stage('embryoscope_silver', 'embryoscope/01_get_embryo_data/02_01_bronze_to_silver.py',
+              inputs=['clinisys:silver.view_pacientes', 'clinisys:silver.prontuario_matching_index'],
+              locks=['embryoscope_clinic_dbs', 'prontuario_match_cache'],
+              after=['embryoscope_bronze'], always_run=True),
+        Stage('embryoscope_cleanup_silver', 'embryoscope/01_get_embryo_data/02_02_cleanup_silver_layer.py',
+              locks=['embryoscope_clinic_dbs'], after=['embryoscope_silver'], always_run=True),
+        Stage('embryoscope_consolidate', 'embryoscope/01_get_embryo_data/02_03_consolidate_embryoscope_dbs.py',
+              outputs=['lake:silver_embryoscope.*'], locks=['embryoscope_clinic_dbs'],
+              after=['embryoscope_cleanup_silver'], always_run=True),
+        Stage('embryoscope_gold', 'embryoscope/01_get_embryo_data/03_consolidated_to_gold.py',
+              inputs=['lake:silver_embryoscope.*'], outputs=['lake:gold.embryoscope_embrioes']),
+
+        # ── Image availability (API results land in files first) ──────────────
+        Stage('images_check', 'embryoscope/02_images_availability_report/01_check_image_availability.py',
+              args=['--mode', 'new'],
+              inputs=['lake:gold.embryoscope_embrioes', 'lake:silver.embryo_image_availability_latest'],
+              locks=['embryoscope_api'], always_run=True),
+        Stage('images_bronze', 'embryoscope/02_images_availability_report/02_logs_to_bronze.py',
+              args=latest_image_results_dir, outputs=['lake:bronze.embryo_image_availability_logs'],
+              after=['images_check'], always_run=True),
+        Stage('images_silver', 'embryoscope/02_images_availability_report/03_bronze_to_silver.py',
+              inputs=['lake:bronze.embryo_image_availability_logs'],
+              outputs=['lake:silver.embryo_image_availability_latest']),
+        Stage('images_gold', 'embryoscope/02_images_availability_report/04_track_changes_to_gold.py',
+              inputs=['lake:silver.embryo_image_availability_latest'], outputs=['lake:gold.embryo_image_status_changes']),
+        Stage('images_cleanup_logs', 'embryoscope/02_images_availability_report/05_cleanup_logs.py',
+              after=['images_bronze'], always_run=True),
+
+        # ── Data lake consolidation ───────────────────────────────────────────
+        Stage('lake_merge_clinisys_embryoscope', 'data_lake_scripts/01_merge_clinisys_embryoscope.py',
+              inputs=['lake:gold.clinisys_embrioes', 'lake:gold.embryoscope_embrioes'],
+              outputs=['lake:gold.embryoscope_clinisys_combined']),
+        Stage('lake_combine_redlara_planilha', 'data_lake_scripts/02_combine_redlara_planilha.py',
+              inputs=['lake:silver.redlara_unified', 'lake:silver.planilha_embriologia_combined'],
+              outputs=['lake:gold.redlara_planilha_combined']),
+        Stage('lake_combine_embryoscope_planilha', 'data_lake_scripts/03_combine_embryoscope_planilha.py',
+              inputs=['lake:gold.embryoscope_clinisys_combined', 'lake:gold.redlara_planilha_combined'],
+              outputs=['lake:gold.planilha_embryoscope_combined']),
+        Stage('lake_export_combined', 'data_lake_scripts/04_02_export_clinsisy_embryoscope_planilha.py',
+              inputs=['lake:gold.planilha_embryoscope_combined']),
+
+        # ── Ploidia ───────────────────────────────────────────────────────────
+        Stage('ploidia_create', 'planilha_ploidia/01_create_data_ploidia_table.py',
+              inputs=['lake:gold.planilha_embryoscope_combined', 'clinisys:silver.view_tratamentos'],
+              outputs=['lake:gold.data_ploidia']),
+        Stage('ploidia_fill', 'planilha_ploidia/02_fill_missing_values.py',
+              inputs=['lake:gold.data_ploidia', 'clinisys:silver.*'], outputs=['lake:gold.data_ploidia']),
+        Stage('ploidia_images', 'planilha_ploidia/03_join_image_availability.py',
+              inputs=['lake:gold.data_ploidia', 'lake:silver.embryo_image_availability_latest'],
+              outputs=['lake:gold.data_ploidia']),
+
+        # ── Prescriptions ─────────────────────────────────────────────────────
+        Stage('prescription_join', 'embryos_with_prescription/01_join_prescriptions.py',
+              inputs=['lake:gold.planilha_embryoscope_combined', 'clinisys:silver.view_medicamentos_prescricoes'],
+              outputs=['lake:gold.embryos_with_prescription_long']),
+        Stage('prescription_wide', 'embryos_with_prescription/02_create_wide_table.py',
+              inputs=['lake:gold.embryos_with_prescription_long'], outputs=['lake:gold.embryos_with_prescription_wide']),
+        Stage('prescription_export', 'embryos_with_prescription/03_export_to_excel.py',
+              inputs=['lake:gold.embryos_with_prescription_wide']),
+
+        # ── Protheus ──────────────────────────────────────────────────────────
+        Stage('protheus_bronze', 'protheus/01_ingestion/01_source_to_bronze.py',
+              outputs=['protheus:bronze.*'], locks=['protheus_api']),
+        Stage('protheus_silver', 'protheus/01_ingestion/02_bronze_to_silver.py',
+              inputs=['protheus:bronze.*'], outputs=['protheus:silver.*']),
+        Stage('protheus_gold', 'protheus/01_ingestion/03_silver_to_gold.py',
+              inputs=['protheus:silver.*', 'clinisys:silver.view_pacientes', 'clinisys:silver.prontuario_matching_index'],
+              outputs=['protheus:gold.protheus_mesclada_vendas'], locks=['prontuario_match_cache']),
+
+        # ── FinOps timelines (run from the repo root, like the .bat) ──────────
+        # The guide lists protheus gold as a finops input; the 03_* builders read silver.mesclada_vendas.
+        # The all-patients timeline reads Clinisys only; it still runs after protheus, as in the .bat.
+        Stage('finops_all_patients_timeline', 'finops/02_create_tables/01_create_all_patient_timeline.py', cwd='',
+              inputs=['clinisys:silver.*'], outputs=['lake:gold.all_patients_timeline'],
+              after=['protheus_gold']),
+        Stage('finops_recent_timeline', 'finops/02_create_tables/02_create_clean_timeline.py', cwd='',
+              inputs=['lake:gold.all_patients_timeline'], outputs=['lake:gold.recent_patients_timeline']),
+        # The 03_* builders run together in one process (shared DuckDB instance and intermediate tables).
+        # They read gold.all_patients_timeline (03_00, 03_01), gold.embryoscope_embrioes (03_03),
+        # silver.mesclada_vendas and Clinisys silver; none reads the recent timeline. Several filter on
+        # CURRENT_DATE, so the stage runs every time: build_cache skips their unchanged tables, per day.
+        Stage('finops_builders', 'finops/02_create_tables/00_run_finops_builders.py', cwd='',
+              inputs=['lake:gold.all_patients_timeline', 'lake:silver.mesclada_vendas', 'lake:gold.embryoscope_embrioes',
+                      'clinisys:silver.*'],
+              always_run=True,
+              outputs=['lake:gold.finops_patient_medico', 'lake:gold.finops_patient_unidade',
+                       'lake:gold.finops_billing_monthly', 'lake:gold.finops_summary', 'lake:gold.patient_info',
+                       'lake:gold.billing_timeline', 'lake:gold.biopsy_pgta_timeline',
+                       'lake:gold.comprehensive_biopsy_pgta_timeline', 'lake:gold.resumed_biopsy_pgta_timeline',
+                       'lake:gold.embryoscope_timeline', 'lake:gold.resumed_embryoscope_timeline',
+                       'lake:gold.embryo_freeze_timeline', 'lake:gold.embryo_billing_timeline',
+                       'lake:gold.comprehensive_embryo_timeline',
+                       'lake:gold.cryopreservation_events_timeline', 'lake:gold.resumed_cryopreservation_events_timeline',
+                       'lake:gold.consultas_timeline', 'lake:gold.resumed_consultas_timeline']),
+    ]
+    stages += [
+        Stage(f'finops_export_{table}', 'finops/02_create_tables/04_export_table_to_csv.py', cwd='',
+              args=['--schema', 'gold', '--table', table, '--prefix', prefix],
+              inputs=[f'lake:gold.{table}'])
+        for table, prefix in FINOPS_EXPORTS
+    ]
+    stages.append(
+        Stage('cleanup_old_logs', 'data_lake_scripts/cleanup_old_logs.py', cwd='',
+              after=[s.name for s in stages], always_run=True)
+    )
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the pipeline as a dependency graph')
+    parser.add_argument('--stages', nargs='+', default=None, help='Stage name globs to run (default: all)')
+    parser.add_argument('--downstream', action='store_true', help='Also run everything downstream of --stages')
+    parser.add_argument('--force', action='store_true', help='Run stages even when their inputs are unchanged')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile every DuckDB statement of the stages that run (see commons/query_profiler.py); '
+                             'combine with --force to profile unchanged stages')
+    parser.add_argument('--max-workers', type=int, default=4, help='Maximum stages running at once')
+    parser.add_argument('--list', action='store_true', help='Print stages, dependencies and locks, then exit')
+    args = parser.parse_args()
+
+    if args.profile:
+        # Inherited by the stage processes
+        os.environ[query_profiler.ENV_VAR] = '1'
+
+    dag = PipelineDAG(build_stages(), DATABASES, REPO_ROOT, STATE_PATH)
+    selected = dag.select(args.stages, downstream=args.downstream) if args.stages else None
+
+    logger.info('Pipeline DAG: %d stages, %s selected, state file %s',
+                len(dag.stages), len(selected) if selected else 'all', STATE_PATH)
+    status = dag.run(selected=selected, max_workers=args.max_workers, force=args.force, dry_run=args.list)
+
+    failed = [name for name, s in status.items() if s in (FAILED, BLOCKED)]
+    if failed:
+        logger.error('Pipeline finished with failed/blocked stages: %s', ', '.join(failed))
+        sys.exit(1)
+    logger.info('Pipeline DAG finished successfully')
+
+
+if __name__ == '__main__':
+    main()
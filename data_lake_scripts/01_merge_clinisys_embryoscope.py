@@ -1,9 +1,13 @@
-import duckdb
 import os
+import sys
 import logging
+import time
 from datetime import datetime
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons import duckdb_manager
+
 # Load config and logging level
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'params.yml')
 with open(CONFIG_PATH, 'r') as f:
@@ -31,32 +35,91 @@ logger.info(f'Loaded logging level: {logging_level_str}')
 # Database path
 db_path = os.path.join('..', 'database', 'huntington_data_lake.duckdb')
 
-def test_join_strategies(con):
-    """Test exact day matching strategy."""
-    logger.info("Testing exact day matching strategy...")
-    
-    strategy = {
-        'name': 'Exact DATE match with prontuario and embryo_number (embryos only)',
-        'query': '''
-            SELECT COUNT(*) as matches
+# Embryoscope FertilizationTime may be logged up to this many days away from micro_Data_DL
+MERGE_DATE_WINDOW_DAYS = 3
+
+def build_range_merge_query(select_columns, window_days=MERGE_DATE_WINDOW_DAYS):
+    """LEFT JOIN every clinisys row to the embryoscope rows within ±window_days (BETWEEN)."""
+    return f'''
+            SELECT 
+                {', '.join(select_columns)}
             FROM gold.clinisys_embrioes c
-            LEFT JOIN gold.embryoscope_embrioes e
-                ON c.micro_Data_DL = DATE(e.embryo_FertilizationTime)
+            LEFT JOIN (
+                SELECT *
+                FROM gold.embryoscope_embrioes
+                WHERE prontuario IS NOT NULL
+            ) e
+                ON CAST(e.embryo_FertilizationTime AS DATE) BETWEEN (CAST(c.micro_Data_DL AS DATE) - {window_days}) AND (CAST(c.micro_Data_DL AS DATE) + {window_days})
                 AND c.micro_prontuario = e.prontuario
                 AND e.embryo_embryo_number = c.oocito_embryo_number
-                AND e.prontuario IS NOT NULL
-                -- AND c.oocito_flag_embryoscope = 1  -- Flag no longer used
-            WHERE e.embryo_EmbryoID IS NOT NULL
-        '''
-    }
-    
-    try:
-        result = con.execute(strategy['query']).fetchone()[0]
-        logger.info(f"{strategy['name']}: {result} matches")
-        return {strategy['name']: result}
-    except Exception as e:
-        logger.warning(f"Strategy '{strategy['name']}' failed: {e}")
-        return {strategy['name']: 0}
+            '''
+
+def build_merge_candidates_query(window_days=MERGE_DATE_WINDOW_DAYS):
+    """
+    Candidate (clinisys row, embryoscope row) pairs for the ±window_days merge,
+    same join as build_range_merge_query. Rows are identified by table rowid.
+    """
+    return f'''
+        SELECT
+            c.rowid AS c_rowid,
+            e.rowid AS e_rowid,
+            ABS(CAST(e.embryo_FertilizationTime AS DATE) - CAST(c.micro_Data_DL AS DATE)) AS date_distance,
+            e.embryo_FertilizationTime,
+            e.embryo_EmbryoID
+        FROM gold.clinisys_embrioes c
+        JOIN gold.embryoscope_embrioes e
+          ON e.prontuario = c.micro_prontuario
+         AND e.embryo_embryo_number = c.oocito_embryo_number
+         AND CAST(e.embryo_FertilizationTime AS DATE) BETWEEN (CAST(c.micro_Data_DL AS DATE) - {window_days}) AND (CAST(c.micro_Data_DL AS DATE) + {window_days})
+    '''
+
+
+def build_merge_query(select_columns, candidates_table, max_candidates=None):
+    """
+    LEFT JOIN every clinisys row to its embryoscope candidates.
+
+    With max_candidates, candidates are ranked per clinisys row (closest date,
+    then earliest FertilizationTime, then EmbryoID, rowid as the last
+    tie-breaker) and only the top max_candidates are kept.
+    """
+    candidates = candidates_table
+    if max_candidates:
+        candidates = f'''(
+                SELECT c_rowid, e_rowid
+                FROM {candidates_table}
+                QUALIFY ROW_NUMBER() OVER (
+                    PARTITION BY c_rowid
+                    ORDER BY date_distance, embryo_FertilizationTime, embryo_EmbryoID, e_rowid
+                ) <= {int(max_candidates)}
+            )'''
+    return f'''
+            SELECT 
+                {', '.join(select_columns)}
+            FROM gold.clinisys_embrioes c
+            LEFT JOIN {candidates} m
+                ON m.c_rowid = c.rowid
+            LEFT JOIN gold.embryoscope_embrioes e
+                ON e.rowid = m.e_rowid
+            '''
+
+def build_candidates_merge_query(con, select_columns, max_candidates):
+    """Materialise the candidate pairs in a temp table, log how ambiguous they are and return the merge query."""
+    start = time.time()
+    con.execute(f"CREATE OR REPLACE TEMP TABLE merge_candidates AS {build_merge_candidates_query()}")
+    n_pairs, n_ambiguous, n_ambiguous_pairs = con.execute("""
+        SELECT
+            SUM(n),
+            COUNT(*) FILTER (WHERE n > 1),
+            COALESCE(SUM(n) FILTER (WHERE n > 1), 0)
+        FROM (SELECT c_rowid, COUNT(*) AS n FROM merge_candidates GROUP BY c_rowid)
+    """).fetchone()
+    n_pairs = n_pairs or 0
+    logger.info(f'Candidate pairs (±{MERGE_DATE_WINDOW_DAYS} days, prontuario, embryo_number): {n_pairs:,} in {time.time() - start:.2f}s')
+    logger.info(f'Clinisys rows with more than one Embryoscope candidate: {n_ambiguous:,} ({n_ambiguous_pairs:,} pairs)')
+    logger.info(f'Keeping the top {max_candidates} ranked candidate(s) per clinisys row (closest date first)')
+    logger.info(f"Using LEFT JOIN on ranked candidates: date within ±{MERGE_DATE_WINDOW_DAYS} days + prontuario + embryo_number")
+    return build_merge_query(select_columns, 'merge_candidates', max_candidates)
+
 
 def main():
     logger.info('Starting combined gold loader (fixed) for embryoscope_clinisys_combined')
@@ -70,27 +133,17 @@ def main():
     try:
         # Read data from database
         logger.info('Connecting to database to test join strategies')
-        with duckdb.connect(db_path) as con:
+        # Memory/threads from params.yml or the machine's resources (heavy profile)
+        with duckdb_manager.connect(db_path, profile='heavy', config=config) as con:
             logger.info('Connected to DuckDB')
             
             # Indexes should be created in silver layer, not here
             logger.info('Using pre-created indexes from silver layer for better JOIN performance')
             
-            # Set DuckDB configuration for better performance
-            logger.info('Setting DuckDB configuration for better performance...')
-            con.execute("SET memory_limit='8GB'")
-            con.execute("SET threads=16")
             con.execute("SET enable_progress_bar=true")
-            logger.info('DuckDB configuration set successfully')
             
-            # Test exact day matching strategy (Skipped for performance)
-            # join_results = test_join_strategies(con)
-            
-            # Use simple FertilizationTime condition (OR condition is too slow)
-            # Cast embryo_FertilizationTime (TIMESTAMP) to DATE for comparison with micro_Data_DL (DATE)
-            # date_condition = "c.micro_Data_DL = DATE(e.embryo_FertilizationTime)"
-            date_condition = "CAST(e.embryo_FertilizationTime AS DATE) BETWEEN (CAST(c.micro_Data_DL AS DATE) - 3) AND (CAST(c.micro_Data_DL AS DATE) + 3)"
-            logger.info(f"Using simple date matching: FertilizationTime only (OR condition too slow)")
+            # Match FertilizationTime within ±MERGE_DATE_WINDOW_DAYS of micro_Data_DL
+            max_candidates = config.get('merge_max_candidates_per_oocyte')
             
             # CURRENT LOGIC (COMMENTED OUT) - Selective columns only
             # query = f'''
@@ -132,22 +185,13 @@ def main():
             # Add all embryoscope columns
             select_columns.append("e.*")
             
-            query = f'''
-            SELECT 
-                {', '.join(select_columns)}
-            FROM gold.clinisys_embrioes c
-            LEFT JOIN (
-                SELECT *
-                FROM gold.embryoscope_embrioes
-                WHERE prontuario IS NOT NULL
-            ) e
-                ON {date_condition}
-                AND c.micro_prontuario = e.prontuario
-                AND e.embryo_embryo_number = c.oocito_embryo_number
-            '''
-            
-            logger.info(f"Using LEFT JOIN with simple date matching: {date_condition} + prontuario + embryo_number")
-            
+            if max_candidates:
+                query = build_candidates_merge_query(con, select_columns, max_candidates)
+            else:
+                # Direct join, every candidate kept (set merge_max_candidates_per_oocyte to resolve by rank)
+                query = build_range_merge_query(select_columns)
+                logger.info(f"Using LEFT JOIN with date within ±{MERGE_DATE_WINDOW_DAYS} days (BETWEEN) + prontuario + embryo_number")
+
             # Create schema if not exists
             con.execute('CREATE SCHEMA IF NOT EXISTS gold;')
             logger.info('Ensured gold schema exists')
@@ -158,8 +202,9 @@ def main():
             
             # Create table directly in SQL
             logger.info("Creating table gold.embryoscope_clinisys_combined directly in DuckDB...")
+            start = time.time()
             con.execute(f"CREATE TABLE gold.embryoscope_clinisys_combined AS {query}")
-            logger.info('Created gold.embryoscope_clinisys_combined table')
+            logger.info(f'Created gold.embryoscope_clinisys_combined table in {time.time() - start:.2f}s')
             
             # Validate schema
             # schema = con.execute("DESCRIBE gold.embryoscope_clinisys_combined").fetchdf()
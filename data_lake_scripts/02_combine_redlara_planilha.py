@@ -12,6 +12,10 @@ import duckdb as db
 from datetime import datetime
 import os
 import logging
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commons import duckdb_manager
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -34,7 +38,7 @@ def get_database_connection(read_only=False):
     """Create and return a connection to the huntington_data_lake database"""
     repo_root = os.path.dirname(os.path.dirname(__file__))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db, read_only=read_only)
+    conn = duckdb_manager.connect(path_to_db, read_only=read_only)
     logger.info(f"Connected to database: {path_to_db} (read_only={read_only})")
     return conn
 
@@ -2,14 +2,19 @@
 """
 04_01_export_redlara_planilha.py
 Exports the gold.redlara_planilha_combined table to Excel.
+Rows are streamed into the workbook (commons/excel_export.py), so memory does
+not grow with the table.
 """
 
 import duckdb as db
-import pandas as pd
 from datetime import datetime
 import os
+import sys
 import logging
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons.excel_export import export_query_to_excel
+
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -42,36 +47,24 @@ def main():
         con = db.connect(db_path, read_only=True)
         
         logger.info("Reading data from gold.redlara_planilha_combined...")
-        df = con.execute("SELECT * FROM gold.redlara_planilha_combined").df()
-        
-        total_rows = len(df)
-        total_cols = len(df.columns)
-        logger.info(f"Loaded {total_rows:,} rows and {total_cols} columns")
+        total_rows = con.execute("SELECT COUNT(*) FROM gold.redlara_planilha_combined").fetchone()[0]
+        logger.info(f"Table has {total_rows:,} rows")
         
         if total_rows == 0:
             logger.warning("No data found in gold.redlara_planilha_combined. Skipping export.")
             return
 
-        # Convert datetime columns to date only to avoid timestamp residues in Excel
-        logger.info("Converting datetime columns to date-only...")
-        for col in df.columns:
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
-                df[col] = df[col].dt.date
-
         # Prepare output filename
         output_filename = f'redlara_planilha_combined_{timestamp}.xlsx'
         output_path = os.path.join(OUTPUT_DIR, output_filename)
         
         logger.info(f"Writing data to {output_path}...")
         
-        # Using xlsxwriter for performance.
-        with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='RedlaraPlanilha', index=False)
-            
-            # Simple Column Formatting
-            worksheet = writer.sheets['RedlaraPlanilha']
-            # Set a standard width for all columns
-            worksheet.set_column(0, total_cols - 1, 15)
+        # Datetime columns are written as dates only to avoid timestamp residues in Excel.
+        # Same width for all columns.
+        export_query_to_excel(con, "SELECT * FROM gold.redlara_planilha_combined", output_path,
+                              sheet_name='RedlaraPlanilha', column_width=15, timestamps_as_dates=True,
+                              log=logger.info)
             
         logger.info(f"Excel export completed successfully: {output_filename}")
         
@@ -3,14 +3,18 @@
 Simplified and Efficient Export to Excel
 - Exports ALL columns from gold.planilha_embryoscope_combined
 - Filter: oocito_TCD = 'Transferido' OR trat2_resultado_tratamento IS NOT NULL
+- Rows are streamed into the workbook (commons/excel_export.py)
 """
 
 import duckdb as db
-import pandas as pd
 from datetime import datetime
 import os
+import sys
 import logging
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons.excel_export import export_query_to_excel
+
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -46,11 +50,8 @@ def main():
         where_clause = "WHERE oocito_TCD IN ('Transferido', 'Criopreservado')"
         
         logger.info("Reading data from gold.planilha_embryoscope_combined...")
-        df = con.execute(f"SELECT * FROM gold.planilha_embryoscope_combined {where_clause}").df()
-        
-        total_rows = len(df)
-        total_cols = len(df.columns)
-        logger.info(f"Loaded {total_rows:,} rows and {total_cols} columns")
+        total_rows = con.execute(f"SELECT COUNT(*) FROM gold.planilha_embryoscope_combined {where_clause}").fetchone()[0]
+        logger.info(f"{total_rows:,} rows match the filter")
         
         if total_rows == 0:
             logger.warning("No data matches the filter criteria. Skipping export.")
@@ -62,14 +63,9 @@ def main():
         
         logger.info(f"Writing all data to {output_path}...")
         
-        # Using xlsxwriter for performance. No column filtering as requested.
-        with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='CombinedData', index=False)
-            
-            # Simple Column Formatting
-            worksheet = writer.sheets['CombinedData']
-            # Set a standard width for all columns (faster than auto-adjusting 222 columns)
-            worksheet.set_column(0, total_cols - 1, 15)
+        # No column filtering as requested. Same width for all columns (faster than auto-adjusting 222 columns)
+        export_query_to_excel(con, f"SELECT * FROM gold.planilha_embryoscope_combined {where_clause}", output_path,
+                              sheet_name='CombinedData', column_width=15, log=logger.info)
             
         logger.info("Excel export completed successfully.")
         
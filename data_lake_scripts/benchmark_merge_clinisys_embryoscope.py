@@ -0,0 +1,167 @@
+"""
+Benchmark + row parity check for the clinisys-embryoscope merge (01_merge_clinisys_embryoscope.py).
+
+Runs the BETWEEN range join the merge uses by default and the candidate-table
+path used with merge_max_candidates_per_oocyte on the same gold tables,
+reports wall time for both, and verifies that the candidate path keeping all
+candidates produces exactly the range join rows (EXCEPT ALL in both
+directions). Also reports what ranking with merge_max_candidates_per_oocyte=1
+would change: rows dropped and clinisys rows that would no longer be
+duplicated.
+
+Usage:
+    python benchmark_merge_clinisys_embryoscope.py                 # uses the data lake (read-only)
+    python benchmark_merge_clinisys_embryoscope.py --synthetic 500000
+    python benchmark_merge_clinisys_embryoscope.py --synthetic 500000 --cycles-per-patient 40
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import time
+from datetime import datetime
+
+import duckdb
+
+# Setup logging
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# The merge script name starts with a digit, so load it by path
+_spec = importlib.util.spec_from_file_location(
+    'merge_clinisys_embryoscope',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '01_merge_clinisys_embryoscope.py'),
+)
+merge = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(merge)
+
+def load_synthetic(con, n_rows, cycles_per_patient):
+    """
+    Synthetic gold tables: ~8 embryos per cycle, several cycles per patient (some
+    only days apart, so the ±3 day window is ambiguous), NULL dates/prontuarios,
+    and Embryoscope fertilization times shifted -4..+4 days from the DL date.
+    """
+    n_cycles = max(n_rows // 8, 1)
+    n_patients = max(n_cycles // cycles_per_patient, 1)
+    con.execute('CREATE SCHEMA IF NOT EXISTS gold')
+    con.execute(f'''
+        CREATE TABLE gold.clinisys_embrioes AS
+        WITH cycles AS (
+            SELECT
+                k AS cycle_id,
+                CASE WHEN k % 101 = 0 THEN NULL ELSE 100000 + CAST(hash(k, 'p') % {n_patients} AS INTEGER) END AS micro_prontuario,
+                CASE WHEN k % 67 = 0 THEN NULL
+                     ELSE DATE '2018-01-01' + CAST(hash(k, 'd') % 2500 AS INTEGER) END AS micro_Data_DL
+            FROM range({n_cycles}) t(k)
+        )
+        SELECT
+            i AS oocito_id,
+            c.cycle_id AS oocito_id_micromanipulacao,
+            c.micro_prontuario,
+            c.micro_Data_DL,
+            CAST(i % 8 + 1 AS INTEGER) AS oocito_embryo_number,
+            CASE i % 3 WHEN 0 THEN 'MII' WHEN 1 THEN 'MI' ELSE 'VG' END AS oocito_Maturidade
+        FROM range({n_rows}) t(i)
+        JOIN cycles c ON c.cycle_id = i // 8
+    ''')
+    con.execute(f'''
+        CREATE TABLE gold.embryoscope_embrioes AS
+        SELECT
+            'E' || CAST(oocito_id AS VARCHAR) || '_' || CAST(dup AS VARCHAR) AS embryo_EmbryoID,
+            CASE WHEN oocito_id % 53 = 0 THEN NULL ELSE micro_prontuario END AS prontuario,
+            oocito_embryo_number AS embryo_embryo_number,
+            CAST(micro_Data_DL + CAST(hash(oocito_id, dup, 'shift') % 9 AS INTEGER) - 4 AS TIMESTAMP)
+                + INTERVAL (CAST(hash(oocito_id, dup, 'h') % 24 AS INTEGER)) HOUR AS embryo_FertilizationTime,
+            CASE oocito_id % 4 WHEN 0 THEN 'Transfer' WHEN 1 THEN 'Freeze' ELSE 'Discard' END AS embryo_EmbryoFate
+        FROM gold.clinisys_embrioes,
+             range(CASE WHEN oocito_id % 9 = 0 THEN 2 ELSE 1 END) t(dup)
+        WHERE oocito_id % 5 != 0
+    ''')
+
+
+def timed(con, label, sql):
+    start = time.time()
+    con.execute(sql)
+    secs = time.time() - start
+    logger.info(f'{label}: {secs:.2f}s')
+    return secs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the clinisys-embryoscope ±3 day merge')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Use N synthetic clinisys rows instead of the data lake gold tables')
+    parser.add_argument('--cycles-per-patient', type=int, default=10,
+                        help='Synthetic cycles per prontuario; drives the (prontuario, embryo_number) fan-out')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        con = duckdb.connect()
+        logger.info(f'Generating {args.synthetic:,} synthetic clinisys rows')
+        load_synthetic(con, args.synthetic, args.cycles_per_patient)
+    else:
+        logger.info(f'Opening {merge.db_path} (read-only)')
+        con = duckdb.connect(merge.db_path, read_only=True)
+
+    resources = merge.duckdb_manager.resolve_resources('heavy', merge.config)
+    con.execute(f"SET memory_limit='{resources['memory_limit']}'")
+    con.execute(f"SET threads={resources['threads']}")
+    logger.info(f"DuckDB configuration: memory_limit={resources['memory_limit']}, threads={resources['threads']}")
+
+    clinisys_count = con.execute('SELECT COUNT(*) FROM gold.clinisys_embrioes').fetchone()[0]
+    embryoscope_count = con.execute('SELECT COUNT(*) FROM gold.embryoscope_embrioes').fetchone()[0]
+    logger.info(f'Clinisys rows: {clinisys_count:,} | Embryoscope rows: {embryoscope_count:,}')
+
+    columns = [f'c.{col}' for col in con.execute('DESCRIBE gold.clinisys_embrioes').df()['column_name']] + ['e.*']
+
+    legacy_secs = timed(con, 'Range join (BETWEEN)', f'''
+        CREATE TEMP TABLE legacy AS
+        {merge.build_range_merge_query(columns)}
+    ''')
+    candidates_secs = timed(con, 'Range join candidates',
+                            f"CREATE TEMP TABLE merge_candidates AS {merge.build_merge_candidates_query()}")
+    rewrite_secs = candidates_secs + timed(con, 'Candidates final LEFT JOIN (all candidates)',
+                                           f"CREATE TEMP TABLE rewritten AS {merge.build_merge_query(columns, 'merge_candidates')}")
+
+    only_legacy = con.execute('SELECT COUNT(*) FROM (SELECT * FROM legacy EXCEPT ALL SELECT * FROM rewritten)').fetchone()[0]
+    only_rewritten = con.execute('SELECT COUNT(*) FROM (SELECT * FROM rewritten EXCEPT ALL SELECT * FROM legacy)').fetchone()[0]
+    legacy_rows = con.execute('SELECT COUNT(*) FROM legacy').fetchone()[0]
+    rewritten_rows = con.execute('SELECT COUNT(*) FROM rewritten').fetchone()[0]
+
+    # What ranking would change (informational, not part of the parity gate)
+    ranked_secs = candidates_secs + timed(con, 'Candidates final LEFT JOIN (top-ranked candidate only)',
+                                          f"CREATE TEMP TABLE ranked AS {merge.build_merge_query(columns, 'merge_candidates', max_candidates=1)}")
+    ranked_rows = con.execute('SELECT COUNT(*) FROM ranked').fetchone()[0]
+    n_ambiguous = con.execute(
+        'SELECT COUNT(*) FROM (SELECT c_rowid FROM merge_candidates GROUP BY c_rowid HAVING COUNT(*) > 1)'
+    ).fetchone()[0]
+
+    logger.info('=' * 60)
+    logger.info(f'Range join rows: {legacy_rows:,} | Candidate path rows: {rewritten_rows:,}')
+    logger.info(f'Range join {legacy_secs:.2f}s | candidate path {rewrite_secs:.2f}s | ranked {ranked_secs:.2f}s')
+    logger.info(f'Ranking (max 1 candidate): {ranked_rows:,} rows, {legacy_rows - ranked_rows:,} duplicate rows removed '
+                f'across {n_ambiguous:,} ambiguous clinisys rows')
+    logger.info('=' * 60)
+
+    con.close()
+    if only_legacy or only_rewritten or legacy_rows != rewritten_rows:
+        logger.error(f'PARITY FAILED: {only_legacy} rows only in the range join, {only_rewritten} rows only in the candidate path')
+        raise SystemExit(1)
+    logger.info(f'PARITY OK: {legacy_rows:,} rows identical')
+
+
+if __name__ == '__main__':
+    main()
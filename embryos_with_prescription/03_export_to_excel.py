@@ -1,9 +1,12 @@
 import duckdb
-import pandas as pd
 import os
+import sys
 import logging
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons.excel_export import export_query_to_excel
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,14 +35,10 @@ def main():
     conn = duckdb.connect(db_path, read_only=True)
     
     try:
-        logger.info("Loading table gold.embryos_with_prescription_wide into pandas...")
-        df = conn.execute("SELECT * FROM gold.embryos_with_prescription_wide").df()
-        
-        logger.info(f"Loaded {len(df):,} rows and {len(df.columns):,} columns.")
-        
-        logger.info(f"Exporting to {export_path}...")
-        # engine='openpyxl' is default for .xlsx in modern pandas
-        df.to_excel(export_path, index=False)
+        logger.info(f"Exporting gold.embryos_with_prescription_wide to {export_path}...")
+        # Rows are streamed into the workbook, the table is never loaded into pandas
+        export_query_to_excel(conn, "SELECT * FROM gold.embryos_with_prescription_wide", export_path,
+                              log=logger.info)
         
         logger.info("Export completed successfully.")
 
@@ -5,7 +5,8 @@ Converts EmbryoScope bronze (raw JSON) tables into structured silver tables
 for each per-clinic DuckDB database.
 
 Patient-prontuario linking is performed by
-commons.prontuario_matching_v1.find_prontuarios (Strategy L):
+commons.prontuario_matching_v1.find_prontuarios_batch (Strategy L), once for
+all clinic databases after their silver.patients tables are rebuilt:
   Tier 0 -- Direct ID match against clinisys codigo
   Tier 1 -- CPF exact match
   Tier 2 -- ID + birthdate match
@@ -29,7 +30,7 @@ sys.path.insert(0, root_dir)
 
 from transformations import flatten_patients_json, flatten_embryo_json
 from patient_id_cleaner import clean_patient_id
-from commons.prontuario_matching_v1 import find_prontuarios
+from commons.prontuario_matching_v1 import find_prontuarios_batch
 import feature_engineering
 
 # -- Logging setup ---------------------------------------------------------------
@@ -125,27 +126,8 @@ _TIER_LABELS = {
 }
 
 
-def _run_prontuario_matching(con, db_name):
-    """
-    Call find_prontuarios against silver.patients and log a tier-breakdown summary.
-    Updates the prontuario column in-place (suffix='').
-    """
-    clinisys_db_path = os.path.join(root_dir, 'database', 'clinisys_all.duckdb')
-    logger.info(f"[{db_name}] Running prontuario matching (find_prontuarios / Strategy L) ...")
-
-    df_matches = find_prontuarios(
-        source_con=con,
-        clinisys_db_path=clinisys_db_path,
-        source_schema='silver',
-        source_table='patients',
-        id_col='PatientID',
-        name_col='FirstName',
-        birthdate_col='DateOfBirth',
-        cpf_col=None,
-        label=db_name,
-        suffix='',
-    )
-
+def _log_matching_summary(df_matches, db_name):
+    """Log a tier-breakdown summary of one clinic's matching result."""
     total   = len(df_matches)
     matched = int((df_matches['prontuario'] != -1).sum())
     rate    = matched / total * 100 if total else 0.0
@@ -174,10 +156,61 @@ def _run_prontuario_matching(con, db_name):
     logger.info(f"[{db_name}] === END PRONTUARIO MATCHING SUMMARY ===")
 
 
+def _run_prontuario_matching(db_paths):
+    """
+    Attach every clinic database and run find_prontuarios_batch once against
+    all silver.patients tables, so candidates are scored per unique patient
+    rather than per clinic. Updates the prontuario columns in-place (suffix='').
+    """
+    clinisys_db_path = os.path.join(root_dir, 'database', 'clinisys_all.duckdb')
+    logger.info("Running prontuario matching (find_prontuarios_batch / Strategy L) ...")
+
+    try:
+        with duckdb.connect() as con:
+            sources = []
+            for db_path in db_paths:
+                db_name = os.path.basename(db_path)
+                alias = os.path.splitext(db_name)[0].replace('-', '_').replace(' ', '_')
+                con.execute(f"ATTACH '{db_path}' AS {alias}")
+                has_patients = con.execute(
+                    "SELECT COUNT(*) FROM information_schema.tables "
+                    f"WHERE table_catalog = '{alias}' AND table_schema = 'silver' AND table_name = 'patients'"
+                ).fetchone()[0]
+                if not has_patients:
+                    logger.warning(f"[{db_name}] silver.patients not found, skipping prontuario matching")
+                    continue
+                sources.append({
+                    'source_schema': f'{alias}.silver',
+                    'source_table': 'patients',
+                    'id_col': 'PatientID',
+                    'name_col': 'FirstName',
+                    'birthdate_col': 'DateOfBirth',
+                    'cpf_col': None,
+                    'label': db_name,
+                })
+
+            if not sources:
+                logger.warning("No silver.patients tables to match.")
+                return
+
+            results = find_prontuarios_batch(
+                source_con=con,
+                clinisys_db_path=clinisys_db_path,
+                sources=sources,
+                suffix='',
+            )
+    except Exception as e:
+        logger.error(f"Failed to run prontuario matching: {e}")
+        return
+
+    for db_name, df_matches in results.items():
+        _log_matching_summary(df_matches, db_name)
+
+
 # -- Table processors ------------------------------------------------------------
 
 def process_database(db_path):
-    """Bronze -> silver: raw_patients -> silver.patients (with prontuario matching)."""
+    """Bronze -> silver: raw_patients -> silver.patients (prontuario matched later in batch)."""
     db_name = os.path.basename(db_path)
     logger.info(f"[{db_name}] Processing patients table.")
     try:
@@ -235,8 +268,6 @@ def process_database(db_path):
         con.unregister('patients_df')
         logger.info(f"[{db_name}] silver.patients creation complete.")
 
-        _run_prontuario_matching(con, db_name)
-
         con.close()
     except Exception as e:
         logger.error(f"[{db_name}] Failed to process patients: {e}")
@@ -559,6 +590,9 @@ def main():
         logger.info(f"Finished: {os.path.basename(db_path)}")
         logger.info("=" * 60)
 
+    # Prontuario matching for all clinics in one batch
+    _run_prontuario_matching(db_paths)
+
     # Create indexes for JOIN performance in the gold layer
     logger.info('Creating indexes for JOIN performance ...')
     for db_path in db_paths:
@@ -1,9 +1,13 @@
 import duckdb
 import os
+import sys
 import logging
 from datetime import datetime
 import yaml
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import cached_build
+
 # Load config and logging level
 script_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(script_dir)
@@ -38,6 +42,14 @@ logger = logging.getLogger(__name__)
 source_db_path = r'G:\My Drive\projetos_individuais\Huntington\database\huntington_data_lake.duckdb'
 target_db_path = r'G:\My Drive\projetos_individuais\Huntington\database\huntington_data_lake.duckdb'
 
+# Silver tables read by the gold query (fingerprinted by the build cache)
+GOLD_INPUT_TABLES = [
+    'silver_embryoscope.patients',
+    'silver_embryoscope.treatments',
+    'silver_embryoscope.embryo_data',
+    'silver_embryoscope.idascore',
+]
+
 def build_query(con=None):
     """Build SELECT query based on configured columns"""
     logger.info('Building query based on config...')
@@ -142,28 +154,33 @@ def main():
             
             query = build_query(con)
             
-            # Execute query
-            logger.info('Executing gold layer transformation...')
-            df = con.execute(query).df()
-            logger.info(f'Read {len(df)} rows')
-            
-            if df.empty:
-                logger.warning('No data found')
-                return
+            def build_gold_table():
+                # Execute query
+                logger.info('Executing gold layer transformation...')
+                df = con.execute(query).df()
+                logger.info(f'Read {len(df)} rows')
+                
+                if df.empty:
+                    logger.warning('No data found')
+                    return False
 
-            # Write to gold schema
-            logger.info('Writing to gold.embryoscope_embrioes...')
-            con.execute('CREATE SCHEMA IF NOT EXISTS gold')
-            con.execute('DROP TABLE IF EXISTS gold.embryoscope_embrioes')
-            con.register('df_gold', df)
-            con.execute('CREATE TABLE gold.embryoscope_embrioes AS SELECT * FROM df_gold')
-            con.unregister('df_gold')
+                # Write to gold schema
+                logger.info('Writing to gold.embryoscope_embrioes...')
+                con.execute('CREATE SCHEMA IF NOT EXISTS gold')
+                con.execute('DROP TABLE IF EXISTS gold.embryoscope_embrioes')
+                con.register('df_gold', df)
+                con.execute('CREATE TABLE gold.embryoscope_embrioes AS SELECT * FROM df_gold')
+                con.unregister('df_gold')
+                
+                # Create indexes
+                logger.info('Creating indexes...')
+                con.execute("CREATE INDEX IF NOT EXISTS idx_es_fert_time ON gold.embryoscope_embrioes(embryo_FertilizationTime)")
+                con.execute("CREATE INDEX IF NOT EXISTS idx_es_patient_id ON gold.embryoscope_embrioes(patient_PatientID)")
+                con.execute("CREATE INDEX IF NOT EXISTS idx_es_embryo_id ON gold.embryoscope_embrioes(embryo_EmbryoID)")
             
-            # Create indexes
-            logger.info('Creating indexes...')
-            con.execute("CREATE INDEX IF NOT EXISTS idx_es_fert_time ON gold.embryoscope_embrioes(embryo_FertilizationTime)")
-            con.execute("CREATE INDEX IF NOT EXISTS idx_es_patient_id ON gold.embryoscope_embrioes(patient_PatientID)")
-            con.execute("CREATE INDEX IF NOT EXISTS idx_es_embryo_id ON gold.embryoscope_embrioes(embryo_EmbryoID)")
+            # Skip the rebuild when neither the silver tables nor the generated query changed
+            if not cached_build(con, 'gold.embryoscope_embrioes', GOLD_INPUT_TABLES, build_gold_table, key=query):
+                return
             
             count = con.execute("SELECT COUNT(*) FROM gold.embryoscope_embrioes").fetchone()[0]
             logger.info(f'Success! gold.embryoscope_embrioes created with {count} rows')
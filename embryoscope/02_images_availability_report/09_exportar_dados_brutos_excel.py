@@ -1,10 +1,13 @@
 
 import duckdb
-import pandas as pd
+import sys
 from pathlib import Path
 from datetime import datetime
 import os
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from commons.excel_export import export_query_to_excel
+
 # Configuration
 DB_PATH = Path('G:/My Drive/projetos_individuais/Huntington/database/huntington_data_lake.duckdb')
 OUTPUT_DIR = Path('G:/My Drive/projetos_individuais/Huntington/embryoscope/report/exports')
@@ -14,28 +17,26 @@ def main():
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     print("Iniciando exportação de dados brutos (SILVER) para Excel...")
     
-    # Connect and Load
     conn = duckdb.connect(str(DB_PATH), read_only=True)
-    df = conn.execute("SELECT * FROM silver.embryo_image_availability_latest").df()
-    conn.close()
-    
-    print(f"Dados carregados: {len(df)} linhas.")
     
     # Sort for better readability
     # Checking if columns exist to avoid errors
+    columns = [row[0] for row in conn.execute("DESCRIBE silver.embryo_image_availability_latest").fetchall()]
     sort_cols = []
-    if 'patient_unit_huntington' in df.columns: sort_cols.append('patient_unit_huntington')
-    if 'embryo_EmbryoDate' in df.columns: sort_cols.append('embryo_EmbryoDate')
-    
-    if sort_cols:
-        df = df.sort_values(sort_cols, ascending=[True, False])
+    if 'patient_unit_huntington' in columns: sort_cols.append('patient_unit_huntington ASC')
+    if 'embryo_EmbryoDate' in columns: sort_cols.append('"embryo_EmbryoDate" DESC')
+    order_by = f" ORDER BY {', '.join(sort_cols)}" if sort_cols else ""
 
     # Export
     filename = f"dados_brutos_disponibilidade_{timestamp}.xlsx"
     filepath = OUTPUT_DIR / filename
     
     print(f"Salvando arquivo Excel...")
-    df.to_excel(filepath, index=False, engine='openpyxl')
+    result = export_query_to_excel(conn, f"SELECT * FROM silver.embryo_image_availability_latest{order_by}",
+                                   str(filepath), log=print)
+    conn.close()
+    
+    print(f"Dados exportados: {result.rows} linhas.")
     
     print(f"\n✅ Exportação concluída com sucesso!")
     print(f"📍 Localização: {filepath.resolve()}")
@@ -11,19 +11,11 @@ from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import hashlib
 import json
+import sys
 from utils.schema_config import get_table_schema, get_supported_data_types, validate_data_type
 
-
-def check_db_lock(db_path):
-    """Check if the DuckDB file can be opened (not locked by another process)."""
-    import duckdb
-    try:
-        conn = duckdb.connect(db_path)
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"ERROR: Cannot open database file '{db_path}'. It may be locked by another process.\nDetails: {e}")
-        return False
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager
 
 
 class EmbryoscopeDatabaseManager:
@@ -44,38 +36,18 @@ class EmbryoscopeDatabaseManager:
         # Ensure database directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
-        # Check for DB lock before proceeding
-        if not check_db_lock(db_path):
-            raise RuntimeError(f"Database file '{db_path}' is locked. Please close all other processes using this file and try again.")
-        
-        # Initialize database
+        # Initialize database (waits while another process holds the file lock)
         self._init_database()
     
     def _init_database(self):
         """Initialize database schema and tables."""
-        try:
-            with duckdb.connect(self.db_path) as conn:
-                # Only create bronze schema
-                conn.execute(f"CREATE SCHEMA IF NOT EXISTS bronze")
-                # Create metadata tables (default schema)
-                self._create_metadata_tables(conn)
-                # Create data tables (default schema)
-                self._create_data_tables(conn)
-        except Exception as e:
-            if "being used by another process" in str(e):
-                self.logger.warning(f"Database file is locked, will retry: {e}")
-                # Wait a bit and retry
-                import time
-                time.sleep(2)
-                with duckdb.connect(self.db_path) as conn:
-                    # Only create bronze schema
-                    conn.execute(f"CREATE SCHEMA IF NOT EXISTS bronze")
-                    # Create metadata tables (default schema)
-                    self._create_metadata_tables(conn)
-                    # Create data tables (default schema)
-                    self._create_data_tables(conn)
-            else:
-                raise
+        with duckdb_manager.connect(self.db_path) as conn:
+            # Only create bronze schema
+            conn.execute(f"CREATE SCHEMA IF NOT EXISTS bronze")
+            # Create metadata tables (default schema)
+            self._create_metadata_tables(conn)
+            # Create data tables (default schema)
+            self._create_data_tables(conn)
     
     def _create_metadata_tables(self, conn):
         """Create metadata tables for tracking extractions."""
@@ -199,7 +171,7 @@ class EmbryoscopeDatabaseManager:
         import pandas as pd
         df = pd.DataFrame(rows)
         # Deduplicate: only insert if (business key + hash) not already present
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             self._create_bronze_tables(conn)
             # Build where clause for deduplication
             if not df.empty:
@@ -338,48 +310,29 @@ class EmbryoscopeDatabaseManager:
         """
         row_counts = {}
         
-        # Retry logic for database file locking
-        max_retries = 3
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                with duckdb.connect(self.db_path) as conn:
-                    for data_type, df in dataframes.items():
-                        if df.empty:
-                            row_counts[data_type] = 0
-                            continue
-                        
-                        self.logger.info(f"DEBUG: Processing data_type: {data_type}")
-                        table_name = self._get_table_name(data_type)
-                        self.logger.info(f"DEBUG: Target table: {table_name}")
-                        
-                        # Insert data incrementally
-                        inserted_rows = self._insert_data_incremental(conn, df, table_name, location, run_id)
-                        row_counts[data_type] = inserted_rows
-                        
-                        # Update metadata
-                        metadata = {
-                            'last_extraction_timestamp': extraction_timestamp,
-                            'last_row_count': len(df),
-                            'last_data_hash': self._generate_data_hash(df),
-                            'change_detection_method': 'hash_based',
-                            'extraction_strategy': 'incremental'
-                        }
-                        self._update_view_metadata(conn, data_type, location, metadata)
-                
-                # If we get here, the operation was successful
-                return row_counts
-                
-            except Exception as e:
-                if "being used by another process" in str(e) and attempt < max_retries - 1:
-                    self.logger.warning(f"Database file is locked (attempt {attempt + 1}/{max_retries}), retrying in {retry_delay} seconds: {e}")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    self.logger.error(f"Failed to save data after {max_retries} attempts: {e}")
-                    raise
+        with duckdb_manager.connect(self.db_path) as conn:
+            for data_type, df in dataframes.items():
+                if df.empty:
+                    row_counts[data_type] = 0
+                    continue
+
+                self.logger.info(f"DEBUG: Processing data_type: {data_type}")
+                table_name = self._get_table_name(data_type)
+                self.logger.info(f"DEBUG: Target table: {table_name}")
+
+                # Insert data incrementally
+                inserted_rows = self._insert_data_incremental(conn, df, table_name, location, run_id)
+                row_counts[data_type] = inserted_rows
+
+                # Update metadata
+                metadata = {
+                    'last_extraction_timestamp': extraction_timestamp,
+                    'last_row_count': len(df),
+                    'last_data_hash': self._generate_data_hash(df),
+                    'change_detection_method': 'hash_based',
+                    'extraction_strategy': 'incremental'
+                }
+                self._update_view_metadata(conn, data_type, location, metadata)
         
         return row_counts
     
@@ -406,7 +359,7 @@ class EmbryoscopeDatabaseManager:
         """
         table_name = self._get_table_name(data_type)
         
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             query = f"""
                 SELECT * FROM {table_name}
                 WHERE _location = ? AND _extraction_timestamp = (
@@ -426,7 +379,7 @@ class EmbryoscopeDatabaseManager:
         Returns:
             Set of tuples (PatientIDx, TreatmentName) representing existing pairs
         """
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             # Query treatments table to get existing pairs
             query = """
                 SELECT DISTINCT PatientIDx, TreatmentName 
@@ -453,7 +406,7 @@ class EmbryoscopeDatabaseManager:
         """
         summary = {}
         
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             data_types = ['patients', 'treatments', 'embryo_data', 'idascore']
             
             for data_type in data_types:
@@ -493,7 +446,7 @@ class EmbryoscopeDatabaseManager:
         Returns:
             Dataframe with extraction history
         """
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             if location:
                 query = f"""
                     SELECT * FROM incremental_runs
@@ -517,7 +470,7 @@ class EmbryoscopeDatabaseManager:
         Args:
             days_to_keep: Number of days of data to keep
         """
-        with duckdb.connect(self.db_path) as conn:
+        with duckdb_manager.connect(self.db_path) as conn:
             data_types = ['patients', 'treatments', 'embryo_data', 'idascore']
             
             for data_type in data_types:
@@ -1,6 +1,9 @@
 import duckdb
-import pandas as pd
 import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commons.excel_export import export_query_to_excel
 
 # Database path
 db_path = r"g:\My Drive\projetos_individuais\Huntington\database\clinisys_all.duckdb"
@@ -29,14 +32,13 @@ def main():
         # Use duckdb to fetch data
         con = duckdb.connect(db_path, read_only=True)
         print("Executing query...")
-        df = con.execute(query).df()
-        con.close()
-
-        print(f"Found {len(df)} records.")
         
-        # Export to Excel
+        # Export to Excel, streaming the rows
         print(f"Exporting to {output_file}...")
-        df.to_excel(output_file, index=False)
+        result = export_query_to_excel(con, query, output_file, log=print)
+        con.close()
+
+        print(f"Found {result.rows} records.")
         print("Export completed successfully.")
 
     except Exception as e:
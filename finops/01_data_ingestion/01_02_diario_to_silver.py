@@ -12,6 +12,10 @@ import pandas as pd
 import duckdb
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -39,7 +43,7 @@ def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
@@ -2,6 +2,9 @@
 """
 FinOps Data Loader - Load Excel files from matr550 folder to bronze schema
 Loads billing data from multiple clinic locations with hash-based deduplication.
+Files unchanged since the last run are skipped (commons/ingestion_registry.py); a
+changed file first deletes the rows it loaded before, then adds its rows whose hash
+is not already in the table.
 """
 
 import logging
@@ -13,6 +16,10 @@ import hashlib
 import os
 import glob
 from pathlib import Path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager, ingestion_registry
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -53,7 +60,7 @@ def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
@@ -115,7 +122,7 @@ def get_existing_hashes(con, table_name):
         return set()
 
 def process_excel_file(file_path, con, existing_hashes):
-    """Process a single Excel file and load data to bronze"""
+    """Process a single Excel file and load data to bronze. Returns the rows inserted, None on error."""
     file_name = os.path.basename(file_path)
     table_name = get_table_name_from_filename(file_name)
     logger.info(f"Processing file: {file_name} -> table: {table_name}")
@@ -170,7 +177,7 @@ def process_excel_file(file_path, con, existing_hashes):
         
     except Exception as e:
         logger.error(f"Error processing file {file_name}: {e}")
-        return 0
+        return None
 
 def main():
     """Main function to load all Excel files to bronze"""
@@ -195,31 +202,85 @@ def main():
         
         logger.info(f"Found {len(excel_files)} Excel files to process")
         
+        # Check every file against the ingestion registry before reading it
+        statuses = {}
+        files_by_table = {}
+        for file_path in excel_files:
+            statuses[file_path] = ingestion_registry.check(con, file_path)
+            files_by_table.setdefault(get_table_name_from_filename(os.path.basename(file_path)), []).append(file_path)
+        
         # Process each file
         total_new_rows = 0
         processed_files = 0
+        skipped_files = 0
         
-        for file_path in excel_files:
-            try:
-                file_name = os.path.basename(file_path)
-                table_name = get_table_name_from_filename(file_name)
-                
-                # Get existing hashes for this specific table
-                existing_hashes = get_existing_hashes(con, table_name)
-                
-                new_rows = process_excel_file(file_path, con, existing_hashes)
-                total_new_rows += new_rows
-                processed_files += 1
-                
-            except Exception as e:
-                logger.error(f"Error processing {file_path}: {e}")
+        for table_name, table_files in files_by_table.items():
+            changed = [f for f in table_files if not statuses[f].unchanged]
+            if not changed:
+                for file_path in table_files:
+                    status = statuses[file_path]
+                    logger.info(f"Skipping unchanged {os.path.basename(file_path)} ({status.reason}; "
+                                f"loaded {status.record['ingested_at']:%Y-%m-%d %H:%M}, {status.record['rows']:,} rows)")
+                skipped_files += len(table_files)
+                continue
+            
+            # A changed file replaces its own rows. Rows it shared with another file of the
+            # same table may have been stored under its name, so when a replacement deleted
+            # rows the other files of the table are re-read as well (they only add hashes
+            # that went missing). A new file deletes nothing and needs no re-read.
+            unchanged = [f for f in table_files if f not in changed]
+            rows_deleted = False
+            for file_path in changed:
+                try:
+                    file_name = os.path.basename(file_path)
+                    status = statuses[file_path]
+                    logger.info(f"Loading {file_name}: {status.reason}")
+                    deleted = ingestion_registry.replace_file_rows(con, f'bronze."{table_name}"', file_name)
+                    if deleted:
+                        rows_deleted = True
+                        logger.info(f"Deleted {deleted:,} rows previously loaded from {file_name}")
+                    
+                    # Get existing hashes for this specific table
+                    existing_hashes = get_existing_hashes(con, table_name)
+                    
+                    new_rows = process_excel_file(file_path, con, existing_hashes)
+                    if new_rows is None:
+                        continue
+                    ingestion_registry.record(con, status, [f'bronze."{table_name}"'], new_rows)
+                    total_new_rows += new_rows
+                    processed_files += 1
+                    
+                except Exception as e:
+                    logger.error(f"Error processing {file_path}: {e}")
+                    continue
+            
+            if not rows_deleted:
+                for file_path in unchanged:
+                    status = statuses[file_path]
+                    logger.info(f"Skipping unchanged {os.path.basename(file_path)} ({status.reason}; "
+                                f"loaded {status.record['ingested_at']:%Y-%m-%d %H:%M}, {status.record['rows']:,} rows)")
+                skipped_files += len(unchanged)
                 continue
+            
+            for file_path in unchanged:
+                try:
+                    logger.info(f"Re-checking {os.path.basename(file_path)} for rows removed from {table_name}")
+                    existing_hashes = get_existing_hashes(con, table_name)
+                    new_rows = process_excel_file(file_path, con, existing_hashes)
+                    if new_rows is None:
+                        continue
+                    total_new_rows += new_rows
+                    processed_files += 1
+                    
+                except Exception as e:
+                    logger.error(f"Error processing {file_path}: {e}")
+                    continue
         
         # Final summary
         logger.info("=" * 50)
         logger.info("LOADING SUMMARY")
         logger.info("=" * 50)
-        logger.info(f"Files processed: {processed_files}/{len(excel_files)}")
+        logger.info(f"Files processed: {processed_files}/{len(excel_files)} ({skipped_files} unchanged, skipped)")
         logger.info(f"New rows inserted: {total_new_rows}")
         
         # Get total rows across all tables
@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
 """
 Mesclada Vendas Loader - Load Excel file from mesclada folder to bronze.mesclada_vendas
-Implements hash-based incremental loading for efficient updates.
-Uses the same strategy as clinisys loader for high performance.
+Reads the sheet once with commons/spreadsheet_reader.py and skips the load when
+the newest file is unchanged since the last run (commons/ingestion_registry.py).
 """
 
 import logging
-import pandas as pd
-import duckdb
 from datetime import datetime
 import os
 import glob
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager, ingestion_registry
+from commons.spreadsheet_reader import insert_sheet, read_workbook
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -39,7 +42,7 @@ def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
@@ -63,7 +66,7 @@ def get_newest_excel_file():
     logger.info(f"Found newest file: {os.path.basename(newest_file)}")
     return newest_file
 
-def create_bronze_table(con, df):
+def create_bronze_table(con, columns):
     """Create the bronze.mesclada_vendas table - drops and recreates for fresh data"""
     logger.info(f"Creating bronze table: {TABLE_NAME}")
     
@@ -74,15 +77,11 @@ def create_bronze_table(con, df):
     con.execute(f"DROP TABLE IF EXISTS bronze.{TABLE_NAME}")
     logger.info(f"Dropped existing bronze.{TABLE_NAME} table")
     
-    # Create table dynamically based on DataFrame columns
-    columns = []
-    for col in df.columns:
-        # Clean column name for SQL (remove special characters)
-        clean_col = col.replace(' ', '_').replace('-', '_').replace('(', '').replace(')', '').replace('%', 'pct').replace('.', '_')
-        columns.append(f'"{col}" VARCHAR')
+    # Create table dynamically based on the sheet columns
+    sql_columns = [f'"{col}" VARCHAR' for col in columns]
     
     # Add metadata columns
-    columns.extend([
+    sql_columns.extend([
         'line_number INTEGER',
         'extraction_timestamp VARCHAR',
         'file_name VARCHAR'
@@ -90,7 +89,7 @@ def create_bronze_table(con, df):
     
     create_table_sql = f"""
     CREATE TABLE bronze.{TABLE_NAME} (
-        {', '.join(columns)}
+        {', '.join(sql_columns)}
     )
     """
     
@@ -103,48 +102,33 @@ def process_excel_file(file_path, con):
     logger.info(f"Processing file: {file_name}")
     
     try:
-        # Read Excel file from BD HT sheet with optimized settings
+        # Read the sheet in one streaming pass, all values as strings
         logger.info(f"Reading sheet '{SHEET_NAME}' from {file_name}")
+        sheets = read_workbook(file_path, [SHEET_NAME])
+        if not sheets:
+            raise ValueError(f"Worksheet named '{SHEET_NAME}' not found")
+        sheet = sheets[0]
         
-        # Use optimized reading settings
-        df = pd.read_excel(
-            file_path, 
-            sheet_name=SHEET_NAME,
-            engine='openpyxl',
-            dtype=str  # Read all as strings to avoid type issues
-        )
-        
-        logger.info(f"Read {len(df)} rows from {file_name}")
+        logger.info(f"Read {len(sheet)} rows from {file_name}")
         
-        if len(df) == 0:
+        if len(sheet) == 0:
             logger.warning(f"No data found in {file_name}")
             return 0
         
-        # Clean data - replace empty strings with None
-        for col in df.columns:
-            df[col] = df[col].replace('', None)
-        
         # Create bronze table for this data
-        create_bronze_table(con, df)
+        create_bronze_table(con, sheet.columns)
         
-        # Add metadata columns
         extraction_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        logger.info(f"Inserting {len(sheet)} rows from {file_name}")
         
-        # Create new DataFrame with all columns to avoid fragmentation
-        new_df = df.copy()
-        new_df['line_number'] = new_df.index  # Add line number based on DataFrame index
-        new_df['extraction_timestamp'] = extraction_timestamp
-        new_df['file_name'] = file_name
-        df = new_df
-        
-        logger.info(f"Inserting {len(df)} rows from {file_name}")
-        
-        # Use the same efficient strategy as clinisys - direct DataFrame insertion
-        # All data is already strings from dtype=str
-        con.execute(f"INSERT INTO bronze.{TABLE_NAME} SELECT * FROM df")
+        # Batched DataFrame insertion; line_number is the row position in the sheet data
+        inserted = insert_sheet(
+            con, f"bronze.{TABLE_NAME}", sheet,
+            metadata={'extraction_timestamp': extraction_timestamp, 'file_name': file_name}
+        )
         
-        logger.info(f"Successfully inserted {len(df)} rows from {file_name}")
-        return len(df)
+        logger.info(f"Successfully inserted {inserted} rows from {file_name}")
+        return inserted
         
     except Exception as e:
         logger.error(f"Error processing file {file_name}: {e}")
@@ -165,8 +149,17 @@ def main():
         # Get the newest Excel file
         file_path = get_newest_excel_file()
         
-        # Process the file
-        new_rows = process_excel_file(file_path, con)
+        # Skip the file if it is unchanged since the last load (size + mtime, then content hash)
+        status = ingestion_registry.check(con, file_path)
+        if status.unchanged:
+            logger.info(f"Skipping unchanged {os.path.basename(file_path)} ({status.reason}; "
+                        f"loaded {status.record['ingested_at']:%Y-%m-%d %H:%M}, {status.record['rows']:,} rows)")
+            new_rows = 0
+        else:
+            # Process the file
+            logger.info(f"Loading {os.path.basename(file_path)}: {status.reason}")
+            new_rows = process_excel_file(file_path, con)
+            ingestion_registry.record(con, status, [f"bronze.{TABLE_NAME}"], new_rows)
         
         # Get final table statistics
         result = con.execute(f'SELECT COUNT(*) FROM bronze.{TABLE_NAME}').fetchone()
@@ -13,6 +13,11 @@ import pandas as pd
 import duckdb
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager
+from commons.prontuario_link_matching import MatchStep, match_prontuarios
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -69,11 +74,20 @@ COLUMN_MAPPING = {
     'Fez Ciclo?': 'Fez Ciclo?'
 }
 
+# Prontuario matching steps, in priority order (commons/prontuario_link_matching.py).
+# A row is matched when the first name in its name_field appears in a name pair
+# of its id that agrees with the patient.
+MATCHING_STEPS = [
+    MatchStep("paciente", "Paciente", name_field="Nom Paciente"),
+    MatchStep("cliente", "Cliente", name_field="Nome"),
+    MatchStep("cliente_totvs", "Cliente_totvs", name_field="Nom Paciente"),
+]
+
 def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
@@ -253,8 +267,8 @@ def create_silver_table(con, df):
     logger.info(f"Table silver.{SILVER_TABLE} created/verified")
 
 def update_prontuario_column(con):
-    """Update prontuario column using three-step matching logic with clinisys_all.silver.view_pacientes"""
-    logger.info("Updating prontuario column using three-step matching logic...")
+    """Update prontuario column with three-step matching against clinisys_all.silver.view_pacientes (active patients first, then inactive)"""
+    logger.info("Updating prontuario column...")
     
     # Attach clinisys_all database
     clinisys_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'database', 'clinisys_all.duckdb')
@@ -262,370 +276,30 @@ def update_prontuario_column(con):
     con.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
     logger.info("clinisys_all database attached successfully")
     
-    # Define matching steps
-    matching_steps = [
-        {
-            "name": "Paciente",
-            "column": "Paciente",
-            "name_field": "Nom Paciente",
-            "filter_condition": 'AND "Paciente" IS NOT NULL AND "Paciente" != \'\'',
-            "numeric_filter": False
-        },
-        {
-            "name": "Cliente", 
-            "column": "Cliente",
-            "name_field": "Nome",
-            "filter_condition": 'AND "Cliente" IS NOT NULL',
-            "numeric_filter": False
-        },
-        {
-            "name": "Cliente_totvs",
-            "column": "Cliente_totvs",
-            "name_field": "Nom Paciente",  # Default to Nom Paciente, but could be made more flexible
-            "filter_condition": 'AND "Cliente_totvs" IS NOT NULL AND "Cliente_totvs" != \'\' AND TRY_CAST("Cliente_totvs" AS INTEGER) IS NOT NULL',
-            "numeric_filter": True
-        }
-    ]
-    
-    # First pass: Active patients only (inativo = 0)
-    logger.info("=== FIRST PASS: Active patients only (inativo = 0) ===")
-    for i, step in enumerate(matching_steps, 1):
-        logger.info(f"Step {i}: Matching using {step['name']} (active patients only)...")
-        update_prontuario_with_column(con, step, i == len(matching_steps), include_inactive=False)
-    
-    # Second pass: Inactive patients only (inativo = 1) - only for unmatched records
-    logger.info("=== SECOND PASS: Inactive patients only (inativo = 1) ===")
-    for i, step in enumerate(matching_steps, 1):
-        logger.info(f"Step {i}: Matching using {step['name']} (inactive patients only)...")
-        update_prontuario_with_column(con, step, i == len(matching_steps), include_inactive=True)
-
-def update_prontuario_with_column(con, step_config, is_final_step=False, include_inactive=False):
-    """Update prontuario column using parameterized matching logic"""
-    column_name = step_config["name"]
-    column_field = step_config["column"]
-    name_field = step_config["name_field"]
-    filter_condition = step_config["filter_condition"]
-    
-    # Determine inactive filter condition
-    inactive_condition = "inativo = 1" if include_inactive else "inativo = 0"
-    
-    patient_type = "inactive" if include_inactive else "active"
-    logger.info(f"Running {column_name}-based matching logic ({patient_type} patients)...")
-    
-    # Generate match type prefix
-    match_type_prefix = column_name.lower().replace('_', '_')
-    
-    # Build the SQL query dynamically
-    update_sql = f"""
-    WITH 
-    -- CTE 1: Extract unmatched records using {column_name}
-    mesclada_extract AS (
-        SELECT DISTINCT 
-            "{column_field}" as {column_field}, 
-            CASE 
-                WHEN "Nome" IS NOT NULL THEN strip_accents(LOWER(SPLIT_PART(TRIM("Nome"), ' ', 1)))
-                ELSE NULL 
-            END as nome_first,
-            CASE 
-                WHEN "Nom Paciente" IS NOT NULL THEN strip_accents(LOWER(SPLIT_PART(TRIM("Nom Paciente"), ' ', 1)))
-                ELSE NULL 
-            END as nom_paciente_first
-        FROM silver.mesclada_vendas
-        WHERE prontuario = -1 
-          {filter_condition}
-        
-    ),
-
-    -- CTE 1B: Pre-process clinisys data with all transformations and accent normalization
-    clinisys_processed AS (
-        SELECT 
-            codigo,
-            prontuario_esposa,
-            prontuario_marido,
-            prontuario_responsavel1,
-            prontuario_responsavel2,
-            prontuario_esposa_pel,
-            prontuario_marido_pel,
-            prontuario_esposa_pc,
-            prontuario_marido_pc,
-            prontuario_responsavel1_pc,
-            prontuario_responsavel2_pc,
-            prontuario_esposa_fc,
-            prontuario_marido_fc,
-            prontuario_esposa_ba,
-            prontuario_marido_ba,
-            strip_accents(LOWER(SPLIT_PART(TRIM(esposa_nome), ' ', 1))) as esposa_nome,
-    		strip_accents(LOWER(SPLIT_PART(TRIM(marido_nome), ' ', 1))) as marido_nome,
-            unidade_origem
-        FROM clinisys_all.silver.view_pacientes
-        where {inactive_condition}
-    ),
-
-    -- CTE 2: {column_name} ↔ prontuario (main/codigo)
-    matches_1 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_main' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.codigo
-    ),
-
-    -- CTE 3: {column_name} ↔ prontuario_esposa
-    matches_2 AS (
-        SELECT d.*, 
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_esposa' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_esposa
-    ),
-
-    -- CTE 4: {column_name} ↔ prontuario_marido
-    matches_3 AS (
-        SELECT d.*,
-              p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_marido' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_marido
-    ),
-
-    -- CTE 5: {column_name} ↔ prontuario_responsavel1
-    matches_4 AS (
-        SELECT d.*,
-              p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_responsavel1' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_responsavel1
-    ),
-
-    -- CTE 6: {column_name} ↔ prontuario_responsavel2
-    matches_5 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_responsavel2' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_responsavel2
-    ),
-
-    -- CTE 7: {column_name} ↔ prontuario_esposa_pel
-    matches_6 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_esposa_pel' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_esposa_pel
-    ),
-
-    -- CTE 8: {column_name} ↔ prontuario_marido_pel
-    matches_7 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_marido_pel' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_marido_pel
-    ),
-    -- CTE 9: {column_name} ↔ prontuario_esposa_pc
-    matches_8 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_esposa_pc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_esposa_pc
-    ),
-    -- CTE 10: {column_name} ↔ prontuario_marido_pc
-    matches_9 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_marido_pc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_marido_pc
-    ),
-    -- CTE 11: {column_name} ↔ prontuario_responsavel1_pc
-    matches_10 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_responsavel1_pc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_responsavel1_pc
-    ),
-    -- CTE 12: {column_name} ↔ prontuario_responsavel2_pc
-    matches_11 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_responsavel2_pc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_responsavel2_pc
-    ),
-    -- CTE 13: {column_name} ↔ prontuario_esposa_fc
-    matches_12 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_esposa_fc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_esposa_fc
-    ),
-    -- CTE 14: {column_name} ↔ prontuario_marido_fc
-    matches_13 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_marido_fc' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_marido_fc
-    ),
-    -- CTE 15: {column_name} ↔ prontuario_esposa_ba
-    matches_14 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_esposa_ba' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_esposa_ba
-    ),
-    -- CTE 16: {column_name} ↔ prontuario_marido_ba
-    matches_15 AS (
-        SELECT d.*,
-               p.codigo as prontuario, p.esposa_nome, p.marido_nome, p.unidade_origem,
-               '{match_type_prefix}_marido_ba' as match_type
-        FROM mesclada_extract d
-        INNER JOIN clinisys_processed p 
-            ON d.{column_field} = p.prontuario_marido_ba
-    ),
-
-    -- CTE 17: UNION matches
-    all_matches AS (
-        SELECT * FROM matches_1
-        UNION
-        SELECT * FROM matches_2
-        UNION
-        SELECT * FROM matches_3
-        UNION 
-        SELECT * FROM matches_4
-        UNION
-        SELECT * FROM matches_5
-        UNION
-        SELECT * FROM matches_6
-        UNION
-        SELECT * FROM matches_7
-        UNION
-        SELECT * FROM matches_8
-        UNION
-        SELECT * FROM matches_9
-        UNION
-        SELECT * FROM matches_10
-        UNION
-        SELECT * FROM matches_11
-        UNION
-        SELECT * FROM matches_12
-        UNION
-        SELECT * FROM matches_13
-        UNION
-        SELECT * FROM matches_14
-        UNION
-        SELECT * FROM matches_15
-    ),
-        -- CTE 18: Calculate scores for ranking
-    scored_matches AS (
-        SELECT *,
-               -- Calculate name match score
-               CASE 
-                   WHEN (nome_first = esposa_nome AND nom_paciente_first = marido_nome) 
-                        OR (nom_paciente_first = esposa_nome AND nome_first = marido_nome) THEN 0
-                   WHEN (nome_first = esposa_nome OR nom_paciente_first = marido_nome) 
-                        OR (nom_paciente_first = esposa_nome OR nome_first = marido_nome) THEN 2
-                   ELSE 4
-               END as name_match_score,
-               -- Calculate match type score (odd numbers)
-               CASE 
-                   WHEN match_type = '{match_type_prefix}_main' THEN 1
-                   WHEN match_type = '{match_type_prefix}_esposa' THEN 3
-                   WHEN match_type = '{match_type_prefix}_marido' THEN 5
-                   WHEN match_type = '{match_type_prefix}_responsavel1' THEN 7
-                   WHEN match_type = '{match_type_prefix}_responsavel2' THEN 9
-                   WHEN match_type = '{match_type_prefix}_esposa_pel' THEN 11
-                   WHEN match_type = '{match_type_prefix}_marido_pel' THEN 13
-                   WHEN match_type = '{match_type_prefix}_esposa_pc' THEN 15
-                   WHEN match_type = '{match_type_prefix}_marido_pc' THEN 17
-                   WHEN match_type = '{match_type_prefix}_responsavel1_pc' THEN 19
-                   WHEN match_type = '{match_type_prefix}_responsavel2_pc' THEN 21
-                   WHEN match_type = '{match_type_prefix}_esposa_fc' THEN 23
-                   WHEN match_type = '{match_type_prefix}_marido_fc' THEN 25
-                   WHEN match_type = '{match_type_prefix}_esposa_ba' THEN 27
-                   WHEN match_type = '{match_type_prefix}_marido_ba' THEN 29
-                   ELSE 31
-               END as match_type_score
-        FROM all_matches
-        WHERE nome_first =esposa_nome OR nome_first = marido_nome OR nom_paciente_first = esposa_nome  OR nom_paciente_first = marido_nome 
-    ),
-
-    -- CTE 19: Apply ranking based on combined scores
-    ranked_matches AS (
-        SELECT *,
-               (name_match_score + match_type_score) as combined_score,
-               ROW_NUMBER() OVER (
-                   PARTITION BY {column_field} , "prontuario" 
-                   ORDER BY (name_match_score + match_type_score)
-               ) 
-               as rn
-        FROM scored_matches
-    ),
-
-    -- CTE 20: Select best match per {column_name} (lowest rn value)
-    best_matches AS (
-        SELECT * 
-        FROM ranked_matches rm1
-        WHERE rn = (
-            SELECT MIN(rn) 
-            FROM ranked_matches rm2 
-            WHERE rm2.{column_field} = rm1.{column_field}
-        )
-    )
-
-    -- Update prontuario column for unmatched records using {column_name}
-    UPDATE silver.mesclada_vendas 
-    SET prontuario = COALESCE(bm.prontuario, -1)
-    FROM best_matches bm 
-    WHERE silver.mesclada_vendas."{column_field}" = bm.{column_field}
-        AND silver.mesclada_vendas.prontuario = -1
-        AND (strip_accents(TRIM(LOWER(SPLIT_PART(silver.mesclada_vendas."{name_field}", ' ', 1)))) = bm.nome_first
-        OR strip_accents(TRIM(LOWER(SPLIT_PART(silver.mesclada_vendas."{name_field}", ' ', 1)))) = bm.nom_paciente_first)
-    """
-    
     try:
-        con.execute(update_sql)
-        logger.info(f"Prontuario column updated successfully with {column_name} matching logic")
+        # One pass: link columns unpivoted once, all steps and both activity states ranked together
+        counts = match_prontuarios(con, f"silver.{SILVER_TABLE}", MATCHING_STEPS, include_inactive=True)
+        logger.info("Prontuario column updated successfully")
+        for match_type, n_rows in counts.items():
+            logger.info(f"  {match_type}: {n_rows:,} rows")
         
         # Get statistics on the update
-        result = con.execute("""
+        result = con.execute(f"""
             SELECT 
                 COUNT(*) as total_rows,
                 COUNT(CASE WHEN prontuario != -1 THEN 1 END) as matched_rows,
                 COUNT(CASE WHEN prontuario = -1 THEN 1 END) as unmatched_rows
-            FROM silver.mesclada_vendas
+            FROM silver.{SILVER_TABLE}
         """).fetchone()
         
-        if is_final_step:
-            logger.info(f"Final prontuario matching results after {column_name}:")
-        else:
-            logger.info(f"Prontuario matching results after {column_name}:")
+        logger.info(f"Prontuario matching results:")
         logger.info(f"  Total rows: {result[0]:,}")
         logger.info(f"  Matched rows: {result[1]:,}")
         logger.info(f"  Unmatched rows: {result[2]:,}")
         logger.info(f"  Match rate: {(result[1]/result[0]*100):.2f}%")
         
     except Exception as e:
-        logger.error(f"Error updating prontuario column with {column_name}: {e}")
+        logger.error(f"Error updating prontuario column: {e}")
         raise
 
 def process_bronze_to_silver(con):
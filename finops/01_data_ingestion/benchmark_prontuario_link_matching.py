@@ -0,0 +1,292 @@
+"""
+Benchmark + parity check for the finops prontuario matching (commons/prontuario_link_matching.py).
+
+Runs the legacy matching (one 15-way UNION of link joins per step and activity
+state, kept here as the reference implementation) and the single ranked pass
+on the same sales table, reports wall time for both and compares the
+prontuario assigned to every row.
+
+Usage:
+    python benchmark_prontuario_link_matching.py                          # mesclada from the data lake (read-only)
+    python benchmark_prontuario_link_matching.py --table diario_vendas
+    python benchmark_prontuario_link_matching.py --synthetic 500000
+    python benchmark_prontuario_link_matching.py --synthetic 500000 --table diario_vendas
+
+The check fails when a row matched by the legacy code is left unmatched.
+Two differences are expected and only reported:
+  - different patient: the legacy UPDATE ... FROM had several candidate
+    patients for the row and kept an arbitrary one; the single pass keeps the
+    best scored one;
+  - only single pass matched (mesclada): the legacy code compared a row's name
+    with one arbitrarily chosen name pair per (id, patient), the single pass
+    with all of them.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import duckdb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.prontuario_link_matching import LINK_ROLES, MatchStep, match_prontuarios
+
+# Setup logging
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'database')
+
+# Same steps as 03_02_mesclada_to_silver.py. 01_02_diario_to_silver.py keeps its own single
+# query (the legacy SQL below), which is faster than the single pass for its one step.
+STEPS = {
+    'mesclada_vendas': [
+        MatchStep('paciente', 'Paciente', name_field='Nom Paciente'),
+        MatchStep('cliente', 'Cliente', name_field='Nome'),
+        MatchStep('cliente_totvs', 'Cliente_totvs', name_field='Nom Paciente'),
+    ],
+    'diario_vendas': [MatchStep('prontuario', 'Cliente')],
+}
+LEGACY_FILTERS = {
+    'Paciente': 'AND "Paciente" IS NOT NULL AND "Paciente" != \'\'',
+    'Cliente': 'AND "Cliente" IS NOT NULL',
+    'Cliente_totvs': 'AND "Cliente_totvs" IS NOT NULL AND "Cliente_totvs" != \'\' '
+                     'AND TRY_CAST("Cliente_totvs" AS INTEGER) IS NOT NULL',
+}
+
+FIRST_F = ['maria', 'ana', 'juliana', 'fernanda', 'priscilla', 'cinthia', 'daniela', 'nelia',
+           'gabriela', 'camila', 'patricia', 'luciana', 'adriana', 'beatriz', 'carolina', 'jocileide']
+FIRST_M = ['joao', 'jose', 'carlos', 'pedro', 'paulo', 'marcos', 'lucas', 'rafael', 'gabriel', 'bruno']
+
+
+# ── Legacy implementation ─────────────────────────────────────────────────────
+
+def legacy_sql(table, step, inactive, per_row):
+    """The UNION-of-joins UPDATE of the old silver scripts for one step and activity state."""
+    col = f'"{step.column}"'
+    label = step.label
+    if per_row:
+        # mesclada: TRIM before SPLIT_PART in the extract, after it in the UPDATE
+        first = "strip_accents(LOWER(SPLIT_PART(TRIM({0}), ' ', 1)))"
+        extract_filter = f'WHERE prontuario = -1 {LEGACY_FILTERS[step.column]}'
+        partition = f'{col}, "prontuario"'
+        update_filter = (
+            f"AND {table}.prontuario = -1 "
+            f"AND (strip_accents(TRIM(LOWER(SPLIT_PART({table}.\"{step.name_field}\", ' ', 1)))) = bm.nome_first "
+            f"OR strip_accents(TRIM(LOWER(SPLIT_PART({table}.\"{step.name_field}\", ' ', 1)))) = bm.nom_paciente_first)"
+        )
+    else:
+        first = "strip_accents(TRIM(LOWER(SPLIT_PART({0}, ' ', 1))))"
+        extract_filter = f'WHERE {col} IS NOT NULL'
+        partition = col
+        update_filter = ''
+    matches = [
+        f"""matches_{i} AS (
+            SELECT d.*, p.codigo AS prontuario, p.esposa_nome, p.marido_nome, '{label}_{role}' AS match_type
+            FROM extract d INNER JOIN clinisys_processed p ON d.{col} = p.{column})"""
+        for i, (column, role) in enumerate(LINK_ROLES, 1)
+    ]
+    type_scores = '\n'.join(f"WHEN match_type = '{label}_{role}' THEN {2 * i + 1}"
+                            for i, (_, role) in enumerate(LINK_ROLES))
+    return f"""
+    WITH extract AS (
+        SELECT DISTINCT {col},
+            {first.format('"Nome"')} AS nome_first,
+            {first.format('"Nom Paciente"')} AS nom_paciente_first
+        FROM {table}
+        {extract_filter}
+    ),
+    clinisys_processed AS (
+        SELECT codigo, {', '.join(c for c, _ in LINK_ROLES[1:])},
+            {first.format('esposa_nome')} AS esposa_nome,
+            {first.format('marido_nome')} AS marido_nome
+        FROM clinisys_all.silver.view_pacientes
+        WHERE inativo = {1 if inactive else 0}
+    ),
+    {', '.join(matches)},
+    all_matches AS ({' UNION '.join(f'SELECT * FROM matches_{i}' for i in range(1, len(LINK_ROLES) + 1))}),
+    scored_matches AS (
+        SELECT *,
+            CASE WHEN (nome_first = esposa_nome AND nom_paciente_first = marido_nome)
+                   OR (nom_paciente_first = esposa_nome AND nome_first = marido_nome) THEN 0
+                 WHEN (nome_first = esposa_nome OR nom_paciente_first = marido_nome)
+                   OR (nom_paciente_first = esposa_nome OR nome_first = marido_nome) THEN 2
+                 ELSE 4 END AS name_match_score,
+            CASE {type_scores} ELSE 31 END AS match_type_score
+        FROM all_matches
+        WHERE nome_first = esposa_nome OR nome_first = marido_nome
+           OR nom_paciente_first = esposa_nome OR nom_paciente_first = marido_nome
+    ),
+    ranked_matches AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY {partition}
+                                     ORDER BY (name_match_score + match_type_score)) AS rn
+        FROM scored_matches
+    ),
+    best_matches AS (
+        SELECT * FROM ranked_matches rm1
+        WHERE rn = (SELECT MIN(rn) FROM ranked_matches rm2 WHERE rm2.{col} = rm1.{col})
+    )
+    UPDATE {table}
+    SET prontuario = COALESCE(bm.prontuario, -1)
+    FROM best_matches bm
+    WHERE {table}.{col} = bm.{col}
+    {update_filter}
+    """
+
+
+def run_legacy(con, table, steps):
+    per_row = steps[0].name_field is not None
+    passes = (False, True) if per_row else (False,)
+    for inactive in passes:
+        for step in steps:
+            con.execute(legacy_sql(table, step, inactive, per_row))
+
+
+# ── Data ──────────────────────────────────────────────────────────────────────
+
+def _pick(values, seed_expr):
+    return (f"list_element([{', '.join(repr(v) for v in values)}], "
+            f"CAST(hash({seed_expr}) % {len(values)} AS INTEGER) + 1)")
+
+
+def load_synthetic(con, n_rows, table):
+    """
+    Synthetic view_pacientes (codigo plus sparse link columns, 5% inactive, many
+    couples sharing first names) and a sales table whose ids point at codigo or a
+    link column, with accented/upper-case names, swapped couples, strangers,
+    non-numeric Cliente_totvs and ids that match nobody.
+    """
+    n_patients = max(n_rows // 4, 10)
+    con.execute('CREATE SCHEMA clinisys_all.silver')
+    links = ',\n'.join(
+        f"CASE WHEN hash(i, '{column}') % 100 < {30 if n == 1 else 3} THEN {(n + 1) * 1000000} + i END AS {column}"
+        for n, (column, _) in enumerate(LINK_ROLES[1:], 1)
+    )
+    con.execute(f"""
+        CREATE TABLE clinisys_all.silver.view_pacientes AS
+        SELECT
+            100000 + i AS codigo,
+            CASE WHEN hash(i, 'inativo') % 20 = 0 THEN '1' ELSE '0' END AS inativo,
+            upper({_pick(FIRST_F, "i % 5000, 'ef'")}) || ' SILVA' AS esposa_nome,
+            {_pick(FIRST_M, "i % 5000, 'mf'")} || ' santos' AS marido_nome,
+            {links},
+            'Ibirapuera' AS unidade_origem
+        FROM range({n_patients}) t(i)
+    """)
+    # Each sale belongs to patient k; its ids use codigo or the esposa link
+    con.execute(f"""
+        CREATE TABLE main.{table} AS
+        WITH sales AS (
+            SELECT j, CAST(hash(j, 'k') % {n_patients} AS INTEGER) AS k, hash(j, 'shape') % 100 AS shape
+            FROM range({n_rows}) t(j)
+        ),
+        people AS (
+            SELECT s.*, p.codigo, p.prontuario_esposa, p.esposa_nome, p.marido_nome
+            FROM sales s JOIN clinisys_all.silver.view_pacientes p ON p.codigo = 100000 + s.k
+        )
+        SELECT
+            CASE WHEN shape < 40 THEN codigo
+                 WHEN shape < 55 THEN TRY_CAST(prontuario_esposa AS INTEGER)
+                 WHEN shape < 60 THEN 9000000 + j END AS "Cliente",
+            CASE WHEN shape < 10 THEN 'CONVENIO ' || CAST(j % 7 AS VARCHAR)
+                 WHEN shape % 3 = 0 THEN marido_nome
+                 ELSE replace(esposa_nome, 'A', 'Á') END AS "Nome",
+            CASE WHEN shape BETWEEN 40 AND 80 THEN CAST(codigo AS VARCHAR)
+                 WHEN shape > 95 THEN '' END AS "Paciente",
+            CASE WHEN shape % 7 = 0 THEN NULL
+                 WHEN shape % 5 = 0 THEN marido_nome
+                 ELSE lower(esposa_nome) END AS "Nom Paciente",
+            CASE WHEN shape > 85 THEN CAST(codigo AS VARCHAR)
+                 WHEN shape BETWEEN 80 AND 85 THEN 'X' || CAST(j AS VARCHAR) END AS "Cliente_totvs",
+            -1 AS prontuario
+        FROM people
+    """)
+
+
+def load_lake(con, table):
+    con.execute(f"ATTACH '{os.path.join(DATABASE_DIR, 'huntington_data_lake.duckdb')}' AS lake (READ_ONLY)")
+    con.execute(f"CREATE TABLE main.{table} AS SELECT * REPLACE (-1 AS prontuario) FROM lake.silver.{table}")
+    con.execute('DETACH lake')
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def timed(label, fn):
+    start = time.time()
+    fn()
+    secs = time.time() - start
+    logger.info(f'{label}: {secs:.2f}s')
+    return secs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the finops prontuario link matching')
+    parser.add_argument('--table', choices=sorted(STEPS), default='mesclada_vendas')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Use N synthetic sales rows instead of the data lake silver table')
+    args = parser.parse_args()
+    steps = STEPS[args.table]
+
+    con = duckdb.connect()
+    if args.synthetic:
+        con.execute("ATTACH ':memory:' AS clinisys_all")
+        logger.info(f'Generating {args.synthetic:,} synthetic {args.table} rows')
+        load_synthetic(con, args.synthetic, args.table)
+    else:
+        con.execute(f"ATTACH '{os.path.join(DATABASE_DIR, 'clinisys_all.duckdb')}' AS clinisys_all (READ_ONLY)")
+        logger.info(f'Copying silver.{args.table} from the data lake')
+        load_lake(con, args.table)
+    con.execute(f'ALTER TABLE main.{args.table} ADD COLUMN bench_id BIGINT')
+    con.execute(f'UPDATE main.{args.table} SET bench_id = rowid')
+    con.execute(f'CREATE TABLE main.legacy AS SELECT * FROM main.{args.table}')
+    n_rows = con.execute('SELECT COUNT(*) FROM main.legacy').fetchone()[0]
+    logger.info(f'{args.table}: {n_rows:,} rows, steps: {[s.label for s in steps]}')
+
+    legacy_secs = timed('Legacy UNION matching (per step and activity state)',
+                        lambda: run_legacy(con, 'main.legacy', steps))
+    include_inactive = steps[0].name_field is not None
+    new_secs = timed('Single ranked pass',
+                     lambda: match_prontuarios(con, f'main.{args.table}', steps, include_inactive=include_inactive))
+
+    same, both_differ, only_legacy, only_new = con.execute(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE l.prontuario = n.prontuario),
+            COUNT(*) FILTER (WHERE l.prontuario != n.prontuario AND l.prontuario != -1 AND n.prontuario != -1),
+            COUNT(*) FILTER (WHERE l.prontuario != -1 AND n.prontuario = -1),
+            COUNT(*) FILTER (WHERE l.prontuario = -1 AND n.prontuario != -1)
+        FROM main.legacy l JOIN main.{args.table} n USING (bench_id)
+    """).fetchone()
+    matched = con.execute(f'SELECT COUNT(*) FROM main.{args.table} WHERE prontuario != -1').fetchone()[0]
+
+    speedup = legacy_secs / new_secs if new_secs > 0 else float('inf')
+    logger.info('=' * 60)
+    logger.info(f'Legacy {legacy_secs:.2f}s vs single pass {new_secs:.2f}s -> speedup {speedup:.1f}x')
+    logger.info(f'Matched rows: {matched:,}/{n_rows:,}')
+    logger.info(f'Same prontuario: {same:,} | different patient: {both_differ:,} | '
+                f'only legacy matched: {only_legacy:,} | only single pass matched: {only_new:,}')
+    logger.info('=' * 60)
+    con.close()
+    if only_legacy:
+        logger.error(f'PARITY FAILED: {only_legacy:,} rows matched by the legacy code are left unmatched')
+        raise SystemExit(1)
+    logger.info(f'PARITY OK: every legacy match kept ({both_differ:,} rows with several candidates '
+                f'resolved by score, {only_new:,} rows newly matched)')
+
+
+if __name__ == '__main__':
+    main()
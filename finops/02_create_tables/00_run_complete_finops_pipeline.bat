@@ -39,9 +39,9 @@ if %errorlevel% neq 0 (
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.3: Creating FinOps Summary Table
+echo STEP %PARENT_STEP%.3: Creating FinOps Summary, Patient Info and Domain Timeline Tables
 echo ========================================
-python finops/02_create_tables/03_01_create_finops_summary.py
+python finops/02_create_tables/00_run_finops_builders.py
 if %errorlevel% neq 0 (
     echo ERROR: Step %PARENT_STEP%.3 failed
     @REM pause (removed for automated execution)
@@ -50,165 +50,99 @@ if %errorlevel% neq 0 (
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.4: Creating Patient Info Table
-echo ========================================
-python finops/02_create_tables/03_00_create_patient_info.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.4 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.5: Creating Biopsy PGT-A Timeline Tables
-echo ========================================
-python finops/02_create_tables/03_02_biopsy_pgta_timeline.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.5 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.6: Creating Embryoscope Timeline Tables
-echo ========================================
-python finops/02_create_tables/03_03_embryoscope_timeline.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.6 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.7: Creating Embryo Timeline Tables
-echo ========================================
-python finops/02_create_tables/03_04_a_embryo_freeze_timeline.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.7 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.8: Creating Cryopreservation Events Timeline Tables
-echo ========================================
-python finops/02_create_tables/03_04_b_cryopreservation_events_timeline.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.8 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.9: Creating Consultation Timeline Tables
-echo ========================================
-python finops/02_create_tables/03_05_consultas_timeline.py
-if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.9 failed
-    @REM pause (removed for automated execution)
-    exit /b 1
-)
-
-echo.
-echo ========================================
-echo STEP %PARENT_STEP%.10: Exporting All Patients Timeline to CSV
+echo STEP %PARENT_STEP%.4: Exporting All Patients Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table all_patients_timeline --prefix "01_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.10 failed
+    echo ERROR: Step %PARENT_STEP%.4 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.11: Exporting Patient Info to CSV
+echo STEP %PARENT_STEP%.5: Exporting Patient Info to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table patient_info --prefix "03_00_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.11 failed
+    echo ERROR: Step %PARENT_STEP%.5 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.12: Exporting Resumed Biopsy PGT-A Timeline to CSV
+echo STEP %PARENT_STEP%.6: Exporting Resumed Biopsy PGT-A Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table resumed_biopsy_pgta_timeline --prefix "03_02_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.12 failed
+    echo ERROR: Step %PARENT_STEP%.6 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.13: Exporting Embryoscope Timeline to CSV
+echo STEP %PARENT_STEP%.7: Exporting Embryoscope Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table embryoscope_timeline --prefix "03_03_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.13 failed
+    echo ERROR: Step %PARENT_STEP%.7 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.14: Exporting Resumed Embryoscope Timeline to CSV
+echo STEP %PARENT_STEP%.8: Exporting Resumed Embryoscope Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table resumed_embryoscope_timeline --prefix "03_03_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.14 failed
+    echo ERROR: Step %PARENT_STEP%.8 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.15: Exporting FinOps Summary to CSV
+echo STEP %PARENT_STEP%.9: Exporting FinOps Summary to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table finops_summary --prefix "03_01_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.15 failed
+    echo ERROR: Step %PARENT_STEP%.9 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.16: Exporting Resumed Cryopreservation Events Timeline to CSV
+echo STEP %PARENT_STEP%.10: Exporting Resumed Cryopreservation Events Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table resumed_cryopreservation_events_timeline --prefix "03_04_b_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.16 failed
+    echo ERROR: Step %PARENT_STEP%.10 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.17: Exporting Consultation Timeline to CSV
+echo STEP %PARENT_STEP%.11: Exporting Consultation Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table consultas_timeline --prefix "03_05_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.17 failed
+    echo ERROR: Step %PARENT_STEP%.11 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
 
 echo.
 echo ========================================
-echo STEP %PARENT_STEP%.18: Exporting Resumed Consultation Timeline to CSV
+echo STEP %PARENT_STEP%.12: Exporting Resumed Consultation Timeline to CSV
 echo ========================================
 python finops/02_create_tables/04_export_table_to_csv.py --schema gold --table resumed_consultas_timeline --prefix "03_05_"
 if %errorlevel% neq 0 (
-    echo ERROR: Step %PARENT_STEP%.18 failed
+    echo ERROR: Step %PARENT_STEP%.12 failed
     @REM pause (removed for automated execution)
     exit /b 1
 )
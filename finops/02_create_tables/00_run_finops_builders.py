@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Run the finops gold builders (03_*.py) concurrently in one process
+
+The builders used to run one after another, each in its own process with
+its own read-write connection to huntington_data_lake.duckdb. DuckDB allows
+one writing process per file, so they could not overlap. Here they run as
+threads of one process: each builder's get_database_connection() gets a
+cursor on the same DuckDB instance (commons/duckdb_manager.py), clinisys_all
+is attached once (read-only) for all of them, and the intermediate tables
+they share (commons/finops_shared_tables.py) are built once before they start.
+
+Each builder still writes its own tables through build_table, so unchanged
+tables are skipped as before. Builders that write the same table are ordered:
+03_02 rewrites gold.patient_info after 03_00, as in the .bat. A failed builder
+blocks the builders that depend on it; the others keep running.
+
+Builder output (print) is logged line by line, prefixed with the builder name.
+
+Usage:
+    python finops/02_create_tables/00_run_finops_builders.py
+    python finops/02_create_tables/00_run_finops_builders.py --only consultas_timeline --max-workers 1
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+sys.path.insert(0, REPO_ROOT)
+from commons import duckdb_manager
+from commons.finops_shared_tables import ensure_shared_tables
+
+# Setup logging
+LOGS_DIR = os.path.join(SCRIPT_DIR, 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH, encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+LAKE_DB_PATH = os.path.join(REPO_ROOT, 'database', 'huntington_data_lake.duckdb')
+CLINISYS_DB_PATH = os.path.join(REPO_ROOT, 'database', 'clinisys_all.duckdb')
+
+# (name, script, builders it must run after)
+BUILDERS = [
+    ('finops_summary', '03_01_create_finops_summary.py', ()),
+    ('patient_info', '03_00_create_patient_info.py', ()),
+    # 03_02 also writes gold.patient_info (from its own timelines); its version is the final one
+    ('biopsy_pgta_timeline', '03_02_biopsy_pgta_timeline.py', ('patient_info',)),
+    ('embryoscope_timeline', '03_03_embryoscope_timeline.py', ()),
+    ('embryo_freeze_timeline', '03_04_a_embryo_freeze_timeline.py', ()),
+    ('cryopreservation_events_timeline', '03_04_b_cryopreservation_events_timeline.py', ()),
+    ('consultas_timeline', '03_05_consultas_timeline.py', ()),
+]
+
+
+class BuilderOutput:
+    """sys.stdout / sys.stderr stand-in: lines written by a builder thread are logged under its name."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def start(self, name):
+        self.local.name = name
+        self.local.buffer = ''
+
+    def finish(self):
+        if self.local.buffer:
+            logger.info(f"[{self.local.name}] {self.local.buffer}")
+        self.local.name = None
+
+    def write(self, text):
+        name = getattr(self.local, 'name', None)
+        if name is None:
+            return self.fallback.write(text)
+        *lines, self.local.buffer = (self.local.buffer + text).split('\n')
+        for line in lines:
+            logger.info(f"[{name}] {line}")
+        return len(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+def load_builder(name, script):
+    """Import a builder script (its file name is not a valid module name)"""
+    spec = importlib.util.spec_from_file_location(f'finops_builder_{name}', os.path.join(SCRIPT_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_builder(name, script, output):
+    output.start(name)
+    start = time.perf_counter()
+    try:
+        load_builder(name, script).main()
+    finally:
+        output.finish()
+    return time.perf_counter() - start
+
+
+def run_builders(selected, max_workers):
+    """Run the selected builders, respecting their order constraints; returns {name: (status, seconds)}"""
+    builders = {name: (script, [d for d in after if d in selected]) for name, script, after in BUILDERS
+                if name in selected}
+    results = {}
+    pending = dict(builders)
+    running = {}
+
+    output = BuilderOutput(sys.stdout)
+    error_output = BuilderOutput(sys.stderr)
+    error_output.local = output.local
+    sys.stdout, sys.stderr = output, error_output
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='finops') as pool:
+            while pending or running:
+                for name, (script, deps) in list(pending.items()):
+                    failed = [d for d in deps if results.get(d, ('',))[0] in ('failed', 'blocked')]
+                    if failed:
+                        results[name] = ('blocked', 0.0)
+                        logger.error(f"{name}: blocked by {', '.join(failed)}")
+                        del pending[name]
+                    elif all(results.get(d, ('',))[0] == 'success' for d in deps):
+                        logger.info(f"{name}: starting ({script})")
+                        running[pool.submit(run_builder, name, script, output)] = name
+                        del pending[name]
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        seconds = future.result()
+                        results[name] = ('success', seconds)
+                        logger.info(f"{name}: done in {seconds:.1f}s")
+                    except BaseException as e:
+                        results[name] = ('failed', 0.0)
+                        logger.error(f"{name}: failed: {e}")
+    finally:
+        sys.stdout, sys.stderr = output.fallback, error_output.fallback
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=[name for name, _, _ in BUILDERS],
+                        help='Builders to run (default: all)')
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help='Builders running at the same time (1 = one after another)')
+    args = parser.parse_args()
+
+    selected = set(args.only or [name for name, _, _ in BUILDERS])
+    logger.info(f"Log file: {LOG_PATH}")
+    logger.info(f"Running {len(selected)} finops builders with up to {args.max_workers} at a time")
+
+    start = time.perf_counter()
+    # Holding this connection keeps the DuckDB instance (and the clinisys_all attach) open for all builders
+    with duckdb_manager.connect(LAKE_DB_PATH) as conn:
+        conn.execute(f"ATTACH IF NOT EXISTS '{CLINISYS_DB_PATH}' AS clinisys_all (READ_ONLY)")
+        t_shared = time.perf_counter()
+        ensure_shared_tables(conn, log=logger.info)
+        logger.info(f"Shared tables ready in {time.perf_counter() - t_shared:.1f}s")
+        results = run_builders(selected, max(1, args.max_workers))
+    wall = time.perf_counter() - start
+
+    logger.info("=" * 80)
+    logger.info("FINOPS BUILDERS SUMMARY")
+    for name, _, _ in BUILDERS:
+        if name in results:
+            status, seconds = results[name]
+            logger.info(f"  {name:<35} {status:<8} {seconds:7.1f}s")
+    busy = sum(seconds for _, seconds in results.values())
+    logger.info(f"Wall time {wall:.1f}s; builder time {busy:.1f}s")
+    logger.info("=" * 80)
+
+    if any(status != 'success' for status, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
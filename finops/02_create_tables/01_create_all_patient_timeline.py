@@ -2,65 +2,77 @@
 """
 Create All Patient Timeline
 Creates unified timelines for ALL patients by combining data from multiple tables using DuckDB SQL.
+
+The timeline is built inside huntington_data_lake with clinisys_all attached
+read-only: the events query feeds CREATE TABLE AS / INSERT directly, so no
+event goes through pandas and memory does not grow with the event history.
+The table is not sorted; readers order by prontuario, event_date themselves.
+
+On a rebuild only the prontuarios whose events changed are replaced
+(commons/incremental_refresh.py); --full / BUILD_CACHE_FORCE=1 recreates the
+whole table.
 """
 
-import duckdb as db
+import argparse
 import os
-import pandas as pd
+import sys
 from datetime import datetime
 import logging
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import cached_build, force_requested, input_fingerprints
+from commons.incremental_refresh import refresh_by_key
+from commons import duckdb_manager
+
 # Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
 logger = logging.getLogger(__name__)
 
-def get_database_connection():
-    """Create and return a connection to the clinisys_all database"""
-    # Resolve DB path relative to repository root
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    path_to_db = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn = db.connect(path_to_db, read_only=True)
-    
-    logger.info(f"Connected to database: {path_to_db}")
-    logger.info(f"Database file exists: {os.path.exists(path_to_db)}")
-    
-    return conn
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAKE_DB_PATH = os.path.join(REPO_ROOT, 'database', 'huntington_data_lake.duckdb')
+CLINISYS_DB_PATH = os.path.join(REPO_ROOT, 'database', 'clinisys_all.duckdb')
 
-def get_all_patients(conn):
-    """Get all unique patients from all relevant tables"""
-    logger.info("Extracting all unique patients from all tables...")
-    
-    patients_query = """
-    SELECT DISTINCT prontuario 
-    FROM (
-        SELECT prontuario FROM silver.view_tratamentos WHERE prontuario IS NOT NULL
-        UNION
-        SELECT prontuario FROM silver.view_extrato_atendimentos_central WHERE prontuario IS NOT NULL
-        UNION
-        SELECT prontuario FROM silver.view_congelamentos_embrioes WHERE prontuario IS NOT NULL
-        UNION
-        SELECT prontuario FROM silver.view_congelamentos_ovulos WHERE prontuario IS NOT NULL
-        UNION
-        SELECT prontuario FROM silver.view_descongelamentos_embrioes WHERE prontuario IS NOT NULL
-        UNION
-        SELECT prontuario FROM silver.view_descongelamentos_ovulos WHERE prontuario IS NOT NULL
-    ) all_patients
-    WHERE prontuario IS NOT NULL
-    ORDER BY prontuario
-    """
-    
-    patients_df = conn.execute(patients_query).fetchdf()
-    logger.info(f"Found {len(patients_df)} unique patients")
-    return patients_df['prontuario'].tolist()
+TIMELINE_TABLE = 'gold.all_patients_timeline'
 
-def create_all_patient_timeline_sql(conn):
-    """
-    Create unified timeline for ALL patients using SQL
-    """
-    logger.info("Creating unified timeline for ALL patients using SQL...")
-    
-    # Main SQL query that processes all patients at once
-    timeline_sql = """
+# Clinisys tables the timeline is built from (fingerprinted by the build cache)
+TIMELINE_INPUT_TABLES = [
+    'clinisys_all.silver.view_tratamentos',
+    'clinisys_all.silver.view_unidades',
+    'clinisys_all.silver.view_extrato_atendimentos_central',
+    'clinisys_all.silver.view_congelamentos_embrioes',
+    'clinisys_all.silver.view_congelamentos_ovulos',
+    'clinisys_all.silver.view_descongelamentos_embrioes',
+    'clinisys_all.silver.view_descongelamentos_ovulos',
+]
+
+TIMELINE_COLUMNS = [
+    'prontuario',
+    'event_id',
+    'event_date',
+    'reference',
+    'reference_value',
+    'tentativa',
+    'unidade',
+    'resultado_tratamento',
+    'flag_date_estimated',
+    'additional_info',
+]
+
+# One row per event; unsorted
+TIMELINE_EVENTS_SQL = """
     WITH all_timeline_events AS (
         -- 1. Treatments (tratamentos)
         SELECT 
@@ -84,8 +96,8 @@ def create_all_patient_timeline_sql(conn):
             COALESCE(u.nome, CAST(t.unidade AS VARCHAR)) as unidade,
             CAST(t.resultado_tratamento AS VARCHAR) as resultado_tratamento,
             '{}' as additional_info
-        FROM silver.view_tratamentos t
-        LEFT JOIN silver.view_unidades u ON t.unidade = u.id
+        FROM clinisys_all.silver.view_tratamentos t
+        LEFT JOIN clinisys_all.silver.view_unidades u ON t.unidade = u.id
         WHERE t.prontuario IS NOT NULL
         AND (
             t.data_procedimento IS NOT NULL 
@@ -112,7 +124,7 @@ def create_all_patient_timeline_sql(conn):
                        PARTITION BY prontuario, data, procedimento_nome, confirmado 
                        ORDER BY agendamento_id
                    ) as rn
-            FROM silver.view_extrato_atendimentos_central 
+            FROM clinisys_all.silver.view_extrato_atendimentos_central 
             WHERE prontuario IS NOT NULL
             AND data IS NOT NULL
             AND procedimento_nome IS NOT NULL
@@ -138,7 +150,7 @@ def create_all_patient_timeline_sql(conn):
                 THEN '{"NEmbrioes": "' || COALESCE(CAST(NEmbrioes AS VARCHAR), '') || '", "Unidade": "' || COALESCE(CAST(Unidade AS VARCHAR), '') || '"}'
                 ELSE '{}'
             END as additional_info
-        FROM silver.view_congelamentos_embrioes 
+        FROM clinisys_all.silver.view_congelamentos_embrioes 
         WHERE prontuario IS NOT NULL
         AND Data IS NOT NULL
         
@@ -160,7 +172,7 @@ def create_all_patient_timeline_sql(conn):
                 THEN '{"NOvulos": "' || COALESCE(CAST(NOvulos AS VARCHAR), '') || '", "Unidade": "' || COALESCE(CAST(Unidade AS VARCHAR), '') || '"}'
                 ELSE '{}'
             END as additional_info
-        FROM silver.view_congelamentos_ovulos 
+        FROM clinisys_all.silver.view_congelamentos_ovulos 
         WHERE prontuario IS NOT NULL
         AND Data IS NOT NULL
         
@@ -182,7 +194,7 @@ def create_all_patient_timeline_sql(conn):
                 THEN '{"CodDescongelamento": "' || COALESCE(CodDescongelamento, '') || '", "Unidade": "' || COALESCE(CAST(Unidade AS VARCHAR), '') || '"}'
                 ELSE '{}'
             END as additional_info
-        FROM silver.view_descongelamentos_embrioes 
+        FROM clinisys_all.silver.view_descongelamentos_embrioes 
         WHERE prontuario IS NOT NULL
         AND DataDescongelamento IS NOT NULL
         
@@ -204,130 +216,51 @@ def create_all_patient_timeline_sql(conn):
                 THEN '{"CodDescongelamento": "' || COALESCE(CodDescongelamento, '') || '", "Unidade": "' || COALESCE(CAST(Unidade AS VARCHAR), '') || '"}'
                 ELSE '{}'
             END as additional_info
-        FROM silver.view_descongelamentos_ovulos 
+        FROM clinisys_all.silver.view_descongelamentos_ovulos 
         WHERE prontuario IS NOT NULL
         AND DataDescongelamento IS NOT NULL
-        
-    ),
-    
-    timeline_with_order AS (
-        SELECT 
-            *,
-            -- Define table hierarchy for sorting (same as Python logic)
-            CASE reference
-                WHEN 'extrato_atendimentos' THEN 1
-                WHEN 'congelamentos_ovulos' THEN 2
-                WHEN 'descongelamentos_ovulos' THEN 3
-                WHEN 'congelamentos_embrioes' THEN 4
-                WHEN 'descongelamentos_embrioes' THEN 5
-                WHEN 'tratamentos' THEN 6
-                ELSE 7
-            END as table_order
-        FROM all_timeline_events
-        WHERE event_date IS NOT NULL
     )
-    
-    SELECT 
-        prontuario,
-        event_id,
-        event_date,
-        reference,
-        reference_value,
-        tentativa,
-        unidade,
-        resultado_tratamento,
-        flag_date_estimated,
-        additional_info
-    FROM timeline_with_order
-    ORDER BY 
-        prontuario,
-        event_date DESC,
-        table_order DESC,
-        event_id DESC
-    """
-    
-    logger.info("Executing timeline creation SQL...")
-    timeline_df = conn.execute(timeline_sql).fetchdf()
-    
-    logger.info(f"Created timeline with {len(timeline_df)} total events")
-    logger.info(f"Date range: {timeline_df['event_date'].min()} to {timeline_df['event_date'].max()}")
-    
-    # Get patient count
-    unique_patients = timeline_df['prontuario'].nunique()
-    logger.info(f"Timeline covers {unique_patients} unique patients")
-    
-    return timeline_df
 
-def save_timeline_to_database(timeline_df):
-    """Save timeline data to huntington_data_lake database in gold schema"""
-    
-    if timeline_df.empty:
-        logger.warning("No timeline data to save")
-        return
+    SELECT
+        """ + ',\n        '.join(TIMELINE_COLUMNS) + """
+    FROM all_timeline_events
+    WHERE event_date IS NOT NULL
+"""
+
+
+def get_database_connection():
+    """Open huntington_data_lake and attach clinisys_all read-only"""
+    conn = duckdb_manager.connect(LAKE_DB_PATH)
+    conn.execute(f"ATTACH '{CLINISYS_DB_PATH}' AS clinisys_all (READ_ONLY)")
     
-    logger.info("Saving timeline to huntington_data_lake database...")
+    logger.info(f"Connected to database: {LAKE_DB_PATH}")
+    logger.info(f"Attached clinisys_all database: {CLINISYS_DB_PATH}")
     
-    try:
-        # Connect to huntington_data_lake database
-        repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-        conn = db.connect(path_to_db)
-        
-        logger.info(f"Connected to database: {path_to_db}")
-        
-        # Create gold schema if it doesn't exist
-        conn.execute("CREATE SCHEMA IF NOT EXISTS gold")
-        
-        # Drop existing table and create new one
-        conn.execute("DROP TABLE IF EXISTS gold.all_patients_timeline")
-        logger.info("Dropped existing table (if any)")
-        
-        # Create new table with current data
-        # Explicitly cast resultado_tratamento to VARCHAR to preserve type
-        conn.execute("""
-            CREATE TABLE gold.all_patients_timeline AS 
-            SELECT 
-                prontuario,
-                event_id,
-                event_date,
-                reference,
-                reference_value,
-                tentativa,
-                unidade,
-                CAST(resultado_tratamento AS VARCHAR) as resultado_tratamento,
-                flag_date_estimated,
-                additional_info
-            FROM timeline_df
-        """)
-        
-        # Get row count
-        count_result = conn.execute("SELECT COUNT(*) as row_count FROM gold.all_patients_timeline").fetchdf()
-        row_count = count_result['row_count'].iloc[0]
-        
-        # Get patient count
-        patient_count_result = conn.execute("SELECT COUNT(DISTINCT prontuario) as patient_count FROM gold.all_patients_timeline").fetchdf()
-        patient_count = patient_count_result['patient_count'].iloc[0]
-        
-        logger.info(f"Successfully saved {len(timeline_df)} timeline events to gold.all_patients_timeline")
-        logger.info(f"Total events in table: {row_count}")
-        logger.info(f"Total patients in table: {patient_count}")
-        
-        # Show sample of saved data
-        sample_data = conn.execute("SELECT * FROM gold.all_patients_timeline LIMIT 5").fetchdf()
-        logger.info(f"Sample of saved data:")
-        logger.info(sample_data.to_string(index=False))
-        
-        conn.close()
-        
-    except Exception as e:
-        logger.error(f"Error saving timeline to database: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
+    return conn
 
-def display_timeline_summary(timeline_df):
-    """Display summary statistics of the timeline"""
+def create_all_patient_timeline(conn, full=False):
+    """
+    Build gold.all_patients_timeline from the Clinisys sources in the database,
+    replacing only the prontuarios whose events changed unless full is set.
+    """
+    logger.info("Creating unified timeline for ALL patients using SQL...")
+    conn.execute("CREATE SCHEMA IF NOT EXISTS gold")
+    return refresh_by_key(conn, TIMELINE_TABLE, TIMELINE_EVENTS_SQL, 'prontuario', force=full, log=logger.info)
+
+def display_timeline_summary(conn):
+    """Display summary statistics of the timeline (SQL aggregates on the gold table)"""
+    
+    total_events, unique_patients, date_range_start, date_range_end, estimated_count = conn.execute(f"""
+        SELECT
+            COUNT(*),
+            COUNT(DISTINCT prontuario),
+            MIN(event_date),
+            MAX(event_date),
+            COUNT(*) FILTER (flag_date_estimated)
+        FROM {TIMELINE_TABLE}
+    """).fetchone()
     
-    if timeline_df.empty:
+    if total_events == 0:
         logger.warning("No timeline data available")
         return
     
@@ -335,64 +268,61 @@ def display_timeline_summary(timeline_df):
     logger.info("TIMELINE SUMMARY")
     logger.info("="*80)
     
-    # Basic statistics
-    total_events = len(timeline_df)
-    unique_patients = timeline_df['prontuario'].nunique()
-    date_range_start = timeline_df['event_date'].min()
-    date_range_end = timeline_df['event_date'].max()
-    
     logger.info(f"Total events: {total_events:,}")
     logger.info(f"Unique patients: {unique_patients:,}")
     logger.info(f"Date range: {date_range_start} to {date_range_end}")
     
     # Events per table
     logger.info("\nEvents per table:")
-    table_counts = timeline_df['reference'].value_counts()
-    for table, count in table_counts.items():
+    table_counts = conn.execute(f"""
+        SELECT reference, COUNT(*) AS n
+        FROM {TIMELINE_TABLE}
+        GROUP BY reference
+        ORDER BY n DESC
+    """).fetchall()
+    for table, count in table_counts:
         logger.info(f"  {table}: {count:,}")
     
     # Events per patient (summary)
-    events_per_patient = timeline_df.groupby('prontuario').size()
+    avg_events, median_events, min_events, max_events = conn.execute(f"""
+        SELECT AVG(n), MEDIAN(n), MIN(n), MAX(n)
+        FROM (SELECT COUNT(*) AS n FROM {TIMELINE_TABLE} GROUP BY prontuario)
+    """).fetchone()
     logger.info(f"\nEvents per patient:")
-    logger.info(f"  Average: {events_per_patient.mean():.1f}")
-    logger.info(f"  Median: {events_per_patient.median():.1f}")
-    logger.info(f"  Min: {events_per_patient.min()}")
-    logger.info(f"  Max: {events_per_patient.max()}")
+    logger.info(f"  Average: {avg_events:.1f}")
+    logger.info(f"  Median: {median_events:.1f}")
+    logger.info(f"  Min: {min_events}")
+    logger.info(f"  Max: {max_events}")
     
-    # Estimated dates count
-    estimated_count = timeline_df['flag_date_estimated'].sum()
     logger.info(f"\nEstimated dates: {estimated_count:,} ({estimated_count/total_events*100:.1f}%)")
     
     logger.info("="*80)
 
 def main():
     """Main function to create timeline for all patients"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true',
+                        help='Recreate the whole table instead of replacing only the changed prontuarios')
+    args = parser.parse_args()
     
     logger.info("Starting all patient timeline creation...")
+    logger.info(f"Log file: {LOG_PATH}")
     
-    # Get database connection
-    conn = get_database_connection()
+    def build_timeline():
+        create_all_patient_timeline(conn, full=args.full or force_requested())
+        display_timeline_summary(conn)
+        return conn.execute(f"SELECT COUNT(*) FROM {TIMELINE_TABLE}").fetchone()[0] > 0
     
-    try:
-        # Get all patients
-        all_patients = get_all_patients(conn)
-        logger.info(f"Processing timeline for {len(all_patients)} patients")
+    with get_database_connection() as conn:
+        # Skip the rebuild when neither the Clinisys tables nor this script changed
+        source_fingerprints = input_fingerprints(conn, TIMELINE_INPUT_TABLES)
+        with open(__file__, 'r', encoding='utf-8') as f:
+            script_source = f.read()
         
-        # Create unified timeline for all patients
-        timeline_df = create_all_patient_timeline_sql(conn)
-        
-        # Display summary
-        display_timeline_summary(timeline_df)
-        
-        # Save timeline to database
-        save_timeline_to_database(timeline_df)
-        
-        logger.info("All patient timeline creation completed successfully!")
-        
-        return timeline_df
-        
-    finally:
-        conn.close()
+        cached_build(conn, TIMELINE_TABLE, source_fingerprints, build_timeline,
+                     key=script_source, force=args.full or None)
+    
+    logger.info("All patient timeline creation completed successfully!")
 
 if __name__ == "__main__":
-    timeline_df = main()
+    main()
@@ -1,95 +1,131 @@
 #!/usr/bin/env python3
 """
-Create clean timeline view for patients with first event after 2024-01-01
+Create clean timeline table for patients with first event on or after 2023-01-01
+
+gold.recent_patients_timeline used to be a view (a window over the whole
+timeline plus a sort) recomputed by every reader and by every pipeline stage
+that fingerprints it. It is now a table sorted by prontuario, event_date, so
+scans filtered on either column skip row groups, and it is refreshed from
+gold.all_patients_timeline one prontuario at a time (see
+commons/incremental_refresh.py). The last refresh is recorded in
+main._incremental_refresh and in the table comment.
 """
 
-import pandas as pd
-import duckdb as db
+import argparse
+import logging
 import os
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager
+from commons.build_cache import cached_build, force_requested
+from commons.incremental_refresh import last_refresh, refresh_by_key
+
+# Setup logging
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+os.makedirs(LOGS_DIR, exist_ok=True)
+timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(LOG_PATH),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+RECENT_TIMELINE_TABLE = 'gold.recent_patients_timeline'
+RECENT_TIMELINE_ORDER = 'prontuario, event_date DESC'
+
+# Same rows and columns as the former view: the timeline of every patient whose first event is recent
+RECENT_TIMELINE_SQL = """
+    WITH first_events AS (
+        SELECT prontuario, MIN(event_date) AS first_event_date
+        FROM gold.all_patients_timeline
+        GROUP BY prontuario
+    )
+    SELECT t.*, f.first_event_date
+    FROM gold.all_patients_timeline t
+    JOIN first_events f USING (prontuario)
+    WHERE f.first_event_date >= '2023-01-01'
+"""
+
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     # Resolve DB path relative to repository root
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
-    
-    print(f"Connected to database: {path_to_db}")
-    print(f"Database file exists: {os.path.exists(path_to_db)}")
-    
+    conn = duckdb_manager.connect(path_to_db)
+
+    logger.info(f"Connected to database: {path_to_db}")
+    logger.info(f"Database file exists: {os.path.exists(path_to_db)}")
+
     return conn
 
-def create_recent_patients_timeline_view(conn):
-    """Create a view for patients with first event after 2024-01-01"""
-    
-    print("Creating recent_patients_timeline view...")
-    
-    # Drop view if it exists
-    conn.execute("DROP VIEW IF EXISTS gold.recent_patients_timeline")
-    
-    # Create the view
-    create_view_query = """
-    CREATE VIEW gold.recent_patients_timeline AS
-    with clean_data as (
-            SELECT *,
-            MIN(event_date) OVER (PARTITION BY prontuario) as first_event_date
-            FROM gold.all_patients_timeline
-        )
-        SELECT* 
-        FROM clean_data
-        WHERE first_event_date >= '2023-01-01'
-        ORDER BY prontuario, event_date DESC
-    """
-    
-    conn.execute(create_view_query)
-    
-    # Verify the view was created
-    view_stats = conn.execute("""
-        SELECT 
+def create_recent_patients_timeline(conn, full=False):
+    """Create or refresh the materialised recent_patients_timeline table"""
+
+    logger.info("Refreshing recent_patients_timeline table...")
+
+    # Replace the former view by the table
+    is_view = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_views() WHERE schema_name = 'gold' AND view_name = 'recent_patients_timeline'"
+    ).fetchone()[0]
+    if is_view:
+        conn.execute(f"DROP VIEW {RECENT_TIMELINE_TABLE}")
+        logger.info("Dropped the former recent_patients_timeline view")
+
+    def refresh():
+        refresh_by_key(conn, RECENT_TIMELINE_TABLE, RECENT_TIMELINE_SQL, 'prontuario',
+                       order_by=RECENT_TIMELINE_ORDER, force=full, log=logger.info)
+
+    cached_build(conn, RECENT_TIMELINE_TABLE, ['gold.all_patients_timeline'], refresh,
+                 key=RECENT_TIMELINE_SQL + RECENT_TIMELINE_ORDER, force=full)
+
+    # Verify the table
+    total_events, unique_patients, earliest_date, latest_date, reference_types = conn.execute(f"""
+        SELECT
             COUNT(*) as total_events,
             COUNT(DISTINCT prontuario) as unique_patients,
             MIN(event_date) as earliest_date,
             MAX(event_date) as latest_date,
             COUNT(DISTINCT reference) as reference_types
-        FROM gold.recent_patients_timeline
-    """).fetchdf()
-    
-    print("View created successfully.")
-    print("View Statistics:")
-    print(f"   - Total events: {view_stats['total_events'].iloc[0]:,}")
-    print(f"   - Unique patients: {view_stats['unique_patients'].iloc[0]:,}")
-    print(f"   - Date range: {view_stats['earliest_date'].iloc[0]} to {view_stats['latest_date'].iloc[0]}")
-    print(f"   - Reference types: {view_stats['reference_types'].iloc[0]}")
-    
-    return view_stats
+        FROM {RECENT_TIMELINE_TABLE}
+    """).fetchone()
+    refreshed = last_refresh(conn, RECENT_TIMELINE_TABLE)
+
+    logger.info("Table Statistics:")
+    logger.info(f"   - Total events: {total_events:,}")
+    logger.info(f"   - Unique patients: {unique_patients:,}")
+    logger.info(f"   - Date range: {earliest_date} to {latest_date}")
+    logger.info(f"   - Reference types: {reference_types}")
+    if refreshed:
+        logger.info(f"   - Last refresh: {refreshed['refreshed_at']:%Y-%m-%d %H:%M:%S} ({refreshed['mode']}, "
+                    f"{refreshed['changed_keys']:,} of {refreshed['total_keys']:,} prontuarios changed)")
+
+    return total_events, unique_patients
 
 
 def main():
-    """Main function to create the recent patients timeline view"""
-    
-    print("=== CREATING RECENT PATIENTS TIMELINE VIEW ===")
-    print(f"Timestamp: {datetime.now()}")
-    print()
-    
-    try:
-        # Connect to database
-        conn = get_database_connection()
-        
-        # Create the view
-        view_stats = create_recent_patients_timeline_view(conn)
-
-        
-        print("\nSuccessfully created gold.recent_patients_timeline view")
-        print(f"View contains {view_stats['unique_patients'].iloc[0]:,} patients with {view_stats['total_events'].iloc[0]:,} total events")
-        print(f"Date range: {view_stats['earliest_date'].iloc[0]} to {view_stats['latest_date'].iloc[0]}")
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    """Main function to create the recent patients timeline table"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true',
+                        help='Recreate the whole table instead of replacing only the changed prontuarios')
+    args = parser.parse_args()
+
+    logger.info("=== CREATING RECENT PATIENTS TIMELINE TABLE ===")
+    logger.info(f"Log file: {LOG_PATH}")
+
+    with get_database_connection() as conn:
+        total_events, unique_patients = create_recent_patients_timeline(conn, full=args.full or force_requested())
+
+    logger.info(f"Successfully refreshed {RECENT_TIMELINE_TABLE}: "
+                f"{unique_patients:,} patients with {total_events:,} total events")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
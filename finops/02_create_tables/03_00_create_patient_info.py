@@ -6,13 +6,20 @@ Create gold.patient_info table with medico and unidade information
 import duckdb as db
 import pandas as pd
 from datetime import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons.finops_shared_tables import PATIENT_MEDICO, PATIENT_UNIDADE, ensure_shared_tables
+from commons import duckdb_manager
 
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     import os
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
+    conn = duckdb_manager.connect(path_to_db)
     
     print(f"Connected to database: {path_to_db}")
     return conn
@@ -21,15 +28,15 @@ def create_patient_info_table(conn):
     """Create the gold.patient_info table with medico and unidade information"""
     print("Creating gold.patient_info table...")
     
-    # Attach clinisys_all database
+    # Attach clinisys_all database (already attached when run by 00_run_finops_builders.py)
     import os
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     clinisys_db_path = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
+    conn.execute(f"ATTACH IF NOT EXISTS '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
     print(f"Attached clinisys_all database: {clinisys_db_path}")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.patient_info")
+    # Doctor and unit per patient, shared with 03_01
+    ensure_shared_tables(conn, [PATIENT_MEDICO, PATIENT_UNIDADE])
     
     # Create the patient info table following 03_01 logic
     create_table_query = """
@@ -40,31 +47,17 @@ def create_patient_info_table(conn):
         SELECT DISTINCT prontuario FROM gold.all_patients_timeline
     ),
     
-    -- Get medico names by joining responsavel_informacoes with view_medicos
-    -- Use the most recent doctor for each patient to avoid duplicates (same logic as 03_01)
+    -- Most recent doctor per patient (same logic as 03_01, see commons/finops_shared_tables.py)
     medico_mapping AS (
-        SELECT 
-            prontuario,
-            COALESCE(m.nome, 'Não informado') as medico_nome
-        FROM (
-            SELECT 
-                prontuario,
-                responsavel_informacoes,
-                ROW_NUMBER() OVER (PARTITION BY prontuario ORDER BY id DESC) as rn
-            FROM clinisys_all.silver.view_tratamentos
-            WHERE responsavel_informacoes IS NOT NULL
-        ) latest_treatment
-        LEFT JOIN clinisys_all.silver.view_medicos m ON latest_treatment.responsavel_informacoes = m.id
-        WHERE latest_treatment.rn = 1
+        SELECT prontuario, medico_nome FROM gold.finops_patient_medico
     ),
     
     -- Get unidade information from view_pacientes and view_unidades
     unidade_mapping AS (
         SELECT 
-            p.codigo as prontuario,
-            COALESCE(u.nome, 'Não informado') as unidade_nome
-        FROM clinisys_all.silver.view_pacientes p
-        LEFT JOIN clinisys_all.silver.view_unidades u ON p.unidade_origem = u.id
+            prontuario,
+            COALESCE(unidade_nome, 'Não informado') as unidade_nome
+        FROM gold.finops_patient_unidade
     )
     
     SELECT 
@@ -77,7 +70,11 @@ def create_patient_info_table(conn):
     ORDER BY ap.prontuario
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.patient_info', create_table_query, [
+        'gold.all_patients_timeline',
+        'gold.finops_patient_medico',
+        'gold.finops_patient_unidade',
+    ], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
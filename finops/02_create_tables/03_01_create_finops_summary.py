@@ -6,6 +6,13 @@ Create gold.finops_summary table with patient-level FIV cycle analysis
 import duckdb as db
 import pandas as pd
 from datetime import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons.finops_shared_tables import PATIENT_MEDICO, PATIENT_UNIDADE, ensure_shared_tables
+from commons import duckdb_manager
 
 def get_database_connection(read_only=False):
 	"""Create and return a connection to the huntington_data_lake database"""
@@ -13,7 +20,7 @@ def get_database_connection(read_only=False):
 	import os
 	repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 	path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-	conn = db.connect(path_to_db, read_only=read_only)
+	conn = duckdb_manager.connect(path_to_db, read_only=read_only)
 	
 	print(f"Connected to database: {path_to_db} (read_only={read_only})")
 	return conn
@@ -23,15 +30,15 @@ def create_finops_summary_table(conn):
 	
 	print("Creating gold.finops_summary table...")
 	
-	# Attach clinisys_all database
+	# Attach clinisys_all database (already attached when run by 00_run_finops_builders.py)
 	import os
 	repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 	clinisys_db_path = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-	conn.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
+	conn.execute(f"ATTACH IF NOT EXISTS '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
 	print(f"Attached clinisys_all database: {clinisys_db_path}")
 	
-	# Drop table if it exists
-	conn.execute("DROP TABLE IF EXISTS gold.finops_summary")
+	# Doctor and unit per patient, shared with 03_00
+	ensure_shared_tables(conn, [PATIENT_MEDICO, PATIENT_UNIDADE])
 	
 	# Create the table with FIV cycle data AND billing data
 	create_table_query = """
@@ -127,22 +134,12 @@ def create_finops_summary_table(conn):
 		FROM clinisys_all.silver.view_tratamentos
 		WHERE utero_substituicao = 'Sim'
 	),
-	-- Get medico names by joining responsavel_informacoes with view_medicos
-	-- Use the most recent doctor for each patient to avoid duplicates
+	-- Most recent doctor per patient (see commons/finops_shared_tables.py)
 	medico_mapping AS (
 		SELECT 
 			CAST(prontuario AS VARCHAR) as prontuario,
-			COALESCE(m.nome, 'Não informado') as medico_nome
-		FROM (
-			SELECT 
-				prontuario,
-				responsavel_informacoes,
-				ROW_NUMBER() OVER (PARTITION BY prontuario ORDER BY id DESC) as rn
-			FROM clinisys_all.silver.view_tratamentos
-			WHERE responsavel_informacoes IS NOT NULL
-		) latest_treatment
-		LEFT JOIN clinisys_all.silver.view_medicos m ON latest_treatment.responsavel_informacoes = m.id
-		WHERE latest_treatment.rn = 1
+			medico_nome
+		FROM gold.finops_patient_medico
 	),
 	-- Define payment conditions using Descrição Gerencial field
 	billing_conditions AS (
@@ -230,14 +227,10 @@ def create_finops_summary_table(conn):
 	ORDER BY COALESCE(t.prontuario, b.prontuario)
 	"""
 	
-	conn.execute(create_table_query)
-	
 	# Add timeline_unidade by joining with view_pacientes and view_unidades
-	print("Adding timeline_unidade from patient data...")
 	add_unidade_query = """
 	ALTER TABLE gold.finops_summary ADD COLUMN timeline_unidade VARCHAR;
 	"""
-	conn.execute(add_unidade_query)
 	
 	# Update the timeline_unidade column with data from view_pacientes and view_unidades
 	update_unidade_query = """
@@ -245,17 +238,14 @@ def create_finops_summary_table(conn):
 	SET timeline_unidade = patient_units.unidade_nome
 	FROM (
 		SELECT 
-			CAST(CAST(p.codigo AS INTEGER) AS VARCHAR) as prontuario,
-			u.nome as unidade_nome
-		FROM clinisys_all.silver.view_pacientes p
-		LEFT JOIN clinisys_all.silver.view_unidades u ON p.unidade_origem = u.id
+			CAST(CAST(prontuario AS INTEGER) AS VARCHAR) as prontuario,
+			unidade_nome
+		FROM gold.finops_patient_unidade
 	) patient_units
 	WHERE finops_summary.prontuario = patient_units.prontuario
 	"""
-	conn.execute(update_unidade_query)
 	
 	# Consolidate any duplicate prontuario rows (normalize INTEGER vs DOUBLE/VARCHAR format differences)
-	print("Consolidating duplicate prontuario rows...")
 	consolidate_query = """
 	CREATE OR REPLACE TABLE gold.finops_summary AS
 	SELECT 
@@ -285,7 +275,13 @@ def create_finops_summary_table(conn):
 	GROUP BY CAST(CAST(prontuario AS INTEGER) AS VARCHAR)
 	ORDER BY CAST(CAST(prontuario AS INTEGER) AS VARCHAR)
 	"""
-	conn.execute(consolidate_query)
+	build_table(conn, 'gold.finops_summary', create_table_query, [
+		'gold.all_patients_timeline',
+		'silver.mesclada_vendas',
+		'clinisys_all.silver.view_tratamentos',
+		'gold.finops_patient_medico',
+		'gold.finops_patient_unidade',
+	], post_sql=[add_unidade_query, update_unidade_query, consolidate_query], log=print)
 	
 	# Verify the table was created
 	table_stats = conn.execute("""
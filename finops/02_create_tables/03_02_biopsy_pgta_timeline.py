@@ -7,13 +7,19 @@ import duckdb as db
 import pandas as pd
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons.finops_shared_tables import BILLING_MONTHLY, ensure_shared_tables
+from commons import duckdb_manager
 
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     # Resolve DB path relative to repository root
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
+    conn = duckdb_manager.connect(path_to_db)
     
     print(f"Connected to database: {path_to_db}")
     return conn
@@ -23,15 +29,12 @@ def create_biopsy_pgta_timeline_table(conn):
     
     print("Creating gold.biopsy_pgta_timeline table...")
     
-    # Attach clinisys_all database
+    # Attach clinisys_all database (already attached when run by 00_run_finops_builders.py)
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     clinisys_db_path = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
+    conn.execute(f"ATTACH IF NOT EXISTS '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
     print(f"Attached clinisys_all database: {clinisys_db_path}")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.biopsy_pgta_timeline")
-    
     # Create the table with monthly biopsy and PGT-A test tracking
     create_table_query = """
     CREATE TABLE gold.biopsy_pgta_timeline AS
@@ -126,7 +129,7 @@ def create_biopsy_pgta_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.biopsy_pgta_timeline', create_table_query, ['clinisys_all.silver.view_micromanipulacao', 'clinisys_all.silver.view_micromanipulacao_oocitos'], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -225,8 +228,8 @@ def create_billing_timeline_table(conn):
     
     print("Creating gold.billing_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.billing_timeline")
+    # Billing by prontuario and month, shared with the other finops builders
+    ensure_shared_tables(conn, [BILLING_MONTHLY])
     
     # Create the table with monthly billing tracking for biopsy and PGT-A services
     create_table_query = """
@@ -236,35 +239,27 @@ def create_billing_timeline_table(conn):
     biopsy_billing AS (
         SELECT 
             prontuario,
-            STRFTIME("DT Emissao", '%Y-%m') as period_month,
-            COUNT(*) as biopsy_payment_count,
-            SUM(Total) as biopsy_payment_amount,
-            SUM("Qntd.") as biopsy_payment_qtd
-        FROM silver.mesclada_vendas
-        WHERE prontuario IS NOT NULL 
-            AND prontuario != -1
-            AND "DT Emissao" IS NOT NULL
-            AND "DT Emissao" <= CURRENT_DATE
-            AND "Descrição Gerencial" = 'Biópsia Embrionária'
-        GROUP BY prontuario, STRFTIME("DT Emissao", '%Y-%m')
+            period_month,
+            CAST(SUM(n_rows) AS BIGINT) as biopsy_payment_count,
+            SUM(total) as biopsy_payment_amount,
+            SUM(quantity) as biopsy_payment_qtd
+        FROM gold.finops_billing_monthly
+        WHERE descricao_gerencial = 'Biópsia Embrionária'
+        GROUP BY prontuario, period_month
     ),
     
     -- Get PGT-A billing data by month and prontuario (excluding PGT-M + A)
     pgta_billing AS (
         SELECT 
             prontuario,
-            STRFTIME("DT Emissao", '%Y-%m') as period_month,
-            COUNT(*) as pgta_payment_count,
-            SUM(Total) as pgta_payment_amount,
-            SUM("Qntd.") as pgta_payment_qtd
-        FROM silver.mesclada_vendas
-        WHERE prontuario IS NOT NULL 
-            AND prontuario != -1
-            AND "DT Emissao" IS NOT NULL
-            AND "DT Emissao" <= CURRENT_DATE
-            AND "Descrição Gerencial" LIKE '%PGT-%'
-            AND "Descrição Gerencial" NOT LIKE '%PGT-M + A%'
-        GROUP BY prontuario, STRFTIME("DT Emissao", '%Y-%m')
+            period_month,
+            CAST(SUM(n_rows) AS BIGINT) as pgta_payment_count,
+            SUM(total) as pgta_payment_amount,
+            SUM(quantity) as pgta_payment_qtd
+        FROM gold.finops_billing_monthly
+        WHERE descricao_gerencial LIKE '%PGT-%'
+            AND descricao_gerencial NOT LIKE '%PGT-M + A%'
+        GROUP BY prontuario, period_month
     ),
     
     -- Get all unique prontuario-month combinations
@@ -344,7 +339,7 @@ def create_billing_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.billing_timeline', create_table_query, [BILLING_MONTHLY], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -441,9 +436,6 @@ def create_comprehensive_timeline_table(conn):
     
     print("Creating gold.comprehensive_biopsy_pgta_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.comprehensive_biopsy_pgta_timeline")
-    
     # Create the comprehensive timeline table
     create_table_query = """
     CREATE TABLE gold.comprehensive_biopsy_pgta_timeline AS
@@ -542,7 +534,7 @@ def create_comprehensive_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.comprehensive_biopsy_pgta_timeline', create_table_query, ['gold.biopsy_pgta_timeline', 'gold.billing_timeline'], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -640,9 +632,6 @@ def create_resumed_timeline_table(conn):
     """Create a resumed timeline table with only the most recent record per patient"""
     print("Creating gold.resumed_biopsy_pgta_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.resumed_biopsy_pgta_timeline")
-    
     # Create the resumed timeline table
     create_table_query = """
     CREATE TABLE gold.resumed_biopsy_pgta_timeline AS
@@ -660,7 +649,7 @@ def create_resumed_timeline_table(conn):
     ORDER BY ct.prontuario
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.resumed_biopsy_pgta_timeline', create_table_query, ['gold.comprehensive_biopsy_pgta_timeline'], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -761,9 +750,6 @@ def create_patient_info_table(conn):
     """Create a patient info table with medico and unidade information"""
     print("Creating gold.patient_info table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.patient_info")
-    
     # Create the patient info table
     create_table_query = """
     CREATE TABLE gold.patient_info AS
@@ -811,7 +797,14 @@ def create_patient_info_table(conn):
     ORDER BY ap.prontuario
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.patient_info', create_table_query, [
+        'gold.biopsy_pgta_timeline',
+        'gold.billing_timeline',
+        'clinisys_all.silver.view_tratamentos',
+        'clinisys_all.silver.view_medicos',
+        'clinisys_all.silver.view_pacientes',
+        'clinisys_all.silver.view_unidades',
+    ], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
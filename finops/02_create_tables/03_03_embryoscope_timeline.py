@@ -7,13 +7,19 @@ import duckdb as db
 import pandas as pd
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons.finops_shared_tables import BILLING_MONTHLY, ensure_shared_tables
+from commons import duckdb_manager
 
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     # Resolve DB path relative to repository root
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
+    conn = duckdb_manager.connect(path_to_db)
     
     print(f"Connected to database: {path_to_db}")
     return conn
@@ -23,8 +29,8 @@ def create_embryoscope_timeline_table(conn):
     
     print("Creating gold.embryoscope_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.embryoscope_timeline")
+    # Billing by prontuario and month, shared with the other finops builders
+    ensure_shared_tables(conn, [BILLING_MONTHLY])
     
     # Create the table with monthly embryoscope usage vs billing tracking
     create_table_query = """
@@ -49,16 +55,12 @@ def create_embryoscope_timeline_table(conn):
     embryoscope_billing AS (
         SELECT 
             prontuario,
-            STRFTIME("DT Emissao", '%Y-%m') as period_month,
-            COUNT(*) as billing_events_count,
-            SUM(Total) as total_billing_amount
-        FROM silver.mesclada_vendas
-        WHERE prontuario IS NOT NULL 
-            AND prontuario != -1
-            AND "DT Emissao" IS NOT NULL
-            AND "DT Emissao" <= CURRENT_DATE
-            AND "Descrição Gerencial" = 'Embryoscope'
-        GROUP BY prontuario, STRFTIME("DT Emissao", '%Y-%m')
+            period_month,
+            CAST(SUM(n_rows) AS BIGINT) as billing_events_count,
+            SUM(total) as total_billing_amount
+        FROM gold.finops_billing_monthly
+        WHERE descricao_gerencial = 'Embryoscope'
+        GROUP BY prontuario, period_month
     ),
     
     -- Get all unique prontuario-month combinations
@@ -127,7 +129,7 @@ def create_embryoscope_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.embryoscope_timeline', create_table_query, ['gold.embryoscope_embrioes', BILLING_MONTHLY], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -233,9 +235,6 @@ def create_resumed_embryoscope_timeline_table(conn):
     """Create a resumed timeline table with only the most recent record per patient"""
     print("Creating gold.resumed_embryoscope_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.resumed_embryoscope_timeline")
-    
     # Create the resumed timeline table
     create_table_query = """
     CREATE TABLE gold.resumed_embryoscope_timeline AS
@@ -253,7 +252,7 @@ def create_resumed_embryoscope_timeline_table(conn):
     ORDER BY et.prontuario
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.resumed_embryoscope_timeline', create_table_query, ['gold.embryoscope_timeline'], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
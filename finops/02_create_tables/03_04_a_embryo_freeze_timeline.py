@@ -7,13 +7,18 @@ import duckdb as db
 import pandas as pd
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons import duckdb_manager
 
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     # Resolve DB path relative to repository root
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
+    conn = duckdb_manager.connect(path_to_db)
     
     print(f"Connected to database: {path_to_db}")
     return conn
@@ -23,15 +28,12 @@ def create_embryo_freeze_timeline_table(conn):
     
     print("Creating gold.embryo_freeze_timeline table...")
     
-    # Attach clinisys_all database
+    # Attach clinisys_all database (already attached when run by 00_run_finops_builders.py)
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     clinisys_db_path = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
+    conn.execute(f"ATTACH IF NOT EXISTS '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
     print(f"Attached clinisys_all database: {clinisys_db_path}")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.embryo_freeze_timeline")
-    
     # Create the table with monthly embryo freeze/unfreeze tracking
     create_table_query = """
     CREATE TABLE gold.embryo_freeze_timeline AS
@@ -189,7 +191,11 @@ def create_embryo_freeze_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.embryo_freeze_timeline', create_table_query, [
+        'clinisys_all.silver.view_congelamentos_embrioes',
+        'clinisys_all.silver.view_descongelamentos_embrioes',
+        'clinisys_all.silver.view_embrioes_congelados',
+    ], log=print)
     
     # Verify the table was created and check exclusion impact
     table_stats = conn.execute("""
@@ -310,9 +316,6 @@ def create_embryo_billing_timeline_table(conn):
     
     print("Creating gold.embryo_billing_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.embryo_billing_timeline")
-    
     # Create the table with monthly embryo billing tracking
     create_table_query = """
     CREATE TABLE gold.embryo_billing_timeline AS
@@ -359,7 +362,7 @@ def create_embryo_billing_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.embryo_billing_timeline', create_table_query, ['silver.mesclada_vendas'], log=print)
     print("Table created successfully.")
     
     # Get table statistics
@@ -386,9 +389,6 @@ def create_comprehensive_embryo_timeline_table(conn):
     
     print("Creating gold.comprehensive_embryo_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.comprehensive_embryo_timeline")
-    
     # Create the comprehensive timeline table
     create_table_query = """
     CREATE TABLE gold.comprehensive_embryo_timeline AS
@@ -520,7 +520,7 @@ def create_comprehensive_embryo_timeline_table(conn):
     ORDER BY ed.prontuario, ed.period_date DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.comprehensive_embryo_timeline', create_table_query, ['gold.embryo_freeze_timeline', 'gold.embryo_billing_timeline'], log=print)
     print("Table created successfully.")
     
     # Get table statistics
@@ -7,13 +7,19 @@ import duckdb as db
 import pandas as pd
 from datetime import datetime
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons.build_cache import build_table
+from commons.finops_shared_tables import BILLING_MONTHLY, ensure_shared_tables
+from commons import duckdb_manager
 
 def get_database_connection():
     """Create and return a connection to the huntington_data_lake database"""
     # Resolve DB path relative to repository root
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db)
+    conn = duckdb_manager.connect(path_to_db)
     
     print(f"Connected to database: {path_to_db}")
     return conn
@@ -23,14 +29,14 @@ def create_consultas_timeline_table(conn):
     
     print("Creating gold.consultas_timeline table...")
     
-    # Attach clinisys_all database
+    # Attach clinisys_all database (already attached when run by 00_run_finops_builders.py)
     repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
     clinisys_db_path = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn.execute(f"ATTACH '{clinisys_db_path}' AS clinisys_all")
+    conn.execute(f"ATTACH IF NOT EXISTS '{clinisys_db_path}' AS clinisys_all (READ_ONLY)")
     print(f"Attached clinisys_all database: {clinisys_db_path}")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.consultas_timeline")
+    # Billing by prontuario and month, shared with the other finops builders
+    ensure_shared_tables(conn, [BILLING_MONTHLY])
     
     # Create the table with monthly consultation events vs billing tracking
     create_table_query = """
@@ -89,17 +95,13 @@ def create_consultas_timeline_table(conn):
     consultas_billing AS (
         SELECT 
             prontuario,
-            STRFTIME("DT Emissao", '%Y-%m') as period_month,
-            COUNT(*) as billing_events_count,
-            SUM(Total) as total_billing_amount,
-            SUM("Qntd.") as total_quantity
-        FROM silver.mesclada_vendas
-        WHERE prontuario IS NOT NULL 
-            AND prontuario != -1
-            AND "DT Emissao" IS NOT NULL
-            AND "DT Emissao" <= CURRENT_DATE
-            AND "Descrição Gerencial" IN ('Consultas de CRH', 'Outras Consultas')
-        GROUP BY prontuario, STRFTIME("DT Emissao", '%Y-%m')
+            period_month,
+            CAST(SUM(n_rows) AS BIGINT) as billing_events_count,
+            SUM(total) as total_billing_amount,
+            SUM(quantity) as total_quantity
+        FROM gold.finops_billing_monthly
+        WHERE descricao_gerencial IN ('Consultas de CRH', 'Outras Consultas')
+        GROUP BY prontuario, period_month
     ),
     
     -- Get all unique prontuario-month combinations
@@ -177,7 +179,7 @@ def create_consultas_timeline_table(conn):
     ORDER BY prontuario, period_month DESC
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.consultas_timeline', create_table_query, ['clinisys_all.silver.view_extrato_atendimentos_central', BILLING_MONTHLY], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -286,9 +288,6 @@ def create_resumed_consultas_timeline_table(conn):
     """Create a resumed timeline table with only the most recent record per patient"""
     print("Creating gold.resumed_consultas_timeline table...")
     
-    # Drop table if it exists
-    conn.execute("DROP TABLE IF EXISTS gold.resumed_consultas_timeline")
-    
     # Create the resumed timeline table
     create_table_query = """
     CREATE TABLE gold.resumed_consultas_timeline AS
@@ -306,7 +305,7 @@ def create_resumed_consultas_timeline_table(conn):
     ORDER BY ct.prontuario
     """
     
-    conn.execute(create_table_query)
+    build_table(conn, 'gold.resumed_consultas_timeline', create_table_query, ['gold.consultas_timeline'], log=print)
     
     # Get statistics
     table_stats = conn.execute("""
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 """
-Script to export tables from DuckDB database to CSV files.
-Usage: python export_table_to_csv.py <schema> <table_name> [output_filename]
+Script to export tables from DuckDB database to CSV (or Parquet) files.
+Usage: python 04_export_table_to_csv.py --schema gold --table patient_info [--prefix 03_00_]
+       python 04_export_table_to_csv.py --schema gold --table consultas_timeline --format parquet --partition-year period_date
 """
 
 import sys
 import os
 import duckdb
-import pandas as pd
+import hashlib
+import json
+import time
 from datetime import datetime
 import argparse
 import logging
@@ -60,15 +63,96 @@ def list_available_tables():
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
 
-def export_table_to_csv(schema, table_name, output_filename=None, prefix=None):
+def _sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _csv_projection(conn, relation, columns):
     """
-    Export a table from DuckDB to CSV.
-    
+    SELECT list that renders each column as text the way pandas' to_csv(decimal=',') did,
+    so COPY writes the same European CSV: DOUBLE/DECIMAL with a comma decimal separator
+    (Python repr digits), NaN and NULL as empty, booleans as True/False, and timestamps as
+    dates when every value is at midnight, with microseconds when any value has them.
+    """
+    timestamp_formats = {}
+    timestamp_columns = [name for name, col_type in columns if col_type.startswith('TIMESTAMP') and 'TIME ZONE' not in col_type]
+    if timestamp_columns:
+        checks = ', '.join(
+            f'bool_and(CAST("{c}" AS TIME) = TIME \'00:00:00\'), bool_or(microsecond("{c}") % 1000000 != 0)'
+            for c in timestamp_columns)
+        flags = conn.execute(f"SELECT {checks} FROM {relation}").fetchone()
+        for i, name in enumerate(timestamp_columns):
+            all_midnight, has_fraction = flags[2 * i], flags[2 * i + 1]
+            if all_midnight is None or all_midnight:
+                timestamp_formats[name] = '%Y-%m-%d'
+            elif has_fraction:
+                timestamp_formats[name] = '%Y-%m-%d %H:%M:%S.%f'
+            else:
+                timestamp_formats[name] = '%Y-%m-%d %H:%M:%S'
+
+    expressions = []
+    for name, col_type in columns:
+        col = f'"{name}"'
+        if col_type == 'DOUBLE' or col_type.startswith('DECIMAL'):
+            value = f"CAST({col} AS DOUBLE)"
+            text = f"CASE WHEN NOT isnan({value}) THEN replace(CAST({value} AS VARCHAR), '.', ',') END"
+        elif col_type == 'FLOAT':
+            text = f"CASE WHEN NOT isnan({col}) THEN replace(CAST({col} AS VARCHAR), '.', ',') END"
+        elif col_type == 'BOOLEAN':
+            text = f"CASE WHEN {col} THEN 'True' WHEN NOT {col} THEN 'False' END"
+        elif name in timestamp_formats:
+            text = f"strftime({col}, '{timestamp_formats[name]}')"
+        else:
+            text = f"CAST({col} AS VARCHAR)"
+        # Empty strings are quoted ("") by FORCE_QUOTE, as pandas did for missing values
+        expressions.append(f"COALESCE({text}, '')")
+    return expressions
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_rows(conn, path, file_format):
+    """Row count of an exported file, read back from the file itself"""
+    if file_format == 'parquet':
+        return conn.execute("SELECT SUM(num_rows) FROM parquet_file_metadata(?)", [path]).fetchone()[0]
+    return conn.execute(
+        "SELECT COUNT(*) FROM read_csv(?, delim=';', quote='\"', header=true, all_varchar=true)", [path]
+    ).fetchone()[0]
+
+
+def _preview(conn, path, file_format):
+    if file_format == 'parquet':
+        return conn.execute("SELECT * FROM read_parquet(?) LIMIT 5", [path]).df()
+    return conn.execute(
+        "SELECT * FROM read_csv(?, delim=';', quote='\"', header=true, decimal_separator=',') LIMIT 5", [path]
+    ).df()
+
+
+def export_table_to_csv(schema, table_name, output_filename=None, prefix=None, file_format='csv',
+                        partition_by=None, partition_year=None):
+    """
+    Export a table from DuckDB to CSV (or Parquet) with COPY ... TO.
+
+    DuckDB streams the table to disk, so memory use does not grow with the table. The CSV
+    dialect is the one the pandas export used: semicolon separator, comma decimals, every
+    field quoted, UTF-8 with BOM. A manifest (<output>.manifest.json) records the row count,
+    size and SHA-256 of every file written.
+
     Args:
         schema (str): Database schema name
         table_name (str): Table name
-        output_filename (str, optional): Output filename. If None, will use schema_table_timestamp.csv
+        output_filename (str, optional): Output filename. If None, will use schema_table.csv
         prefix (str, optional): Prefix to add to the filename (e.g., "01_", "02_")
+        file_format (str): 'csv' or 'parquet'
+        partition_by (list, optional): Columns to partition by; writes a directory with one
+            subdirectory per value (column=value/data_0.csv)
+        partition_year (str, optional): Date column; partitions by its year (<column>_year=2024/)
     """
     db_path = get_database_path()
     
@@ -84,14 +168,15 @@ def export_table_to_csv(schema, table_name, output_filename=None, prefix=None):
     os.makedirs(output_dir, exist_ok=True)
     
     # Generate output filename if not provided
+    extension = '.parquet' if file_format == 'parquet' else '.csv'
     if output_filename is None:
-        base_filename = f"{schema}_{table_name}.csv"
+        base_filename = f"{schema}_{table_name}{extension}"
     else:
         base_filename = output_filename
     
-    # Ensure .csv extension
-    if not base_filename.endswith('.csv'):
-        base_filename += '.csv'
+    # Ensure the extension
+    if not base_filename.endswith(extension):
+        base_filename += extension
     
     # Add prefix if provided
     if prefix:
@@ -100,6 +185,12 @@ def export_table_to_csv(schema, table_name, output_filename=None, prefix=None):
         output_filename = base_filename
     
     output_path = os.path.join(output_dir, output_filename)
+    partition_columns = list(partition_by or [])
+    if partition_year:
+        partition_columns.append(f"{partition_year}_year")
+    if partition_columns:
+        # Partitioned exports are a directory of files, one subdirectory per partition value
+        output_path = output_path[:-len(extension)]
     
     try:
         logger.info(f"Connecting to database: {db_path}")
@@ -116,38 +207,100 @@ def export_table_to_csv(schema, table_name, output_filename=None, prefix=None):
             
             # Get table info
             logger.info(f"Exporting table: {schema}.{table_name}")
+            relation = f'"{schema}"."{table_name}"'
+            columns = [(row[0], row[1]) for row in conn.execute(f"DESCRIBE {relation}").fetchall()]
             
             # Get row count
-            count = conn.execute(f"SELECT COUNT(*) FROM \"{schema}\".\"{table_name}\"").fetchone()[0]
+            count = conn.execute(f"SELECT COUNT(*) FROM {relation}").fetchone()[0]
             logger.info(f"Table has {count:,} rows")
             
-            # Export to CSV
+            partition_exprs = [f'"{c}"' for c in partition_by or []]
+            if partition_year:
+                partition_exprs.append(f'year("{partition_year}") AS "{partition_year}_year"')
+            
+            if file_format == 'parquet':
+                select = ', '.join(['*'] + [e for e in partition_exprs if ' AS ' in e])
+                options = ["FORMAT parquet", "COMPRESSION zstd"]
+                if partition_columns:
+                    options.append("WRITE_PARTITION_COLUMNS true")
+            else:
+                # European CSV: the values are rendered as text in the query and every field is quoted.
+                # COPY has no decimal separator or BOM option for writing, so the BOM and the quoted
+                # header go in PREFIX (which excludes HEADER) and SUFFIX ends the last row.
+                text_columns = [f'{expr} AS "__col_{i}"'
+                                for i, expr in enumerate(_csv_projection(conn, relation, columns))]
+                select = ', '.join(text_columns + partition_exprs)
+                header = ';'.join('"' + name.replace('"', '""') + '"' for name, _ in columns)
+                header = '\ufeff' + header + (os.linesep if count else '')
+                options = ["FORMAT csv", "DELIMITER ';'", "QUOTE '\"'", "HEADER false", "FORCE_QUOTE *",
+                           f"NEW_LINE {_sql_literal(os.linesep)}",
+                           f"PREFIX {_sql_literal(header)}", f"SUFFIX {_sql_literal(os.linesep)}"]
+            if partition_columns:
+                quoted = ', '.join(f'"{c}"' for c in partition_columns)
+                options += [f"PARTITION_BY ({quoted})", "OVERWRITE true"]
+                target = output_path
+            else:
+                # Write next to the target and swap it in, so readers never see a half-written file
+                target = output_path + '.tmp'
+            
+            # Export
             logger.info(f"Starting export to: {output_path}")
+            start = time.perf_counter()
+            try:
+                written, files = conn.execute(
+                    f"COPY (SELECT {select} FROM {relation}) TO {_sql_literal(target)} "
+                    f"({', '.join(options + ['RETURN_FILES true'])})"
+                ).fetchone()
+                if not partition_columns:
+                    os.replace(target, output_path)
+                    files = [output_path]
+            finally:
+                if not partition_columns and os.path.exists(target):
+                    os.remove(target)
+            logger.info(f"Wrote {written:,} rows to {len(files)} file(s) in {time.perf_counter() - start:.1f}s")
             
-            # Use pandas to export with European CSV format: decimal separator as comma, field separator as semicolon, quote all
-            # Use utf-8-sig encoding to add BOM (Byte Order Mark) for better compatibility with Excel and other CSV readers
-            df = conn.execute(f"SELECT * FROM \"{schema}\".\"{table_name}\"").df()
-            df.to_csv(output_path, sep=';', decimal=',', quoting=1, index=False, encoding='utf-8-sig')  # quoting=1 means QUOTE_ALL
+            # Manifest: what was written, so the export can be checked after copying it elsewhere
+            manifest_files = []
+            for path in sorted(files):
+                rows = written if not partition_columns else _file_rows(conn, path, file_format)
+                manifest_files.append({
+                    'path': os.path.relpath(path, output_dir).replace(os.sep, '/'),
+                    'rows': rows,
+                    'bytes': os.path.getsize(path),
+                    'sha256': _sha256(path),
+                })
+            exported_rows = sum(f['rows'] for f in manifest_files)
+            if exported_rows != count:
+                logger.error(f"Export has {exported_rows:,} rows but the table has {count:,}")
+                return False
+            manifest_path = output_path + '.manifest.json'
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'table': f"{schema}.{table_name}",
+                    'format': file_format,
+                    'exported_at': datetime.now().isoformat(timespec='seconds'),
+                    'rows': count,
+                    'columns': dict(columns),
+                    'partition_by': partition_columns,
+                    'files': manifest_files,
+                }, f, indent=2, ensure_ascii=False)
             
-            # Verify the file was created and has content
-            if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path)
-                logger.info(f"Export completed successfully!")
-                logger.info(f"Output file: {output_path}")
-                logger.info(f"File size: {file_size:,} bytes")
-                
-                # Show first few lines as preview
+            file_size = sum(f['bytes'] for f in manifest_files)
+            logger.info(f"Export completed successfully!")
+            logger.info(f"Output: {output_path}")
+            logger.info(f"File size: {file_size:,} bytes")
+            logger.info(f"Manifest: {manifest_path}")
+            
+            # Show first few lines as preview
+            if files:
                 try:
-                    df_preview = pd.read_csv(output_path, nrows=5, sep=';', decimal=',', encoding='utf-8-sig')
+                    df_preview = _preview(conn, sorted(files)[0], file_format)
                     logger.info(f"Preview of exported data:")
                     logger.info(f"\n{df_preview.to_string()}")
                 except Exception as e:
                     logger.warning(f"Could not preview data: {e}")
-                
-                return True
-            else:
-                logger.error("Export failed - output file was not created")
-                return False
+            
+            return True
                 
     except Exception as e:
         logger.error(f"Error during export: {e}")
@@ -168,12 +321,18 @@ def main():
         ]
     )
     
-    parser = argparse.ArgumentParser(description='Export tables from DuckDB to CSV')
+    parser = argparse.ArgumentParser(description='Export tables from DuckDB to CSV or Parquet')
     parser.add_argument('--list', action='store_true', help='List all available schemas and tables')
     parser.add_argument('--schema', type=str, help='Schema name')
     parser.add_argument('--table', type=str, help='Table name')
     parser.add_argument('--output', type=str, help='Output filename (optional)')
     parser.add_argument('--prefix', type=str, help='Prefix for output filename (e.g., "01_", "02_")')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='csv: European CSV as before (default); parquet: typed, zstd-compressed (e.g. for Power BI)')
+    parser.add_argument('--partition-by', nargs='+', metavar='COLUMN',
+                        help='Write one file per value of these columns (e.g. timeline_unidade)')
+    parser.add_argument('--partition-year', metavar='DATE_COLUMN',
+                        help='Write one file per year of this date column')
     
     args = parser.parse_args()
     
@@ -186,7 +345,8 @@ def main():
         parser.print_help()
         return
     
-    success = export_table_to_csv(args.schema, args.table, args.output, args.prefix)
+    success = export_table_to_csv(args.schema, args.table, args.output, args.prefix, args.format,
+                                  args.partition_by, args.partition_year)
     
     if success:
         logger.info("Export completed successfully!")
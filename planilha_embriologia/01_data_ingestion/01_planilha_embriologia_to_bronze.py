@@ -3,38 +3,50 @@
 Planilha Embriologia Loader - Load all Excel files from year subfolders to bronze.planilha_embriologia
 Reads all Excel files from planilha_embriologia/data_input/YYYY/ folders and loads them to bronze layer.
 Reads from the "FET" sheet in each file.
-Fully overwrites the bronze table on each run.
+Fully overwrites the bronze tables of each changed file; files unchanged since the
+last run are skipped (commons/ingestion_registry.py). Workbooks are read once each, in
+parallel worker processes (commons/spreadsheet_reader.py).
 """
 
 import logging
-import pandas as pd
-import duckdb
 from datetime import datetime
 import os
 import glob
 import re
+import sys
 
-# Setup logging
-LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
-os.makedirs(LOGS_DIR, exist_ok=True)
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-script_name = os.path.splitext(os.path.basename(__file__))[0]
-LOG_PATH = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import duckdb_manager, ingestion_registry
+from commons.spreadsheet_reader import insert_sheet, read_workbooks, unique_column_names
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
+LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """
+    Log to logs/<script>_<timestamp>.log and the console. Called from __main__ only:
+    the workbook reader's worker processes re-import this module and must not
+    create log files of their own.
+    """
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+    log_path = os.path.join(LOGS_DIR, f'{script_name}_{timestamp}.log')
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s',
+        handlers=[
+            logging.FileHandler(log_path),
+            logging.StreamHandler()
+        ]
+    )
+
 # Configuration
 DUCKDB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'database', 'huntington_data_lake.duckdb')
 DATA_INPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_input')
 SHEETS_TO_LOAD = ['FET', 'FRESH']
+MAX_WORKERS = min(4, os.cpu_count() or 1)
 
 # Year-specific configurations
 YEAR_CONFIGS = {
@@ -60,7 +72,7 @@ def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
@@ -98,34 +110,29 @@ def get_all_excel_files():
     logger.info(f"Total Excel files found: {len(excel_files)}")
     return sorted(excel_files)  # Sort for consistent processing order
 
-def detect_header_row(file_path, sheet_name, max_rows=5):
+def detect_header_row(rows, max_rows=5):
     """
     Attempt to detect the header row by looking for 'PIN' or 'DATA DA PUNÇÃO' (normalized)
-    in the first few rows. Returns the 0-indexed row number.
+    in the first few rows (as read by spreadsheet_reader). Returns the 0-indexed row number.
     """
-    try:
-        # Read first few rows without header
-        df_top = pd.read_excel(file_path, sheet_name=sheet_name, nrows=max_rows, header=None, engine='openpyxl')
-        for i, row in df_top.iterrows():
-            # Normalize and check for key columns
-            row_vals = [str(val).upper().strip() for val in row if pd.notna(val)]
-            # Match common clinical columns
-            if any(col in row_vals for col in ['PIN', 'PRONTUARIO', 'DATA DA PUNCAO', 'DATA DA PUNÇÃO', 'DATA DA FET', 'TIPO 1']):
-                return i
-    except Exception as e:
-        logger.warning(f"Header detection failed for {file_path} [{sheet_name}]: {e}")
+    for i, row in enumerate(rows[:max_rows]):
+        # Normalize and check for key columns
+        row_vals = [str(val).upper().strip() for val in row if val is not None]
+        # Match common clinical columns
+        if any(col in row_vals for col in ['PIN', 'PRONTUARIO', 'DATA DA PUNCAO', 'DATA DA PUNÇÃO', 'DATA DA FET', 'TIPO 1']):
+            return i
     return None
 
-def check_sheet_exists(file_path, sheet_name):
-    """Check if the specified sheet exists in the Excel file"""
-    try:
-        xl_file = pd.ExcelFile(file_path, engine='openpyxl')
-        # Case insensitive check
-        sheet_names_lower = [s.lower() for s in xl_file.sheet_names]
-        return sheet_name.lower() in sheet_names_lower
-    except Exception as e:
-        logger.warning(f"Could not check sheets in {os.path.basename(file_path)}: {e}")
-        return False
+def get_read_options(file_path):
+    """spreadsheet_reader.read_workbook options for a file, from its year configuration"""
+    year = os.path.basename(os.path.dirname(file_path))
+    config = YEAR_CONFIGS.get(year, YEAR_CONFIGS['DEFAULT'])
+    return {
+        'sheets': config['sheets'],
+        'header': config['header'],
+        # Header detection for 2021/2022/2023, falling back to the configured row
+        'detect_header': detect_header_row if year in ['2021', '2022', '2023'] else None,
+    }
 
 def generate_table_name(file_path, sheet_name):
     """Generate standardized table name: planilha_{year}_{location}_{sheet}"""
@@ -166,25 +173,8 @@ def create_bronze_table(con, table_name, columns):
     con.execute(f"DROP TABLE IF EXISTS bronze.{table_name}")
     logger.info(f"Dropped existing bronze.{table_name} table")
     
-    # Make column names unique for SQL (handle duplicates within the same file)
-    sql_columns = []
-    used_names = set()  # Track all column names we've used (case-insensitive for DuckDB)
-    
-    for col in columns:
-        original_col = str(col)  # Ensure it's a string
-        counter = 0
-        unique_col = original_col
-        
-        # Keep trying until we find a unique name (case-insensitive check for DuckDB)
-        while unique_col.lower() in [n.lower() for n in used_names]:
-            counter += 1
-            unique_col = f"{original_col}_{counter}"
-        
-        sql_columns.append(f'"{unique_col}" VARCHAR')
-        used_names.add(unique_col)
-        
-        if counter > 0:
-            logger.debug(f"Renamed duplicate column '{original_col}' to '{unique_col}'")
+    # Column names are made unique by the caller (unique_column_names)
+    sql_columns = [f'"{col}" VARCHAR' for col in columns]
     
     # Add metadata columns
     sql_columns.extend([
@@ -203,135 +193,66 @@ def create_bronze_table(con, table_name, columns):
     con.execute(create_table_sql)
     logger.info(f"Table bronze.{table_name} created successfully with {len(columns)} data columns")
 
-def process_excel_file(file_path, con):
-    """Process a single Excel file and load data from all configured sheets"""
+def load_workbook_sheets(file_path, sheets, con):
+    """
+    Load the sheets read from one Excel file into their bronze tables.
+    Returns (rows, tables, failed sheet names).
+    """
     file_name = os.path.basename(file_path)
-    total_loaded = 0
-    
     year = os.path.basename(os.path.dirname(file_path))
-    config = YEAR_CONFIGS.get(year, YEAR_CONFIGS['DEFAULT'])
-    sheets_to_try = config['sheets']
-    header_row = config['header']
+    total_loaded = 0
+    tables = []
+    failed = []
     
-    # Get actual sheet names present in file
-    try:
-        xl_file = pd.ExcelFile(file_path, engine='openpyxl')
-        actual_sheets = xl_file.sheet_names
-        actual_sheets_lower = [s.lower() for s in actual_sheets]
-    except Exception as e:
-        logger.error(f"Could not read excel file {file_name}: {e}")
-        return 0
-
-    # Determine which sheets to process (find actual case-sensitive name)
-    sheets_to_process = []
-    for sheet_pattern in sheets_to_try:
-        try:
-            # Case insensitive match
-            idx = actual_sheets_lower.index(sheet_pattern.lower())
-            actual_name = actual_sheets[idx]
-            if actual_name not in sheets_to_process:
-                sheets_to_process.append(actual_name)
-        except ValueError:
-            continue
-
-    if not sheets_to_process:
+    if not sheets:
+        sheets_to_try = YEAR_CONFIGS.get(year, YEAR_CONFIGS['DEFAULT'])['sheets']
         logger.warning(f"None of the configured sheets {sheets_to_try} found in {file_name}")
-        return 0
+        return 0, tables, failed
 
-    for sheet in sheets_to_process:
+    for sheet in sheets:
         # Generate table name for this sheet
-        table_name = generate_table_name(file_path, sheet)
+        table_name = generate_table_name(file_path, sheet.name)
         
-        # Determine header row - prefer detection for 2021/2022/2023
-        actual_header_row = header_row
         if year in ['2021', '2022', '2023']:
-            detected = detect_header_row(file_path, sheet)
-            if detected is not None:
-                actual_header_row = detected
-                logger.info(f"Detected header for {file_name} [{sheet}] at row {actual_header_row}")
+            if sheet.header_detected:
+                logger.info(f"Detected header for {file_name} [{sheet.name}] at row {sheet.header_row}")
             else:
-                logger.info(f"Could not detect header for {file_name} [{sheet}], using default {actual_header_row}")
+                logger.info(f"Could not detect header for {file_name} [{sheet.name}], using default {sheet.header_row}")
         
-        logger.info(f"Processing file: {file_name} [{sheet}] (Year: {year}, Header Row: {actual_header_row}) -> table: {table_name}")
+        logger.info(f"Processing file: {file_name} [{sheet.name}] (Year: {year}, Header Row: {sheet.header_row}) -> table: {table_name}")
+        logger.info(f"Read {len(sheet)} rows from {file_name} [{sheet.name}]")
+        
+        if len(sheet) == 0:
+            logger.warning(f"No data found in {file_name} [{sheet.name}]")
+            continue
         
         try:
-            logger.info(f"Reading sheet '{sheet}' from {file_name} (header in row {actual_header_row + 1})")
-            
-            # Use optimized reading settings
-            df = pd.read_excel(
-                file_path, 
-                sheet_name=sheet,
-                engine='openpyxl',
-                header=actual_header_row,
-                dtype=str  # Read all as strings to avoid type issues
-            )
-            
-            logger.info(f"Read {len(df)} rows from {file_name} [{sheet}]")
-            
-            if len(df) == 0:
-                logger.warning(f"No data found in {file_name} [{sheet}]")
-                continue
-            
-            # Get original column names (preserve order from sheet)
-            original_columns = df.columns.tolist()
-            
-            # Create bronze table for this file/sheet
-            create_bronze_table(con, table_name, original_columns)
-            
             # Make column names unique for SQL (handle duplicates within this file)
-            used_names = set()
-            column_mapping = {}
-            unique_columns = []
-            
-            for col in original_columns:
-                original_col = str(col)
-                counter = 0
-                unique_col = original_col
-                
-                # Keep trying until we find a unique name (case-insensitive check for DuckDB)
-                while unique_col.lower() in [n.lower() for n in used_names]:
-                    counter += 1
-                    unique_col = f"{original_col}_{counter}"
-                
-                column_mapping[col] = unique_col
-                unique_columns.append(unique_col)
-                used_names.add(unique_col)
-            
-            # Rename columns to unique names for SQL compatibility
-            df = df.rename(columns=column_mapping)
-            
-            # Reorder columns to match unique_columns order
-            df = df[unique_columns]
+            unique_columns = unique_column_names(sheet.columns)
             
-            # Clean data - replace empty strings with None
-            for col in df.columns:
-                df[col] = df[col].replace('', None)
+            # Create bronze table for this file/sheet
+            create_bronze_table(con, table_name, unique_columns)
             
-            # Add metadata columns
             extraction_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            logger.info(f"Inserting {len(sheet)} rows from {file_name} [{sheet.name}] into bronze.{table_name}")
             
-            # Create new DataFrame with all columns to avoid fragmentation
-            new_df = df.copy()
-            new_df['line_number'] = new_df.index  # Add line number based on DataFrame index
-            new_df['extraction_timestamp'] = extraction_timestamp
-            new_df['file_name'] = file_name
-            new_df['sheet_name'] = sheet
-            df = new_df
-            
-            logger.info(f"Inserting {len(df)} rows from {file_name} [{sheet}] into bronze.{table_name}")
-            
-            # Direct DataFrame insertion
-            con.execute(f"INSERT INTO bronze.{table_name} SELECT * FROM df")
+            # Batched DataFrame insertion; line_number is the row position in the sheet data
+            inserted = insert_sheet(
+                con, f"bronze.{table_name}", sheet, columns=unique_columns,
+                metadata={'extraction_timestamp': extraction_timestamp, 'file_name': file_name, 'sheet_name': sheet.name}
+            )
             
-            logger.info(f"Successfully inserted {len(df)} rows")
-            total_loaded += len(df)
+            logger.info(f"Successfully inserted {inserted} rows")
+            total_loaded += inserted
+            tables.append(f"bronze.{table_name}")
             
         except Exception as e:
-            logger.error(f"Error processing {file_name} [{sheet}]: {e}")
+            logger.error(f"Error processing {file_name} [{sheet.name}]: {e}")
+            failed.append(sheet.name)
             # Continue with next sheet
             continue
             
-    return total_loaded
+    return total_loaded, tables, failed
 
 def main():
     """Main function to load all planilha_embriologia Excel files to bronze tables"""
@@ -349,17 +270,38 @@ def main():
         # Get all Excel files from year subfolders
         excel_files = get_all_excel_files()
         
-        # Process each file
+        # Skip files unchanged since their last load (size + mtime, then content hash)
         total_rows = 0
         files_processed = 0
-        
-        # Import regex module since we used it in generate_table_name but forgot to import it at top level if it wasn't there
-        import re 
-        
+        files_skipped = 0
+        jobs = []
+        statuses = {}
         for file_path in excel_files:
+            status = ingestion_registry.check(con, file_path)
+            if status.unchanged:
+                logger.info(f"Skipping unchanged {os.path.basename(file_path)} ({status.reason}; "
+                            f"loaded {status.record['ingested_at']:%Y-%m-%d %H:%M}, {status.record['rows']:,} rows)")
+                files_skipped += 1
+                continue
+            logger.info(f"Loading {os.path.basename(file_path)}: {status.reason}")
+            statuses[file_path] = status
+            jobs.append((file_path, get_read_options(file_path)))
+        
+        # Parse the changed workbooks in parallel; write to DuckDB here as each one finishes
+        logger.info(f"Reading {len(jobs)} Excel file(s) with up to {MAX_WORKERS} worker processes")
+        for file_path, result in read_workbooks(jobs, max_workers=MAX_WORKERS):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to process {os.path.basename(file_path)}: {result}")
+                continue
             try:
-                rows = process_excel_file(file_path, con)
+                rows, tables, failed = load_workbook_sheets(file_path, result, con)
                 total_rows += rows
+                if failed:
+                    # Not recorded: the next run loads the file again, failed sheets included
+                    logger.error(f"Failed to load {os.path.basename(file_path)} sheet(s) {failed}; "
+                                 f"the file will be retried on the next run")
+                    continue
+                ingestion_registry.record(con, statuses[file_path], tables, rows)
                 files_processed += 1
             except Exception as e:
                 logger.error(f"Failed to process {os.path.basename(file_path)}: {e}")
@@ -369,7 +311,7 @@ def main():
         logger.info("=" * 50)
         logger.info("LOADING SUMMARY")
         logger.info("=" * 50)
-        logger.info(f"Files processed: {files_processed}/{len(excel_files)}")
+        logger.info(f"Files processed: {files_processed}/{len(excel_files)} ({files_skipped} unchanged, skipped)")
         logger.info(f"Total rows loaded to bronze: {total_rows:,}")
         logger.info("=" * 50)
         
@@ -382,5 +324,6 @@ def main():
         raise
 
 if __name__ == "__main__":
+    setup_logging()
     main()
 
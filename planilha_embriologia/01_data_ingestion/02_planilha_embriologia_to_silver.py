@@ -23,6 +23,7 @@ _root_dir   = os.path.dirname(os.path.dirname(_script_dir))  # Huntington/
 sys.path.insert(0, _root_dir)
 
 from commons.prontuario_matching_v1 import find_prontuarios
+from commons import duckdb_manager
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -752,7 +753,7 @@ def get_duckdb_connection():
     """Create DuckDB connection"""
     try:
         logger.info(f"Attempting to connect to DuckDB at: {DUCKDB_PATH}")
-        con = duckdb.connect(DUCKDB_PATH)
+        con = duckdb_manager.connect(DUCKDB_PATH)
         logger.info("DuckDB connection successful")
         return con
     except Exception as e:
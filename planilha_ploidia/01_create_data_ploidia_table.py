@@ -16,6 +16,9 @@ import os
 import logging
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commons import duckdb_manager
+
 # Import column mapping configuration
 sys.path.insert(0, os.path.dirname(__file__))
 import importlib.util
@@ -46,7 +49,7 @@ def get_database_connection(read_only=False):
     """Create and return a connection to the huntington_data_lake database and attach clinisys_all"""
     repo_root = os.path.dirname(os.path.dirname(__file__))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db, read_only=read_only)
+    conn = duckdb_manager.connect(path_to_db, read_only=read_only)
     logger.info(f"Connected to database: {path_to_db} (read_only={read_only})")
     
     # Attach clinisys_all database for access to view_tratamentos
@@ -4,15 +4,19 @@ Fill missing values in gold.data_ploidia table
 
 This script fills NULL values in BMI, Diagnosis, and Oocyte Source columns
 by using the most frequent values from silver.view_tratamentos per patient (prontuario).
+Each fill is declared as a FillSpec and applied as one UPDATE ... FROM
+(commons/reference_fill.py) instead of one UPDATE per patient.
 """
 
-import duckdb
-import pandas as pd
 from datetime import datetime
 import os
 import logging
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commons import duckdb_manager
+from commons.reference_fill import FillSpec, fill_missing_from_reference
+
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -36,7 +40,7 @@ def get_database_connection(read_only=False):
     
     # Connect to clinisys_all (has view_tratamentos)
     clinisys_db = os.path.join(repo_root, 'database', 'clinisys_all.duckdb')
-    conn = duckdb.connect(clinisys_db, read_only=True)
+    conn = duckdb_manager.connect(clinisys_db, read_only=True)
     logger.info(f"Connected to clinisys database: {clinisys_db}")
     
     # Attach huntington_data_lake (has gold.data_ploidia)
@@ -98,14 +102,14 @@ def log_all_null_counts(conn, label=""):
         'null_oocyte_source': int(result_df['Oocyte Source'].iloc[0]) if 'Oocyte Source' in result_df else 0
     }
 
-def fill_bmi_values(conn):
-    """Fill NULL BMI values using most frequent weight/height from view_tratamentos per patient"""
-    logger.info("=" * 80)
-    logger.info("FILLING BMI VALUES")
-    logger.info("=" * 80)
-    
-    # Get most frequent weight and height per patient from view_tratamentos
-    query = """
+# Per-patient reference values from view_tratamentos, one row per prontuario
+BMI_FILL = FillSpec(
+    target_column="BMI",
+    key="Patient ID",
+    source_key="prontuario",
+    value_column="calculated_bmi",
+    # Most frequent weight/height pair per patient
+    source_query="""
     WITH patient_bmi AS (
         SELECT 
             prontuario,
@@ -128,33 +132,16 @@ def fill_bmi_values(conn):
         calculated_bmi
     FROM patient_bmi
     WHERE rn = 1
-    """
-    
-    bmi_values = conn.execute(query).df()
-    logger.info(f"Found BMI values for {len(bmi_values)} patients")
-    
-    # Update data_ploidia with BMI values
-    updates = 0
-    for _, row in bmi_values.iterrows():
-        result = conn.execute(f"""
-            UPDATE huntington.gold.data_ploidia
-            SET "BMI" = {row['calculated_bmi']}
-            WHERE "Patient ID" = {row['prontuario']}
-              AND "BMI" IS NULL
-        """)
-        updates += result.fetchone()[0] if result else 0
-    
-    logger.info(f"Updated {updates} rows with BMI values")
-    return updates
+    """,
+)
 
-def fill_diagnosis_values(conn):
-    """Fill NULL Diagnosis values using most frequent diagnosis from view_tratamentos per patient"""
-    logger.info("=" * 80)
-    logger.info("FILLING DIAGNOSIS VALUES")
-    logger.info("=" * 80)
-    
-    # Get most frequent diagnosis per patient
-    query = """
+DIAGNOSIS_FILL = FillSpec(
+    target_column="Diagnosis",
+    key="Patient ID",
+    source_key="prontuario",
+    value_column="diagnosis",
+    # Most frequent diagnosis per patient
+    source_query="""
     WITH patient_diagnosis AS (
         SELECT 
             prontuario,
@@ -173,35 +160,16 @@ def fill_diagnosis_values(conn):
         diagnosis
     FROM patient_diagnosis
     WHERE rn = 1
-    """
-    
-    diagnosis_values = conn.execute(query).df()
-    logger.info(f"Found Diagnosis values for {len(diagnosis_values)} patients")
-    
-    # Update data_ploidia with Diagnosis values
-    updates = 0
-    for _, row in diagnosis_values.iterrows():
-        # Escape single quotes in diagnosis
-        diagnosis_escaped = str(row['diagnosis']).replace("'", "''")
-        result = conn.execute(f"""
-            UPDATE huntington.gold.data_ploidia
-            SET "Diagnosis" = '{diagnosis_escaped}'
-            WHERE "Patient ID" = {row['prontuario']}
-              AND "Diagnosis" IS NULL
-        """)
-        updates += result.fetchone()[0] if result else 0
-    
-    logger.info(f"Updated {updates} rows with Diagnosis values")
-    return updates
+    """,
+)
 
-def fill_oocyte_source_values(conn):
-    """Fill NULL Oocyte Source values using most frequent source from view_tratamentos per patient"""
-    logger.info("=" * 80)
-    logger.info("FILLING OOCYTE SOURCE VALUES")
-    logger.info("=" * 80)
-    
-    # Get most frequent oocyte source per patient
-    query = """
+OOCYTE_SOURCE_FILL = FillSpec(
+    target_column="Oocyte Source",
+    key="Patient ID",
+    source_key="prontuario",
+    value_column="oocyte_source",
+    # Most frequent oocyte source per patient
+    source_query="""
     WITH patient_oocyte_source AS (
         SELECT 
             prontuario,
@@ -220,26 +188,19 @@ def fill_oocyte_source_values(conn):
         oocyte_source
     FROM patient_oocyte_source
     WHERE rn = 1
-    """
-    
-    oocyte_source_values = conn.execute(query).df()
-    logger.info(f"Found Oocyte Source values for {len(oocyte_source_values)} patients")
-    
-    # Update data_ploidia with Oocyte Source values
-    updates = 0
-    for _, row in oocyte_source_values.iterrows():
-        # Escape single quotes in oocyte source
-        source_escaped = str(row['oocyte_source']).replace("'", "''")
-        result = conn.execute(f"""
-            UPDATE huntington.gold.data_ploidia
-            SET "Oocyte Source" = '{source_escaped}'
-            WHERE "Patient ID" = {row['prontuario']}
-              AND "Oocyte Source" IS NULL
-        """)
-        updates += result.fetchone()[0] if result else 0
-    
-    logger.info(f"Updated {updates} rows with Oocyte Source values")
-    return updates
+    """,
+)
+
+# Oocyte Source is handled in the creation script (01_create_data_ploidia_table.py)
+FILLS = [BMI_FILL, DIAGNOSIS_FILL]
+
+
+def fill_values(conn, spec):
+    """Fill NULL values of one column in gold.data_ploidia with a single UPDATE ... FROM"""
+    logger.info("=" * 80)
+    logger.info(f"FILLING {spec.label.upper()} VALUES")
+    logger.info("=" * 80)
+    return fill_missing_from_reference(conn, "huntington.gold.data_ploidia", spec)
 
 def main():
     """Main function"""
@@ -257,27 +218,14 @@ def main():
         before_counts = log_all_null_counts(conn, "(BEFORE FILLING)")
         
         # Fill missing values
-        bmi_updates = 0
-        try:
-            bmi_updates = fill_bmi_values(conn)
-        except Exception as e:
-            logger.error(f"Error filling BMI values: {e}")
-            logger.error("Continuing with other updates...")
-
-        diagnosis_updates = 0
-        try:
-            diagnosis_updates = fill_diagnosis_values(conn)
-        except Exception as e:
-            logger.error(f"Error filling Diagnosis values: {e}")
-            logger.error("Continuing with other updates...")
-
-        # oocyte_source_updates = 0
-        # try:
-        #     oocyte_source_updates = fill_oocyte_source_values(conn)
-        # except Exception as e:
-        #     logger.error(f"Error filling Oocyte Source values: {e}")
-        #     logger.error("Continuing with other updates...")
-        oocyte_source_updates = 0 # Handled in creation script
+        updates = {}
+        for spec in FILLS:
+            updates[spec.target_column] = 0
+            try:
+                updates[spec.target_column] = fill_values(conn, spec)
+            except Exception as e:
+                logger.error(f"Error filling {spec.label} values: {e}")
+                logger.error("Continuing with other updates...")
         
         # Get NULL counts after filling
         after_counts = log_all_null_counts(conn, "(AFTER FILLING)")
@@ -286,9 +234,9 @@ def main():
         logger.info("=" * 80)
         logger.info("SUMMARY")
         logger.info("=" * 80)
-        logger.info(f"BMI: Filled {bmi_updates:,} rows ({before_counts['null_bmi'] - after_counts['null_bmi']:,} NULLs removed)")
-        logger.info(f"Diagnosis: Filled {diagnosis_updates:,} rows ({before_counts['null_diagnosis'] - after_counts['null_diagnosis']:,} NULLs removed)")
-        logger.info(f"Oocyte Source: Filled {oocyte_source_updates:,} rows ({before_counts['null_oocyte_source'] - after_counts['null_oocyte_source']:,} NULLs removed)")
+        logger.info(f"BMI: Filled {updates.get('BMI', 0):,} rows ({before_counts['null_bmi'] - after_counts['null_bmi']:,} NULLs removed)")
+        logger.info(f"Diagnosis: Filled {updates.get('Diagnosis', 0):,} rows ({before_counts['null_diagnosis'] - after_counts['null_diagnosis']:,} NULLs removed)")
+        logger.info(f"Oocyte Source: Filled {updates.get('Oocyte Source', 0):,} rows ({before_counts['null_oocyte_source'] - after_counts['null_oocyte_source']:,} NULLs removed)")
         logger.info("")
         logger.info("=" * 80)
         logger.info("COMPLETED SUCCESSFULLY")
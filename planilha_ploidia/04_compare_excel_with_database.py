@@ -16,6 +16,11 @@ from datetime import datetime
 import os
 import logging
 import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from commons import duckdb_manager
+from commons.excel_export import export_dataframe_to_excel
 
 # Setup logging
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -47,7 +52,7 @@ def get_database_connection(read_only=True):
     """Create and return a connection to the huntington_data_lake database"""
     repo_root = os.path.dirname(os.path.dirname(__file__))
     path_to_db = os.path.join(repo_root, 'database', 'huntington_data_lake.duckdb')
-    conn = db.connect(path_to_db, read_only=read_only)
+    conn = duckdb_manager.connect(path_to_db, read_only=read_only)
     logger.info(f"Connected to database: {path_to_db} (read_only={read_only})")
     return conn
 
@@ -494,7 +499,7 @@ def export_filtered_data(df_database):
     logger.info("=" * 80)
     
     export_path = os.path.join(DATA_EXPORT_DIR, f'filtered_data_ploidia_{timestamp}.xlsx')
-    df_database.to_excel(export_path, index=False, sheet_name='Filtered Data')
+    export_dataframe_to_excel(df_database, export_path, sheet_name='Filtered Data', log=logger.info)
     logger.info(f"Exported {len(df_database)} rows to: {export_path}")
     
     return export_path
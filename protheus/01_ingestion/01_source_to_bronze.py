@@ -2,22 +2,34 @@
 """
 Protheus API to DuckDB Bronze Ingestion Script
 Extracts data from 5 endpoints, flattens Notas, maps all columns to VARCHAR,
-and performs hash-based incremental appends to the database.
+and performs hash-based incremental appends to the database (row hashes are
+computed and probed in DuckDB, see commons/bronze_dedup.py).
 Handles multi-tenant ingestion for Notas and optimized page sizes.
+
+The multi-tenant endpoints (notas, pedidos, pedidos_venda) are fetched
+concurrently: one task per (endpoint, tenant, date chunk), up to --max-workers
+at a time, under a global request rate (--requests-per-second). Only the main
+thread writes to DuckDB, and each written chunk is checkpointed in
+main._protheus_chunk_checkpoints, so an interrupted --force-backfill resumes
+from the chunks it had not completed (--restart-backfill starts over).
 """
 
 import os
+import sys
 import yaml
 import logging
-import requests
-import hashlib
 import pandas as pd
 import duckdb
 import time
 import random
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from requests.auth import HTTPBasicAuth
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import bronze_dedup, http_transport
+
 # Setup logging standard
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOGS_DIR = os.path.join(SCRIPT_DIR, 'logs')
@@ -46,10 +58,14 @@ API_CONF = config['api']
 AUTH = HTTPBasicAuth(API_CONF['username'], API_CONF['password'])
 BASE_URL = API_CONF['base_url']
 BACKFILL_START = API_CONF.get('backfill_start_date', '20220101')
+MAX_WORKERS = API_CONF.get('max_workers', 4)
+REQUESTS_PER_SECOND = API_CONF.get('requests_per_second', 4.0)
 
-# Initialize persistent HTTP session with connection pooling and auth pre-configured
-session = requests.Session()
-session.auth = AUTH
+# Read timeout is long for the offset pagination queries
+REQUEST_TIMEOUT = (10, 90)
+
+# Persistent HTTP session with keep-alive pooling (one connection per fetch thread) and auth pre-configured
+session = http_transport.create_session(pool_size=MAX_WORKERS, timeout=REQUEST_TIMEOUT, auth=AUTH)
 
 # Primary keys for each table to help identify deleted records from the source
 TABLE_PKS = {
@@ -80,7 +96,7 @@ def get_existing_pks(table_name, company_id=None, filial=None, start_date=None,
         return set()
         
     try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+        with duckdb.connect(DUCKDB_PATH) as con:
             # Check if table exists
             exists = con.execute(f"""
                 SELECT COUNT(*) FROM information_schema.tables 
@@ -191,6 +207,8 @@ ACCESSIBLE_TENANTS = [
     "07,030101", # FIV Brasilia
 ]
 
+rate_limiter = http_transport.RateLimiter(REQUESTS_PER_SECOND)
+
 def make_request(path, params=None, tenant_id=None):
     url = f"{BASE_URL}{path}"
     headers = {
@@ -200,11 +218,11 @@ def make_request(path, params=None, tenant_id=None):
         headers["TenantId"] = tenant_id
         
     max_attempts = 5
-    timeout = 90  # Increased timeout for offset pagination queries
     
     for attempt in range(1, max_attempts + 1):
+        rate_limiter.wait()
         try:
-            r = session.get(url, params=params, headers=headers, timeout=timeout)
+            r = session.get(url, params=params, headers=headers)
             if r.status_code == 200:
                 r.encoding = 'utf-8'
                 return r.json()
@@ -220,37 +238,17 @@ def make_request(path, params=None, tenant_id=None):
             # Exponential backoff: base_delay * (2 ** (attempt - 1)) + jitter
             sleep_time = 4 * (2 ** (attempt - 1)) + random.uniform(0, 2)
             logger.info(f"Sleeping for {sleep_time:.2f} seconds before retry...")
+            # The other fetch threads back off too while the API recovers
+            rate_limiter.defer(sleep_time)
             time.sleep(sleep_time)
             
     raise RuntimeError(f"Failed to fetch {path} (Tenant: {headers.get('TenantId', 'None')}) after {max_attempts} attempts.")
 
-def compute_row_hash(row_dict):
-    # Exclude metadata keys from hash computation
-    clean_dict = {k: v for k, v in row_dict.items() if k not in ['hash', 'extraction_timestamp']}
-    # Normalize values to string, handling None
-    row_str = "|".join(f"{k}:{str(v).strip() if v is not None else ''}" for k, v in sorted(clean_dict.items()))
-    return hashlib.md5(row_str.encode('utf-8')).hexdigest()
-
-def get_existing_hashes(table_name):
-    try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
-            # Check if table exists
-            exists = con.execute(f"""
-                SELECT COUNT(*) FROM information_schema.tables 
-                WHERE table_schema = 'bronze' AND table_name = '{table_name}'
-            """).fetchone()[0]
-            if exists:
-                hashes = con.execute(f"SELECT hash FROM bronze.{table_name}").fetchall()
-                return {h[0] for h in hashes if h[0]}
-            return set()
-    except Exception as e:
-        logger.warning(f"Could not fetch existing hashes for bronze.{table_name}: {e}")
-        return set()
-
 def write_to_bronze(table_name, rows):
+    """Appends the rows bronze does not hold yet (by row hash); returns how many were written."""
     if not rows:
         logger.info(f"No new rows to write to bronze.{table_name}")
-        return
+        return 0
         
     df = pd.DataFrame(rows)
     
@@ -289,38 +287,10 @@ def write_to_bronze(table_name, rows):
         
     try:
         with duckdb.connect(DUCKDB_PATH) as con:
-            # Check if table exists
-            exists = con.execute(f"""
-                SELECT COUNT(*) FROM information_schema.tables 
-                WHERE table_schema = 'bronze' AND table_name = '{table_name}'
-            """).fetchone()[0]
-            
-            con.register('df_temp', df)
-            try:
-                if not exists:
-                    logger.info(f"Creating table bronze.{table_name} with VARCHAR columns and inserting {unique_parents} unique {parent_label} ({len(df)} flat rows)")
-                    cols_def = ", ".join(f'"{c}" VARCHAR' for c in df.columns)
-                    con.execute(f"CREATE TABLE bronze.{table_name} ({cols_def})")
-                    cols_str = ", ".join(f'"{c}"' for c in df.columns)
-                    con.execute(f"INSERT INTO bronze.{table_name} ({cols_str}) SELECT {cols_str} FROM df_temp")
-                else:
-                    # Check and handle schema evolution
-                    existing_cols = {row[0] for row in con.execute(f"DESCRIBE bronze.{table_name}").fetchall()}
-                    new_cols = set(df.columns) - existing_cols
-                    for col in new_cols:
-                        logger.info(f"Schema evolution: Adding column '{col}' to bronze.{table_name}")
-                        con.execute(f"ALTER TABLE bronze.{table_name} ADD COLUMN \"{col}\" VARCHAR")
-                        
-                    # Select and insert aligned columns
-                    cols_str = ", ".join(f'"{c}"' for c in df.columns)
-                    logger.info(f"Inserting {unique_parents} unique {parent_label} ({len(df)} flat rows) to bronze.{table_name}")
-                    con.execute(f"INSERT INTO bronze.{table_name} ({cols_str}) SELECT {cols_str} FROM df_temp")
-            finally:
-                try:
-                    con.unregister('df_temp')
-                except Exception:
-                    pass
-            logger.info(f"Successfully wrote {unique_parents} unique {parent_label} to bronze.{table_name}")
+            inserted = bronze_dedup.append_new_rows(con, f"bronze.{table_name}", df)
+        logger.info(f"Wrote {inserted} new rows to bronze.{table_name} "
+                    f"({len(df)} flat rows fetched, {unique_parents} unique {parent_label})")
+        return inserted
     except Exception as bulk_err:
         logger.error(f"Bulk insert failed for bronze.{table_name}: {bulk_err}")
         raise bulk_err
@@ -338,208 +308,34 @@ def generate_date_chunks(start_dt, end_dt, force_backfill):
         current_start = current_end + timedelta(days=1)
     return chunks
 
-def fetch_invoice_range(tenant_id, company_id, start_date_str, end_date_str, existing_hashes):
-    new_rows = []
-    invoices_read = 0
-    flat_rows_read = 0
-    seen_hashes = set()
-    page = 1
-    page_size = 500
-    api_total = 0
-    
-    # Retrieve existing PKs for auditing deletions
-    filial = tenant_id.split(',')[1] if tenant_id and ',' in tenant_id else None
-    existing_pks = get_existing_pks("notas", company_id, filial, start_date_str, end_date_str)
-    fetched_pks = set()
-    
-    while True:
-        params = {
-            "dataIni": start_date_str,
-            "dataFim": end_date_str,
-            "nPage": page,
-            "nPageSize": page_size
-        }
-        res = make_request("/rest/CONSNOTA/notas", params=params, tenant_id=tenant_id)
-        if not res or "data" not in res or not res["data"]:
-            break
-            
-        if page == 1:
-            api_total = res.get("total", 0)
-            
-        extraction_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        invoices_read += len(res["data"])
-        for invoice in res["data"]:
-            items = invoice.get("ITENS", [])
-            header = {k: v for k, v in invoice.items() if k != "ITENS"}
-            
-            if not items:
-                flat_rows_read += 1
-                flat_row = header.copy()
-                flat_row["company_id"] = company_id
-                flat_row["extraction_timestamp"] = extraction_ts
-                flat_row["is_deleted"] = "FALSE"
-                flat_row["hash"] = compute_row_hash(flat_row)
-                
-                pk_val = (
-                    str(flat_row.get("F2_FILIAL", '')).strip(),
-                    str(flat_row.get("F2_DOC", '')).strip(),
-                    str(flat_row.get("F2_SERIE", '')).strip(),
-                    str(flat_row.get("D2_ITEM", '')).strip()
-                )
-                fetched_pks.add(pk_val)
-                
-                if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                    new_rows.append(flat_row)
-                    seen_hashes.add(flat_row["hash"])
-            else:
-                flat_rows_read += len(items)
-                for item in items:
-                    flat_row = header.copy()
-                    flat_row.update(item)
-                    flat_row["company_id"] = company_id
-                    flat_row["extraction_timestamp"] = extraction_ts
-                    flat_row["is_deleted"] = "FALSE"
-                    flat_row["hash"] = compute_row_hash(flat_row)
-                    
-                    pk_val = (
-                        str(flat_row.get("F2_FILIAL", '')).strip(),
-                        str(flat_row.get("F2_DOC", '')).strip(),
-                        str(flat_row.get("F2_SERIE", '')).strip(),
-                        str(flat_row.get("D2_ITEM", '')).strip()
-                    )
-                    fetched_pks.add(pk_val)
-                    
-                    if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                        new_rows.append(flat_row)
-                        seen_hashes.add(flat_row["hash"])
-                        
-        if not res.get("hasNext", False):
-            break
-        page += 1
-        
-    logger.info(f"Notas Auditing for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, Fetched parent records={invoices_read}")
-    if api_total != invoices_read:
-        logger.warning(f"Notas count mismatch for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, fetched={invoices_read}")
-        
-    if existing_pks:
-        deleted_pks = existing_pks - fetched_pks
-        if deleted_pks:
-            logger.warning(f"Auditing 'notas' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): "
-                           f"{len(deleted_pks)} entries might have been deleted from the source. "
-                           f"Examples: {list(deleted_pks)[:5]}")
-            flag_deleted_in_bronze("notas", company_id, deleted_pks)
-        else:
-            logger.info(f"Auditing 'notas' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): 0 entries deleted.")
-            
-    return new_rows, invoices_read, flat_rows_read
+# Multi-tenant endpoints filtered by emission date: table -> (path, label, parent label)
+INCREMENTAL_ENDPOINTS = {
+    "notas": ("/rest/CONSNOTA/notas", "Notas", "invoices"),
+    "pedidos": ("/rest/CONSPED/pedidos", "Pedidos", "orders"),
+    "pedidos_venda": ("/rest/CONSPEVD/pedidos", "Pedidos Venda", "direct sales"),
+}
 
-def fetch_sales_orders_range(tenant_id, company_id, start_date_str, end_date_str, existing_hashes):
-    new_rows = []
-    orders_read = 0
-    flat_rows_read = 0
-    seen_hashes = set()
-    page = 1
-    page_size = 500
-    api_total = 0
-    
-    # Retrieve existing PKs for auditing deletions
-    filial = tenant_id.split(',')[1] if tenant_id and ',' in tenant_id else None
-    existing_pks = get_existing_pks("pedidos", company_id, filial, start_date_str, end_date_str)
-    fetched_pks = set()
-    
-    while True:
-        params = {
-            "dataIni": start_date_str,
-            "dataFim": end_date_str,
-            "nPage": page,
-            "nPageSize": page_size
-        }
-        res = make_request("/rest/CONSPED/pedidos", params=params, tenant_id=tenant_id)
-        if not res or "data" not in res or not res["data"]:
-            break
-            
-        if page == 1:
-            api_total = res.get("total", 0)
-            
-        extraction_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        orders_read += len(res["data"])
-        for order in res["data"]:
-            items = order.get("ITENS", [])
-            header = {k: v for k, v in order.items() if k != "ITENS"}
-            
-            if not items:
-                flat_rows_read += 1
-                flat_row = header.copy()
-                flat_row["company_id"] = company_id
-                flat_row["extraction_timestamp"] = extraction_ts
-                flat_row["is_deleted"] = "FALSE"
-                flat_row["hash"] = compute_row_hash(flat_row)
-                
-                pk_val = (
-                    str(flat_row.get("C5_FILIAL", '')).strip(),
-                    str(flat_row.get("C5_NUM", '')).strip(),
-                    str(flat_row.get("C6_ITEM", '')).strip()
-                )
-                fetched_pks.add(pk_val)
-                
-                if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                    new_rows.append(flat_row)
-                    seen_hashes.add(flat_row["hash"])
-            else:
-                flat_rows_read += len(items)
-                for item in items:
-                    flat_row = header.copy()
-                    flat_row.update(item)
-                    flat_row["company_id"] = company_id
-                    flat_row["extraction_timestamp"] = extraction_ts
-                    flat_row["is_deleted"] = "FALSE"
-                    flat_row["hash"] = compute_row_hash(flat_row)
-                    
-                    pk_val = (
-                        str(flat_row.get("C5_FILIAL", '')).strip(),
-                        str(flat_row.get("C5_NUM", '')).strip(),
-                        str(flat_row.get("C6_ITEM", '')).strip()
-                    )
-                    fetched_pks.add(pk_val)
-                    
-                    if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                        new_rows.append(flat_row)
-                        seen_hashes.add(flat_row["hash"])
-                        
-        if not res.get("hasNext", False):
-            break
-        page += 1
-        
-    logger.info(f"Pedidos Auditing for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, Fetched parent records={orders_read}")
-    if api_total != orders_read:
-        logger.warning(f"Pedidos count mismatch for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, fetched={orders_read}")
-        
-    if existing_pks:
-        deleted_pks = existing_pks - fetched_pks
-        if deleted_pks:
-            logger.warning(f"Auditing 'pedidos' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): "
-                           f"{len(deleted_pks)} entries might have been deleted from the source. "
-                           f"Examples: {list(deleted_pks)[:5]}")
-            flag_deleted_in_bronze("pedidos", company_id, deleted_pks)
-        else:
-            logger.info(f"Auditing 'pedidos' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): 0 entries deleted.")
-            
-    return new_rows, orders_read, flat_rows_read
+# Progress of the incremental endpoints, kept in the bronze database
+RUNS_TABLE = "main._protheus_ingestion_runs"
+CHECKPOINTS_TABLE = "main._protheus_chunk_checkpoints"
 
-def fetch_direct_sales_range(tenant_id, company_id, start_date_str, end_date_str, existing_hashes):
-    new_rows = []
-    sales_read = 0
+def fetch_chunk(table_name, tenant_id, start_date_str, end_date_str):
+    """
+    Fetches every page of one (endpoint, tenant, date chunk) and flattens the ITENS
+    of each parent record. Runs in a fetch thread: it does not touch DuckDB.
+    Returns (rows, fetched_pks, api_total, parents_read, flat_rows_read).
+    """
+    path, label, _ = INCREMENTAL_ENDPOINTS[table_name]
+    pks = TABLE_PKS[table_name]
+    company_id = tenant_id.split(',')[0]
+    rows = []
+    parents_read = 0
     flat_rows_read = 0
-    seen_hashes = set()
+    fetched_pks = set()
     page = 1
     page_size = 500
     api_total = 0
-    
-    # Retrieve existing PKs for auditing deletions
-    filial = tenant_id.split(',')[1] if tenant_id and ',' in tenant_id else None
-    existing_pks = get_existing_pks("pedidos_venda", company_id, filial, start_date_str, end_date_str)
-    fetched_pks = set()
-    
+
     while True:
         params = {
             "dataIni": start_date_str,
@@ -547,239 +343,221 @@ def fetch_direct_sales_range(tenant_id, company_id, start_date_str, end_date_str
             "nPage": page,
             "nPageSize": page_size
         }
-        res = make_request("/rest/CONSPEVD/pedidos", params=params, tenant_id=tenant_id)
+        res = make_request(path, params=params, tenant_id=tenant_id)
         if not res or "data" not in res or not res["data"]:
             break
-            
+
         if page == 1:
             api_total = res.get("total", 0)
-            
+
         extraction_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sales_read += len(res["data"])
-        for sale in res["data"]:
-            items = sale.get("ITENS", [])
-            header = {k: v for k, v in sale.items() if k != "ITENS"}
-            
-            if not items:
-                flat_rows_read += 1
+        parents_read += len(res["data"])
+        for record in res["data"]:
+            items = record.get("ITENS", [])
+            header = {k: v for k, v in record.items() if k != "ITENS"}
+            flat_rows_read += len(items) or 1
+
+            for item in items or [{}]:
                 flat_row = header.copy()
+                flat_row.update(item)
                 flat_row["company_id"] = company_id
                 flat_row["extraction_timestamp"] = extraction_ts
                 flat_row["is_deleted"] = "FALSE"
-                flat_row["hash"] = compute_row_hash(flat_row)
-                
-                pk_val = (
-                    str(flat_row.get("L1_FILIAL", '')).strip(),
-                    str(flat_row.get("L1_NUM", '')).strip(),
-                    str(flat_row.get("L2_ITEM", '')).strip()
-                )
-                fetched_pks.add(pk_val)
-                
-                if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                    new_rows.append(flat_row)
-                    seen_hashes.add(flat_row["hash"])
-            else:
-                flat_rows_read += len(items)
-                for item in items:
-                    flat_row = header.copy()
-                    flat_row.update(item)
-                    flat_row["company_id"] = company_id
-                    flat_row["extraction_timestamp"] = extraction_ts
-                    flat_row["is_deleted"] = "FALSE"
-                    flat_row["hash"] = compute_row_hash(flat_row)
-                    
-                    pk_val = (
-                        str(flat_row.get("L1_FILIAL", '')).strip(),
-                        str(flat_row.get("L1_NUM", '')).strip(),
-                        str(flat_row.get("L2_ITEM", '')).strip()
-                    )
-                    fetched_pks.add(pk_val)
-                    
-                    if flat_row["hash"] not in existing_hashes and flat_row["hash"] not in seen_hashes:
-                        new_rows.append(flat_row)
-                        seen_hashes.add(flat_row["hash"])
-                        
+
+                fetched_pks.add(tuple(str(flat_row.get(p, '')).strip() for p in pks))
+                rows.append(flat_row)
+
         if not res.get("hasNext", False):
             break
         page += 1
-        
-    logger.info(f"Pedidos Venda Auditing for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, Fetched parent records={sales_read}")
-    if api_total != sales_read:
-        logger.warning(f"Pedidos Venda count mismatch for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, fetched={sales_read}")
-        
+
+    logger.info(f"{label} Auditing for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, Fetched parent records={parents_read}")
+    if api_total != parents_read:
+        logger.warning(f"{label} count mismatch for {start_date_str}-{end_date_str} (Tenant: {tenant_id}): API total={api_total}, fetched={parents_read}")
+
+    return rows, fetched_pks, api_total, parents_read, flat_rows_read
+
+def tenant_has_records(table_name, tenant_id, end_date_str):
+    """Quick check (one record over the whole backfill range) before walking a tenant's chunks."""
+    path = INCREMENTAL_ENDPOINTS[table_name][0]
+    check_params = {
+        "dataIni": BACKFILL_START,
+        "dataFim": end_date_str,
+        "nPage": 1,
+        "nPageSize": 1
+    }
+    check_res = make_request(path, params=check_params, tenant_id=tenant_id)
+    return bool(check_res and "data" in check_res and check_res["data"])
+
+def start_ingestion_run(mode, restart=False):
+    """
+    Opens a run in RUNS_TABLE and returns (run_id, completed chunks).
+    A backfill resumes the latest unfinished backfill run: its completed
+    (table, tenant, start, end) chunks are returned so they are not fetched again.
+    """
+    with duckdb.connect(DUCKDB_PATH) as con:
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                run_id VARCHAR PRIMARY KEY,
+                mode VARCHAR,
+                status VARCHAR,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                run_id VARCHAR,
+                table_name VARCHAR,
+                tenant_id VARCHAR,
+                chunk_start VARCHAR,
+                chunk_end VARCHAR,
+                parents_read BIGINT,
+                flat_rows_read BIGINT,
+                rows_written BIGINT,
+                completed_at TIMESTAMP
+            )
+        """)
+
+        if mode == "backfill":
+            unfinished = con.execute(f"""
+                SELECT run_id FROM {RUNS_TABLE}
+                WHERE mode = 'backfill' AND status = 'running'
+                ORDER BY started_at DESC
+            """).fetchall()
+            if unfinished and restart:
+                logger.info(f"Abandoning unfinished backfill run(s) {[r[0] for r in unfinished]} (--restart-backfill)")
+                con.execute(f"UPDATE {RUNS_TABLE} SET status = 'abandoned' WHERE mode = 'backfill' AND status = 'running'")
+            elif unfinished:
+                run_id = unfinished[0][0]
+                completed = {tuple(r) for r in con.execute(f"""
+                    SELECT table_name, tenant_id, chunk_start, chunk_end
+                    FROM {CHECKPOINTS_TABLE} WHERE run_id = ?
+                """, [run_id]).fetchall()}
+                logger.info(f"Resuming backfill run {run_id}: {len(completed)} chunks already completed")
+                return run_id, completed
+
+        run_id = f"{mode}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        con.execute(f"INSERT INTO {RUNS_TABLE} VALUES (?, ?, 'running', current_localtimestamp(), NULL)", [run_id, mode])
+    return run_id, set()
+
+def record_chunk(run_id, table_name, tenant_id, start_date_str, end_date_str, parents_read, flat_rows_read, rows_written):
+    with duckdb.connect(DUCKDB_PATH) as con:
+        con.execute(f"INSERT INTO {CHECKPOINTS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, current_localtimestamp())",
+                    [run_id, table_name, tenant_id, start_date_str, end_date_str, parents_read, flat_rows_read, rows_written])
+
+def finish_ingestion_run(run_id):
+    with duckdb.connect(DUCKDB_PATH) as con:
+        con.execute(f"UPDATE {RUNS_TABLE} SET status = 'finished', finished_at = current_localtimestamp() WHERE run_id = ?", [run_id])
+
+def write_chunk(run_id, table_name, tenant_id, start_date_str, end_date_str, result):
+    """
+    Writer side of a fetched chunk (main thread only): flags deleted PKs, appends
+    the new rows to bronze and checkpoints the chunk.
+    """
+    _, label, parent_label = INCREMENTAL_ENDPOINTS[table_name]
+    rows, fetched_pks, _, parents_read, flat_rows_read = result
+    company_id = tenant_id.split(',')[0]
+    filial = tenant_id.split(',')[1] if ',' in tenant_id else None
+
+    # Audit deletions against what bronze holds for this tenant and range
+    existing_pks = get_existing_pks(table_name, company_id, filial, start_date_str, end_date_str)
     if existing_pks:
         deleted_pks = existing_pks - fetched_pks
         if deleted_pks:
-            logger.warning(f"Auditing 'pedidos_venda' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): "
+            logger.warning(f"Auditing '{table_name}' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): "
                            f"{len(deleted_pks)} entries might have been deleted from the source. "
                            f"Examples: {list(deleted_pks)[:5]}")
-            flag_deleted_in_bronze("pedidos_venda", company_id, deleted_pks)
+            flag_deleted_in_bronze(table_name, company_id, deleted_pks)
         else:
-            logger.info(f"Auditing 'pedidos_venda' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): 0 entries deleted.")
-            
-    return new_rows, sales_read, flat_rows_read
+            logger.info(f"Auditing '{table_name}' (Tenant: {tenant_id}, range: {start_date_str}-{end_date_str}): 0 entries deleted.")
 
-def ingest_notas(force_backfill=False):
-    table_name = "notas"
-    logger.info("Starting ingestion of 'notas' (invoices)...")
-    
-    today = datetime.now()
-    if force_backfill:
-        start_dt = datetime.strptime(BACKFILL_START, "%Y%m%d")
-        logger.info(f"Force backfill enabled for Notas. Bypassing incremental check.")
-    else:
-        start_dt = today - timedelta(days=60)
-    end_dt = today
-    
-    # Cache existing hashes to avoid duplicates
-    existing_hashes = get_existing_hashes(table_name)
-    
-    # Loop through each tenant sequentially
-    for tenant_id in ACCESSIBLE_TENANTS:
-        try:
-            logger.info(f"=== Ingesting Notas for Tenant: {tenant_id} ===")
-            company_id = tenant_id.split(',')[0]
-            
-            # 1. Quick check if tenant has any invoices at all
-            check_params = {
-                "dataIni": BACKFILL_START,
-                "dataFim": today.strftime("%Y%m%d"),
-                "nPage": 1,
-                "nPageSize": 1
-            }
-            check_res = make_request("/rest/CONSNOTA/notas", params=check_params, tenant_id=tenant_id)
-            if not check_res or "data" not in check_res or not check_res["data"]:
-                logger.info(f"Tenant {tenant_id} has no invoices in the backfill range. Skipping.")
-                continue
-                
-            logger.info(f"Ingestion range for Tenant {tenant_id}: {start_dt.strftime('%Y%m%d')} to {end_dt.strftime('%Y%m%d')}")
-            
-            # Generate chunks
-            chunks = generate_date_chunks(start_dt, end_dt, force_backfill)
-            
-            for current_start, current_end in chunks:
-                data_ini_str = current_start.strftime("%Y%m%d")
-                data_fim_str = current_end.strftime("%Y%m%d")
-                
-                logger.info(f"Processing chunk {data_ini_str}-{data_fim_str} for Tenant {tenant_id}...")
-                new_rows, invoices_read, flat_rows_read = fetch_invoice_range(
-                    tenant_id, company_id, data_ini_str, data_fim_str, existing_hashes
-                )
-                
-                logger.info(f"Chunk {data_ini_str}-{data_fim_str} complete. Invoices read: {invoices_read}, Flat rows read: {flat_rows_read}. Unique new written: {len(new_rows)}")
-                
-                if new_rows:
-                    for r in new_rows:
-                        existing_hashes.add(r["hash"])
-                    write_to_bronze(table_name, new_rows)
-        except Exception as e:
-            logger.error(f"Error ingesting Notas for Tenant {tenant_id}: {e}")
+    written = write_to_bronze(table_name, rows)
+    logger.info(f"{label} chunk {start_date_str}-{end_date_str} (Tenant: {tenant_id}) complete. "
+                f"{parent_label.capitalize()} read: {parents_read}, Flat rows read: {flat_rows_read}. Unique new written: {written}")
 
-def ingest_pedidos(force_backfill=False):
-    table_name = "pedidos"
-    logger.info("Starting ingestion of 'pedidos' (Sales Orders)...")
-    
-    today = datetime.now()
-    if force_backfill:
-        start_dt = datetime.strptime(BACKFILL_START, "%Y%m%d")
-        logger.info(f"Force backfill enabled for Pedidos. Bypassing incremental check.")
-    else:
-        start_dt = today - timedelta(days=60)
-    end_dt = today
-    
-    existing_hashes = get_existing_hashes(table_name)
-    
-    for tenant_id in ACCESSIBLE_TENANTS:
-        try:
-            logger.info(f"=== Ingesting Pedidos for Tenant: {tenant_id} ===")
-            company_id = tenant_id.split(',')[0]
-            
-            # Quick check if tenant has any orders
-            check_params = {
-                "dataIni": BACKFILL_START,
-                "dataFim": today.strftime("%Y%m%d"),
-                "nPage": 1,
-                "nPageSize": 1
-            }
-            check_res = make_request("/rest/CONSPED/pedidos", params=check_params, tenant_id=tenant_id)
-            if not check_res or "data" not in check_res or not check_res["data"]:
-                logger.info(f"Tenant {tenant_id} has no orders in the backfill range. Skipping.")
-                continue
-                
-            logger.info(f"Ingestion range for Tenant {tenant_id}: {start_dt.strftime('%Y%m%d')} to {end_dt.strftime('%Y%m%d')}")
-            
-            chunks = generate_date_chunks(start_dt, end_dt, force_backfill)
-            
-            for current_start, current_end in chunks:
-                data_ini_str = current_start.strftime("%Y%m%d")
-                data_fim_str = current_end.strftime("%Y%m%d")
-                
-                logger.info(f"Processing chunk {data_ini_str}-{data_fim_str} for Tenant {tenant_id}...")
-                new_rows, orders_read, flat_rows_read = fetch_sales_orders_range(
-                    tenant_id, company_id, data_ini_str, data_fim_str, existing_hashes
-                )
-                
-                logger.info(f"Chunk {data_ini_str}-{data_fim_str} complete. Orders read: {orders_read}, Flat rows read: {flat_rows_read}. Unique new written: {len(new_rows)}")
-                
-                if new_rows:
-                    for r in new_rows:
-                        existing_hashes.add(r["hash"])
-                    write_to_bronze(table_name, new_rows)
-        except Exception as e:
-            logger.error(f"Error ingesting Pedidos for Tenant {tenant_id}: {e}")
+    record_chunk(run_id, table_name, tenant_id, start_date_str, end_date_str, parents_read, flat_rows_read, written)
+    return written
 
-def ingest_pedidos_venda(force_backfill=False):
-    table_name = "pedidos_venda"
-    logger.info("Starting ingestion of 'pedidos_venda' (Direct Sales)...")
-    
+def ingest_incremental_tables(table_names=tuple(INCREMENTAL_ENDPOINTS), force_backfill=False, max_workers=4, restart_backfill=False):
+    """
+    Ingests the multi-tenant endpoints (notas, pedidos, pedidos_venda).
+
+    Every (endpoint, tenant) is first checked for records, then each of its
+    date chunks is fetched as a separate task. Up to max_workers tasks run at
+    once across all endpoints and tenants; requests share the global rate
+    limiter and make_request's retry policy. Fetch threads only talk to the
+    API: this thread is the single DuckDB writer and checkpoints each chunk
+    once it is written, so an interrupted backfill resumes from the chunks it
+    had not completed.
+    """
+    mode = "backfill" if force_backfill else "incremental"
     today = datetime.now()
     if force_backfill:
         start_dt = datetime.strptime(BACKFILL_START, "%Y%m%d")
-        logger.info(f"Force backfill enabled for Pedidos Venda. Bypassing incremental check.")
+        logger.info("Force backfill enabled for the incremental endpoints. Bypassing incremental check.")
     else:
         start_dt = today - timedelta(days=60)
     end_dt = today
-    
-    existing_hashes = get_existing_hashes(table_name)
-    
-    for tenant_id in ACCESSIBLE_TENANTS:
-        try:
-            logger.info(f"=== Ingesting Pedidos Venda for Tenant: {tenant_id} ===")
-            company_id = tenant_id.split(',')[0]
-            
-            # Quick check if tenant has any direct sales
-            check_params = {
-                "dataIni": BACKFILL_START,
-                "dataFim": today.strftime("%Y%m%d"),
-                "nPage": 1,
-                "nPageSize": 1
-            }
-            check_res = make_request("/rest/CONSPEVD/pedidos", params=check_params, tenant_id=tenant_id)
-            if not check_res or "data" not in check_res or not check_res["data"]:
-                logger.info(f"Tenant {tenant_id} has no direct sales in the backfill range. Skipping.")
+    end_date_str = end_dt.strftime("%Y%m%d")
+    chunks = [(s.strftime("%Y%m%d"), e.strftime("%Y%m%d")) for s, e in generate_date_chunks(start_dt, end_dt, force_backfill)]
+
+    run_id, completed = start_ingestion_run(mode, restart=restart_backfill)
+    logger.info(f"Ingesting {', '.join(table_names)} for {len(ACCESSIBLE_TENANTS)} tenants, "
+                f"{len(chunks)} chunks from {chunks[0][0]} to {end_date_str} "
+                f"(run {run_id}, up to {max_workers} concurrent requests)")
+
+    # Tasks: ("check", table, tenant) then ("chunk", table, tenant, start, end)
+    pending = deque()
+    for table_name in table_names:
+        for tenant_id in ACCESSIBLE_TENANTS:
+            if all((table_name, tenant_id, s, e) in completed for s, e in chunks):
                 continue
-                
-            logger.info(f"Ingestion range for Tenant {tenant_id}: {start_dt.strftime('%Y%m%d')} to {end_dt.strftime('%Y%m%d')}")
-            
-            chunks = generate_date_chunks(start_dt, end_dt, force_backfill)
-            
-            for current_start, current_end in chunks:
-                data_ini_str = current_start.strftime("%Y%m%d")
-                data_fim_str = current_end.strftime("%Y%m%d")
-                
-                logger.info(f"Processing chunk {data_ini_str}-{data_fim_str} for Tenant {tenant_id}...")
-                new_rows, sales_read, flat_rows_read = fetch_direct_sales_range(
-                    tenant_id, company_id, data_ini_str, data_fim_str, existing_hashes
-                )
-                
-                logger.info(f"Chunk {data_ini_str}-{data_fim_str} complete. Sales read: {sales_read}, Flat rows read: {flat_rows_read}. Unique new written: {len(new_rows)}")
-                
-                if new_rows:
-                    for r in new_rows:
-                        existing_hashes.add(r["hash"])
-                    write_to_bronze(table_name, new_rows)
-        except Exception as e:
-            logger.error(f"Error ingesting Pedidos Venda for Tenant {tenant_id}: {e}")
+            pending.append(("check", table_name, tenant_id))
+
+    written = {table_name: 0 for table_name in table_names}
+    done_chunks = 0
+    failed = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="protheus") as pool:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                task = pending.popleft()
+                if task[0] == "check":
+                    future = pool.submit(tenant_has_records, task[1], task[2], end_date_str)
+                else:
+                    future = pool.submit(fetch_chunk, *task[1:])
+                running[future] = task
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                kind, table_name, tenant_id = task[:3]
+                label = INCREMENTAL_ENDPOINTS[table_name][1]
+                try:
+                    if kind == "check":
+                        if not future.result():
+                            logger.info(f"Tenant {tenant_id} has no {INCREMENTAL_ENDPOINTS[table_name][2]} in the backfill range. Skipping.")
+                            continue
+                        todo = [(s, e) for s, e in chunks if (table_name, tenant_id, s, e) not in completed]
+                        logger.info(f"=== {label} for Tenant {tenant_id}: {len(todo)} of {len(chunks)} chunks to fetch ===")
+                        pending.extend(("chunk", table_name, tenant_id, s, e) for s, e in todo)
+                    else:
+                        written[table_name] += write_chunk(run_id, table_name, tenant_id, task[3], task[4], future.result())
+                        done_chunks += 1
+                except Exception as e:
+                    failed.append(task)
+                    logger.error(f"Error ingesting {label} for Tenant {tenant_id} {' '.join(task[3:])}: {e}")
+
+    for table_name in table_names:
+        logger.info(f"bronze.{table_name}: {written[table_name]:,} new rows")
+    if failed:
+        logger.error(f"{len(failed)} tasks failed; {done_chunks} chunks completed in run {run_id}")
+        if force_backfill:
+            logger.error("Run with --force-backfill again to resume from the completed chunks.")
+    else:
+        finish_ingestion_run(run_id)
+        logger.info(f"Run {run_id} finished: {done_chunks} chunks completed")
 
 def ingest_full_table(name, path, max_sweeps=10):
     """
@@ -789,7 +567,6 @@ def ingest_full_table(name, path, max_sweeps=10):
         f"Starting ingestion of '{name}' "
         f"(sequential full load, up to {max_sweeps} convergence sweeps)..."
     )
-    existing_hashes = get_existing_hashes(name)
     page_size = 500
 
     # Retrieve existing PKs for auditing deletions
@@ -799,7 +576,7 @@ def ingest_full_table(name, path, max_sweeps=10):
 
     for sweep in range(1, max_sweeps + 1):
         logger.info(f"--- Sweep {sweep} for {name} ---")
-        sweep_new_rows = []
+        sweep_written = 0
         extraction_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         page = 1
         total_read = 0
@@ -811,10 +588,11 @@ def ingest_full_table(name, path, max_sweeps=10):
                 break
 
             total_read += len(res["data"])
+            page_rows = []
             for item in res["data"]:
                 row_dict = item.copy()
                 row_dict["extraction_timestamp"] = extraction_ts
-                row_dict["hash"] = compute_row_hash(row_dict)
+                page_rows.append(row_dict)
                 
                 # Track fetched PKs
                 if pks:
@@ -823,20 +601,16 @@ def ingest_full_table(name, path, max_sweeps=10):
                     else:
                         fetched_pks.add(tuple(str(row_dict.get(p, '')).strip() for p in pks))
 
-                if row_dict["hash"] not in existing_hashes:
-                    sweep_new_rows.append(row_dict)
-                    existing_hashes.add(row_dict["hash"])
+            # Written page by page: bronze decides which rows are new
+            sweep_written += write_to_bronze(name, page_rows)
 
             if not res.get("hasNext", False):
                 break
             page += 1
 
-        logger.info(f"Sweep {sweep} complete. Total records read: {total_read:,}. New unique rows found: {len(sweep_new_rows):,}")
+        logger.info(f"Sweep {sweep} complete. Total records read: {total_read:,}. New unique rows written: {sweep_written:,}")
 
-        if sweep_new_rows:
-            logger.info(f"Writing {len(sweep_new_rows):,} new rows to bronze.{name}")
-            write_to_bronze(name, sweep_new_rows)
-        else:
+        if not sweep_written:
             logger.info(f"Sweep {sweep} complete. Total records read: {total_read:,}. 0 new rows found. Converged — stopping sweeps for {name}.")
             break
 
@@ -869,7 +643,7 @@ def get_dynamic_tenants(force_backfill=False):
     # 2. Query DuckDB for M0_CODIGO and M0_CODFIL
     tenants = []
     try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+        with duckdb.connect(DUCKDB_PATH) as con:
             # Check if table exists
             exists = con.execute("""
                 SELECT COUNT(*) FROM information_schema.tables 
@@ -905,10 +679,20 @@ def main():
     import argparse
     parser = argparse.ArgumentParser(description="Protheus API Ingestion Script")
     parser.add_argument("--force-backfill", action="store_true", help="Force a full backfill for all endpoints, bypassing incremental checks")
+    parser.add_argument("--restart-backfill", action="store_true", help="With --force-backfill: start from BACKFILL_START instead of resuming an unfinished backfill")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Concurrent (endpoint, tenant, date chunk) fetches (1 = one after another)")
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND, help="Global API request rate across all fetch threads (0 = unlimited)")
     args = parser.parse_args()
+    max_workers = max(1, args.max_workers)
+
+    global rate_limiter, session
+    rate_limiter = http_transport.RateLimiter(args.requests_per_second)
+    if max_workers != MAX_WORKERS:
+        session = http_transport.create_session(pool_size=max_workers, timeout=REQUEST_TIMEOUT, auth=AUTH)
 
     logger.info("=== PROTHEUS SOURCE TO BRONZE INGESTION STARTED ===")
     logger.info(f"Target Database: {DUCKDB_PATH}")
+    logger.info(f"Fetch workers: {max_workers}, rate limit: {args.requests_per_second} requests/s")
     
     max_retries = 10
     retry_delay = 15
@@ -920,20 +704,19 @@ def main():
     except Exception as e:
         logger.warning(f"Failed to create schema directly on target database: {e}")
 
+    # Holding a connection keeps the DuckDB instance, and the bronze hash indexes it has loaded,
+    # open for every helper that connects during the run
+    keep_open = duckdb.connect(DUCKDB_PATH)
+
     for attempt in range(1, max_retries + 1):
         try:
             # 1. Fetch dynamic tenants list
             global ACCESSIBLE_TENANTS
             ACCESSIBLE_TENANTS = get_dynamic_tenants(force_backfill=args.force_backfill)
             
-            # Ingest multi-tenant invoices (Notas)
-            ingest_notas(force_backfill=args.force_backfill)
-            
-            # Ingest multi-tenant sales orders (Pedidos)
-            ingest_pedidos(force_backfill=args.force_backfill)
-            
-            # Ingest multi-tenant direct sales (Pedidos Venda)
-            ingest_pedidos_venda(force_backfill=args.force_backfill)
+            # Ingest multi-tenant invoices (Notas), sales orders (Pedidos) and direct sales (Pedidos Venda)
+            ingest_incremental_tables(force_backfill=args.force_backfill, max_workers=max_workers,
+                                      restart_backfill=args.restart_backfill and attempt == 1)
             
             # Ingest globally shared full-load tables
             ingest_full_table("tes", "/rest/CONSTES/tes", max_sweeps=1)
@@ -941,15 +724,18 @@ def main():
             ingest_full_table("clientes", "/rest/CONSCLI/clientes", max_sweeps=1)
             ingest_full_table("vendedores", "/rest/CONSVEN/vendedores", max_sweeps=1)
             
+            http_transport.log_metrics(logger.info)
             logger.info("=== PROTHEUS SOURCE TO BRONZE INGESTION FINISHED SUCCESSFUL ===")
             break
         except Exception as e:
             logger.error(f"Ingestion Pipeline Attempt {attempt}/{max_retries} Failed: {e}", exc_info=True)
             if attempt == max_retries:
                 logger.error("Maximum retries reached. Pipeline failed permanently.")
+                http_transport.log_metrics(logger.info)
                 raise
             logger.info(f"Retrying in {retry_delay} seconds...")
             time.sleep(retry_delay)
+    keep_open.close()
 
 if __name__ == "__main__":
     main()
@@ -10,7 +10,6 @@ import sys
 import os
 import yaml
 import logging
-import duckdb
 from datetime import datetime
 
 # Setup logging standard
@@ -45,6 +44,7 @@ _root_dir = os.path.dirname(os.path.dirname(SCRIPT_DIR))
 if _root_dir not in sys.path:
     sys.path.insert(0, _root_dir)
 
+from commons import duckdb_manager
 from commons.prontuario_matching_v1 import find_prontuarios
 
 
@@ -156,7 +156,8 @@ def update_prontuario_column(con):
         suffix='',
     )
 
-    # 2. Second run: Cliente (matching remaining unmatched)
+    # 2. Second run: Cliente (matching remaining unmatched). Kept as a separate
+    # call: its tie-breaker must see the prontuarios written by the Paciente run.
     logger.info("Run 2: Matching via Cliente columns...")
     find_prontuarios(
         source_con=con,
@@ -188,7 +189,7 @@ def main():
     logger.info(f"Target Database: {DUCKDB_PATH}")
 
     try:
-        with duckdb.connect(DUCKDB_PATH) as con:
+        with duckdb_manager.connect(DUCKDB_PATH, config=config) as con:
             con.execute("CREATE SCHEMA IF NOT EXISTS gold")
             create_gold_table(con)
             update_prontuario_column(con)
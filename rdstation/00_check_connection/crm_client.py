@@ -1,6 +1,9 @@
 import os
+import sys
 import json
-import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import http_transport
 
 class RDStationCRMClient:
     def __init__(self, tokens_filepath=None):
@@ -9,6 +12,8 @@ class RDStationCRMClient:
             
         self.tokens_filepath = tokens_filepath
         self.load_tokens()
+        # One keep-alive session for the token refresh and every API call
+        self.session = http_transport.create_session()
         self.base_url = "https://api.rd.services/crm/v2"
 
     def load_tokens(self):
@@ -58,7 +63,7 @@ class RDStationCRMClient:
             "grant_type": "refresh_token"
         }
         
-        response = requests.post(url, data=payload, headers=headers)
+        response = self.session.post(url, data=payload, headers=headers)
         if response.status_code == 200:
             data = response.json()
             self.access_token = data.get("access_token")
@@ -83,7 +88,7 @@ class RDStationCRMClient:
         kwargs["headers"]["Accept"] = "application/json"
         
         # Try request
-        response = requests.request(method, url, **kwargs)
+        response = self.session.request(method, url, **kwargs)
         
         # If token expired (401 Unauthorized), refresh token and retry once
         if response.status_code == 401:
@@ -91,7 +96,7 @@ class RDStationCRMClient:
             self.refresh_access_token()
             # Update headers with new token
             kwargs["headers"]["Authorization"] = f"Bearer {self.access_token}"
-            response = requests.request(method, url, **kwargs)
+            response = self.session.request(method, url, **kwargs)
             
         return response
 
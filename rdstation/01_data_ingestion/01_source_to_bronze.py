@@ -2,23 +2,34 @@
 """
 RD Station CRM API to DuckDB Bronze Ingestion Script
 Extracts data from Deals, Contacts, Pipelines, Stages, Users, and Sources,
-converts all columns to VARCHAR, and performs hash-based incremental appends to the database.
+converts all columns to VARCHAR, and performs hash-based incremental appends to the database
+(row hashes are computed and probed in DuckDB, see commons/bronze_dedup.py).
 Handles rate limiting (HTTP 429) and token rolling refreshes.
+
+Deals and contacts are fetched by updated_at windows. The windows are planned
+from the record density already in bronze (dense months are split before they
+hit the API's 10,000-record ceiling), fetched by several threads under one
+request rate limit, and written to bronze in chronological order.
 """
 
 import os
+import sys
 import yaml
 import json
 import logging
-import requests
-import hashlib
 import pandas as pd
 import duckdb
 import time
 import random
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from commons import bronze_dedup, http_transport
+
 # Setup logging standard
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOGS_DIR = os.path.join(SCRIPT_DIR, 'logs')
@@ -45,13 +56,21 @@ with open(PARAMS_PATH, 'r') as f:
 DUCKDB_PATH = config['duckdb_path']
 TOKENS_PATH = os.path.join(SCRIPT_DIR, config.get('tokens_path', 'tokens.json'))
 BACKFILL_START = config.get('backfill_start_date', '2020-01-01')
+REQUEST_TIMEOUT = (10, 60)
+MAX_WORKERS = config.get('max_workers', 4)
+REQUESTS_PER_SECOND = config.get('requests_per_second', 2.0)
+# The API refuses filters matching more than 10,000 records; plan windows at half that
+WINDOW_TARGET_RECORDS = config.get('window_target_records', 5000)
 
 class RDStationCRMClient:
-    def __init__(self, tokens_filepath):
+    def __init__(self, tokens_filepath, pool_size=1, requests_per_second=None):
         self.tokens_filepath = tokens_filepath
+        self.token_lock = threading.Lock()
         self.load_tokens()
         self.base_url = "https://api.rd.services/crm/v2"
-        self.session = requests.Session()
+        # Keep-alive pool with one connection per thread using the client
+        self.session = http_transport.create_session(pool_size=pool_size, timeout=REQUEST_TIMEOUT)
+        self.rate_limiter = http_transport.RateLimiter(requests_per_second)
 
     def load_tokens(self):
         """Loads client credentials and tokens from the JSON storage."""
@@ -79,8 +98,17 @@ class RDStationCRMClient:
                 "refresh_token": self.refresh_token
             }, f, indent=4)
 
-    def refresh_access_token(self):
-        """Refreshes the access token using the refresh token."""
+    def refresh_access_token(self, stale_token=None):
+        """
+        Refreshes the access token using the refresh token. With stale_token (the token
+        a request was rejected with), does nothing if another thread has already replaced it.
+        """
+        with self.token_lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return
+            self._refresh_access_token()
+
+    def _refresh_access_token(self):
         logger.info("[*] Refreshing CRM v2 access token in the background...")
         url = "https://api.rd.services/oauth2/token"
         headers = {
@@ -110,31 +138,32 @@ class RDStationCRMClient:
         """Makes API request with automatic 401 retry and 429 rate limit backoff."""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         
-        if "headers" not in kwargs:
-            kwargs["headers"] = {}
-        kwargs["headers"]["Authorization"] = f"Bearer {self.access_token}"
+        kwargs["headers"] = dict(kwargs.get("headers") or {})
         kwargs["headers"]["Accept"] = "application/json"
         
         max_attempts = 6
-        timeout = 60
         
         for attempt in range(1, max_attempts + 1):
+            token = self.access_token
+            kwargs["headers"]["Authorization"] = f"Bearer {token}"
+            self.rate_limiter.wait()
             try:
-                r = self.session.request(method, url, timeout=timeout, **kwargs)
+                r = self.session.request(method, url, **kwargs)
                 
                 # Handle Rate Limit (Too Many Requests)
                 if r.status_code == 429:
                     retry_after = r.headers.get("Retry-After")
                     sleep_time = int(retry_after) if retry_after and retry_after.isdigit() else (5 * attempt + random.uniform(1, 3))
                     logger.warning(f"[!] Rate limit (429) hit. Sleeping for {sleep_time} seconds before attempt {attempt}/{max_attempts}...")
+                    # The other fetch threads wait out the limit too, and all resume a bit slower
+                    self.rate_limiter.defer(sleep_time, slow_down=1.25)
                     time.sleep(sleep_time)
                     continue
                     
                 # Handle Expired Token (401 Unauthorized)
                 if r.status_code == 401:
                     logger.warning("[!] Request returned 401. Refreshing token and retrying...")
-                    self.refresh_access_token()
-                    kwargs["headers"]["Authorization"] = f"Bearer {self.access_token}"
+                    self.refresh_access_token(stale_token=token)
                     continue
                 
                 return r
@@ -157,24 +186,9 @@ TABLE_PKS = {
     "sources": ["id"]
 }
 
-def get_existing_hashes(table_name):
-    try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
-            exists = con.execute(f"""
-                SELECT COUNT(*) FROM information_schema.tables 
-                WHERE table_schema = 'bronze' AND table_name = '{table_name}'
-            """).fetchone()[0]
-            if exists:
-                hashes = con.execute(f"SELECT hash FROM bronze.{table_name}").fetchall()
-                return {h[0] for h in hashes if h[0]}
-            return set()
-    except Exception as e:
-        logger.warning(f"Could not fetch existing hashes for bronze.{table_name}: {e}")
-        return set()
-
 def get_max_updated_at(table_name):
     try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+        with duckdb.connect(DUCKDB_PATH) as con:
             exists = con.execute(f"""
                 SELECT COUNT(*) FROM information_schema.tables 
                 WHERE table_schema = 'bronze' AND table_name = '{table_name}'
@@ -193,7 +207,7 @@ def get_existing_pks(table_name):
     if not pks:
         return set()
     try:
-        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+        with duckdb.connect(DUCKDB_PATH) as con:
             exists = con.execute(f"""
                 SELECT COUNT(*) FROM information_schema.tables 
                 WHERE table_schema = 'bronze' AND table_name = '{table_name}'
@@ -258,15 +272,11 @@ def flag_deleted_in_bronze(table_name, deleted_pks):
     except Exception as e:
         logger.error(f"Failed to flag deleted records in bronze.{table_name}: {e}")
 
-def compute_row_hash(row_dict):
-    clean_dict = {k: v for k, v in row_dict.items() if k not in ['hash', 'extraction_timestamp']}
-    row_str = "|".join(f"{k}:{str(v).strip() if v is not None else ''}" for k, v in sorted(clean_dict.items()))
-    return hashlib.md5(row_str.encode('utf-8')).hexdigest()
-
 def write_to_bronze(table_name, rows):
+    """Appends the rows bronze does not hold yet (by row hash); returns how many were written."""
     if not rows:
         logger.info(f"No new rows to write to bronze.{table_name}")
-        return
+        return 0
         
     df = pd.DataFrame(rows)
     
@@ -290,35 +300,9 @@ def write_to_bronze(table_name, rows):
         
     try:
         with duckdb.connect(DUCKDB_PATH) as con:
-            exists = con.execute(f"""
-                SELECT COUNT(*) FROM information_schema.tables 
-                WHERE table_schema = 'bronze' AND table_name = '{table_name}'
-            """).fetchone()[0]
-            
-            con.register('df_temp', df)
-            try:
-                if not exists:
-                    logger.info(f"Creating table bronze.{table_name} with VARCHAR columns and inserting {len(df)} rows")
-                    cols_def = ", ".join(f'"{c}" VARCHAR' for c in df.columns)
-                    con.execute(f"CREATE TABLE bronze.{table_name} ({cols_def})")
-                    cols_str = ", ".join(f'"{c}"' for c in df.columns)
-                    con.execute(f"INSERT INTO bronze.{table_name} ({cols_str}) SELECT {cols_str} FROM df_temp")
-                else:
-                    existing_cols = {row[0] for row in con.execute(f"DESCRIBE bronze.{table_name}").fetchall()}
-                    new_cols = set(df.columns) - existing_cols
-                    for col in new_cols:
-                        logger.info(f"Schema evolution: Adding column '{col}' to bronze.{table_name}")
-                        con.execute(f"ALTER TABLE bronze.{table_name} ADD COLUMN \"{col}\" VARCHAR")
-                        
-                    cols_str = ", ".join(f'"{c}"' for c in df.columns)
-                    logger.info(f"Inserting {len(df)} rows to bronze.{table_name}")
-                    con.execute(f"INSERT INTO bronze.{table_name} ({cols_str}) SELECT {cols_str} FROM df_temp")
-            finally:
-                try:
-                    con.unregister('df_temp')
-                except Exception:
-                    pass
-            logger.info(f"Successfully wrote {len(rows)} rows to bronze.{table_name}")
+            inserted = bronze_dedup.append_new_rows(con, f"bronze.{table_name}", df)
+        logger.info(f"Wrote {inserted} new rows to bronze.{table_name} ({len(df)} rows fetched)")
+        return inserted
     except Exception as bulk_err:
         logger.error(f"Bulk insert failed for bronze.{table_name}: {bulk_err}")
         raise bulk_err
@@ -333,12 +317,17 @@ def format_datetime_for_api(dt_str):
         normalized += "Z"
     return normalized
 
-def fetch_and_ingest_range(client, table_name, endpoint, start_str, end_str, existing_hashes, fetched_pks):
+def fetch_range(client, table_name, endpoint, start_str, end_str):
+    """
+    Fetches every record updated in [start_str, end_str]. Runs on the fetch threads:
+    returns (rows, halves), bronze is written by the caller. For a range the API
+    refuses (more than 10,000 records), halves holds the two halves to fetch
+    instead and rows the pages read before the refusal; otherwise halves is None.
+    """
     logger.info(f"Fetching {table_name} range: {start_str} to {end_str}")
     page = 1
     page_size = 100
-    pks = TABLE_PKS.get(table_name, [])
-    new_rows = []
+    rows = []
     resp = None
     
     while True:
@@ -378,22 +367,7 @@ def fetch_and_ingest_range(client, table_name, endpoint, start_str, end_str, exi
             row = item.copy()
             row["extraction_timestamp"] = extraction_ts
             row["is_deleted"] = "FALSE"
-            row["hash"] = compute_row_hash(row)
-            
-            if pks:
-                if len(pks) == 1:
-                    fetched_pks.add(str(row.get(pks[0], '')).strip())
-                else:
-                    fetched_pks.add(tuple(str(row.get(p, '')).strip() for p in pks))
-                    
-            if row["hash"] not in existing_hashes:
-                new_rows.append(row)
-                existing_hashes.add(row["hash"])
-                
-        # Write batches of 500 records to prevent memory build-up
-        if len(new_rows) >= 500:
-            write_to_bronze(table_name, new_rows)
-            new_rows = []
+            rows.append(row)
             
         if len(data_list) < page_size:
             break
@@ -405,9 +379,7 @@ def fetch_and_ingest_range(client, table_name, endpoint, start_str, end_str, exi
         end_dt = pd.to_datetime(end_str)
         if (end_dt - start_dt).total_seconds() < 60:
             logger.error(f"Cannot split range further (less than 1 minute). Writing what we have...")
-            if new_rows:
-                write_to_bronze(table_name, new_rows)
-            return len(new_rows)
+            return rows, None
             
         mid_dt = start_dt + (end_dt - start_dt) / 2
         start_fmt = start_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -415,13 +387,8 @@ def fetch_and_ingest_range(client, table_name, endpoint, start_str, end_str, exi
         mid_fmt = mid_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
         
         logger.info(f"Recursive split: Left: {start_fmt} to {mid_fmt} | Right: {mid_fmt} to {end_fmt}")
-        left_count = fetch_and_ingest_range(client, table_name, endpoint, start_fmt, mid_fmt, existing_hashes, fetched_pks)
-        right_count = fetch_and_ingest_range(client, table_name, endpoint, mid_fmt, end_fmt, existing_hashes, fetched_pks)
-        return left_count + right_count
-    else:
-        if new_rows:
-            write_to_bronze(table_name, new_rows)
-        return len(new_rows)
+        return rows, [(start_fmt, mid_fmt), (mid_fmt, end_fmt)]
+    return rows, None
 
 def generate_date_chunks(start_str, end_str):
     start_dt = pd.to_datetime(start_str)
@@ -438,11 +405,85 @@ def generate_date_chunks(start_str, end_str):
         curr = next_curr
     return chunks
 
-def ingest_incremental_table(client, table_name, endpoint, force_backfill=False):
+def get_daily_counts(table_name):
+    """
+    Records per UTC day of their current updated_at, counting the latest bronze
+    version of each record: what an updated_at filter on that day returns today.
+    """
+    pks = TABLE_PKS.get(table_name, [])
+    if not pks:
+        return {}
+    try:
+        with duckdb.connect(DUCKDB_PATH) as con:
+            exists = con.execute(f"""
+                SELECT COUNT(*) FROM information_schema.tables 
+                WHERE table_schema = 'bronze' AND table_name = '{table_name}'
+            """).fetchone()[0]
+            if not exists:
+                return {}
+            pk_cols_str = ", ".join(f'"{p}"' for p in pks)
+            rows = con.execute(f"""
+                SELECT date_trunc('day', timezone('UTC', TRY_CAST(updated_at AS TIMESTAMPTZ))) AS day, COUNT(*)
+                FROM (
+                    SELECT updated_at, is_deleted FROM bronze.{table_name}
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY {pk_cols_str} ORDER BY extraction_timestamp DESC) = 1
+                )
+                WHERE COALESCE(is_deleted, 'FALSE') = 'FALSE'
+                GROUP BY day
+                HAVING day IS NOT NULL
+            """).fetchall()
+        return {pd.Timestamp(day): count for day, count in rows}
+    except Exception as e:
+        logger.warning(f"Could not compute record density for bronze.{table_name}: {e}")
+        return {}
+
+def estimate_records(daily_counts, start_dt, end_dt):
+    """Expected records in [start_dt, end_dt), spreading each day's count evenly over the day."""
+    one_day = pd.Timedelta(days=1)
+    total = 0.0
+    day = start_dt.floor('D')
+    while day < end_dt:
+        count = daily_counts.get(day)
+        if count:
+            overlap = min(end_dt, day + one_day) - max(start_dt, day)
+            total += count * (overlap / one_day)
+        day += one_day
+    return total
+
+def plan_windows(start_str, end_str, daily_counts, target=WINDOW_TARGET_RECORDS):
+    """
+    The 30-day chunks of generate_date_chunks, with every chunk expected to hold more
+    than target records halved until its parts are under it (or one minute long).
+    Returns chronological (start, end, expected records) windows.
+    """
+    windows = []
+    for chunk_start, chunk_end in generate_date_chunks(start_str, end_str):
+        # Naive UTC, like the daily_counts keys
+        stack = [(pd.to_datetime(chunk_start).tz_localize(None), pd.to_datetime(chunk_end).tz_localize(None))]
+        while stack:
+            start_dt, end_dt = stack.pop()
+            expected = estimate_records(daily_counts, start_dt, end_dt)
+            if expected > target and (end_dt - start_dt).total_seconds() >= 120:
+                mid_dt = (start_dt + (end_dt - start_dt) / 2).floor('s')
+                # Right half first: the stack pops the left half next
+                stack.append((mid_dt, end_dt))
+                stack.append((start_dt, mid_dt))
+                continue
+            windows.append((start_dt.strftime("%Y-%m-%dT%H:%M:%SZ"), end_dt.strftime("%Y-%m-%dT%H:%M:%SZ"), expected))
+    return windows
+
+def ingest_incremental_table(client, table_name, endpoint, force_backfill=False, max_workers=MAX_WORKERS):
+    """
+    Fetches the updated_at windows of plan_windows on max_workers threads (sharing
+    the client's rate limit) and writes them to bronze from this thread, oldest
+    window first: a run that stops early leaves no gap below max(updated_at), where
+    the next incremental run resumes. A window that turns out too dense for the API
+    is replaced by its two halves, fetched like any other window.
+    """
     logger.info(f"=== Starting incremental ingestion of '{table_name}' using date ranges ===")
-    existing_hashes = get_existing_hashes(table_name)
     existing_pks = get_existing_pks(table_name)
     fetched_pks = set()
+    pks = TABLE_PKS.get(table_name, [])
     
     # Calculate global incremental start date
     if force_backfill:
@@ -461,15 +502,69 @@ def ingest_incremental_table(client, table_name, endpoint, force_backfill=False)
     end_date = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     
     chunks = generate_date_chunks(start_date, end_date)
-    logger.info(f"Generated {len(chunks)} date range chunks to query for {table_name}")
+    windows = plan_windows(start_date, end_date, get_daily_counts(table_name))
+    expected_total = sum(expected for _, _, expected in windows)
+    logger.info(f"Planned {len(windows)} date windows from {len(chunks)} 30-day chunks for {table_name} "
+                f"(~{expected_total:,.0f} records expected from bronze history, "
+                f"at most ~{WINDOW_TARGET_RECORDS:,} per window), fetching with {max_workers} workers")
     
     total_written = 0
-    for idx, (chunk_start, chunk_end) in enumerate(chunks):
-        logger.info(f"[{idx+1}/{len(chunks)}] Processing range {chunk_start} to {chunk_end}...")
-        count = fetch_and_ingest_range(client, table_name, endpoint, chunk_start, chunk_end, existing_hashes, fetched_pks)
-        total_written += count
+    total_fetched = 0
+    windows_done = 0
+    pending = deque(windows)
+    # (start, end, future, rows read before a split of the window, written with its right half)
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"rd_{table_name}") as pool:
+        def fetch(start, end):
+            return pool.submit(fetch_range, client, table_name, endpoint, start, end)
+
+        try:
+            while pending or in_flight:
+                # Keep every worker busy with the next windows while the oldest ones are written
+                while pending and len(in_flight) < 2 * max_workers:
+                    window_start, window_end, _ = pending.popleft()
+                    in_flight.append((window_start, window_end, fetch(window_start, window_end), []))
+                wait([future for _, _, future, _ in in_flight], return_when=FIRST_COMPLETED)
+
+                # Replace windows found too dense by their halves as soon as they are known
+                queue = deque()
+                for window_start, window_end, future, carried in in_flight:
+                    if future.done():
+                        rows, halves = future.result()
+                        if halves:
+                            (left_start, left_end), (right_start, right_end) = halves
+                            queue.append((left_start, left_end, fetch(left_start, left_end), []))
+                            queue.append((right_start, right_end, fetch(right_start, right_end), carried + rows))
+                            continue
+                    queue.append((window_start, window_end, future, carried))
+                in_flight = queue
+
+                # Write the finished windows at the head of the queue, oldest first
+                while in_flight and in_flight[0][2].done():
+                    rows, halves = in_flight[0][2].result()
+                    if halves:
+                        break
+                    window_start, window_end, _, carried = in_flight.popleft()
+                    rows = carried + rows
+                    for row in rows:
+                        if pks:
+                            if len(pks) == 1:
+                                fetched_pks.add(str(row.get(pks[0], '')).strip())
+                            else:
+                                fetched_pks.add(tuple(str(row.get(p, '')).strip() for p in pks))
+                    count = write_to_bronze(table_name, rows)
+                    total_written += count
+                    total_fetched += len(rows)
+                    windows_done += 1
+                    logger.info(f"[{windows_done} windows done, {len(pending) + len(in_flight)} left] "
+                                f"Range {window_start} to {window_end}: {len(rows)} records fetched, {count} new")
+        except BaseException:
+            for _, _, future, _ in in_flight:
+                future.cancel()
+            raise
         
-    logger.info(f"Finished ingestion of '{table_name}'. Ingested {total_written} new unique records.")
+    logger.info(f"Finished ingestion of '{table_name}'. Fetched {total_fetched} records, "
+                f"ingested {total_written} new unique records.")
     
     # Perform deletion audit
     if force_backfill and existing_pks:
@@ -482,8 +577,7 @@ def ingest_incremental_table(client, table_name, endpoint, force_backfill=False)
 
 def ingest_full_table(client, table_name, endpoint):
     logger.info(f"Starting full load of '{table_name}'...")
-    existing_hashes = get_existing_hashes(table_name)
-    new_rows = []
+    written = 0
     
     page = 1
     page_size = 100
@@ -508,24 +602,20 @@ def ingest_full_table(client, table_name, endpoint):
         if not data_list:
             break
             
+        rows = []
         for item in data_list:
             row = item.copy()
             row["extraction_timestamp"] = extraction_ts
             row["is_deleted"] = "FALSE"
-            row["hash"] = compute_row_hash(row)
-            
-            if row["hash"] not in existing_hashes:
-                new_rows.append(row)
-                existing_hashes.add(row["hash"])
+            rows.append(row)
+        written += write_to_bronze(table_name, rows)
                 
         if len(data_list) < page_size:
             break
             
         page += 1
         
-    logger.info(f"Full load complete for {table_name}. Found {len(new_rows)} new unique records.")
-    if new_rows:
-        write_to_bronze(table_name, new_rows)
+    logger.info(f"Full load complete for {table_name}. Wrote {written} new unique records.")
 
 def ingest_stages(client):
     logger.info("Ingesting 'stages' per pipeline...")
@@ -550,8 +640,7 @@ def ingest_stages(client):
             break
             
     logger.info(f"Found {len(pipelines_list)} pipelines to fetch stages for.")
-    existing_hashes = get_existing_hashes("stages")
-    new_rows = []
+    rows = []
     extraction_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     for pipe in pipelines_list:
@@ -579,28 +668,27 @@ def ingest_stages(client):
                 row["pipeline_id"] = pipeline_id
                 row["extraction_timestamp"] = extraction_ts
                 row["is_deleted"] = "FALSE"
-                row["hash"] = compute_row_hash(row)
-                
-                if row["hash"] not in existing_hashes:
-                    new_rows.append(row)
-                    existing_hashes.add(row["hash"])
+                rows.append(row)
                     
             if len(data_list) < page_size:
                 break
             page_s += 1
             
-    logger.info(f"Ingested {len(new_rows)} new unique stages.")
-    if new_rows:
-        write_to_bronze("stages", new_rows)
+    written = write_to_bronze("stages", rows)
+    logger.info(f"Ingested {written} new unique stages.")
 
 def main():
     parser = argparse.ArgumentParser(description="RD Station CRM API Ingestion Script")
     parser.add_argument("--force-backfill", action="store_true", help="Force a full backfill for all endpoints, bypassing incremental checks")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Concurrent date-window fetches for deals and contacts (1 = one after another)")
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND, help="Global CRM API request rate across all fetch threads (0 = unlimited)")
     args = parser.parse_args()
+    max_workers = max(1, args.max_workers)
 
     logger.info("=== RD STATION CRM SOURCE TO BRONZE INGESTION STARTED ===")
     logger.info(f"Target Database: {DUCKDB_PATH}")
     logger.info(f"Tokens File Path: {TOKENS_PATH}")
+    logger.info(f"Fetch workers: {max_workers}, rate limit: {args.requests_per_second} requests/s")
     
     # Initialize Schema if not exists
     try:
@@ -609,8 +697,12 @@ def main():
     except Exception as e:
         logger.warning(f"Failed to create schema directly on target database: {e}")
 
+    # Holding a connection keeps the DuckDB instance, and the bronze hash indexes it has loaded,
+    # open for every helper that connects during the run
+    keep_open = duckdb.connect(DUCKDB_PATH)
+
     try:
-        client = RDStationCRMClient(TOKENS_PATH)
+        client = RDStationCRMClient(TOKENS_PATH, pool_size=max_workers, requests_per_second=args.requests_per_second)
         
         # 1. Ingest metadata/full-load tables
         ingest_full_table(client, "pipelines", "pipelines")
@@ -619,13 +711,17 @@ def main():
         ingest_full_table(client, "sources", "sources")
         
         # 2. Ingest transaction/incremental tables
-        ingest_incremental_table(client, "deals", "deals", force_backfill=args.force_backfill)
-        ingest_incremental_table(client, "contacts", "contacts", force_backfill=args.force_backfill)
+        ingest_incremental_table(client, "deals", "deals", force_backfill=args.force_backfill, max_workers=max_workers)
+        ingest_incremental_table(client, "contacts", "contacts", force_backfill=args.force_backfill, max_workers=max_workers)
         
+        http_transport.log_metrics(logger.info)
         logger.info("=== RD STATION CRM SOURCE TO BRONZE INGESTION FINISHED SUCCESSFUL ===")
     except Exception as e:
         logger.error(f"Ingestion Pipeline Failed: {e}", exc_info=True)
+        http_transport.log_metrics(logger.info)
         raise
+    finally:
+        keep_open.close()
 
 if __name__ == "__main__":
     main()
@@ -3,9 +3,21 @@
 RD Station CRM Dashboard Generator
 Queries DuckDB and compiles an interactive standalone HTML page with client-side filtering.
 Includes a centered sales funnel chart, tabbed sheets, and default 'Todos' filters.
+
+The page does not embed the deals. DuckDB aggregates them into monthly cubes
+(by pipeline, clinic, agent, stage/status and month, plus one cube each for
+channel, treatment and lost reason) that are embedded in the HTML; the charts
+and KPIs are computed from those. Deal-level rows are written per creation month
+to dashboard_data/deals_YYYY-MM.js (gzip-compressed, dictionary-encoded
+columns, loaded by a script tag so the page also works from file://). The page
+loads a month only when the details tab needs it, or when a date filter cuts
+through that month.
 """
 
 import os
+import gzip
+import glob
+import base64
 import yaml
 import json
 import logging
@@ -37,11 +49,33 @@ with open(PARAMS_PATH, 'r') as f:
 
 DUCKDB_PATH = config['duckdb_path']
 OUTPUT_HTML = os.path.join(SCRIPT_DIR, 'dashboard.html')
+# Deal detail chunks, referenced from the HTML by this relative path
+DATA_DIR_NAME = 'dashboard_data'
+OUTPUT_DATA_DIR = os.path.join(SCRIPT_DIR, DATA_DIR_NAME)
+# Month key of the deals without created_at
+NO_MONTH = ''
 
-def fetch_data():
-    logger.info("Connecting to database and fetching raw records...")
-    con = duckdb.connect(DUCKDB_PATH, read_only=True)
-    
+# Dimensions stored as indexes into rawData.dict
+DIMENSIONS = ('pipeline', 'clinic', 'agent', 'month', 'stage', 'status', 'channel', 'treatment', 'lost_reason')
+
+# Cube name -> (dimension columns, measure SQL, rows included); every cube carries the filter dimensions
+FILTER_DIMENSIONS = ('pipeline', 'clinic', 'agent', 'month')
+CUBES = {
+    'deals': (('stage', 'status'), """
+        COUNT(*) AS n,
+        ROUND(SUM(revenue), 2) AS revenue,
+        COALESCE(SUM(closed - created) FILTER (WHERE status = 'won'), 0) AS cycle_days,
+        COUNT(closed - created) FILTER (WHERE status = 'won') AS cycle_n,
+        COALESCE(SUM(created - DATE '1970-01-01') FILTER (WHERE status = 'ongoing'), 0) AS created_days,
+        COUNT(created) FILTER (WHERE status = 'ongoing') AS created_n,
+        COUNT(*) FILTER (WHERE status = 'ongoing' AND updated <= $reference_date - 15) AS stalled
+    """, "TRUE"),
+    'channels': (('channel', 'status'), "COUNT(*) AS n", "TRUE"),
+    'treatments': (('treatment', 'status'), "COUNT(*) AS n", "TRUE"),
+    'lost': (('lost_reason',), "COUNT(*) AS n", "status = 'lost'"),
+}
+
+def load_lost_reasons():
     # Load lost reasons mapping if exists
     lost_reasons_path = os.path.join(SCRIPT_DIR, 'lost_reasons.json')
     lost_reasons_map = {}
@@ -52,10 +86,27 @@ def fetch_data():
             logger.info(f"Loaded lost reasons mapping with {len(lost_reasons_map)} keys.")
         except Exception as e:
             logger.warning(f"Could not load lost reasons mapping: {e}")
-            
-    # 1. Fetch all deals for client-side aggregation
+    return lost_reasons_map
+
+class Dictionary:
+    """Per-dimension value lists; rows carry the value's index."""
+
+    def __init__(self):
+        self.values = {dim: [] for dim in DIMENSIONS}
+        self.index = {dim: {} for dim in DIMENSIONS}
+
+    def encode(self, dim, value):
+        idx = self.index[dim].get(value)
+        if idx is None:
+            idx = self.index[dim][value] = len(self.values[dim])
+            self.values[dim].append(value)
+        return idx
+
+def create_deals_table(con):
+    """One row per deal, with the display names the dashboard filters and groups on."""
     logger.info("Querying deals...")
-    deals_rows = con.execute("""
+    con.execute("""
+        CREATE TEMP TABLE dashboard_deals AS
         SELECT 
             d.id,
             d.name,
@@ -67,37 +118,94 @@ def fetch_data():
             COALESCE(d.custom_como_conheceu_a_huntington, 'Sem Canal') AS channel,
             COALESCE(d.custom_procurou_por, 'Não Informado') AS treatment,
             COALESCE(TRY_CAST(d.total_price AS DOUBLE), 0.0) AS revenue,
-            strftime(d.created_at, '%Y-%m-%d') AS created_at,
-            strftime(d.updated_at, '%Y-%m-%d') AS updated_at,
-            strftime(d.closed_at, '%Y-%m-%d') AS closed_at,
+            CAST(d.created_at AS DATE) AS created,
+            CAST(d.updated_at AS DATE) AS updated,
+            CAST(d.closed_at AS DATE) AS closed,
+            COALESCE(strftime(d.created_at, '%Y-%m'), '') AS month,
             COALESCE(d.lost_reason_id, 'Sem Motivo') AS lost_reason
         FROM silver.deals d
         LEFT JOIN silver.pipelines p ON d.pipeline_id = p.id
         LEFT JOIN silver.stages s ON d.stage_id = s.id AND d.pipeline_id = s.pipeline_id
         LEFT JOIN silver.users u ON d.owner_id = u.id
+    """)
+    return con.execute("SELECT COUNT(*) FROM dashboard_deals").fetchone()[0]
+
+def build_cubes(con, dictionary, reference_date):
+    """Aggregates dashboard_deals into CUBES; returns {name: {"columns": [...], "rows": [[...], ...]}}."""
+    cubes = {}
+    for name, (dims, measures, where) in CUBES.items():
+        dim_cols = FILTER_DIMENSIONS + dims
+        result = con.execute(f"""
+            SELECT {', '.join(dim_cols)}, {measures.replace('$reference_date', "CAST(? AS DATE)")}
+            FROM dashboard_deals
+            WHERE {where}
+            GROUP BY ALL
+            ORDER BY ALL
+        """, [reference_date] if '$reference_date' in measures else [])
+        columns = [c[0] for c in result.description]
+        rows = []
+        for row in result.fetchall():
+            rows.append([dictionary.encode(col, val) if col in DIMENSIONS else val
+                         for col, val in zip(columns, row)])
+        cubes[name] = {"columns": columns, "rows": rows}
+        logger.info(f"Cube '{name}': {len(rows)} cells")
+    return cubes
+
+def write_deal_chunks(con, dictionary):
+    """
+    Writes the deals of each creation month to OUTPUT_DATA_DIR/deals_<month>.js and
+    returns {month: relative path}. Chunks of an earlier run are removed first.
+    """
+    os.makedirs(OUTPUT_DATA_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(OUTPUT_DATA_DIR, 'deals_*.js')):
+        os.remove(stale)
+
+    encoded = ('status', 'pipeline', 'stage', 'agent', 'clinic', 'channel', 'treatment', 'lost_reason')
+    columns = ('id', 'name') + encoded + ('revenue', 'created_at', 'updated_at', 'closed_at')
+    rows = con.execute(f"""
+        SELECT month, id, name, {', '.join(encoded)}, revenue,
+               strftime(created, '%Y-%m-%d'), strftime(updated, '%Y-%m-%d'), strftime(closed, '%Y-%m-%d')
+        FROM dashboard_deals
+        ORDER BY month DESC, created DESC, id
     """).fetchall()
-    
-    deals = []
-    for r in deals_rows:
-        reason_id = r[13]
-        reason_name = lost_reasons_map.get(reason_id, reason_id)
-        deals.append({
-            "id": r[0],
-            "name": r[1],
-            "status": r[2],
-            "pipeline": r[3],
-            "stage": r[4],
-            "agent": r[5],
-            "clinic": r[6],
-            "channel": r[7],
-            "treatment": r[8],
-            "revenue": r[9],
-            "created_at": r[10],
-            "updated_at": r[11],
-            "closed_at": r[12],
-            "lost_reason": reason_name
-        })
-        
+
+    chunks = {}
+    total_bytes = 0
+    start = 0
+    while start < len(rows):
+        month = rows[start][0]
+        end = start
+        while end < len(rows) and rows[end][0] == month:
+            end += 1
+        data = {col: [] for col in columns}
+        for row in rows[start:end]:
+            for col, val in zip(columns, row[1:]):
+                data[col].append(dictionary.encode(col, val) if col in encoded else val)
+        # Fixed gzip mtime: a month whose deals did not change gets a byte-identical file
+        payload = base64.b64encode(gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), mtime=0))
+        file_name = f"deals_{month or 'sem_data'}.js"
+        with open(os.path.join(OUTPUT_DATA_DIR, file_name), 'w', encoding='utf-8') as out:
+            out.write(f'rdDealChunk({json.dumps(month)}, "{payload.decode("ascii")}");\n')
+        chunks[month] = f"{DATA_DIR_NAME}/{file_name}"
+        total_bytes += len(payload)
+        start = end
+    logger.info(f"Wrote {len(rows)} deals in {len(chunks)} monthly chunks to {OUTPUT_DATA_DIR} ({total_bytes / 1e6:.1f} MB)")
+    return chunks
+
+def fetch_data():
+    logger.info("Connecting to database and aggregating deals...")
+    con = duckdb.connect(DUCKDB_PATH, read_only=True)
+    lost_reasons_map = load_lost_reasons()
+
+    n_deals = create_deals_table(con)
+    reference_date = con.execute("SELECT COALESCE(MAX(updated), current_date) FROM dashboard_deals").fetchone()[0]
+
+    # 1. Aggregate cubes (embedded) and per-month deal chunks (loaded on demand)
+    dictionary = Dictionary()
+    cubes = build_cubes(con, dictionary, reference_date)
+    chunks = write_deal_chunks(con, dictionary)
+    months = sorted({dictionary.values['month'][row[3]] for row in cubes['deals']['rows']}, reverse=True)
+
     # 2. Fetch pipelines and stages in order for funnel chart mapping
     logger.info("Querying pipelines and stages order...")
     stages_rows = con.execute("""
@@ -117,8 +225,19 @@ def fetch_data():
         stages[pipe].append(stage)
         
     con.close()
-    logger.info(f"Successfully loaded {len(deals)} deals and {len(stages)} pipelines.")
-    return deals, stages
+
+    # Lost reasons are displayed by name
+    dictionary.values['lost_reason'] = [lost_reasons_map.get(r, r) for r in dictionary.values['lost_reason']]
+    logger.info(f"Successfully aggregated {n_deals} deals and loaded {len(stages)} pipelines.")
+    return {
+        "stages": stages,
+        "dict": dictionary.values,
+        "cubes": cubes,
+        "months": months,
+        "chunks": chunks,
+        # Reference "today" for deal age and stalled deals: the latest update in the data
+        "reference_date": reference_date.strftime('%Y-%m-%d'),
+    }
 
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="pt-BR">
@@ -476,6 +595,94 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         // Pagination state
         let currentPage = 1;
         const pageSize = 50;
+        // Latest refresh of the overview / details table; an older one still loading chunks must not overwrite it
+        let renderToken = 0;
+        let detailsToken = 0;
+
+        // Aggregate cubes: rows of dictionary indexes and measures -> objects with names
+        function decodeCube(cube) {
+            return cube.rows.map(row => {
+                const obj = {};
+                cube.columns.forEach((col, i) => {
+                    obj[col] = rawData.dict[col] ? rawData.dict[col][row[i]] : row[i];
+                });
+                return obj;
+            });
+        }
+        const cubes = {};
+        Object.keys(rawData.cubes).forEach(name => { cubes[name] = decodeCube(rawData.cubes[name]); });
+
+        // Deal detail chunks (one per creation month), loaded on demand by script tag
+        const chunkResolvers = {};
+        const chunkPromises = {};
+        window.rdDealChunk = (month, payload) => {
+            if (chunkResolvers[month]) chunkResolvers[month](payload);
+        };
+
+        async function decodeChunk(payload) {
+            const bytes = Uint8Array.from(atob(payload), c => c.charCodeAt(0));
+            const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+            const cols = await new Response(stream).json();
+            return cols.id.map((id, i) => {
+                const deal = {};
+                Object.keys(cols).forEach(col => {
+                    deal[col] = rawData.dict[col] ? rawData.dict[col][cols[col][i]] : cols[col][i];
+                });
+                return deal;
+            });
+        }
+
+        function loadChunk(month) {
+            if (!chunkPromises[month]) {
+                chunkPromises[month] = new Promise((resolve, reject) => {
+                    const src = rawData.chunks[month];
+                    if (!src) return resolve(null);
+                    chunkResolvers[month] = resolve;
+                    const script = document.createElement('script');
+                    script.src = src;
+                    script.onerror = () => reject(new Error(`Não foi possível carregar ${src}`));
+                    document.head.appendChild(script);
+                }).then(payload => payload ? decodeChunk(payload) : []);
+                // Allow a retry after a failed load
+                chunkPromises[month].catch(() => { delete chunkPromises[month]; });
+            }
+            return chunkPromises[month];
+        }
+
+        async function loadDeals(months) {
+            const chunks = await Promise.all(months.map(loadChunk));
+            return [].concat(...chunks);
+        }
+
+        // Days since 1970-01-01 of a 'YYYY-MM-DD' string (same unit as the cube measures)
+        function dayNumber(str) {
+            if (!str) return null;
+            const [y, m, d] = str.split('-').map(Number);
+            return Date.UTC(y, m - 1, d) / 86400000;
+        }
+        const referenceDay = dayNumber(rawData.reference_date);
+
+        // A deal as rows of the four cubes (n = 1), to combine with the cube rows
+        function dealFacts(d) {
+            const created = dayNumber(d.created_at);
+            const updated = dayNumber(d.updated_at);
+            const closed = dayNumber(d.closed_at);
+            const won = d.status === 'won';
+            const ongoing = d.status === 'ongoing';
+            const hasCycle = won && created !== null && closed !== null;
+            return {
+                deals: [{
+                    pipeline: d.pipeline, clinic: d.clinic, agent: d.agent, stage: d.stage, status: d.status,
+                    n: 1, revenue: d.revenue,
+                    cycle_days: hasCycle ? closed - created : 0, cycle_n: hasCycle ? 1 : 0,
+                    created_days: ongoing && created !== null ? created : 0, created_n: ongoing && created !== null ? 1 : 0,
+                    stalled: ongoing && updated !== null && updated <= referenceDay - 15 ? 1 : 0
+                }],
+                channels: [{ channel: d.channel, status: d.status, n: 1 }],
+                treatments: [{ treatment: d.treatment, status: d.status, n: 1 }],
+                lost: d.status === 'lost' ? [{ lost_reason: d.lost_reason, n: 1 }] : []
+            };
+        }
 
         // Utility: Formatter for Currency
         const formatBRL = (val) => {
@@ -538,8 +745,8 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         // Setup Dropdown Filters
         function initFilters() {
             const pipelines = ['Todos', ...Object.keys(rawData.stages).sort()];
-            const clinics = ['Todos', ...[...new Set(rawData.deals.map(d => d.clinic).filter(c => c))].sort()];
-            const agents = ['Todos', ...[...new Set(rawData.deals.map(d => d.agent).filter(a => a))].sort()];
+            const clinics = ['Todos', ...rawData.dict.clinic.filter(c => c).sort()];
+            const agents = ['Todos', ...rawData.dict.agent.filter(a => a).sort()];
             
             // Populate Pipeline select
             const pipeSel = document.getElementById('filter-pipeline');
@@ -637,8 +844,8 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             });
         }
 
-        // Main In-Memory Filter Engine
-        function getFilteredDeals() {
+        // Current filter selections; start/end bound the creation date
+        function getFilters() {
             const pipe = document.getElementById('filter-pipeline').value;
             const clinic = document.getElementById('filter-clinic').value;
             const agent = document.getElementById('filter-agent').value;
@@ -662,32 +869,66 @@ HTML_TEMPLATE = """<!DOCTYPE html>
                 if (sVal) start = new Date(sVal + 'T00:00:00');
                 if (eVal) end = new Date(eVal + 'T23:59:59');
             }
+            return { pipe, clinic, agent, start, end };
+        }
+
+        // Pipeline / clinic / agent filters (deals and cube rows alike)
+        function matchesDimensions(row, f) {
+            if (f.pipe !== 'Todos' && row.pipeline !== f.pipe) return false;
+            if (f.clinic !== 'Todos' && row.clinic !== f.clinic) return false;
+            if (f.agent !== 'Todos' && row.agent !== f.agent) return false;
+            return true;
+        }
+
+        // Date range filter (based on created_at)
+        function matchesDates(deal, f) {
+            if (f.start || f.end) {
+                const cDate = parseDate(deal.created_at);
+                if (!cDate) return false;
+                if (f.start && cDate < f.start) return false;
+                if (f.end && cDate > f.end) return false;
+            }
+            return true;
+        }
+
+        // 'full': every deal created in the month passes the date filter, 'none': no deal does, 'partial': look at the deals
+        function monthCoverage(month, f) {
+            if (!f.start && !f.end) return 'full';
+            if (!month) return 'none';
+            const [y, m] = month.split('-').map(Number);
+            const first = new Date(y, m - 1, 1);
+            const last = new Date(y, m, 0);
+            if ((f.start && last < f.start) || (f.end && first > f.end)) return 'none';
+            if ((!f.start || first >= f.start) && (!f.end || last <= f.end)) return 'full';
+            return 'partial';
+        }
+
+        // Filtered rows of every cube: cube cells of the months inside the date range, plus the
+        // deals (as n = 1 rows) of the months the range only partly covers
+        async function getFilteredFacts(f) {
+            const coverage = {};
+            rawData.months.forEach(m => { coverage[m] = monthCoverage(m, f); });
             
-            return rawData.deals.filter(d => {
-                // Pipeline filter
-                if (pipe !== 'Todos' && d.pipeline !== pipe) return false;
-                
-                // Clinic filter
-                if (clinic !== 'Todos' && d.clinic !== clinic) return false;
-                
-                // Agent filter
-                if (agent !== 'Todos' && d.agent !== agent) return false;
-                
-                // Date range filter (based on created_at)
-                if (start || end) {
-                    const cDate = parseDate(d.created_at);
-                    if (!cDate) return false;
-                    if (start && cDate < start) return false;
-                    if (end && cDate > end) return false;
-                }
-                
-                return true;
+            const facts = {};
+            Object.keys(cubes).forEach(name => {
+                facts[name] = cubes[name].filter(r => coverage[r.month] === 'full' && matchesDimensions(r, f));
             });
+            
+            const partial = rawData.months.filter(m => coverage[m] === 'partial');
+            if (partial.length > 0) {
+                const deals = await loadDeals(partial);
+                deals.filter(d => matchesDimensions(d, f) && matchesDates(d, f)).forEach(d => {
+                    const rows = dealFacts(d);
+                    Object.keys(facts).forEach(name => facts[name].push(...rows[name]));
+                });
+            }
+            return facts;
         }
 
-        // Get Filtered and Text-Searched Deals for Tab 2
-        function getFilteredAndSearchedDeals() {
-            const deals = getFilteredDeals();
+        // Filtered and Text-Searched Deals for Tab 2 (loads the deal chunks of the date range)
+        async function getFilteredAndSearchedDeals(f) {
+            const months = rawData.months.filter(m => monthCoverage(m, f) !== 'none');
+            const deals = (await loadDeals(months)).filter(d => matchesDimensions(d, f) && matchesDates(d, f));
             const searchVal = document.getElementById('details-search').value.toLowerCase().trim();
             
             if (!searchVal) return deals;
@@ -702,9 +943,20 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
 
         // Dynamic Calculations
-        function updateDashboard() {
-            const deals = getFilteredDeals();
-            const pipe = document.getElementById('filter-pipeline').value;
+        async function updateDashboard() {
+            const token = ++renderToken;
+            const f = getFilters();
+            let facts;
+            try {
+                facts = await getFilteredFacts(f);
+            } catch (err) {
+                console.error(err);
+                return;
+            }
+            if (token !== renderToken) return;
+            const deals = facts.deals;
+            const pipe = f.pipe;
+            const sum = (rows, field) => rows.reduce((acc, r) => acc + r[field], 0);
             
             // 1. Calculate historical win rates per stage for forecasting
             const stageConversionRates = {};
@@ -713,10 +965,10 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             
             deals.forEach(d => {
                 if (d.status === 'won') {
-                    stageWon[d.stage] = (stageWon[d.stage] || 0) + 1;
-                    stageTotal[d.stage] = (stageTotal[d.stage] || 0) + 1;
+                    stageWon[d.stage] = (stageWon[d.stage] || 0) + d.n;
+                    stageTotal[d.stage] = (stageTotal[d.stage] || 0) + d.n;
                 } else if (d.status === 'lost') {
-                    stageTotal[d.stage] = (stageTotal[d.stage] || 0) + 1;
+                    stageTotal[d.stage] = (stageTotal[d.stage] || 0) + d.n;
                 }
             });
             
@@ -725,60 +977,32 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             });
 
             // 2. Compute KPIs
-            const total = deals.length;
-            const active = deals.filter(d => d.status === 'ongoing').length;
-            const won = deals.filter(d => d.status === 'won').length;
-            const lost = deals.filter(d => d.status === 'lost').length;
+            const total = sum(deals, 'n');
+            const active = sum(deals.filter(d => d.status === 'ongoing'), 'n');
+            const won = sum(deals.filter(d => d.status === 'won'), 'n');
+            const lost = sum(deals.filter(d => d.status === 'lost'), 'n');
             
             const winRate = (won + lost) > 0 ? (won / (won + lost) * 100) : 0.0;
             
             // Revenue metrics
             let rawActiveRevenue = 0.0;
             let weightedActiveRevenue = 0.0;
-            let wonRevenue = 0.0;
-            
-            // Use the latest update date in the dataset as the reference point for stalled calculations
-            const dates = deals.map(d => parseDate(d.updated_at)).filter(d => d !== null);
-            const today = dates.length > 0 ? new Date(Math.max(...dates)) : new Date();
             
-            // Stalled count
-            let stalledCount = 0;
-            
-            // Cycle Time calculation variables
-            let totalCycleDays = 0;
-            let wonDealsWithDates = 0;
-            let totalAgeDays = 0;
-            let activeDealsWithDates = 0;
-
-            deals.forEach(d => {
-                const created = parseDate(d.created_at);
-                const updated = parseDate(d.updated_at);
-                const closed = parseDate(d.closed_at);
-                
-                if (d.status === 'won') {
-                    wonRevenue += d.revenue;
-                    if (created && closed) {
-                        totalCycleDays += (closed - created) / (1000 * 60 * 60 * 24);
-                        wonDealsWithDates++;
-                    }
-                } else if (d.status === 'ongoing') {
-                    rawActiveRevenue += d.revenue;
-                    
-                    // Apply stage conversion probability as forecast weight
-                    const weight = stageConversionRates[d.stage] || 0.15; // default 15% if no history
-                    weightedActiveRevenue += (d.revenue * weight);
-                    
-                    if (created) {
-                        totalAgeDays += (today - created) / (1000 * 60 * 60 * 24);
-                        activeDealsWithDates++;
-                    }
-                    
-                    if (updated && (today - updated) / (1000 * 60 * 60 * 24) >= 15) {
-                        stalledCount++;
-                    }
-                }
+            deals.filter(d => d.status === 'ongoing').forEach(d => {
+                rawActiveRevenue += d.revenue;
+                // Apply stage conversion probability as forecast weight
+                const weight = stageConversionRates[d.stage] || 0.15; // default 15% if no history
+                weightedActiveRevenue += (d.revenue * weight);
             });
             
+            // Cycle time of won deals; age and stalled (no update in 15+ days) counted from the latest
+            // update in the dataset (rawData.reference_date)
+            const totalCycleDays = sum(deals, 'cycle_days');
+            const wonDealsWithDates = sum(deals, 'cycle_n');
+            const activeDealsWithDates = sum(deals, 'created_n');
+            const totalAgeDays = referenceDay * activeDealsWithDates - sum(deals, 'created_days');
+            const stalledCount = sum(deals, 'stalled');
+            
             const avgCycle = wonDealsWithDates > 0 ? Math.round(totalCycleDays / wonDealsWithDates) : 0;
             const avgAge = activeDealsWithDates > 0 ? Math.round(totalAgeDays / activeDealsWithDates) : 0;
 
@@ -792,21 +1016,21 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             document.getElementById('kpi-stalled').innerText = stalledCount.toLocaleString();
 
             // Render Sales Reps Leaderboard table
-            renderTeamTable(deals, today);
+            renderTeamTable(deals);
             
             // Draw / Update all charts
             renderFunnelChart(deals, pipe);
-            renderLostReasonsChart(deals);
+            renderLostReasonsChart(facts.lost);
             renderClinicsChart(deals);
-            renderTreatmentsChart(deals);
-            renderMarketingChart(deals);
+            renderTreatmentsChart(facts.treatments);
+            renderMarketingChart(facts.channels);
             
             // Render Details Table
             renderDetailsTable();
         }
 
         // Leaderboard table rendering
-        function renderTeamTable(deals, today) {
+        function renderTeamTable(deals) {
             const agentsData = {};
             deals.forEach(d => {
                 if (!d.agent) return;
@@ -816,19 +1040,15 @@ HTML_TEMPLATE = """<!DOCTYPE html>
                     };
                 }
                 const ag = agentsData[d.agent];
-                ag.total++;
-                if (d.status === 'ongoing') ag.active++;
+                ag.total += d.n;
+                if (d.status === 'ongoing') ag.active += d.n;
                 else if (d.status === 'won') {
-                    ag.won++;
+                    ag.won += d.n;
                     ag.revenue += d.revenue;
-                    const created = parseDate(d.created_at);
-                    const closed = parseDate(d.closed_at);
-                    if (created && closed) {
-                        ag.cycleSum += (closed - created) / (1000 * 60 * 60 * 24);
-                        ag.cycleCount++;
-                    }
+                    ag.cycleSum += d.cycle_days;
+                    ag.cycleCount += d.cycle_n;
                 }
-                else if (d.status === 'lost') ag.lost++;
+                else if (d.status === 'lost') ag.lost += d.n;
             });
 
             const agentsList = Object.values(agentsData).map(ag => {
@@ -853,8 +1073,30 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
 
         // Detailed Table pagination & rendering
-        function renderDetailsTable() {
-            const deals = getFilteredAndSearchedDeals();
+        async function renderDetailsTable() {
+            // Only the visible tab needs the deal chunks
+            if (document.getElementById('tab-content-details').classList.contains('hidden')) return;
+            const token = ++detailsToken;
+            const tbody = document.getElementById('details-table-body');
+            let deals;
+            try {
+                if (Object.keys(chunkPromises).length < rawData.months.length) {
+                    tbody.innerHTML = `
+                        <tr>
+                            <td colspan="10" class="py-8 text-center text-slate-500 font-semibold">Carregando oportunidades...</td>
+                        </tr>
+                    `;
+                }
+                deals = await getFilteredAndSearchedDeals(getFilters());
+            } catch (err) {
+                tbody.innerHTML = `
+                    <tr>
+                        <td colspan="10" class="py-8 text-center text-rose-400 font-semibold">${err.message}</td>
+                    </tr>
+                `;
+                return;
+            }
+            if (token !== detailsToken) return;
             const total = deals.length;
             const totalPages = Math.max(1, Math.ceil(total / pageSize));
             
@@ -865,7 +1107,6 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             const endIdx = Math.min(startIdx + pageSize, total);
             
             const pageDeals = deals.slice(startIdx, endIdx);
-            const tbody = document.getElementById('details-table-body');
             tbody.innerHTML = '';
             
             if (pageDeals.length === 0) {
@@ -986,7 +1227,7 @@ HTML_TEMPLATE = """<!DOCTYPE html>
                     }
                     const reachedIdx = getHighestReachedIndex(d);
                     return reachedIdx >= idx;
-                }).length;
+                }).reduce((acc, d) => acc + d.n, 0);
             });
             
             // Calculate Stage-to-Stage Conversions
@@ -1075,13 +1316,13 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
 
         // Lost Reasons doughnut chart
-        function renderLostReasonsChart(deals) {
+        function renderLostReasonsChart(lostRows) {
             const ctx = document.getElementById('chart-lost').getContext('2d');
             if (chartInstances.lost) chartInstances.lost.destroy();
 
             const counts = {};
-            deals.filter(d => d.status === 'lost').forEach(d => {
-                counts[d.lost_reason] = (counts[d.lost_reason] || 0) + 1;
+            lostRows.forEach(d => {
+                counts[d.lost_reason] = (counts[d.lost_reason] || 0) + d.n;
             });
 
             const sorted = Object.entries(counts).map(([reason, count]) => ({reason, count}))
@@ -1130,9 +1371,9 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             deals.forEach(d => {
                 if (!d.clinic) return;
                 if (!data[d.clinic]) data[d.clinic] = { total: 0, won: 0, lost: 0 };
-                data[d.clinic].total++;
-                if (d.status === 'won') data[d.clinic].won++;
-                else if (d.status === 'lost') data[d.clinic].lost++;
+                data[d.clinic].total += d.n;
+                if (d.status === 'won') data[d.clinic].won += d.n;
+                else if (d.status === 'lost') data[d.clinic].lost += d.n;
             });
 
             const clinics = Object.entries(data).map(([clinic, counts]) => {
@@ -1183,17 +1424,17 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
 
         // Treatment Analytics
-        function renderTreatmentsChart(deals) {
+        function renderTreatmentsChart(treatmentRows) {
             const ctx = document.getElementById('chart-treatments').getContext('2d');
             if (chartInstances.treatments) chartInstances.treatments.destroy();
 
             const data = {};
-            deals.forEach(d => {
+            treatmentRows.forEach(d => {
                 if (!d.treatment) return;
                 if (!data[d.treatment]) data[d.treatment] = { total: 0, won: 0, lost: 0 };
-                data[d.treatment].total++;
-                if (d.status === 'won') data[d.treatment].won++;
-                else if (d.status === 'lost') data[d.treatment].lost++;
+                data[d.treatment].total += d.n;
+                if (d.status === 'won') data[d.treatment].won += d.n;
+                else if (d.status === 'lost') data[d.treatment].lost += d.n;
             });
 
             const list = Object.entries(data).map(([treatment, counts]) => {
@@ -1244,17 +1485,17 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
 
         // Marketing Analytics
-        function renderMarketingChart(deals) {
+        function renderMarketingChart(channelRows) {
             const ctx = document.getElementById('chart-marketing').getContext('2d');
             if (chartInstances.marketing) chartInstances.marketing.destroy();
 
             const data = {};
-            deals.forEach(d => {
+            channelRows.forEach(d => {
                 if (!d.channel) return;
                 if (!data[d.channel]) data[d.channel] = { total: 0, won: 0, lost: 0 };
-                data[d.channel].total++;
-                if (d.status === 'won') data[d.channel].won++;
-                else if (d.status === 'lost') data[d.channel].lost++;
+                data[d.channel].total += d.n;
+                if (d.status === 'won') data[d.channel].won += d.n;
+                else if (d.status === 'lost') data[d.channel].lost += d.n;
             });
 
             const list = Object.entries(data).map(([channel, counts]) => {
@@ -1312,20 +1553,17 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 """
 
 def generate_dashboard():
-    deals, stages = fetch_data()
-    
-    dashboard_data = {
-        "deals": deals,
-        "stages": stages,
-        "updated_at": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    }
+    dashboard_data = fetch_data()
+    dashboard_data["updated_at"] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     
     # Compile template using simple replace to bypass f-string escaping limits
-    html_content = HTML_TEMPLATE.replace("__RAW_DATA__", json.dumps(dashboard_data, indent=4))
+    html_content = HTML_TEMPLATE.replace("__RAW_DATA__", json.dumps(dashboard_data, ensure_ascii=False, separators=(',', ':')))
     
     logger.info(f"Writing dashboard HTML output to: {OUTPUT_HTML}")
     with open(OUTPUT_HTML, "w", encoding="utf-8") as out:
         out.write(html_content)
+    logger.info(f"Dashboard HTML: {len(html_content.encode('utf-8')) / 1e6:.2f} MB "
+                f"(deal details in {len(dashboard_data['chunks'])} files under {DATA_DIR_NAME}/)")
         
     logger.info("=== DASHBOARD GENERATION COMPLETED SUCCESSFULLY ===")
 
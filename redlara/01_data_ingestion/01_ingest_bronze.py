@@ -1,13 +1,23 @@
-import pandas as pd
-import duckdb
+import sys
 from pathlib import Path
 import re
 import os
 
+# Add Huntington root directory to sys.path to resolve commons
+_script_dir = Path(__file__).resolve().parent
+_root_dir = _script_dir.parent.parent
+if str(_root_dir) not in sys.path:
+    sys.path.insert(0, str(_root_dir))
+
+from commons import duckdb_manager, ingestion_registry
+from commons.spreadsheet_reader import insert_sheet, read_workbooks
+
 # Configuration
 INPUT_DIR = Path(r"g:\My Drive\projetos_individuais\Huntington\redlara\data_input")
 DB_PATH = Path(r"g:\My Drive\projetos_individuais\Huntington\database\huntington_data_lake.duckdb")
 TABLE_NAME = "bronze.redlara_data"
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+HEADER_KEYWORDS = ['outcome', 'date', 'unidade', 'folder', 'chart', 'pin', 'patient']
 
 def get_metadata_from_path(file_path):
     """
@@ -53,100 +63,92 @@ def get_metadata_from_path(file_path):
             
     return year, unidade
 
+def find_fet_sheet(sheet_names):
+    """First sheet containing FET (case insensitive)"""
+    return [s for s in sheet_names if 'FET' in s.upper()][:1]
+
+def detect_header_row(rows):
+    """Dynamic header detection: first of the top rows with at least 2 header keywords"""
+    for idx, row in enumerate(rows):
+        row_str = " ".join(str(x).lower() for x in row)
+        matches = sum(1 for k in HEADER_KEYWORDS if k in row_str)
+        if matches >= 2:  # Threshold: at least 2 keywords found
+            return idx
+    return None
+
+def get_table_name(file_path):
+    """bronze.redlara_<filename without extension, sanitized>"""
+    safe_name = file_path.stem.lower().strip().replace(' ', '_').replace('.', '_').replace('-', '_')
+    
+    # Avoid double prefix if filename already starts with redlara_
+    if safe_name.startswith('redlara_'):
+        return f"bronze.{safe_name}"
+    return f"bronze.redlara_{safe_name}"
+
 def ingest_data():
-    conn = duckdb.connect(str(DB_PATH))
+    conn = duckdb_manager.connect(str(DB_PATH))
     conn.execute("CREATE SCHEMA IF NOT EXISTS bronze")
     
-    # Cleanup existing tables
-    print("Cleaning up existing bronze.redlara_% tables...")
-    tables = conn.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='bronze' AND table_name LIKE 'redlara_%'").fetchall()
-    for t in tables:
-        conn.execute(f"DROP TABLE IF EXISTS bronze.{t[0]}")
-    print(f"Dropped {len(tables)} tables.")
-
-    # 1. list all xlsx files
+    # 1. list all xlsx files and check them against the ingestion registry
     files = list(INPUT_DIR.rglob("*.xlsx"))
     print(f"Found {len(files)} files.")
+    statuses = {f: ingestion_registry.check(conn, str(f)) for f in files}
+    changed = [f for f in files if not statuses[f].unchanged]
+    for f in files:
+        if statuses[f].unchanged:
+            print(f"Skipping unchanged {f.name} ({statuses[f].reason})")
+    
+    # Cleanup: drop the tables of changed files and of files no longer in the input folder;
+    # tables of unchanged files are kept
+    print("Cleaning up bronze.redlara_% tables of changed or removed files...")
+    keep = {get_table_name(f) for f in files if statuses[f].unchanged}
+    tables = conn.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='bronze' AND table_name LIKE 'redlara_%'").fetchall()
+    dropped = 0
+    for t in tables:
+        if f"bronze.{t[0]}" not in keep:
+            conn.execute(f"DROP TABLE IF EXISTS bronze.{t[0]}")
+            dropped += 1
+    ingestion_registry.forget_missing(conn, [str(f) for f in files], str(INPUT_DIR))
+    print(f"Dropped {dropped} tables, kept {len(keep)} unchanged.")
     
-    for i, file_path in enumerate(files):
-        print(f"Processing ({i+1}/{len(files)}): {file_path.name}")
+    # 2. Read the 'FET' sheet of each changed workbook (one pass per file, in parallel processes)
+    jobs = [(str(f), {'sheets': find_fet_sheet, 'detect_header': detect_header_row}) for f in changed]
+    for i, (path, result) in enumerate(read_workbooks(jobs, max_workers=MAX_WORKERS)):
+        file_path = Path(path)
+        print(f"Processing ({i+1}/{len(changed)}): {file_path.name} ({statuses[file_path].reason})")
         
         try:
-            # 2. Extract metadata
-            year, unidade = get_metadata_from_path(file_path)
-            print(f"  Metadata - Year: {year}, Unidade: {unidade}")
-            
-            # 3. Read Excel (find 'FET' sheet)
-            try:
-                xls = pd.ExcelFile(file_path, engine='openpyxl')
-                sheet_names = xls.sheet_names
-                
-                # Find sheet containing FET (case insensitive)
-                fet_sheet = next((s for s in sheet_names if 'FET' in s.upper()), None)
-                
-                if fet_sheet:
-                    print(f"  Found 'FET' sheet: '{fet_sheet}'")
-                    
-                    # Dynamic Header Detection
-                    # Read first 20 rows without header to find the true header row
-                    df_preview = pd.read_excel(file_path, sheet_name=fet_sheet, engine='openpyxl', header=None, nrows=20)
-                    
-                    header_row_idx = 0 # Default
-                    keywords = ['outcome', 'date', 'unidade', 'folder', 'chart', 'pin', 'patient']
-                    
-                    found_header = False
-                    for idx, row in df_preview.iterrows():
-                        # Convert row to string and check for keywords
-                        row_str = " ".join([str(x).lower() for x in row.values])
-                        matches = sum(1 for k in keywords if k in row_str)
-                        if matches >= 2: # Threshold: at least 2 keywords found
-                            header_row_idx = idx
-                            print(f"  Detected header at row index: {idx}")
-                            found_header = True
-                            break
-                    
-                    if not found_header:
-                        print("  Warning: Could not detect header row with keywords. Defaulting to 0.")
-
-                    # Read actual data with detected header
-                    df = pd.read_excel(file_path, sheet_name=fet_sheet, engine='openpyxl', header=header_row_idx)
-                else:
-                    print(f"  Warning: No sheet containing 'FET' found in {file_path.name}. Available: {sheet_names}")
-                    continue
-
-            except Exception as e:
-                print(f"  Error reading {file_path.name}: {e}")
+            if isinstance(result, Exception):
+                print(f"  Error reading {file_path.name}: {result}")
                 continue
+            if not result:
+                print(f"  Warning: No sheet containing 'FET' found in {file_path.name}")
+                ingestion_registry.record(conn, statuses[file_path], [], 0)
+                continue
+            sheet = result[0]
+            print(f"  Found 'FET' sheet: '{sheet.name}'")
+            if sheet.header_detected:
+                print(f"  Detected header at row index: {sheet.header_row}")
+            else:
+                print("  Warning: Could not detect header row with keywords. Defaulting to 0.")
             
-            # 4. Add metadata
-            df['year'] = year
-            df['unidade'] = unidade
-            
-            # Clean column names
-            # df.columns = [str(c).lower().strip().replace(' ', '_').replace('/', '_').replace('-', '_') for c in df.columns]
-            # User requested original headers
-            df.columns = [str(c).strip() for c in df.columns]
-            
-            # Cast to string
-            df = df.astype(str)
-            df = df.replace('nan', None)
-
-            # 5. Generate Table Name
-            # bronze.redlara_<filename without extension, sanitized>
-            safe_name = file_path.stem.lower().strip().replace(' ', '_').replace('.', '_').replace('-', '_')
+            # 3. Extract metadata
+            year, unidade = get_metadata_from_path(file_path)
+            print(f"  Metadata - Year: {year}, Unidade: {unidade}")
             
-            # Avoid double prefix if filename already starts with redlara_
-            if safe_name.startswith('redlara_'):
-                table_name = f"bronze.{safe_name}"
-            else:
-                table_name = f"bronze.redlara_{safe_name}"
+            # 4. Generate Table Name
+            table_name = get_table_name(file_path)
             
             print(f"  Writing to table: {table_name}")
 
-            # 6. Write to DuckDB
-            conn.register('df_view', df)
-            conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df_view")
-            conn.unregister('df_view')
+            # 5. Write to DuckDB: original headers (stripped), all values as strings, plus year/unidade
+            rows = insert_sheet(
+                conn, table_name, sheet,
+                columns=[str(c).strip() for c in sheet.columns],
+                metadata={'year': str(year) if year is not None else None, 'unidade': unidade},
+                line_number_column=None, create=True
+            )
+            ingestion_registry.record(conn, statuses[file_path], [table_name], rows)
             print("  Successfully created table.")
             
         except Exception as e:
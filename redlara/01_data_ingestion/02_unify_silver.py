@@ -1,5 +1,4 @@
 import sys
-import duckdb
 from pathlib import Path
 
 # Add Huntington root directory to sys.path to resolve commons
@@ -8,6 +7,7 @@ _root_dir = _script_dir.parent.parent
 if str(_root_dir) not in sys.path:
     sys.path.insert(0, str(_root_dir))
 
+from commons import duckdb_manager
 from commons.prontuario_matching_v1 import find_prontuarios
 
 # Updated DB Path to 'database' folder
@@ -363,7 +363,7 @@ TABLE_CONFIGS = {
 }
 
 def unify_tables():
-    conn = duckdb.connect(str(DB_PATH))
+    conn = duckdb_manager.connect(str(DB_PATH))
     conn.execute("CREATE SCHEMA IF NOT EXISTS silver")
     
     union_parts = []
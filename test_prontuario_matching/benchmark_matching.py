@@ -0,0 +1,473 @@
+"""
+benchmark_matching.py
+=====================
+Reproducible performance benchmark for the patient matching engines.
+
+For every requested size it generates (once, cached under database/benchmark/)
+a synthetic Clinisys silver.view_pacientes and a source table with a known
+expected prontuario per row, covering:
+  - exact wife names on the direct ID (Tier 0)
+  - first-name typos (adjacent letter swap)
+  - spouse folders (husband name under the wife's codigo)
+  - "LAST, FIRST" names on a secondary prontuario link column (Tier 3)
+  - CPF-only rows with punctuation noise (Tier 1)
+  - name-less rows with exact or day-1 birthdates (Tier 2)
+  - noise rows that must stay unmatched
+
+Each engine run records total time, the per-phase `_t()` checkpoints, peak
+process RSS, candidate pairs scored (production engine), match rate and
+precision against the expected prontuario. Results are appended to
+benchmark_history.jsonl; a run fails (exit code 1) when the match counts
+differ from the previous run of the same engine/size/seed, or when the
+elapsed time regresses beyond --tolerance versus the median of previous runs.
+
+Usage
+-----
+  python benchmark_matching.py                                # 100k rows, prod + L
+  python benchmark_matching.py --sizes 100000 1000000 10000000
+  python benchmark_matching.py --engines prod g h i j l --sizes 100000
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import statistics
+import threading
+import time
+from datetime import datetime
+import duckdb
+import psutil
+
+# --- Logging Setup ---
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_LOG_DIR = os.path.join(_HERE, "logs")
+os.makedirs(_LOG_DIR, exist_ok=True)
+
+log_file = os.path.join(_LOG_DIR, f"benchmark_matching_{datetime.now():%Y%m%d_%H%M%S}.log")
+formatter = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+
+fh = logging.FileHandler(log_file, encoding="utf-8")
+fh.setFormatter(formatter)
+sh = logging.StreamHandler(sys.stdout)
+sh.setFormatter(formatter)
+logging.basicConfig(level=logging.INFO, handlers=[sh, fh])
+
+# --- Paths ---
+DB_DIR = os.path.abspath(os.path.join(_HERE, "..", "database"))
+BENCH_DIR = os.path.join(DB_DIR, "benchmark")
+HISTORY_PATH = os.path.join(_HERE, "benchmark_history.jsonl")
+
+sys.path.insert(0, os.path.dirname(_HERE))
+sys.path.insert(0, _HERE)
+
+# Bump when the generated data changes, so cached datasets are rebuilt and
+# history entries are not compared across generator versions.
+GENERATOR_VERSION = 1
+
+# Source rows per Clinisys patient
+SOURCE_ROWS_PER_PATIENT = 4
+
+FIRST_F = ["maria", "ana", "juliana", "fernanda", "priscilla", "cinthia", "daniela", "nelia",
+           "gabriela", "camila", "patricia", "luciana", "adriana", "beatriz", "carolina", "jocileide"]
+FIRST_M = ["joao", "jose", "carlos", "pedro", "paulo", "marcos", "lucas", "rafael", "gabriel", "bruno"]
+# Secondary prontuario link columns of the real view_pacientes (engine G
+# references them by name); left empty in the synthetic data.
+EXTRA_LINK_COLUMNS = [
+    "prontuario_esposa_pel", "prontuario_marido_pel", "prontuario_esposa_pc", "prontuario_marido_pc",
+    "prontuario_responsavel1", "prontuario_responsavel2", "prontuario_responsavel1_pc",
+    "prontuario_responsavel2_pc", "prontuario_esposa_fc", "prontuario_marido_fc",
+    "prontuario_esposa_ba", "prontuario_marido_ba",
+]
+LAST = ["silva", "santos", "oliveira", "souza", "lima", "pereira", "costa", "branco", "sonego",
+        "lobo", "gomes", "metello", "grando", "almeida", "ferreira", "rodrigues", "carvalho", "ribeiro"]
+
+
+def _sql_list(values):
+    return "[" + ", ".join(f"'{v}'" for v in values) + "]"
+
+
+def _pick(values, seed_expr):
+    """SQL: deterministic pseudo-random element of `values` for a seed expression."""
+    return f"list_element({_sql_list(values)}, CAST(hash({seed_expr}) % {len(values)} AS INTEGER) + 1)"
+
+
+# ── Dataset generation ───────────────────────────────────────────────────────
+
+def generate_clinisys(path: str, n_patients: int, seed: int) -> None:
+    """Synthetic clinisys_all.duckdb with silver.view_pacientes (dynamic-schema compatible)."""
+    with duckdb.connect(path) as con:
+        con.execute("CREATE SCHEMA IF NOT EXISTS silver")
+        con.execute(f"""
+            CREATE OR REPLACE TABLE silver.view_pacientes AS
+            WITH base AS (
+                SELECT
+                    i,
+                    100000 + i AS codigo,
+                    {_pick(FIRST_F, f"i, {seed}, 'ef'")} AS esposa_first,
+                    {_pick(LAST, f"i, {seed}, 'el1'")} AS esposa_last1,
+                    {_pick(LAST, f"i, {seed}, 'el2'")} AS esposa_last2,
+                    {_pick(FIRST_M, f"i, {seed}, 'mf'")} AS marido_first
+                FROM range({n_patients}) t(i)
+            )
+            SELECT
+                codigo,
+                CASE WHEN hash(i, {seed}, 'inativo') % 20 = 0 THEN '1' ELSE '0' END AS inativo,
+                upper(esposa_first || ' ' || esposa_last1 || ' ' || esposa_last2) AS esposa_nome,
+                CASE WHEN hash(i, {seed}, 'ecpf') % 10 < 7
+                     THEN lpad(CAST(hash(i, {seed}, 'ecpfv') % 99999999999 AS VARCHAR), 11, '0') END AS esposa_cpf,
+                strftime(DATE '1960-01-01' + CAST(hash(i, {seed}, 'ebd') % 12000 AS INTEGER), '%d/%m/%Y') AS esposa_nascimento,
+                upper(marido_first || ' ' || esposa_last2) AS marido_nome,
+                CASE WHEN hash(i, {seed}, 'mcpf') % 10 < 5
+                     THEN lpad(CAST(hash(i, {seed}, 'mcpfv') % 99999999999 AS VARCHAR), 11, '0') END AS marido_cpf,
+                strftime(DATE '1955-01-01' + CAST(hash(i, {seed}, 'mbd') % 12000 AS INTEGER), '%d/%m/%Y') AS marido_nascimento,
+                CASE WHEN hash(i, {seed}, 'resp') % 10 = 0
+                     THEN upper({_pick(FIRST_F, f"i, {seed}, 'rf'")} || ' ' || esposa_last1) END AS responsavel_nome,
+                CAST(NULL AS VARCHAR) AS responsavel_cpf,
+                CAST(NULL AS VARCHAR) AS responsavel_nascimento,
+                CASE WHEN hash(i, {seed}, 'link') % 10 < 3 THEN CAST(5000000 + i AS VARCHAR) END AS prontuario_esposa,
+                CASE WHEN hash(i, {seed}, 'mlink') % 10 = 0 THEN CAST(8000000 + i AS VARCHAR) END AS prontuario_marido,
+                {", ".join(f"CAST(NULL AS VARCHAR) AS {c}" for c in EXTRA_LINK_COLUMNS)}
+            FROM base
+        """)
+
+
+def generate_source(path: str, clinisys_path: str, n_rows: int, n_patients: int, seed: int) -> None:
+    """Synthetic source table main.bench_source with expected_prontuario ground truth."""
+    with duckdb.connect(path) as con:
+        con.execute(f"ATTACH '{clinisys_path}' AS clin (READ_ONLY)")
+        con.execute(f"""
+            CREATE OR REPLACE TABLE main.bench_source AS
+            WITH rows AS (
+                SELECT
+                    j,
+                    100000 + CAST(hash(j, {seed}, 'p') % {n_patients} AS BIGINT) AS codigo,
+                    CAST(hash(j, {seed}, 'case') % 100 AS INTEGER) AS case_pct
+                FROM range({n_rows}) t(j)
+            ),
+            joined AS (
+                SELECT r.*, p.* EXCLUDE (codigo),
+                       lower(split_part(p.esposa_nome, ' ', 1)) AS first_lc
+                FROM rows r
+                JOIN clin.silver.view_pacientes p USING (codigo)
+            )
+            SELECT
+                CASE
+                    WHEN case_pct < 70 OR case_pct BETWEEN 88 AND 94 THEN CAST(codigo AS VARCHAR)
+                    WHEN case_pct < 80 THEN COALESCE(prontuario_esposa, CAST(codigo AS VARCHAR))
+                    WHEN case_pct < 88 THEN CAST(9000000 + j AS VARCHAR)
+                    ELSE CAST(20000000 + j AS VARCHAR)
+                END AS id,
+                CASE
+                    -- exact wife name
+                    WHEN case_pct < 50 THEN esposa_nome
+                    -- first-name typo: swap 2nd and 3rd letters
+                    WHEN case_pct < 60 THEN upper(
+                        substr(first_lc, 1, 1) || substr(first_lc, 3, 1) || substr(first_lc, 2, 1) || substr(first_lc, 4)
+                    ) || substr(esposa_nome, length(first_lc) + 1)
+                    -- spouse folder: husband's name under the wife's codigo
+                    WHEN case_pct < 70 THEN marido_nome
+                    -- 'LAST, FIRST' format on the secondary link column
+                    WHEN case_pct < 80 THEN upper(split_part(esposa_nome, ' ', -1) || ', ' || split_part(esposa_nome, ' ', 1))
+                    -- CPF-only rows
+                    WHEN case_pct < 88 THEN esposa_nome
+                    -- birthdate-only rows
+                    WHEN case_pct < 95 THEN NULL
+                    -- noise
+                    ELSE upper({_pick(FIRST_F, f"j, {seed}, 'nf'")} || ' ' || {_pick(LAST, f"j, {seed}, 'nl'")})
+                END AS name,
+                CASE
+                    WHEN case_pct BETWEEN 88 AND 91 THEN CAST(try_strptime(esposa_nascimento, '%d/%m/%Y') AS DATE)
+                    WHEN case_pct BETWEEN 92 AND 94 THEN CAST(date_trunc('month', try_strptime(esposa_nascimento, '%d/%m/%Y')) AS DATE)
+                END AS birthdate,
+                CASE
+                    WHEN case_pct BETWEEN 80 AND 87 AND esposa_cpf IS NOT NULL THEN
+                        substr(esposa_cpf, 1, 3) || '.' || substr(esposa_cpf, 4, 3) || '.' ||
+                        substr(esposa_cpf, 7, 3) || '-' || substr(esposa_cpf, 10, 2)
+                END AS cpf,
+                CAST(NULL AS VARCHAR) AS prontuario_old,
+                CASE
+                    WHEN case_pct >= 95 THEN -1
+                    WHEN case_pct BETWEEN 80 AND 87 AND esposa_cpf IS NULL THEN -1
+                    ELSE codigo
+                END AS expected_prontuario,
+                case_pct
+            FROM joined
+        """)
+
+
+def ensure_dataset(n_rows: int, seed: int):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    n_patients = max(n_rows // SOURCE_ROWS_PER_PATIENT, 1)
+    stem = f"g{GENERATOR_VERSION}_s{seed}_n{n_rows}"
+    clinisys_path = os.path.join(BENCH_DIR, f"clinisys_{stem}.duckdb")
+    source_path = os.path.join(BENCH_DIR, f"source_{stem}.duckdb")
+    if not (os.path.exists(clinisys_path) and os.path.exists(source_path)):
+        t0 = time.perf_counter()
+        logging.info("Generating dataset %s (%d patients, %d source rows)...", stem, n_patients, n_rows)
+        for p in (clinisys_path, source_path):
+            if os.path.exists(p):
+                os.remove(p)
+        generate_clinisys(clinisys_path, n_patients, seed)
+        generate_source(source_path, clinisys_path, n_rows, n_patients, seed)
+        logging.info("Dataset generated in %.1f seconds.", time.perf_counter() - t0)
+    return clinisys_path, source_path
+
+
+# ── Engines ──────────────────────────────────────────────────────────────────
+
+def _run_prod(con, clinisys_path):
+    from commons.prontuario_matching_v1 import find_prontuarios_batch
+    results = find_prontuarios_batch(
+        source_con=con,
+        clinisys_db_path=clinisys_path,
+        sources=[{
+            "source_schema": "main", "source_table": "bench_run", "id_col": "id",
+            "name_col": "name", "birthdate_col": "birthdate", "cpf_col": "cpf", "label": "bench_prod",
+        }],
+        use_cache=False,
+    )
+    return results["bench_prod"]
+
+
+def _legacy_engine(letter, full_signature=True):
+    def run(con, clinisys_path):
+        module = __import__(f"matching_engine_{letter}")
+        fn = getattr(module, f"run_strategy_{letter}")
+        kwargs = dict(source_con=con, clinisys_db_path=clinisys_path, source_schema="main",
+                      source_table="bench_run", id_col="id", name_col="name", label=f"bench_{letter}")
+        if full_signature:
+            kwargs.update(birthdate_col="birthdate", cpf_col="cpf")
+        return fn(**kwargs)
+    return run
+
+
+ENGINES = {
+    "prod": _run_prod,
+    "e": _legacy_engine("e", full_signature=False),
+    "f": _legacy_engine("f", full_signature=False),
+    "g": _legacy_engine("g"),
+    "h": _legacy_engine("h"),
+    "i": _legacy_engine("i"),
+    "j": _legacy_engine("j"),
+    "l": _legacy_engine("l"),
+}
+
+
+# ── Measurement helpers ──────────────────────────────────────────────────────
+
+class _PhaseCapture(logging.Handler):
+    """Collects `_t()` checkpoints and pair counts logged by the engines."""
+
+    def __init__(self):
+        super().__init__()
+        self.phases = []
+        self.pairs_scored = None
+        self.pairs_total = None
+
+    def emit(self, record):
+        msg = str(record.msg)
+        if msg.lstrip().startswith("[T]") and record.args:
+            label, ms = record.args
+            self.phases.append({"phase": label, "ms": round(float(ms), 1)})
+        elif "Name scoring:" in msg and record.args:
+            self.pairs_scored, self.pairs_total = record.args[1], record.args[2]
+
+
+class _PeakRSS:
+    """Samples process RSS in a background thread (DuckDB runs in-process)."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._proc = psutil.Process()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._proc.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._proc.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_engine(engine, n_rows, seed, clinisys_path, source_path):
+    con = duckdb.connect(source_path)
+    try:
+        con.execute("CREATE OR REPLACE TABLE main.bench_run AS SELECT * FROM main.bench_source")
+        capture = _PhaseCapture()
+        root = logging.getLogger()
+        root.addHandler(capture)
+        try:
+            with _PeakRSS() as rss:
+                t0 = time.perf_counter()
+                df = ENGINES[engine](con, clinisys_path)
+                elapsed = time.perf_counter() - t0
+        finally:
+            root.removeHandler(capture)
+
+        con.register("__bench_result", df[["source_id", "patient_name", "prontuario"]])
+        total_rows, matched, correct, wrong = con.execute("""
+            WITH res AS (
+                SELECT DISTINCT source_id, patient_name, CAST(prontuario AS BIGINT) AS prontuario
+                FROM __bench_result
+            )
+            SELECT
+                COUNT(*),
+                COUNT(*) FILTER (WHERE COALESCE(r.prontuario, -1) != -1),
+                COUNT(*) FILTER (WHERE COALESCE(r.prontuario, -1) != -1 AND r.prontuario = s.expected_prontuario),
+                COUNT(*) FILTER (WHERE COALESCE(r.prontuario, -1) != -1 AND r.prontuario != s.expected_prontuario)
+            FROM main.bench_source s
+            LEFT JOIN res r
+                   ON r.source_id = s.id
+                  AND r.patient_name IS NOT DISTINCT FROM s.name
+        """).fetchone()
+        con.unregister("__bench_result")
+    finally:
+        con.execute("DROP TABLE IF EXISTS main.bench_run")
+        con.close()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "engine": engine,
+        "n_rows": n_rows,
+        "seed": seed,
+        "generator_version": GENERATOR_VERSION,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "duckdb_version": duckdb.__version__,
+        "elapsed_s": round(elapsed, 3),
+        "peak_rss_mb": round(rss.peak / 1024 ** 2, 1),
+        "phases": capture.phases,
+        "pairs_scored": capture.pairs_scored,
+        "pairs_total": capture.pairs_total,
+        "total_rows": total_rows,
+        "matched_rows": matched,
+        "correct_rows": correct,
+        "wrong_rows": wrong,
+        "match_rate": round(matched / total_rows * 100, 4) if total_rows else 0.0,
+        "precision": round(correct / matched * 100, 4) if matched else 0.0,
+    }
+
+
+# ── History / regression checks ──────────────────────────────────────────────
+
+def load_history():
+    if not os.path.exists(HISTORY_PATH):
+        return []
+    with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_against_history(result, history, tolerance, window, min_delta):
+    """Return a list of failure messages for this result."""
+    same = [
+        h for h in history
+        if h["engine"] == result["engine"] and h["n_rows"] == result["n_rows"]
+        and h["seed"] == result["seed"] and h.get("generator_version") == result["generator_version"]
+    ]
+    if not same:
+        logging.info("[%s/%d] No previous runs, baseline recorded.", result["engine"], result["n_rows"])
+        return []
+
+    failures = []
+    last = same[-1]
+    for key in ("matched_rows", "correct_rows", "wrong_rows"):
+        if last[key] != result[key]:
+            failures.append(f"{key} changed: {last[key]} -> {result[key]}")
+
+    comparable = [h for h in same if h.get("host") == result["host"]][-window:]
+    if comparable:
+        baseline = statistics.median(h["elapsed_s"] for h in comparable)
+        ratio = result["elapsed_s"] / baseline if baseline else 1.0
+        logging.info("[%s/%d] %.2fs vs median %.2fs of last %d runs (x%.2f)",
+                     result["engine"], result["n_rows"], result["elapsed_s"], baseline, len(comparable), ratio)
+        # Sub-second runs jitter by more than any sensible ratio; require an absolute slowdown too
+        if ratio > 1 + tolerance and result["elapsed_s"] - baseline > min_delta:
+            failures.append(f"time regression: {result['elapsed_s']:.2f}s vs median {baseline:.2f}s (x{ratio:.2f})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Patient matching performance benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000], help="Source row counts")
+    parser.add_argument("--engines", nargs="+", default=["prod", "l"], choices=sorted(ENGINES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown vs median of previous runs (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.5,
+                        help="Minimum absolute slowdown in seconds before a regression is flagged")
+    parser.add_argument("--window", type=int, default=5, help="Previous runs used for the time median")
+    parser.add_argument("--no-history", action="store_true", help="Do not append results to the history file")
+    args = parser.parse_args()
+
+    history = load_history()
+    failures = []
+    results = []
+
+    for n_rows in args.sizes:
+        clinisys_path, source_path = ensure_dataset(n_rows, args.seed)
+        index_build_s = None
+        if "prod" in args.engines:
+            # Production reads the persisted matching index; build it (or reuse it)
+            # outside the timed region, as 02_03_build_matching_index does upstream.
+            from commons.prontuario_matching_v1 import build_matching_index
+            t0 = time.perf_counter()
+            build_matching_index(clinisys_path)
+            index_build_s = round(time.perf_counter() - t0, 3)
+            logging.info("Matching index ready in %.2f seconds.", index_build_s)
+        for engine in args.engines:
+            logging.info("=" * 60)
+            logging.info("BENCHMARK engine=%s rows=%d seed=%d", engine, n_rows, args.seed)
+            logging.info("=" * 60)
+            result = run_engine(engine, n_rows, args.seed, clinisys_path, source_path)
+            if engine == "prod":
+                result["index_build_s"] = index_build_s
+            results.append(result)
+            logging.info("[%s/%d] %.2fs | peak RSS %.0f MB | match %.2f%% | precision %.2f%% | pairs scored %s",
+                         engine, n_rows, result["elapsed_s"], result["peak_rss_mb"],
+                         result["match_rate"], result["precision"], result["pairs_scored"])
+            for msg in check_against_history(result, history, args.tolerance, args.window, args.min_delta):
+                failures.append(f"[{engine}/{n_rows}] {msg}")
+
+        # Strategy L and the production engine implement the same rules
+        by_engine = {r["engine"]: r for r in results if r["n_rows"] == n_rows}
+        if "prod" in by_engine and "l" in by_engine:
+            if by_engine["prod"]["matched_rows"] != by_engine["l"]["matched_rows"]:
+                failures.append(
+                    f"[prod/l/{n_rows}] match parity: prod={by_engine['prod']['matched_rows']} "
+                    f"l={by_engine['l']['matched_rows']}"
+                )
+
+    if not args.no_history:
+        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+        logging.info("Appended %d results to %s", len(results), HISTORY_PATH)
+
+    logging.info("=" * 60)
+    logging.info("%-6s %10s %10s %10s %9s %9s %12s", "engine", "rows", "time_s", "rss_mb", "match%", "prec%", "pairs")
+    for r in results:
+        logging.info("%-6s %10d %10.2f %10.0f %9.2f %9.2f %12s", r["engine"], r["n_rows"], r["elapsed_s"],
+                     r["peak_rss_mb"], r["match_rate"], r["precision"], r["pairs_scored"])
+    logging.info("=" * 60)
+
+    if failures:
+        for msg in failures:
+            logging.error("REGRESSION %s", msg)
+        sys.exit(1)
+    logging.info("No regressions detected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+run_blocking_parity.py
+======================
+Runs the production engine (commons.prontuario_matching_v1) on
+main.mapped_patients in database/test_mapped_patients.duckdb twice — with and
+without blocking-key pruning of score_name — and verifies that prontuario,
+match tier and name score are identical for every source row.
+
+Writes prontuario_BP0 / prontuario_BP1 (+ clinisys name columns) to the test
+table so the two runs can be inspected side by side.
+"""
+
+import os
+import sys
+import logging
+import time
+from datetime import datetime
+import duckdb
+
+# --- Logging Setup ---
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_LOG_DIR = os.path.join(_HERE, "logs")
+os.makedirs(_LOG_DIR, exist_ok=True)
+
+log_file = os.path.join(_LOG_DIR, f"run_blocking_parity_{datetime.now():%Y%m%d_%H%M%S}.log")
+formatter = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s")
+
+fh = logging.FileHandler(log_file, encoding="utf-8")
+fh.setFormatter(formatter)
+sh = logging.StreamHandler(sys.stdout)
+sh.setFormatter(formatter)
+logging.basicConfig(level=logging.INFO, handlers=[sh, fh])
+
+# --- Paths ---
+DB_DIR = os.path.abspath(os.path.join(_HERE, "..", "database"))
+CLINISYS_DB = os.path.join(DB_DIR, "clinisys_all.duckdb")
+SOURCE_DB = os.path.join(DB_DIR, "test_mapped_patients.duckdb")
+
+logging.info("Source DB   : %s", SOURCE_DB)
+logging.info("Clinisys DB : %s", CLINISYS_DB)
+logging.info("Log file    : %s", log_file)
+
+sys.path.insert(0, os.path.dirname(_HERE))
+from commons.prontuario_matching_v1 import find_prontuarios_batch
+
+KEY_COLS = ["source_id", "patient_name"]
+COMPARE_COLS = ["prontuario", "match_tier", "name_score"]
+
+
+def run(con, suffix, block_pruning):
+    cols_df = con.execute("PRAGMA table_info('main.mapped_patients')").df()
+    existing_cols = {c.lower() for c in cols_df["name"]}
+    for col in [f"prontuario{suffix}", f"clinisys_name{suffix}", f"clinisys_matched_name{suffix}"]:
+        if col.lower() in existing_cols:
+            con.execute(f"UPDATE main.mapped_patients SET {col} = NULL")
+
+    t_start = time.perf_counter()
+    results = find_prontuarios_batch(
+        source_con=con,
+        clinisys_db_path=CLINISYS_DB,
+        sources=[{
+            "source_schema": "main",
+            "source_table": "mapped_patients",
+            "id_col": "id",
+            "name_col": "name",
+            "birthdate_col": "birthdate",
+            "cpf_col": "cpf",
+            "label": f"mapped_patients{suffix}",
+        }],
+        suffix=suffix,
+        use_cache=False,
+        block_pruning=block_pruning,
+    )
+    duration = time.perf_counter() - t_start
+    logging.info("block_pruning=%s completed in %.2f seconds.", block_pruning, duration)
+    return results[f"mapped_patients{suffix}"], duration
+
+
+def main():
+    if not os.path.exists(CLINISYS_DB):
+        logging.error("Clinisys DB not found. Make sure it exists.")
+        sys.exit(1)
+    if not os.path.exists(SOURCE_DB):
+        logging.error("Source DB not found. Run create_test_db.py first.")
+        sys.exit(1)
+
+    con = duckdb.connect(SOURCE_DB)
+    try:
+        df_full, t_full = run(con, "_BP0", block_pruning=False)
+        df_pruned, t_pruned = run(con, "_BP1", block_pruning=True)
+
+        merged = df_full.merge(df_pruned, on=KEY_COLS, how="outer", suffixes=("_full", "_pruned"), indicator=True)
+        mismatch = merged["_merge"] != "both"
+        for col in COMPARE_COLS:
+            a = merged[f"{col}_full"].astype("string").fillna("<NA>")
+            b = merged[f"{col}_pruned"].astype("string").fillna("<NA>")
+            mismatch |= a != b
+
+        table_diff = con.execute("""
+            SELECT COUNT(*) FROM main.mapped_patients
+            WHERE prontuario_BP0 IS DISTINCT FROM prontuario_BP1
+        """).fetchone()[0]
+
+        logging.info("=" * 60)
+        logging.info("BLOCKING PARITY")
+        logging.info("=" * 60)
+        logging.info("Source tuples compared     : %d", len(merged))
+        logging.info("Decision mismatches        : %d", int(mismatch.sum()))
+        logging.info("Table rows with diff pront : %d", table_diff)
+        logging.info("Time without / with pruning: %.2fs / %.2fs", t_full, t_pruned)
+        logging.info("=" * 60)
+
+        if mismatch.any() or table_diff:
+            logging.error("Blocking changed matching decisions:\n%s",
+                          merged[mismatch].head(50).to_string(index=False))
+            sys.exit(1)
+        logging.info("PARITY OK: blocking keys did not change any decision.")
+    except SystemExit:
+        raise
+    except Exception as e:
+        logging.exception("Error running blocking parity: %s", e)
+        sys.exit(1)
+    finally:
+        con.close()
+        logging.info("DuckDB connection closed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ echo Conda Environment : try_request
 echo ==============================================================================
 echo.
 
-echo [1/4] Recreating the test database...
+echo [1/5] Recreating the test database...
 call conda run -n try_request python test_prontuario_matching/create_test_db.py
 if !ERRORLEVEL! neq 0 (
     echo ERROR: Failed to recreate test database.
@@ -20,7 +20,7 @@ if !ERRORLEVEL! neq 0 (
 )
 echo.
 
-echo [2/4] Running matching benchmark strategies (A to L)...
+echo [2/5] Running matching benchmark strategies (A to L)...
 call conda run -n try_request python test_prontuario_matching/run_all_strategies.py
 if !ERRORLEVEL! neq 0 (
     echo ERROR: Failed to run matching benchmark strategies.
@@ -28,7 +28,7 @@ if !ERRORLEVEL! neq 0 (
 )
 echo.
 
-echo [3/4] Running production matching strategy (fills main prontuario)...
+echo [3/5] Running production matching strategy (fills main prontuario)...
 call conda run -n try_request python test_prontuario_matching/run_production_strategy_v1.py
 if !ERRORLEVEL! neq 0 (
     echo ERROR: Failed to run production matching strategy.
@@ -36,7 +36,7 @@ if !ERRORLEVEL! neq 0 (
 )
 echo.
 
-echo [4/4] Running false positive validation tests...
+echo [4/5] Running false positive validation tests...
 call conda run -n try_request python test_prontuario_matching/run_validation_tests.py
 if !ERRORLEVEL! neq 0 (
     echo ERROR: Failed to run false positive tests.
@@ -44,6 +44,13 @@ if !ERRORLEVEL! neq 0 (
 )
 echo.
 
+echo [5/5] Running blocking-key parity check (score_name pruning)...
+call conda run -n try_request python test_prontuario_matching/run_blocking_parity.py
+if !ERRORLEVEL! neq 0 (
+    echo ERROR: Blocking-key pruning changed matching decisions.
+    exit /b !ERRORLEVEL!
+)
+echo.
 echo ==============================================================================
 echo PIPELINE COMPLETED SUCCESSFULLY!
 echo ==============================================================================